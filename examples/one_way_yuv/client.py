@@ -7,6 +7,7 @@ import cv2
 import yuv_pb2
 from gabriel_client import push_source
 from gabriel_client.gabriel_client import InputProducer
+from gabriel_client.yuv import bgr_to_nv21
 from gabriel_client.zeromq_client import ZeroMQClient
 from gabriel_protocol.v1 import gabriel_pb2
 from google.protobuf.any_pb2 import Any
@@ -15,41 +16,6 @@ DEFAULT_SERVER_HOST = "localhost"
 ROTATION = 0
 
 
-class YuvConverter:
-    """Converts a BGR image to YUV NV21 format."""
-
-    def __init__(self, frame):
-        """Initialize the converter with a BGR frame."""
-        self._frame = frame
-
-    def convert_to_nv21(self):
-        """Converts the BGR frame to YUV NV21 format."""
-        # As of version 4.5.0, OpenCV has no COLOR_BGR2YUV_NV21 converter.
-        # I made this converter, which uses COLOR_BGR2YUV_I420 as a starting
-        # point.
-        # See here for details about l420 and NV21 https://wiki.videolan.org/YUV
-
-        bgr_height, width, _ = self._frame.shape
-        yuv = cv2.cvtColor(self._frame, cv2.COLOR_BGR2YUV_I420)
-        yuv_height = yuv.shape[0]
-
-        chrominance = []
-        chrominance_height = yuv_height - bgr_height
-        u_height = int(chrominance_height / 2)
-        for y in range(u_height):
-            for x in range(width):
-                chrominance.append(yuv[bgr_height + u_height + y, x])
-                chrominance.append(yuv[bgr_height + y, x])
-
-        # Convert i420 representation to NV21
-        chrominance = iter(chrominance)
-        for y in range(chrominance_height):
-            for x in range(width):
-                yuv[bgr_height + y, x] = next(chrominance)
-
-        return yuv
-
-
 def main():
     """Starts the Gabriel client."""
     common.configure_logging()
@@ -68,8 +34,7 @@ def main():
             return None
 
         height, width, _ = frame.shape
-        yuv_converter = YuvConverter(frame)
-        yuv = yuv_converter.convert_to_nv21()
+        yuv = bgr_to_nv21(frame)
 
         input_frame = gabriel_pb2.InputFrame()
         input_frame.payload_type = gabriel_pb2.PayloadType.IMAGE
@@ -59,6 +59,8 @@ func (client *GrpcClient) consumerHandler(
 			client.engineIDMu.Lock()
 			client.engineIDs = engineIDs
 			client.engineIDMu.Unlock()
+		case *gabrielpb.ToClient_TokenUpdate_:
+			client.processTokenUpdate(x.TokenUpdate)
 		case nil:
 			log.Error().Msg("could not decode message type")
 		default:
@@ -145,6 +147,23 @@ func (client *GrpcClient) registrationHandler(
 	}
 }
 
+// processTokenUpdate resizes a producer's token pool to the number of tokens
+// that the server set.
+func (client *GrpcClient) processTokenUpdate(tokenUpdate *gabrielpb.ToClient_TokenUpdate) {
+	pool, ok := client.tokenPool[tokenUpdate.ProducerId]
+	if !ok {
+		log.Warn().
+			Str("producer_id", tokenUpdate.ProducerId).
+			Msg("token update for unknown producer")
+		return
+	}
+	log.Debug().
+		Str("producer_id", tokenUpdate.ProducerId).
+		Int32("num_tokens", tokenUpdate.NumTokens).
+		Msg("token update")
+	pool.Resize(int(tokenUpdate.NumTokens))
+}
+
 // processResult processes results from the server.
 func (client *GrpcClient) processResult(resultWrapper *gabrielpb.ToClient_ResultWrapper) {
 	result := resultWrapper.Result
@@ -169,6 +188,19 @@ func (client *GrpcClient) processResult(resultWrapper *gabrielpb.ToClient_Result
 			Str("message", msg).
 			Msg("engine dropped frame")
 
+	case gabrielpb.StatusCode_SERVER_EVICTED_FRAME:
+		// Expected when the server's queue policy favours fresh frames
+		log.Debug().
+			Str("producer_id", resultWrapper.ProducerId).
+			Str("message", msg).
+			Msg("server evicted frame")
+
+	case gabrielpb.StatusCode_FRAME_EXPIRED:
+		log.Debug().
+			Str("producer_id", resultWrapper.ProducerId).
+			Str("message", msg).
+			Msg("frame expired")
+
 	default:
 		log.Error().
 			Str("producer_id", resultWrapper.ProducerId).
@@ -239,6 +271,7 @@ func (client *GrpcClient) producerHandler(
 			return
 		case inputFrame = <-resultCh:
 		}
+		captureTime := time.Now()
 
 		if inputFrame == nil {
 			logger.Error().Msg("received nil frame from producer")
@@ -255,6 +288,12 @@ func (client *GrpcClient) producerHandler(
 		input.FrameId = int64(frameId)
 		frameId += 1
 		input.ProducerId = producer.Name
+		if producer.MaxAge > 0 {
+			input.CaptureTimeUs = captureTime.UnixMicro()
+			input.MaxAgeMs = uint32(producer.MaxAge.Milliseconds())
+		}
+		input.Priority = producer.Priority
+		input.Weight = producer.Weight
 
 		targetEngines := producer.TargetEngineIDs()
 		client.engineIDMu.Lock()
@@ -4,6 +4,7 @@ import (
 	"context"
 	"sync"
 	"sync/atomic"
+	"time"
 
 	gabrielpb "github.com/cmusatyalab/gabriel/protocol/go"
 	"golang.org/x/sync/semaphore"
@@ -16,7 +17,21 @@ type ProducerFunc func(ctx context.Context) <-chan *gabrielpb.InputFrame
 // InputProducer wraps a ProducerFunc with a name, target engines, and
 // pause/resume state.
 type InputProducer struct {
-	Name            string
+	Name string
+	// MaxAge is how long after it is produced an input stops being useful.
+	// The server returns the token of an input that is older than this
+	// instead of sending it to an engine. Inputs are sent with the time they
+	// were produced, by this host's clock, which should be synchronized with
+	// the server's. Zero means that inputs do not expire.
+	MaxAge time.Duration
+	// Priority is the priority of this producer, for servers that schedule
+	// engines by priority. Inputs from producers with a higher priority are
+	// sent to engines first.
+	Priority uint32
+	// Weight is the weight of this producer, for servers that share engines
+	// fairly between producers. Each producer gets a share of an engine in
+	// proportion to its weight. Zero is treated as one.
+	Weight          uint32
 	producer        ProducerFunc
 	targetEngineIDs map[string]struct{}
 	running         bool
@@ -117,49 +132,127 @@ func (p *InputProducer) TargetEngineIDs() []string {
 	return engineIDs
 }
 
+// maxPoolTokens bounds the number of tokens that a tokenPool can be resized
+// to. A pool's semaphore has this capacity, and the pool holds the part of it
+// that is not made up of tokens, so that tokens can be added by releasing it.
+const maxPoolTokens = 1 << 16
+
 // tokenPool manages the tokens for a single InputProducer. remaining mirrors
 // the semaphore's available weight for the gabriel_producer_token_count
-// metric, since semaphore.Weighted exposes no way to query it directly.
+// metric, since semaphore.Weighted exposes no way to query it directly. The
+// server can change the number of tokens in the pool while inputs are in
+// flight (see Resize).
 type tokenPool struct {
 	sem          *semaphore.Weighted
-	maxTokens    int
 	producerName string
 	remaining    atomic.Int64
+	// mu guards maxTokens and owed.
+	mu        sync.Mutex
+	maxTokens int
+	// owed is the number of tokens that the pool has been shrunk by and that
+	// have not been taken out of it yet.
+	owed int
 }
 
 // newTokenPool creates a tokenPool with maxTokens available, and initializes
 // its gabriel_producer_token_count gauge.
 func newTokenPool(maxTokens int, producerName string) *tokenPool {
-	pool := &tokenPool{
-		sem:          semaphore.NewWeighted(int64(maxTokens)),
-		maxTokens:    maxTokens,
-		producerName: producerName,
-	}
-	pool.remaining.Store(int64(maxTokens))
-	producerTokenCount.WithLabelValues(producerName).Set(float64(maxTokens))
+	pool := &tokenPool{producerName: producerName}
+	pool.reset(maxTokens)
 	return pool
 }
 
-func (pool *tokenPool) ResetTokens() {
-	pool.sem = semaphore.NewWeighted(int64(pool.maxTokens))
-	pool.remaining.Store(int64(pool.maxTokens))
+func (pool *tokenPool) reset(maxTokens int) {
+	maxTokens = min(maxTokens, maxPoolTokens)
+	pool.sem = semaphore.NewWeighted(maxPoolTokens)
+	pool.sem.TryAcquire(int64(maxPoolTokens - maxTokens))
+	pool.remaining.Store(int64(maxTokens))
+	pool.mu.Lock()
+	pool.maxTokens = maxTokens
+	pool.owed = 0
+	pool.mu.Unlock()
+	pool.updateTokenCount()
+}
+
+// updateTokenCount sets the gabriel_producer_token_count gauge to the number
+// of tokens available.
+func (pool *tokenPool) updateTokenCount() {
+	pool.mu.Lock()
+	available := max(pool.remaining.Load()-int64(pool.owed), 0)
+	pool.mu.Unlock()
 	producerTokenCount.WithLabelValues(pool.producerName).
-		Set(float64(pool.maxTokens))
+		Set(float64(available))
+}
+
+func (pool *tokenPool) ResetTokens() {
+	pool.mu.Lock()
+	maxTokens := pool.maxTokens
+	pool.mu.Unlock()
+	pool.reset(maxTokens)
 }
 
 func (pool *tokenPool) GetToken(ctx context.Context) error {
 	if err := pool.sem.Acquire(ctx, 1); err != nil {
 		return err
 	}
-	remaining := pool.remaining.Add(-1)
-	producerTokenCount.WithLabelValues(pool.producerName).
-		Set(float64(remaining))
+	pool.remaining.Add(-1)
+	for {
+		// Take the tokens that the pool has been shrunk by out of it first
+		pool.mu.Lock()
+		if pool.owed == 0 {
+			pool.mu.Unlock()
+			break
+		}
+		pool.owed--
+		pool.mu.Unlock()
+		if err := pool.sem.Acquire(ctx, 1); err != nil {
+			pool.mu.Lock()
+			pool.owed++
+			pool.mu.Unlock()
+			pool.ReturnToken()
+			return err
+		}
+		pool.remaining.Add(-1)
+	}
+	pool.updateTokenCount()
 	return nil
 }
 
 func (pool *tokenPool) ReturnToken() {
+	pool.mu.Lock()
+	if pool.owed > 0 {
+		pool.owed--
+		pool.mu.Unlock()
+		pool.updateTokenCount()
+		return
+	}
+	pool.mu.Unlock()
 	pool.sem.Release(1)
-	remaining := pool.remaining.Add(1)
-	producerTokenCount.WithLabelValues(pool.producerName).
-		Set(float64(remaining))
+	pool.remaining.Add(1)
+	pool.updateTokenCount()
+}
+
+// Resize changes the number of tokens in the pool, including those in use.
+// Tokens added are available immediately. When the pool shrinks, tokens are
+// taken out of it as they become available, either by GetToken or by
+// ReturnToken, so inputs in flight are not affected.
+func (pool *tokenPool) Resize(numTokens int) {
+	numTokens = min(numTokens, maxPoolTokens)
+	pool.mu.Lock()
+	change := numTokens - pool.maxTokens
+	pool.maxTokens = numTokens
+	if change < 0 {
+		pool.owed -= change
+		change = 0
+	} else {
+		repaid := min(change, pool.owed)
+		pool.owed -= repaid
+		change -= repaid
+	}
+	pool.mu.Unlock()
+	if change > 0 {
+		pool.sem.Release(int64(change))
+		pool.remaining.Add(int64(change))
+	}
+	pool.updateTokenCount()
 }
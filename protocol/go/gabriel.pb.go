@@ -98,19 +98,33 @@ const (
 	StatusCode_NO_TOKENS StatusCode = 6
 	// The server dropped the frame because it was backed up.
 	StatusCode_SERVER_DROPPED_FRAME StatusCode = 7
+	// The server evicted the frame from its queue to make room for a newer
+	// frame from the same producer, before any engine processed it.
+	StatusCode_SERVER_EVICTED_FRAME StatusCode = 8
+	// The frame was older than its max_age_ms, or than the max_input_age_ms of
+	// the engine that would have processed it, before it was sent to an
+	// engine.
+	StatusCode_FRAME_EXPIRED StatusCode = 9
+	// The server cancelled the input, because the client that sent it
+	// disconnected, before the engine started to process it. Only returned by
+	// engines to the server.
+	StatusCode_INPUT_CANCELLED StatusCode = 10
 )
 
 // Enum value maps for StatusCode.
 var (
 	StatusCode_name = map[int32]string{
-		0: "STATUS_CODE_UNSPECIFIED",
-		1: "SUCCESS",
-		2: "UNSPECIFIED_ERROR",
-		3: "ENGINE_ERROR",
-		4: "WRONG_INPUT_FORMAT",
-		5: "NO_ENGINE_FOR_INPUT",
-		6: "NO_TOKENS",
-		7: "SERVER_DROPPED_FRAME",
+		0:  "STATUS_CODE_UNSPECIFIED",
+		1:  "SUCCESS",
+		2:  "UNSPECIFIED_ERROR",
+		3:  "ENGINE_ERROR",
+		4:  "WRONG_INPUT_FORMAT",
+		5:  "NO_ENGINE_FOR_INPUT",
+		6:  "NO_TOKENS",
+		7:  "SERVER_DROPPED_FRAME",
+		8:  "SERVER_EVICTED_FRAME",
+		9:  "FRAME_EXPIRED",
+		10: "INPUT_CANCELLED",
 	}
 	StatusCode_value = map[string]int32{
 		"STATUS_CODE_UNSPECIFIED": 0,
@@ -121,6 +135,9 @@ var (
 		"NO_ENGINE_FOR_INPUT":     5,
 		"NO_TOKENS":               6,
 		"SERVER_DROPPED_FRAME":    7,
+		"SERVER_EVICTED_FRAME":    8,
+		"FRAME_EXPIRED":           9,
+		"INPUT_CANCELLED":         10,
 	}
 )
 
@@ -532,6 +549,7 @@ type ToClient struct {
 	//	*ToClient_Registered_
 	//	*ToClient_ResultWrapper_
 	//	*ToClient_EngineIdsUpdate_
+	//	*ToClient_TokenUpdate_
 	MessageType   isToClient_MessageType `protobuf_oneof:"message_type"`
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
@@ -601,6 +619,15 @@ func (x *ToClient) GetEngineIdsUpdate() *ToClient_EngineIdsUpdate {
 	return nil
 }
 
+func (x *ToClient) GetTokenUpdate() *ToClient_TokenUpdate {
+	if x != nil {
+		if x, ok := x.MessageType.(*ToClient_TokenUpdate_); ok {
+			return x.TokenUpdate
+		}
+	}
+	return nil
+}
+
 type isToClient_MessageType interface {
 	isToClient_MessageType()
 }
@@ -619,19 +646,33 @@ type ToClient_EngineIdsUpdate_ struct {
 	EngineIdsUpdate *ToClient_EngineIdsUpdate `protobuf:"bytes,3,opt,name=engine_ids_update,json=engineIdsUpdate,proto3,oneof"`
 }
 
+type ToClient_TokenUpdate_ struct {
+	TokenUpdate *ToClient_TokenUpdate `protobuf:"bytes,4,opt,name=token_update,json=tokenUpdate,proto3,oneof"`
+}
+
 func (*ToClient_Registered_) isToClient_MessageType() {}
 
 func (*ToClient_ResultWrapper_) isToClient_MessageType() {}
 
 func (*ToClient_EngineIdsUpdate_) isToClient_MessageType() {}
 
+func (*ToClient_TokenUpdate_) isToClient_MessageType() {}
+
 type FromEngine struct {
 	state protoimpl.MessageState `protogen:"open.v1"`
 	// Types that are valid to be assigned to MessageType:
 	//
 	//	*FromEngine_Register_
 	//	*FromEngine_Result
-	MessageType   isFromEngine_MessageType `protobuf_oneof:"message_type"`
+	MessageType isFromEngine_MessageType `protobuf_oneof:"message_type"`
+	// The frame id of the input that a result is for, copied from the
+	// ToEngine message that carried the input.
+	FrameId int64 `protobuf:"varint,3,opt,name=frame_id,json=frameId,proto3" json:"frame_id,omitempty"`
+	// The producer id of the input that a result is for, copied from the
+	// ToEngine message that carried the input.
+	ProducerId string `protobuf:"bytes,4,opt,name=producer_id,json=producerId,proto3" json:"producer_id,omitempty"`
+	// The timestamps recorded by the engine, if the input was traced.
+	Trace         *Trace `protobuf:"bytes,5,opt,name=trace,proto3" json:"trace,omitempty"`
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
 }
@@ -691,6 +732,27 @@ func (x *FromEngine) GetResult() *Result {
 	return nil
 }
 
+func (x *FromEngine) GetFrameId() int64 {
+	if x != nil {
+		return x.FrameId
+	}
+	return 0
+}
+
+func (x *FromEngine) GetProducerId() string {
+	if x != nil {
+		return x.ProducerId
+	}
+	return ""
+}
+
+func (x *FromEngine) GetTrace() *Trace {
+	if x != nil {
+		return x.Trace
+	}
+	return nil
+}
+
 type isFromEngine_MessageType interface {
 	isFromEngine_MessageType()
 }
@@ -712,11 +774,28 @@ type ToEngine struct {
 	// Types that are valid to be assigned to MessageType:
 	//
 	//	*ToEngine_InputFrame
+	//	*ToEngine_ClientSessionOpened
+	//	*ToEngine_ClientSessionClosed
+	//	*ToEngine_CancelInput
 	MessageType isToEngine_MessageType `protobuf_oneof:"message_type"`
-	// Client-specific information registered by the producer of this input,
-	// forwarded from the client's Registration message. Unset if the
-	// producing client did not register any.
-	ClientInfo    *anypb.Any `protobuf:"bytes,2,opt,name=client_info,json=clientInfo,proto3" json:"client_info,omitempty"`
+	// Client-specific information registered by the producer of this input.
+	// The server sends client_info once per session instead, in a
+	// ClientSession, so it leaves this unset.
+	ClientInfo *anypb.Any `protobuf:"bytes,2,opt,name=client_info,json=clientInfo,proto3" json:"client_info,omitempty"`
+	// The frame id of the input, as set by the producing client. Engines
+	// return it in FromEngine, so that the server can match results to inputs
+	// when an engine has several inputs in flight.
+	FrameId int64 `protobuf:"varint,3,opt,name=frame_id,json=frameId,proto3" json:"frame_id,omitempty"`
+	// The id of the producer of the input. Engines return it in FromEngine
+	// along with frame_id.
+	ProducerId string `protobuf:"bytes,4,opt,name=producer_id,json=producerId,proto3" json:"producer_id,omitempty"`
+	// The handle of the client session that the input is from, announced in
+	// an earlier ClientSession. Zero if the producing client did not register
+	// any client_info.
+	SessionHandle uint64 `protobuf:"varint,5,opt,name=session_handle,json=sessionHandle,proto3" json:"session_handle,omitempty"`
+	// Whether the input is traced, in which case the engine returns the
+	// timestamps it recorded in FromEngine.
+	Trace         bool `protobuf:"varint,8,opt,name=trace,proto3" json:"trace,omitempty"`
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
 }
@@ -767,6 +846,33 @@ func (x *ToEngine) GetInputFrame() *InputFrame {
 	return nil
 }
 
+func (x *ToEngine) GetClientSessionOpened() *ToEngine_ClientSession {
+	if x != nil {
+		if x, ok := x.MessageType.(*ToEngine_ClientSessionOpened); ok {
+			return x.ClientSessionOpened
+		}
+	}
+	return nil
+}
+
+func (x *ToEngine) GetClientSessionClosed() uint64 {
+	if x != nil {
+		if x, ok := x.MessageType.(*ToEngine_ClientSessionClosed); ok {
+			return x.ClientSessionClosed
+		}
+	}
+	return 0
+}
+
+func (x *ToEngine) GetCancelInput() bool {
+	if x != nil {
+		if x, ok := x.MessageType.(*ToEngine_CancelInput); ok {
+			return x.CancelInput
+		}
+	}
+	return false
+}
+
 func (x *ToEngine) GetClientInfo() *anypb.Any {
 	if x != nil {
 		return x.ClientInfo
@@ -774,6 +880,34 @@ func (x *ToEngine) GetClientInfo() *anypb.Any {
 	return nil
 }
 
+func (x *ToEngine) GetFrameId() int64 {
+	if x != nil {
+		return x.FrameId
+	}
+	return 0
+}
+
+func (x *ToEngine) GetProducerId() string {
+	if x != nil {
+		return x.ProducerId
+	}
+	return ""
+}
+
+func (x *ToEngine) GetSessionHandle() uint64 {
+	if x != nil {
+		return x.SessionHandle
+	}
+	return 0
+}
+
+func (x *ToEngine) GetTrace() bool {
+	if x != nil {
+		return x.Trace
+	}
+	return false
+}
+
 type isToEngine_MessageType interface {
 	isToEngine_MessageType()
 }
@@ -782,8 +916,168 @@ type ToEngine_InputFrame struct {
 	InputFrame *InputFrame `protobuf:"bytes,1,opt,name=input_frame,json=inputFrame,proto3,oneof"`
 }
 
+type ToEngine_ClientSessionOpened struct {
+	ClientSessionOpened *ToEngine_ClientSession `protobuf:"bytes,6,opt,name=client_session_opened,json=clientSessionOpened,proto3,oneof"`
+}
+
+type ToEngine_ClientSessionClosed struct {
+	// The handle of a client session that has ended. The engine can
+	// discard the session's client_info.
+	ClientSessionClosed uint64 `protobuf:"varint,7,opt,name=client_session_closed,json=clientSessionClosed,proto3,oneof"`
+}
+
+type ToEngine_CancelInput struct {
+	// Cancels the input with this message's frame_id and producer_id, which
+	// the server sent earlier, because its client disconnected. If the
+	// engine has not started to process the input, it returns a result with
+	// the INPUT_CANCELLED status for it instead. Always true when set.
+	CancelInput bool `protobuf:"varint,9,opt,name=cancel_input,json=cancelInput,proto3,oneof"`
+}
+
 func (*ToEngine_InputFrame) isToEngine_MessageType() {}
 
+func (*ToEngine_ClientSessionOpened) isToEngine_MessageType() {}
+
+func (*ToEngine_ClientSessionClosed) isToEngine_MessageType() {}
+
+func (*ToEngine_CancelInput) isToEngine_MessageType() {}
+
+// The times at which a traced input reached each stage of its path through
+// the client, the server and the engine, in nanoseconds of a monotonic clock.
+// Each host records its timestamps by its own clock, so only the timestamps
+// recorded by the same host can be compared. Zero means that the input did
+// not reach a stage.
+type Trace struct {
+	state protoimpl.MessageState `protogen:"open.v1"`
+	// Recorded by the client.
+	// When the client sent the input.
+	ClientSendNs int64 `protobuf:"varint,1,opt,name=client_send_ns,json=clientSendNs,proto3" json:"client_send_ns,omitempty"`
+	// Recorded by the server.
+	// When the server received the input.
+	ServerReceiveNs int64 `protobuf:"varint,2,opt,name=server_receive_ns,json=serverReceiveNs,proto3" json:"server_receive_ns,omitempty"`
+	// When the server accepted the input, to send to engines or to queue.
+	EnqueueNs int64 `protobuf:"varint,3,opt,name=enqueue_ns,json=enqueueNs,proto3" json:"enqueue_ns,omitempty"`
+	// When the server sent the input to the engine that returned its result.
+	DispatchNs int64 `protobuf:"varint,4,opt,name=dispatch_ns,json=dispatchNs,proto3" json:"dispatch_ns,omitempty"`
+	// Recorded by the engine.
+	// When the engine received the input.
+	EngineReceiveNs int64 `protobuf:"varint,5,opt,name=engine_receive_ns,json=engineReceiveNs,proto3" json:"engine_receive_ns,omitempty"`
+	// When the engine started to process the input.
+	HandleStartNs int64 `protobuf:"varint,6,opt,name=handle_start_ns,json=handleStartNs,proto3" json:"handle_start_ns,omitempty"`
+	// When the engine finished processing the input.
+	HandleEndNs int64 `protobuf:"varint,7,opt,name=handle_end_ns,json=handleEndNs,proto3" json:"handle_end_ns,omitempty"`
+	// Recorded by the server.
+	// When the server received the result from the engine.
+	EngineResultNs int64 `protobuf:"varint,8,opt,name=engine_result_ns,json=engineResultNs,proto3" json:"engine_result_ns,omitempty"`
+	// When the server sent the result to the client.
+	ResultWriteNs int64 `protobuf:"varint,9,opt,name=result_write_ns,json=resultWriteNs,proto3" json:"result_write_ns,omitempty"`
+	// Recorded by the client.
+	// When the client received the result.
+	ClientReceiveNs int64 `protobuf:"varint,10,opt,name=client_receive_ns,json=clientReceiveNs,proto3" json:"client_receive_ns,omitempty"`
+	unknownFields   protoimpl.UnknownFields
+	sizeCache       protoimpl.SizeCache
+}
+
+func (x *Trace) Reset() {
+	*x = Trace{}
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[7]
+	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+	ms.StoreMessageInfo(mi)
+}
+
+func (x *Trace) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*Trace) ProtoMessage() {}
+
+func (x *Trace) ProtoReflect() protoreflect.Message {
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[7]
+	if x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use Trace.ProtoReflect.Descriptor instead.
+func (*Trace) Descriptor() ([]byte, []int) {
+	return file_gabriel_protocol_v1_gabriel_proto_rawDescGZIP(), []int{7}
+}
+
+func (x *Trace) GetClientSendNs() int64 {
+	if x != nil {
+		return x.ClientSendNs
+	}
+	return 0
+}
+
+func (x *Trace) GetServerReceiveNs() int64 {
+	if x != nil {
+		return x.ServerReceiveNs
+	}
+	return 0
+}
+
+func (x *Trace) GetEnqueueNs() int64 {
+	if x != nil {
+		return x.EnqueueNs
+	}
+	return 0
+}
+
+func (x *Trace) GetDispatchNs() int64 {
+	if x != nil {
+		return x.DispatchNs
+	}
+	return 0
+}
+
+func (x *Trace) GetEngineReceiveNs() int64 {
+	if x != nil {
+		return x.EngineReceiveNs
+	}
+	return 0
+}
+
+func (x *Trace) GetHandleStartNs() int64 {
+	if x != nil {
+		return x.HandleStartNs
+	}
+	return 0
+}
+
+func (x *Trace) GetHandleEndNs() int64 {
+	if x != nil {
+		return x.HandleEndNs
+	}
+	return 0
+}
+
+func (x *Trace) GetEngineResultNs() int64 {
+	if x != nil {
+		return x.EngineResultNs
+	}
+	return 0
+}
+
+func (x *Trace) GetResultWriteNs() int64 {
+	if x != nil {
+		return x.ResultWriteNs
+	}
+	return 0
+}
+
+func (x *Trace) GetClientReceiveNs() int64 {
+	if x != nil {
+		return x.ClientReceiveNs
+	}
+	return 0
+}
+
 type FromClient_Input struct {
 	state protoimpl.MessageState `protogen:"open.v1"`
 	// A monotonically increasing frame identifier.
@@ -793,14 +1087,38 @@ type FromClient_Input struct {
 	// The targeted engines for this input.
 	TargetEngineIds []string `protobuf:"bytes,3,rep,name=target_engine_ids,json=targetEngineIds,proto3" json:"target_engine_ids,omitempty"`
 	// The data to be sent to the server.
-	InputFrame    *InputFrame `protobuf:"bytes,4,opt,name=input_frame,json=inputFrame,proto3" json:"input_frame,omitempty"`
+	InputFrame *InputFrame `protobuf:"bytes,4,opt,name=input_frame,json=inputFrame,proto3" json:"input_frame,omitempty"`
+	// When the input was captured, in microseconds since the Unix epoch, by
+	// the client's clock. The server measures the age of the input from
+	// this time, so the clocks of clients that set it should be
+	// synchronized with the server's. If unset, the server uses the time it
+	// received the input.
+	CaptureTimeUs int64 `protobuf:"varint,5,opt,name=capture_time_us,json=captureTimeUs,proto3" json:"capture_time_us,omitempty"`
+	// How long after capture_time_us the input stops being useful, in
+	// milliseconds. The server returns the token of an input that is older
+	// than this before it is sent to an engine, with the FRAME_EXPIRED
+	// status, rather than sending it. Zero means that the input does not
+	// expire.
+	MaxAgeMs uint32 `protobuf:"varint,6,opt,name=max_age_ms,json=maxAgeMs,proto3" json:"max_age_ms,omitempty"`
+	// The priority of the producer, used by servers that schedule engines by
+	// priority. Inputs from producers with a higher priority are sent to
+	// engines first.
+	Priority uint32 `protobuf:"varint,7,opt,name=priority,proto3" json:"priority,omitempty"`
+	// The weight of the producer, used by servers that share engines fairly
+	// between producers. Each producer gets a share of an engine in
+	// proportion to its weight. Zero is treated as one.
+	Weight uint32 `protobuf:"varint,8,opt,name=weight,proto3" json:"weight,omitempty"`
+	// Set by the client, with its client_send_ns, to have the input traced
+	// through the server and the engine. The trace is returned with the
+	// input's result.
+	Trace         *Trace `protobuf:"bytes,9,opt,name=trace,proto3" json:"trace,omitempty"`
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
 }
 
 func (x *FromClient_Input) Reset() {
 	*x = FromClient_Input{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[7]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[8]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -812,7 +1130,7 @@ func (x *FromClient_Input) String() string {
 func (*FromClient_Input) ProtoMessage() {}
 
 func (x *FromClient_Input) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[7]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[8]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -856,6 +1174,41 @@ func (x *FromClient_Input) GetInputFrame() *InputFrame {
 	return nil
 }
 
+func (x *FromClient_Input) GetCaptureTimeUs() int64 {
+	if x != nil {
+		return x.CaptureTimeUs
+	}
+	return 0
+}
+
+func (x *FromClient_Input) GetMaxAgeMs() uint32 {
+	if x != nil {
+		return x.MaxAgeMs
+	}
+	return 0
+}
+
+func (x *FromClient_Input) GetPriority() uint32 {
+	if x != nil {
+		return x.Priority
+	}
+	return 0
+}
+
+func (x *FromClient_Input) GetWeight() uint32 {
+	if x != nil {
+		return x.Weight
+	}
+	return 0
+}
+
+func (x *FromClient_Input) GetTrace() *Trace {
+	if x != nil {
+		return x.Trace
+	}
+	return nil
+}
+
 type FromClient_Registration struct {
 	state protoimpl.MessageState `protogen:"open.v1"`
 	// Arbitrary client-specific information, made available to engines
@@ -867,7 +1220,7 @@ type FromClient_Registration struct {
 
 func (x *FromClient_Registration) Reset() {
 	*x = FromClient_Registration{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[8]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[9]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -879,7 +1232,7 @@ func (x *FromClient_Registration) String() string {
 func (*FromClient_Registration) ProtoMessage() {}
 
 func (x *FromClient_Registration) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[8]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[9]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -914,7 +1267,7 @@ type ToClient_Registered struct {
 
 func (x *ToClient_Registered) Reset() {
 	*x = ToClient_Registered{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[9]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[10]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -926,7 +1279,7 @@ func (x *ToClient_Registered) String() string {
 func (*ToClient_Registered) ProtoMessage() {}
 
 func (x *ToClient_Registered) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[9]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[10]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -968,7 +1321,7 @@ type ToClient_EngineIdsUpdate struct {
 
 func (x *ToClient_EngineIdsUpdate) Reset() {
 	*x = ToClient_EngineIdsUpdate{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[10]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[11]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -980,7 +1333,7 @@ func (x *ToClient_EngineIdsUpdate) String() string {
 func (*ToClient_EngineIdsUpdate) ProtoMessage() {}
 
 func (x *ToClient_EngineIdsUpdate) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[10]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[11]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -1011,14 +1364,17 @@ type ToClient_ResultWrapper struct {
 	// Whether to replenish a client token.
 	ReturnToken bool `protobuf:"varint,2,opt,name=return_token,json=returnToken,proto3" json:"return_token,omitempty"`
 	// The result sent from the engine.
-	Result        *Result `protobuf:"bytes,3,opt,name=result,proto3" json:"result,omitempty"`
+	Result *Result `protobuf:"bytes,3,opt,name=result,proto3" json:"result,omitempty"`
+	// The trace of the input, if the client set one, with the timestamps
+	// recorded by the server and the engine.
+	Trace         *Trace `protobuf:"bytes,4,opt,name=trace,proto3" json:"trace,omitempty"`
 	unknownFields protoimpl.UnknownFields
 	sizeCache     protoimpl.SizeCache
 }
 
 func (x *ToClient_ResultWrapper) Reset() {
 	*x = ToClient_ResultWrapper{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[11]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[12]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -1030,7 +1386,7 @@ func (x *ToClient_ResultWrapper) String() string {
 func (*ToClient_ResultWrapper) ProtoMessage() {}
 
 func (x *ToClient_ResultWrapper) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[11]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[12]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -1067,6 +1423,73 @@ func (x *ToClient_ResultWrapper) GetResult() *Result {
 	return nil
 }
 
+func (x *ToClient_ResultWrapper) GetTrace() *Trace {
+	if x != nil {
+		return x.Trace
+	}
+	return nil
+}
+
+// Sent when the server changes the number of tokens that a producer
+// holds. The producer's tokens change by the difference from its previous
+// number: new tokens are available immediately, and when the number is
+// lowered, tokens are taken from those available and then from the next
+// tokens returned.
+type ToClient_TokenUpdate struct {
+	state protoimpl.MessageState `protogen:"open.v1"`
+	// The producer whose number of tokens changed.
+	ProducerId string `protobuf:"bytes,1,opt,name=producer_id,json=producerId,proto3" json:"producer_id,omitempty"`
+	// The number of tokens the producer holds, including the tokens of its
+	// inputs in flight.
+	NumTokens     int32 `protobuf:"varint,2,opt,name=num_tokens,json=numTokens,proto3" json:"num_tokens,omitempty"`
+	unknownFields protoimpl.UnknownFields
+	sizeCache     protoimpl.SizeCache
+}
+
+func (x *ToClient_TokenUpdate) Reset() {
+	*x = ToClient_TokenUpdate{}
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[13]
+	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+	ms.StoreMessageInfo(mi)
+}
+
+func (x *ToClient_TokenUpdate) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*ToClient_TokenUpdate) ProtoMessage() {}
+
+func (x *ToClient_TokenUpdate) ProtoReflect() protoreflect.Message {
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[13]
+	if x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use ToClient_TokenUpdate.ProtoReflect.Descriptor instead.
+func (*ToClient_TokenUpdate) Descriptor() ([]byte, []int) {
+	return file_gabriel_protocol_v1_gabriel_proto_rawDescGZIP(), []int{4, 3}
+}
+
+func (x *ToClient_TokenUpdate) GetProducerId() string {
+	if x != nil {
+		return x.ProducerId
+	}
+	return ""
+}
+
+func (x *ToClient_TokenUpdate) GetNumTokens() int32 {
+	if x != nil {
+		return x.NumTokens
+	}
+	return 0
+}
+
 type FromEngine_Register struct {
 	state protoimpl.MessageState `protogen:"open.v1"`
 	// The engine id.
@@ -1075,13 +1498,37 @@ type FromEngine_Register struct {
 	// producer, even if they do not correspond to the latest input. This
 	// flag determines whether stale results are sent to the producer.
 	AllResponsesRequired bool `protobuf:"varint,2,opt,name=all_responses_required,json=allResponsesRequired,proto3" json:"all_responses_required,omitempty"`
-	unknownFields        protoimpl.UnknownFields
-	sizeCache            protoimpl.SizeCache
+	// The maximum number of inputs the engine processes together in one
+	// batch. The server keeps up to this many inputs in flight to the
+	// engine, so that it can fill its batches. Zero is treated as one.
+	MaxBatchSize uint32 `protobuf:"varint,3,opt,name=max_batch_size,json=maxBatchSize,proto3" json:"max_batch_size,omitempty"`
+	// The maximum number of inputs the server sends to the engine before
+	// the engine has returned results for them, so that the engine receives
+	// its next input while it processes the current one. The server keeps
+	// at least max_batch_size inputs in flight regardless. Zero is treated
+	// as one.
+	PipelineDepth uint32 `protobuf:"varint,4,opt,name=pipeline_depth,json=pipelineDepth,proto3" json:"pipeline_depth,omitempty"`
+	// The maximum number of client sessions whose client_info the engine
+	// keeps, evicting the least recently used one when it announces another.
+	// The server tracks the same sessions, so that it announces a session
+	// again before sending an input from it if it has been evicted. Zero is
+	// treated as one.
+	ClientInfoCacheSize uint32 `protobuf:"varint,5,opt,name=client_info_cache_size,json=clientInfoCacheSize,proto3" json:"client_info_cache_size,omitempty"`
+	// The maximum age of an input, measured from its capture_time_us, for
+	// the engine to process it. The server does not send the engine inputs
+	// older than this, returning the token of queued inputs with the
+	// FRAME_EXPIRED status instead. Zero means no limit.
+	MaxInputAgeMs uint32 `protobuf:"varint,6,opt,name=max_input_age_ms,json=maxInputAgeMs,proto3" json:"max_input_age_ms,omitempty"`
+	// Whether the engine accepts ToEngine messages with cancel_input set.
+	// The server only cancels inputs sent to engines that set this.
+	SupportsCancel bool `protobuf:"varint,7,opt,name=supports_cancel,json=supportsCancel,proto3" json:"supports_cancel,omitempty"`
+	unknownFields  protoimpl.UnknownFields
+	sizeCache      protoimpl.SizeCache
 }
 
 func (x *FromEngine_Register) Reset() {
 	*x = FromEngine_Register{}
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[12]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[14]
 	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 	ms.StoreMessageInfo(mi)
 }
@@ -1093,7 +1540,7 @@ func (x *FromEngine_Register) String() string {
 func (*FromEngine_Register) ProtoMessage() {}
 
 func (x *FromEngine_Register) ProtoReflect() protoreflect.Message {
-	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[12]
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[14]
 	if x != nil {
 		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
 		if ms.LoadMessageInfo() == nil {
@@ -1123,6 +1570,98 @@ func (x *FromEngine_Register) GetAllResponsesRequired() bool {
 	return false
 }
 
+func (x *FromEngine_Register) GetMaxBatchSize() uint32 {
+	if x != nil {
+		return x.MaxBatchSize
+	}
+	return 0
+}
+
+func (x *FromEngine_Register) GetPipelineDepth() uint32 {
+	if x != nil {
+		return x.PipelineDepth
+	}
+	return 0
+}
+
+func (x *FromEngine_Register) GetClientInfoCacheSize() uint32 {
+	if x != nil {
+		return x.ClientInfoCacheSize
+	}
+	return 0
+}
+
+func (x *FromEngine_Register) GetMaxInputAgeMs() uint32 {
+	if x != nil {
+		return x.MaxInputAgeMs
+	}
+	return 0
+}
+
+func (x *FromEngine_Register) GetSupportsCancel() bool {
+	if x != nil {
+		return x.SupportsCancel
+	}
+	return false
+}
+
+// Announces a client session, before the first input from the session
+// that is sent to the engine.
+type ToEngine_ClientSession struct {
+	state protoimpl.MessageState `protogen:"open.v1"`
+	// The handle that inputs from the session refer to it by.
+	SessionHandle uint64 `protobuf:"varint,1,opt,name=session_handle,json=sessionHandle,proto3" json:"session_handle,omitempty"`
+	// Client-specific information registered by the client, forwarded from
+	// its Registration message.
+	ClientInfo    *anypb.Any `protobuf:"bytes,2,opt,name=client_info,json=clientInfo,proto3" json:"client_info,omitempty"`
+	unknownFields protoimpl.UnknownFields
+	sizeCache     protoimpl.SizeCache
+}
+
+func (x *ToEngine_ClientSession) Reset() {
+	*x = ToEngine_ClientSession{}
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[15]
+	ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+	ms.StoreMessageInfo(mi)
+}
+
+func (x *ToEngine_ClientSession) String() string {
+	return protoimpl.X.MessageStringOf(x)
+}
+
+func (*ToEngine_ClientSession) ProtoMessage() {}
+
+func (x *ToEngine_ClientSession) ProtoReflect() protoreflect.Message {
+	mi := &file_gabriel_protocol_v1_gabriel_proto_msgTypes[15]
+	if x != nil {
+		ms := protoimpl.X.MessageStateOf(protoimpl.Pointer(x))
+		if ms.LoadMessageInfo() == nil {
+			ms.StoreMessageInfo(mi)
+		}
+		return ms
+	}
+	return mi.MessageOf(x)
+}
+
+// Deprecated: Use ToEngine_ClientSession.ProtoReflect.Descriptor instead.
+func (*ToEngine_ClientSession) Descriptor() ([]byte, []int) {
+	return file_gabriel_protocol_v1_gabriel_proto_rawDescGZIP(), []int{6, 0}
+}
+
+func (x *ToEngine_ClientSession) GetSessionHandle() uint64 {
+	if x != nil {
+		return x.SessionHandle
+	}
+	return 0
+}
+
+func (x *ToEngine_ClientSession) GetClientInfo() *anypb.Any {
+	if x != nil {
+		return x.ClientInfo
+	}
+	return nil
+}
+
 var File_gabriel_protocol_v1_gabriel_proto protoreflect.FileDescriptor
 
 const file_gabriel_protocol_v1_gabriel_proto_rawDesc = "" +
@@ -1135,18 +1674,24 @@ const file_gabriel_protocol_v1_gabriel_proto_rawDesc = "" +
 	"\fbyte_payload\x18\x03 \x01(\fH\x00R\vbytePayload\x127\n" +
 	"\vany_payload\x18\x04 \x01(\v2\x14.google.protobuf.AnyH\x00R\n" +
 	"anyPayloadB\t\n" +
-	"\apayload\"\xaa\x03\n" +
+	"\apayload\"\xd6\x04\n" +
 	"\n" +
 	"FromClient\x12=\n" +
 	"\x05input\x18\x01 \x01(\v2%.gabriel_protocol.v1.FromClient.InputH\x00R\x05input\x12R\n" +
-	"\fregistration\x18\x02 \x01(\v2,.gabriel_protocol.v1.FromClient.RegistrationH\x00R\fregistration\x1a\xb1\x01\n" +
+	"\fregistration\x18\x02 \x01(\v2,.gabriel_protocol.v1.FromClient.RegistrationH\x00R\fregistration\x1a\xdd\x02\n" +
 	"\x05Input\x12\x19\n" +
 	"\bframe_id\x18\x01 \x01(\x03R\aframeId\x12\x1f\n" +
 	"\vproducer_id\x18\x02 \x01(\tR\n" +
 	"producerId\x12*\n" +
 	"\x11target_engine_ids\x18\x03 \x03(\tR\x0ftargetEngineIds\x12@\n" +
 	"\vinput_frame\x18\x04 \x01(\v2\x1f.gabriel_protocol.v1.InputFrameR\n" +
-	"inputFrame\x1aE\n" +
+	"inputFrame\x12&\n" +
+	"\x0fcapture_time_us\x18\x05 \x01(\x03R\rcaptureTimeUs\x12\x1c\n" +
+	"\n" +
+	"max_age_ms\x18\x06 \x01(\rR\bmaxAgeMs\x12\x1a\n" +
+	"\bpriority\x18\a \x01(\rR\bpriority\x12\x16\n" +
+	"\x06weight\x18\b \x01(\rR\x06weight\x120\n" +
+	"\x05trace\x18\t \x01(\v2\x1a.gabriel_protocol.v1.TraceR\x05trace\x1aE\n" +
 	"\fRegistration\x125\n" +
 	"\vclient_info\x18\x01 \x01(\v2\x14.google.protobuf.AnyR\n" +
 	"clientInfoB\x0e\n" +
@@ -1162,13 +1707,14 @@ const file_gabriel_protocol_v1_gabriel_proto_rawDesc = "" +
 	"any_result\x18\x04 \x01(\v2\x14.google.protobuf.AnyH\x00R\tanyResult\x12(\n" +
 	"\x10target_engine_id\x18\x05 \x01(\tR\x0etargetEngineId\x12\x19\n" +
 	"\bframe_id\x18\x06 \x01(\x03R\aframeIdB\t\n" +
-	"\apayload\"\xba\x04\n" +
+	"\apayload\"\x8b\x06\n" +
 	"\bToClient\x12J\n" +
 	"\n" +
 	"registered\x18\x01 \x01(\v2(.gabriel_protocol.v1.ToClient.RegisteredH\x00R\n" +
 	"registered\x12T\n" +
 	"\x0eresult_wrapper\x18\x02 \x01(\v2+.gabriel_protocol.v1.ToClient.ResultWrapperH\x00R\rresultWrapper\x12[\n" +
-	"\x11engine_ids_update\x18\x03 \x01(\v2-.gabriel_protocol.v1.ToClient.EngineIdsUpdateH\x00R\x0fengineIdsUpdate\x1ab\n" +
+	"\x11engine_ids_update\x18\x03 \x01(\v2-.gabriel_protocol.v1.ToClient.EngineIdsUpdateH\x00R\x0fengineIdsUpdate\x12N\n" +
+	"\ftoken_update\x18\x04 \x01(\v2).gabriel_protocol.v1.ToClient.TokenUpdateH\x00R\vtokenUpdate\x1ab\n" +
 	"\n" +
 	"Registered\x125\n" +
 	"\x17num_tokens_per_producer\x18\x01 \x01(\x05R\x14numTokensPerProducer\x12\x1d\n" +
@@ -1176,34 +1722,75 @@ const file_gabriel_protocol_v1_gabriel_proto_rawDesc = "" +
 	"engine_ids\x18\x02 \x03(\tR\tengineIds\x1a0\n" +
 	"\x0fEngineIdsUpdate\x12\x1d\n" +
 	"\n" +
-	"engine_ids\x18\x01 \x03(\tR\tengineIds\x1a\x88\x01\n" +
+	"engine_ids\x18\x01 \x03(\tR\tengineIds\x1a\xba\x01\n" +
 	"\rResultWrapper\x12\x1f\n" +
 	"\vproducer_id\x18\x01 \x01(\tR\n" +
 	"producerId\x12!\n" +
 	"\freturn_token\x18\x02 \x01(\bR\vreturnToken\x123\n" +
-	"\x06result\x18\x03 \x01(\v2\x1b.gabriel_protocol.v1.ResultR\x06resultB\x0e\n" +
-	"\fmessage_type\"\xfa\x01\n" +
+	"\x06result\x18\x03 \x01(\v2\x1b.gabriel_protocol.v1.ResultR\x06result\x120\n" +
+	"\x05trace\x18\x04 \x01(\v2\x1a.gabriel_protocol.v1.TraceR\x05trace\x1aM\n" +
+	"\vTokenUpdate\x12\x1f\n" +
+	"\vproducer_id\x18\x01 \x01(\tR\n" +
+	"producerId\x12\x1d\n" +
+	"\n" +
+	"num_tokens\x18\x02 \x01(\x05R\tnumTokensB\x0e\n" +
+	"\fmessage_type\"\xbd\x04\n" +
 	"\n" +
 	"FromEngine\x12F\n" +
 	"\bregister\x18\x01 \x01(\v2(.gabriel_protocol.v1.FromEngine.RegisterH\x00R\bregister\x125\n" +
-	"\x06result\x18\x02 \x01(\v2\x1b.gabriel_protocol.v1.ResultH\x00R\x06result\x1a]\n" +
+	"\x06result\x18\x02 \x01(\v2\x1b.gabriel_protocol.v1.ResultH\x00R\x06result\x12\x19\n" +
+	"\bframe_id\x18\x03 \x01(\x03R\aframeId\x12\x1f\n" +
+	"\vproducer_id\x18\x04 \x01(\tR\n" +
+	"producerId\x120\n" +
+	"\x05trace\x18\x05 \x01(\v2\x1a.gabriel_protocol.v1.TraceR\x05trace\x1a\xb1\x02\n" +
 	"\bRegister\x12\x1b\n" +
 	"\tengine_id\x18\x01 \x01(\tR\bengineId\x124\n" +
-	"\x16all_responses_required\x18\x02 \x01(\bR\x14allResponsesRequiredB\x0e\n" +
-	"\fmessage_type\"\x95\x01\n" +
+	"\x16all_responses_required\x18\x02 \x01(\bR\x14allResponsesRequired\x12$\n" +
+	"\x0emax_batch_size\x18\x03 \x01(\rR\fmaxBatchSize\x12%\n" +
+	"\x0epipeline_depth\x18\x04 \x01(\rR\rpipelineDepth\x123\n" +
+	"\x16client_info_cache_size\x18\x05 \x01(\rR\x13clientInfoCacheSize\x12'\n" +
+	"\x10max_input_age_ms\x18\x06 \x01(\rR\rmaxInputAgeMs\x12'\n" +
+	"\x0fsupports_cancel\x18\a \x01(\bR\x0esupportsCancelB\x0e\n" +
+	"\fmessage_type\"\xbb\x04\n" +
 	"\bToEngine\x12B\n" +
 	"\vinput_frame\x18\x01 \x01(\v2\x1f.gabriel_protocol.v1.InputFrameH\x00R\n" +
-	"inputFrame\x125\n" +
+	"inputFrame\x12a\n" +
+	"\x15client_session_opened\x18\x06 \x01(\v2+.gabriel_protocol.v1.ToEngine.ClientSessionH\x00R\x13clientSessionOpened\x124\n" +
+	"\x15client_session_closed\x18\a \x01(\x04H\x00R\x13clientSessionClosed\x12#\n" +
+	"\fcancel_input\x18\t \x01(\bH\x00R\vcancelInput\x125\n" +
+	"\vclient_info\x18\x02 \x01(\v2\x14.google.protobuf.AnyR\n" +
+	"clientInfo\x12\x19\n" +
+	"\bframe_id\x18\x03 \x01(\x03R\aframeId\x12\x1f\n" +
+	"\vproducer_id\x18\x04 \x01(\tR\n" +
+	"producerId\x12%\n" +
+	"\x0esession_handle\x18\x05 \x01(\x04R\rsessionHandle\x12\x14\n" +
+	"\x05trace\x18\b \x01(\bR\x05trace\x1am\n" +
+	"\rClientSession\x12%\n" +
+	"\x0esession_handle\x18\x01 \x01(\x04R\rsessionHandle\x125\n" +
 	"\vclient_info\x18\x02 \x01(\v2\x14.google.protobuf.AnyR\n" +
 	"clientInfoB\x0e\n" +
-	"\fmessage_type*a\n" +
+	"\fmessage_type\"\x8f\x03\n" +
+	"\x05Trace\x12$\n" +
+	"\x0eclient_send_ns\x18\x01 \x01(\x03R\fclientSendNs\x12*\n" +
+	"\x11server_receive_ns\x18\x02 \x01(\x03R\x0fserverReceiveNs\x12\x1d\n" +
+	"\n" +
+	"enqueue_ns\x18\x03 \x01(\x03R\tenqueueNs\x12\x1f\n" +
+	"\vdispatch_ns\x18\x04 \x01(\x03R\n" +
+	"dispatchNs\x12*\n" +
+	"\x11engine_receive_ns\x18\x05 \x01(\x03R\x0fengineReceiveNs\x12&\n" +
+	"\x0fhandle_start_ns\x18\x06 \x01(\x03R\rhandleStartNs\x12\"\n" +
+	"\rhandle_end_ns\x18\a \x01(\x03R\vhandleEndNs\x12(\n" +
+	"\x10engine_result_ns\x18\b \x01(\x03R\x0eengineResultNs\x12&\n" +
+	"\x0fresult_write_ns\x18\t \x01(\x03R\rresultWriteNs\x12*\n" +
+	"\x11client_receive_ns\x18\n" +
+	" \x01(\x03R\x0fclientReceiveNs*a\n" +
 	"\vPayloadType\x12\x1c\n" +
 	"\x18PAYLOAD_TYPE_UNSPECIFIED\x10\x00\x12\b\n" +
 	"\x04TEXT\x10\x01\x12\t\n" +
 	"\x05IMAGE\x10\x02\x12\t\n" +
 	"\x05AUDIO\x10\x03\x12\t\n" +
 	"\x05VIDEO\x10\x04\x12\t\n" +
-	"\x05OTHER\x10d*\xb9\x01\n" +
+	"\x05OTHER\x10d*\xfb\x01\n" +
 	"\n" +
 	"StatusCode\x12\x1b\n" +
 	"\x17STATUS_CODE_UNSPECIFIED\x10\x00\x12\v\n" +
@@ -1213,7 +1800,11 @@ const file_gabriel_protocol_v1_gabriel_proto_rawDesc = "" +
 	"\x12WRONG_INPUT_FORMAT\x10\x04\x12\x17\n" +
 	"\x13NO_ENGINE_FOR_INPUT\x10\x05\x12\r\n" +
 	"\tNO_TOKENS\x10\x06\x12\x18\n" +
-	"\x14SERVER_DROPPED_FRAME\x10\a2k\n" +
+	"\x14SERVER_DROPPED_FRAME\x10\a\x12\x18\n" +
+	"\x14SERVER_EVICTED_FRAME\x10\b\x12\x11\n" +
+	"\rFRAME_EXPIRED\x10\t\x12\x13\n" +
+	"\x0fINPUT_CANCELLED\x10\n" +
+	"2k\n" +
 	"\x14GabrielClientService\x12S\n" +
 	"\rClientSession\x12\x1f.gabriel_protocol.v1.FromClient\x1a\x1d.gabriel_protocol.v1.ToClient(\x010\x012k\n" +
 	"\x14GabrielEngineService\x12S\n" +
@@ -1232,7 +1823,7 @@ func file_gabriel_protocol_v1_gabriel_proto_rawDescGZIP() []byte {
 }
 
 var file_gabriel_protocol_v1_gabriel_proto_enumTypes = make([]protoimpl.EnumInfo, 2)
-var file_gabriel_protocol_v1_gabriel_proto_msgTypes = make([]protoimpl.MessageInfo, 13)
+var file_gabriel_protocol_v1_gabriel_proto_msgTypes = make([]protoimpl.MessageInfo, 16)
 var file_gabriel_protocol_v1_gabriel_proto_goTypes = []any{
 	(PayloadType)(0),                 // 0: gabriel_protocol.v1.PayloadType
 	(StatusCode)(0),                  // 1: gabriel_protocol.v1.StatusCode
@@ -1243,41 +1834,50 @@ var file_gabriel_protocol_v1_gabriel_proto_goTypes = []any{
 	(*ToClient)(nil),                 // 6: gabriel_protocol.v1.ToClient
 	(*FromEngine)(nil),               // 7: gabriel_protocol.v1.FromEngine
 	(*ToEngine)(nil),                 // 8: gabriel_protocol.v1.ToEngine
-	(*FromClient_Input)(nil),         // 9: gabriel_protocol.v1.FromClient.Input
-	(*FromClient_Registration)(nil),  // 10: gabriel_protocol.v1.FromClient.Registration
-	(*ToClient_Registered)(nil),      // 11: gabriel_protocol.v1.ToClient.Registered
-	(*ToClient_EngineIdsUpdate)(nil), // 12: gabriel_protocol.v1.ToClient.EngineIdsUpdate
-	(*ToClient_ResultWrapper)(nil),   // 13: gabriel_protocol.v1.ToClient.ResultWrapper
-	(*FromEngine_Register)(nil),      // 14: gabriel_protocol.v1.FromEngine.Register
-	(*anypb.Any)(nil),                // 15: google.protobuf.Any
+	(*Trace)(nil),                    // 9: gabriel_protocol.v1.Trace
+	(*FromClient_Input)(nil),         // 10: gabriel_protocol.v1.FromClient.Input
+	(*FromClient_Registration)(nil),  // 11: gabriel_protocol.v1.FromClient.Registration
+	(*ToClient_Registered)(nil),      // 12: gabriel_protocol.v1.ToClient.Registered
+	(*ToClient_EngineIdsUpdate)(nil), // 13: gabriel_protocol.v1.ToClient.EngineIdsUpdate
+	(*ToClient_ResultWrapper)(nil),   // 14: gabriel_protocol.v1.ToClient.ResultWrapper
+	(*ToClient_TokenUpdate)(nil),     // 15: gabriel_protocol.v1.ToClient.TokenUpdate
+	(*FromEngine_Register)(nil),      // 16: gabriel_protocol.v1.FromEngine.Register
+	(*ToEngine_ClientSession)(nil),   // 17: gabriel_protocol.v1.ToEngine.ClientSession
+	(*anypb.Any)(nil),                // 18: google.protobuf.Any
 }
 var file_gabriel_protocol_v1_gabriel_proto_depIdxs = []int32{
 	0,  // 0: gabriel_protocol.v1.InputFrame.payload_type:type_name -> gabriel_protocol.v1.PayloadType
-	15, // 1: gabriel_protocol.v1.InputFrame.any_payload:type_name -> google.protobuf.Any
-	9,  // 2: gabriel_protocol.v1.FromClient.input:type_name -> gabriel_protocol.v1.FromClient.Input
-	10, // 3: gabriel_protocol.v1.FromClient.registration:type_name -> gabriel_protocol.v1.FromClient.Registration
+	18, // 1: gabriel_protocol.v1.InputFrame.any_payload:type_name -> google.protobuf.Any
+	10, // 2: gabriel_protocol.v1.FromClient.input:type_name -> gabriel_protocol.v1.FromClient.Input
+	11, // 3: gabriel_protocol.v1.FromClient.registration:type_name -> gabriel_protocol.v1.FromClient.Registration
 	1,  // 4: gabriel_protocol.v1.Status.code:type_name -> gabriel_protocol.v1.StatusCode
 	4,  // 5: gabriel_protocol.v1.Result.status:type_name -> gabriel_protocol.v1.Status
-	15, // 6: gabriel_protocol.v1.Result.any_result:type_name -> google.protobuf.Any
-	11, // 7: gabriel_protocol.v1.ToClient.registered:type_name -> gabriel_protocol.v1.ToClient.Registered
-	13, // 8: gabriel_protocol.v1.ToClient.result_wrapper:type_name -> gabriel_protocol.v1.ToClient.ResultWrapper
-	12, // 9: gabriel_protocol.v1.ToClient.engine_ids_update:type_name -> gabriel_protocol.v1.ToClient.EngineIdsUpdate
-	14, // 10: gabriel_protocol.v1.FromEngine.register:type_name -> gabriel_protocol.v1.FromEngine.Register
-	5,  // 11: gabriel_protocol.v1.FromEngine.result:type_name -> gabriel_protocol.v1.Result
-	2,  // 12: gabriel_protocol.v1.ToEngine.input_frame:type_name -> gabriel_protocol.v1.InputFrame
-	15, // 13: gabriel_protocol.v1.ToEngine.client_info:type_name -> google.protobuf.Any
-	2,  // 14: gabriel_protocol.v1.FromClient.Input.input_frame:type_name -> gabriel_protocol.v1.InputFrame
-	15, // 15: gabriel_protocol.v1.FromClient.Registration.client_info:type_name -> google.protobuf.Any
-	5,  // 16: gabriel_protocol.v1.ToClient.ResultWrapper.result:type_name -> gabriel_protocol.v1.Result
-	3,  // 17: gabriel_protocol.v1.GabrielClientService.ClientSession:input_type -> gabriel_protocol.v1.FromClient
-	7,  // 18: gabriel_protocol.v1.GabrielEngineService.EngineSession:input_type -> gabriel_protocol.v1.FromEngine
-	6,  // 19: gabriel_protocol.v1.GabrielClientService.ClientSession:output_type -> gabriel_protocol.v1.ToClient
-	8,  // 20: gabriel_protocol.v1.GabrielEngineService.EngineSession:output_type -> gabriel_protocol.v1.ToEngine
-	19, // [19:21] is the sub-list for method output_type
-	17, // [17:19] is the sub-list for method input_type
-	17, // [17:17] is the sub-list for extension type_name
-	17, // [17:17] is the sub-list for extension extendee
-	0,  // [0:17] is the sub-list for field type_name
+	18, // 6: gabriel_protocol.v1.Result.any_result:type_name -> google.protobuf.Any
+	12, // 7: gabriel_protocol.v1.ToClient.registered:type_name -> gabriel_protocol.v1.ToClient.Registered
+	14, // 8: gabriel_protocol.v1.ToClient.result_wrapper:type_name -> gabriel_protocol.v1.ToClient.ResultWrapper
+	13, // 9: gabriel_protocol.v1.ToClient.engine_ids_update:type_name -> gabriel_protocol.v1.ToClient.EngineIdsUpdate
+	15, // 10: gabriel_protocol.v1.ToClient.token_update:type_name -> gabriel_protocol.v1.ToClient.TokenUpdate
+	16, // 11: gabriel_protocol.v1.FromEngine.register:type_name -> gabriel_protocol.v1.FromEngine.Register
+	5,  // 12: gabriel_protocol.v1.FromEngine.result:type_name -> gabriel_protocol.v1.Result
+	9,  // 13: gabriel_protocol.v1.FromEngine.trace:type_name -> gabriel_protocol.v1.Trace
+	2,  // 14: gabriel_protocol.v1.ToEngine.input_frame:type_name -> gabriel_protocol.v1.InputFrame
+	17, // 15: gabriel_protocol.v1.ToEngine.client_session_opened:type_name -> gabriel_protocol.v1.ToEngine.ClientSession
+	18, // 16: gabriel_protocol.v1.ToEngine.client_info:type_name -> google.protobuf.Any
+	2,  // 17: gabriel_protocol.v1.FromClient.Input.input_frame:type_name -> gabriel_protocol.v1.InputFrame
+	9,  // 18: gabriel_protocol.v1.FromClient.Input.trace:type_name -> gabriel_protocol.v1.Trace
+	18, // 19: gabriel_protocol.v1.FromClient.Registration.client_info:type_name -> google.protobuf.Any
+	5,  // 20: gabriel_protocol.v1.ToClient.ResultWrapper.result:type_name -> gabriel_protocol.v1.Result
+	9,  // 21: gabriel_protocol.v1.ToClient.ResultWrapper.trace:type_name -> gabriel_protocol.v1.Trace
+	18, // 22: gabriel_protocol.v1.ToEngine.ClientSession.client_info:type_name -> google.protobuf.Any
+	3,  // 23: gabriel_protocol.v1.GabrielClientService.ClientSession:input_type -> gabriel_protocol.v1.FromClient
+	7,  // 24: gabriel_protocol.v1.GabrielEngineService.EngineSession:input_type -> gabriel_protocol.v1.FromEngine
+	6,  // 25: gabriel_protocol.v1.GabrielClientService.ClientSession:output_type -> gabriel_protocol.v1.ToClient
+	8,  // 26: gabriel_protocol.v1.GabrielEngineService.EngineSession:output_type -> gabriel_protocol.v1.ToEngine
+	25, // [25:27] is the sub-list for method output_type
+	23, // [23:25] is the sub-list for method input_type
+	23, // [23:23] is the sub-list for extension type_name
+	23, // [23:23] is the sub-list for extension extendee
+	0,  // [0:23] is the sub-list for field type_name
 }
 
 func init() { file_gabriel_protocol_v1_gabriel_proto_init() }
@@ -1303,6 +1903,7 @@ func file_gabriel_protocol_v1_gabriel_proto_init() {
 		(*ToClient_Registered_)(nil),
 		(*ToClient_ResultWrapper_)(nil),
 		(*ToClient_EngineIdsUpdate_)(nil),
+		(*ToClient_TokenUpdate_)(nil),
 	}
 	file_gabriel_protocol_v1_gabriel_proto_msgTypes[5].OneofWrappers = []any{
 		(*FromEngine_Register_)(nil),
@@ -1310,6 +1911,9 @@ func file_gabriel_protocol_v1_gabriel_proto_init() {
 	}
 	file_gabriel_protocol_v1_gabriel_proto_msgTypes[6].OneofWrappers = []any{
 		(*ToEngine_InputFrame)(nil),
+		(*ToEngine_ClientSessionOpened)(nil),
+		(*ToEngine_ClientSessionClosed)(nil),
+		(*ToEngine_CancelInput)(nil),
 	}
 	type x struct{}
 	out := protoimpl.TypeBuilder{
@@ -1317,7 +1921,7 @@ func file_gabriel_protocol_v1_gabriel_proto_init() {
 			GoPackagePath: reflect.TypeOf(x{}).PkgPath(),
 			RawDescriptor: unsafe.Slice(unsafe.StringData(file_gabriel_protocol_v1_gabriel_proto_rawDesc), len(file_gabriel_protocol_v1_gabriel_proto_rawDesc)),
 			NumEnums:      2,
-			NumMessages:   13,
+			NumMessages:   16,
 			NumExtensions: 0,
 			NumServices:   2,
 		},
@@ -0,0 +1,143 @@
+"""Wire framing that keeps input payloads opaque to the Gabriel server.
+
+Shared by both the server and client packages. A client normally sends each
+input as a serialized FromClient, which the server has to parse in full,
+payload included, only to read the routing fields of the input. With split
+framing, a client instead sends a small FromClient header, without an
+input_frame, followed by the serialized InputFrame:
+
+    SPLIT_INPUT_MARKER | varint header length | header | InputFrame
+
+The server parses only the header, and forwards the InputFrame bytes to
+engines without decoding or re-encoding them. A serialized FromClient never
+starts with SPLIT_INPUT_MARKER, since field number zero is invalid in
+protobuf, so both framings can be used on the same connection.
+"""
+
+from typing import Optional, Union
+
+from google.protobuf.message import DecodeError
+
+from gabriel_protocol.v1 import gabriel_pb2
+
+SPLIT_INPUT_MARKER = b"\x00"
+
+# The tag of ToEngine.input_frame: field number 1, length-delimited
+_TO_ENGINE_INPUT_FRAME_TAG = b"\x0a"
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _encode_varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _decode_varint(data: memoryview, pos: int) -> tuple[int, int]:
+    """Return the varint at data[pos] and the position after it."""
+    value = 0
+    shift = 0
+    while pos < len(data) and shift < 64:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    raise DecodeError("Truncated or invalid varint in split input")
+
+
+def encode_split_input(
+    header: gabriel_pb2.FromClient, input_frame: Buffer
+) -> bytes:
+    """Frame an input with split framing.
+
+    Args:
+        header: The FromClient carrying the input's routing fields, with no
+            input_frame set.
+        input_frame: The serialized InputFrame of the input.
+    """
+    header_bytes = header.SerializeToString()
+    return b"".join(
+        [
+            SPLIT_INPUT_MARKER,
+            _encode_varint(len(header_bytes)),
+            header_bytes,
+            input_frame,
+        ]
+    )
+
+
+def decode_from_client(
+    data: Buffer,
+) -> tuple[gabriel_pb2.FromClient, Optional[memoryview]]:
+    """Parse a message sent by a client, in either framing.
+
+    Returns the FromClient and, for a split input, a view of the serialized
+    InputFrame that follows the header, which shares memory with data. The
+    view is None for a FromClient sent in full.
+
+    Raises DecodeError if the message cannot be parsed.
+    """
+    from_client = gabriel_pb2.FromClient()
+    if data[:1] != SPLIT_INPUT_MARKER:
+        from_client.ParseFromString(data)
+        return from_client, None
+
+    view = memoryview(data)
+    header_length, header_start = _decode_varint(view, 1)
+    header_end = header_start + header_length
+    if header_end > len(view):
+        raise DecodeError("Split input header is truncated")
+    from_client.ParseFromString(view[header_start:header_end])
+    if from_client.WhichOneof("message_type") != "input":
+        raise DecodeError("Split input header does not carry an input")
+    return from_client, view[header_end:]
+
+
+def encode_to_engine(
+    input_frame: Buffer, to_engine: gabriel_pb2.ToEngine
+) -> bytes:
+    """Serialize a ToEngine around an already serialized InputFrame.
+
+    Produces the same bytes as setting to_engine.input_frame and serializing
+    to_engine, without parsing input_frame or copying it more than once.
+
+    Args:
+        input_frame: The serialized InputFrame to send to the engine.
+        to_engine: The other fields of the ToEngine, with no input_frame.
+    """
+    return b"".join(
+        [
+            _TO_ENGINE_INPUT_FRAME_TAG,
+            _encode_varint(len(input_frame)),
+            input_frame,
+            to_engine.SerializeToString(),
+        ]
+    )
+
+
+def decode_to_engine(data: Buffer) -> gabriel_pb2.ToEngine:
+    """Parse a ToEngine, even if its InputFrame is malformed.
+
+    The server forwards the InputFrame of a split input without parsing it,
+    so an engine is the first to parse it. If the InputFrame cannot be
+    parsed, the ToEngine is returned without it, so that the engine can
+    still return an error for the input.
+
+    Raises DecodeError if the rest of the ToEngine cannot be parsed.
+    """
+    try:
+        return gabriel_pb2.ToEngine.FromString(data)
+    except DecodeError:
+        view = memoryview(data)
+        if view[:1] != _TO_ENGINE_INPUT_FRAME_TAG:
+            raise
+        input_frame_length, input_frame_start = _decode_varint(view, 1)
+        return gabriel_pb2.ToEngine.FromString(
+            view[input_frame_start + input_frame_length :]
+        )
@@ -0,0 +1,240 @@
+"""Per-input stage tracing, shared by the server and client packages.
+
+A client can attach a Trace to an input. The client, the server and the
+engine each record monotonic timestamps in it as the input passes through
+them, and the Trace comes back to the client with the input's result. Each
+host's timestamps are taken by its own clock, so durations are only computed
+between timestamps taken by the same host. The network delays between hosts
+are the part of a round trip that the next host did not account for, and
+cannot be split into the uplink and downlink delays without synchronized
+clocks.
+"""
+
+import json
+import threading
+
+from gabriel_protocol.v1 import gabriel_pb2
+
+# The stages that a traced input passes through, as (name, host, start, end),
+# where start and end are the Trace fields of timestamps taken by the host
+STAGES = (
+    # The server checking the input and handing it to the engines
+    ("receive", "server", "server_receive_ns", "enqueue_ns"),
+    # The input waiting in its producer's queue for an engine
+    ("queue", "server", "enqueue_ns", "dispatch_ns"),
+    # The input waiting on the engine, for the engine to finish the previous
+    # inputs or to fill a batch
+    ("engine_wait", "engine", "engine_receive_ns", "handle_start_ns"),
+    # The engine's handle() or handle_batch()
+    ("handle", "engine", "handle_start_ns", "handle_end_ns"),
+    # The server returning the result to the client
+    ("result", "server", "engine_result_ns", "result_write_ns"),
+)
+
+# The round trip between the server and the engine, less the time that the
+# engine spent on the input
+ENGINE_NETWORK_STAGE = "engine_network"
+# The round trip between the client and the server, less the time that the
+# server spent on the input
+NETWORK_STAGE = "network"
+# The time the server spent on the input, from receiving it to writing its
+# result
+SERVER_STAGE = "server"
+
+_NS_PER_SECOND = 1e9
+_NS_PER_US = 1e3
+
+# The processes that spans are shown in, by Chrome trace process id
+_CLIENT_PID = 1
+_SERVER_PID = 2
+_ENGINE_PID = 3
+_PROCESS_NAMES = {
+    _CLIENT_PID: "client",
+    _SERVER_PID: "server",
+    _ENGINE_PID: "engine",
+}
+
+
+def _interval(trace, start, end):
+    """Return the nanoseconds from start to end, or None if either is unset."""
+    start_ns = getattr(trace, start)
+    end_ns = getattr(trace, end)
+    if not start_ns or not end_ns:
+        return None
+    return end_ns - start_ns
+
+
+def stage_durations(trace: gabriel_pb2.Trace) -> dict[str, float]:
+    """Return the duration in seconds of each stage recorded in a Trace.
+
+    Stages whose timestamps were not both recorded are left out.
+    """
+    durations = {}
+    for name, _, start, end in STAGES:
+        interval = _interval(trace, start, end)
+        if interval is not None:
+            durations[name] = interval / _NS_PER_SECOND
+
+    engine_round_trip = _interval(trace, "dispatch_ns", "engine_result_ns")
+    engine_time = _interval(trace, "engine_receive_ns", "handle_end_ns")
+    if engine_round_trip is not None and engine_time is not None:
+        durations[ENGINE_NETWORK_STAGE] = (
+            engine_round_trip - engine_time
+        ) / _NS_PER_SECOND
+
+    round_trip = _interval(trace, "client_send_ns", "client_receive_ns")
+    server_time = _interval(trace, "server_receive_ns", "result_write_ns")
+    if server_time is not None:
+        durations[SERVER_STAGE] = server_time / _NS_PER_SECOND
+        if round_trip is not None:
+            durations[NETWORK_STAGE] = (
+                round_trip - server_time
+            ) / _NS_PER_SECOND
+    return durations
+
+
+def chrome_trace_events(
+    trace: gabriel_pb2.Trace, producer_id: str, frame_id: int
+) -> list[dict]:
+    """Return Chrome trace events for a complete Trace.
+
+    The spans are placed on the client's clock. The server's and the
+    engine's clocks are aligned by assuming that each network delay is the
+    same in both directions, so the uplink and downlink spans are estimates.
+    Each input is shown in its own thread, named after its frame id.
+
+    Returns no events if the Trace was not recorded by all three hosts.
+    """
+    round_trip = _interval(trace, "client_send_ns", "client_receive_ns")
+    server_time = _interval(trace, "server_receive_ns", "result_write_ns")
+    engine_round_trip = _interval(trace, "dispatch_ns", "engine_result_ns")
+    engine_time = _interval(trace, "engine_receive_ns", "handle_end_ns")
+    if None in (round_trip, server_time, engine_round_trip, engine_time):
+        return []
+
+    # The offsets to add to the server's and the engine's timestamps to put
+    # them on the client's clock
+    server_offset = (
+        trace.client_send_ns
+        + (round_trip - server_time) / 2
+        - trace.server_receive_ns
+    )
+    engine_offset = (
+        trace.dispatch_ns
+        + (engine_round_trip - engine_time) / 2
+        - trace.engine_receive_ns
+        + server_offset
+    )
+
+    args = {"producer_id": producer_id, "frame_id": frame_id}
+    events = []
+
+    def add_span(name, pid, start_ns, end_ns):
+        events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "pid": pid,
+                "tid": frame_id,
+                "ts": start_ns / _NS_PER_US,
+                "dur": max(end_ns - start_ns, 0) / _NS_PER_US,
+                "args": args,
+            }
+        )
+
+    add_span(
+        "round_trip",
+        _CLIENT_PID,
+        trace.client_send_ns,
+        trace.client_receive_ns,
+    )
+    add_span(
+        "uplink",
+        _CLIENT_PID,
+        trace.client_send_ns,
+        trace.server_receive_ns + server_offset,
+    )
+    add_span(
+        "downlink",
+        _CLIENT_PID,
+        trace.result_write_ns + server_offset,
+        trace.client_receive_ns,
+    )
+    for name, host, start, end in STAGES:
+        if _interval(trace, start, end) is None:
+            continue
+        if host == "engine":
+            pid, offset = _ENGINE_PID, engine_offset
+        else:
+            pid, offset = _SERVER_PID, server_offset
+        add_span(
+            name,
+            pid,
+            getattr(trace, start) + offset,
+            getattr(trace, end) + offset,
+        )
+    add_span(
+        "engine",
+        _SERVER_PID,
+        trace.dispatch_ns + server_offset,
+        trace.engine_result_ns + server_offset,
+    )
+    return events
+
+
+class ChromeTraceWriter:
+    """Writes traced inputs to a file in the Chrome trace event format.
+
+    The file is a JSON array of events, which can be opened in Perfetto or
+    chrome://tracing. Events are appended as inputs are written, and the
+    array is closed by :meth:`close`. The trace viewers also accept a file
+    whose array was never closed, such as one left by a process that was
+    killed.
+    """
+
+    def __init__(self, path: str):
+        """Open the trace file, replacing any existing file.
+
+        Args:
+            path (str): The path of the trace file
+        """
+        self._file = open(path, "w")  # noqa: SIM115
+        self._lock = threading.Lock()
+        self._file.write("[")
+        self._num_events = 0
+        for pid, name in _PROCESS_NAMES.items():
+            self._write_event(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": name},
+                }
+            )
+
+    def _write_event(self, event: dict) -> None:
+        if self._num_events:
+            self._file.write(",")
+        self._file.write("\n")
+        self._file.write(json.dumps(event))
+        self._num_events += 1
+
+    def write(
+        self, trace: gabriel_pb2.Trace, producer_id: str, frame_id: int
+    ) -> None:
+        """Append the spans of a complete Trace to the file."""
+        events = chrome_trace_events(trace, producer_id, frame_id)
+        with self._lock:
+            if self._file.closed:
+                return
+            for event in events:
+                self._write_event(event)
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the JSON array and the file."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write("\n]\n")
+            self._file.close()
@@ -25,7 +25,7 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import any_pb2 as google_dot_protobuf_dot_any__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n!gabriel_protocol/v1/gabriel.proto\x12\x13gabriel_protocol.v1\x1a\x19google/protobuf/any.proto\"\xe3\x01\n\nInputFrame\x12\x43\n\x0cpayload_type\x18\x01 \x01(\x0e\x32 .gabriel_protocol.v1.PayloadTypeR\x0bpayloadType\x12\'\n\x0estring_payload\x18\x02 \x01(\tH\x00R\rstringPayload\x12#\n\x0c\x62yte_payload\x18\x03 \x01(\x0cH\x00R\x0b\x62ytePayload\x12\x37\n\x0b\x61ny_payload\x18\x04 \x01(\x0b\x32\x14.google.protobuf.AnyH\x00R\nanyPayloadB\t\n\x07payload\"\xaa\x03\n\nFromClient\x12=\n\x05input\x18\x01 \x01(\x0b\x32%.gabriel_protocol.v1.FromClient.InputH\x00R\x05input\x12R\n\x0cregistration\x18\x02 \x01(\x0b\x32,.gabriel_protocol.v1.FromClient.RegistrationH\x00R\x0cregistration\x1a\xb1\x01\n\x05Input\x12\x19\n\x08\x66rame_id\x18\x01 \x01(\x03R\x07\x66rameId\x12\x1f\n\x0bproducer_id\x18\x02 \x01(\tR\nproducerId\x12*\n\x11target_engine_ids\x18\x03 \x03(\tR\x0ftargetEngineIds\x12@\n\x0binput_frame\x18\x04 \x01(\x0b\x32\x1f.gabriel_protocol.v1.InputFrameR\ninputFrame\x1a\x45\n\x0cRegistration\x12\x35\n\x0b\x63lient_info\x18\x01 \x01(\x0b\x32\x14.google.protobuf.AnyR\nclientInfoB\x0e\n\x0cmessage_type\"W\n\x06Status\x12\x33\n\x04\x63ode\x18\x01 \x01(\x0e\x32\x1f.gabriel_protocol.v1.StatusCodeR\x04\x63ode\x12\x18\n\x07message\x18\x02 \x01(\tR\x07message\"\x90\x02\n\x06Result\x12\x33\n\x06status\x18\x01 \x01(\x0b\x32\x1b.gabriel_protocol.v1.StatusR\x06status\x12%\n\rstring_result\x18\x02 \x01(\tH\x00R\x0cstringResult\x12#\n\x0c\x62ytes_result\x18\x03 \x01(\x0cH\x00R\x0b\x62ytesResult\x12\x35\n\nany_result\x18\x04 \x01(\x0b\x32\x14.google.protobuf.AnyH\x00R\tanyResult\x12(\n\x10target_engine_id\x18\x05 \x01(\tR\x0etargetEngineId\x12\x19\n\x08\x66rame_id\x18\x06 \x01(\x03R\x07\x66rameIdB\t\n\x07payload\"\xba\x04\n\x08ToClient\x12J\n\nregistered\x18\x01 \x01(\x0b\x32(.gabriel_protocol.v1.ToClient.RegisteredH\x00R\nregistered\x12T\n\x0eresult_wrapper\x18\x02 \x01(\x0b\x32+.gabriel_protocol.v1.ToClient.ResultWrapperH\x00R\rresultWrapper\x12[\n\x11\x65ngine_ids_update\x18\x03 \x01(\x0b\x32-.gabriel_protocol.v1.ToClient.EngineIdsUpdateH\x00R\x0f\x65ngineIdsUpdate\x1a\x62\n\nRegistered\x12\x35\n\x17num_tokens_per_producer\x18\x01 \x01(\x05R\x14numTokensPerProducer\x12\x1d\n\nengine_ids\x18\x02 \x03(\tR\tengineIds\x1a\x30\n\x0f\x45ngineIdsUpdate\x12\x1d\n\nengine_ids\x18\x01 \x03(\tR\tengineIds\x1a\x88\x01\n\rResultWrapper\x12\x1f\n\x0bproducer_id\x18\x01 \x01(\tR\nproducerId\x12!\n\x0creturn_token\x18\x02 \x01(\x08R\x0breturnToken\x12\x33\n\x06result\x18\x03 \x01(\x0b\x32\x1b.gabriel_protocol.v1.ResultR\x06resultB\x0e\n\x0cmessage_type\"\xfa\x01\n\nFromEngine\x12\x46\n\x08register\x18\x01 \x01(\x0b\x32(.gabriel_protocol.v1.FromEngine.RegisterH\x00R\x08register\x12\x35\n\x06result\x18\x02 \x01(\x0b\x32\x1b.gabriel_protocol.v1.ResultH\x00R\x06result\x1a]\n\x08Register\x12\x1b\n\tengine_id\x18\x01 \x01(\tR\x08\x65ngineId\x12\x34\n\x16\x61ll_responses_required\x18\x02 \x01(\x08R\x14\x61llResponsesRequiredB\x0e\n\x0cmessage_type\"\x95\x01\n\x08ToEngine\x12\x42\n\x0binput_frame\x18\x01 \x01(\x0b\x32\x1f.gabriel_protocol.v1.InputFrameH\x00R\ninputFrame\x12\x35\n\x0b\x63lient_info\x18\x02 \x01(\x0b\x32\x14.google.protobuf.AnyR\nclientInfoB\x0e\n\x0cmessage_type*a\n\x0bPayloadType\x12\x1c\n\x18PAYLOAD_TYPE_UNSPECIFIED\x10\x00\x12\x08\n\x04TEXT\x10\x01\x12\t\n\x05IMAGE\x10\x02\x12\t\n\x05\x41UDIO\x10\x03\x12\t\n\x05VIDEO\x10\x04\x12\t\n\x05OTHER\x10\x64*\xb9\x01\n\nStatusCode\x12\x1b\n\x17STATUS_CODE_UNSPECIFIED\x10\x00\x12\x0b\n\x07SUCCESS\x10\x01\x12\x15\n\x11UNSPECIFIED_ERROR\x10\x02\x12\x10\n\x0c\x45NGINE_ERROR\x10\x03\x12\x16\n\x12WRONG_INPUT_FORMAT\x10\x04\x12\x17\n\x13NO_ENGINE_FOR_INPUT\x10\x05\x12\r\n\tNO_TOKENS\x10\x06\x12\x18\n\x14SERVER_DROPPED_FRAME\x10\x07\x32k\n\x14GabrielClientService\x12S\n\rClientSession\x12\x1f.gabriel_protocol.v1.FromClient\x1a\x1d.gabriel_protocol.v1.ToClient(\x01\x30\x01\x32k\n\x14GabrielEngineService\x12S\n\rEngineSession\x12\x1f.gabriel_protocol.v1.FromEngine\x1a\x1d.gabriel_protocol.v1.ToEngine(\x01\x30\x01\x42\x36Z4github.com/cmusatyalab/gabriel/protocol/go;gabrielpbb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n!gabriel_protocol/v1/gabriel.proto\x12\x13gabriel_protocol.v1\x1a\x19google/protobuf/any.proto\"\xe3\x01\n\nInputFrame\x12\x43\n\x0cpayload_type\x18\x01 \x01(\x0e\x32 .gabriel_protocol.v1.PayloadTypeR\x0bpayloadType\x12\'\n\x0estring_payload\x18\x02 \x01(\tH\x00R\rstringPayload\x12#\n\x0c\x62yte_payload\x18\x03 \x01(\x0cH\x00R\x0b\x62ytePayload\x12\x37\n\x0b\x61ny_payload\x18\x04 \x01(\x0b\x32\x14.google.protobuf.AnyH\x00R\nanyPayloadB\t\n\x07payload\"\xd6\x04\n\nFromClient\x12=\n\x05input\x18\x01 \x01(\x0b\x32%.gabriel_protocol.v1.FromClient.InputH\x00R\x05input\x12R\n\x0cregistration\x18\x02 \x01(\x0b\x32,.gabriel_protocol.v1.FromClient.RegistrationH\x00R\x0cregistration\x1a\xdd\x02\n\x05Input\x12\x19\n\x08\x66rame_id\x18\x01 \x01(\x03R\x07\x66rameId\x12\x1f\n\x0bproducer_id\x18\x02 \x01(\tR\nproducerId\x12*\n\x11target_engine_ids\x18\x03 \x03(\tR\x0ftargetEngineIds\x12@\n\x0binput_frame\x18\x04 \x01(\x0b\x32\x1f.gabriel_protocol.v1.InputFrameR\ninputFrame\x12&\n\x0f\x63\x61pture_time_us\x18\x05 \x01(\x03R\rcaptureTimeUs\x12\x1c\n\nmax_age_ms\x18\x06 \x01(\rR\x08maxAgeMs\x12\x1a\n\x08priority\x18\x07 \x01(\rR\x08priority\x12\x16\n\x06weight\x18\x08 \x01(\rR\x06weight\x12\x30\n\x05trace\x18\t \x01(\x0b\x32\x1a.gabriel_protocol.v1.TraceR\x05trace\x1a\x45\n\x0cRegistration\x12\x35\n\x0b\x63lient_info\x18\x01 \x01(\x0b\x32\x14.google.protobuf.AnyR\nclientInfoB\x0e\n\x0cmessage_type\"W\n\x06Status\x12\x33\n\x04\x63ode\x18\x01 \x01(\x0e\x32\x1f.gabriel_protocol.v1.StatusCodeR\x04\x63ode\x12\x18\n\x07message\x18\x02 \x01(\tR\x07message\"\x90\x02\n\x06Result\x12\x33\n\x06status\x18\x01 \x01(\x0b\x32\x1b.gabriel_protocol.v1.StatusR\x06status\x12%\n\rstring_result\x18\x02 \x01(\tH\x00R\x0cstringResult\x12#\n\x0c\x62ytes_result\x18\x03 \x01(\x0cH\x00R\x0b\x62ytesResult\x12\x35\n\nany_result\x18\x04 \x01(\x0b\x32\x14.google.protobuf.AnyH\x00R\tanyResult\x12(\n\x10target_engine_id\x18\x05 \x01(\tR\x0etargetEngineId\x12\x19\n\x08\x66rame_id\x18\x06 \x01(\x03R\x07\x66rameIdB\t\n\x07payload\"\x8b\x06\n\x08ToClient\x12J\n\nregistered\x18\x01 \x01(\x0b\x32(.gabriel_protocol.v1.ToClient.RegisteredH\x00R\nregistered\x12T\n\x0eresult_wrapper\x18\x02 \x01(\x0b\x32+.gabriel_protocol.v1.ToClient.ResultWrapperH\x00R\rresultWrapper\x12[\n\x11\x65ngine_ids_update\x18\x03 \x01(\x0b\x32-.gabriel_protocol.v1.ToClient.EngineIdsUpdateH\x00R\x0f\x65ngineIdsUpdate\x12N\n\x0ctoken_update\x18\x04 \x01(\x0b\x32).gabriel_protocol.v1.ToClient.TokenUpdateH\x00R\x0btokenUpdate\x1a\x62\n\nRegistered\x12\x35\n\x17num_tokens_per_producer\x18\x01 \x01(\x05R\x14numTokensPerProducer\x12\x1d\n\nengine_ids\x18\x02 \x03(\tR\tengineIds\x1a\x30\n\x0f\x45ngineIdsUpdate\x12\x1d\n\nengine_ids\x18\x01 \x03(\tR\tengineIds\x1a\xba\x01\n\rResultWrapper\x12\x1f\n\x0bproducer_id\x18\x01 \x01(\tR\nproducerId\x12!\n\x0creturn_token\x18\x02 \x01(\x08R\x0breturnToken\x12\x33\n\x06result\x18\x03 \x01(\x0b\x32\x1b.gabriel_protocol.v1.ResultR\x06result\x12\x30\n\x05trace\x18\x04 \x01(\x0b\x32\x1a.gabriel_protocol.v1.TraceR\x05trace\x1aM\n\x0bTokenUpdate\x12\x1f\n\x0bproducer_id\x18\x01 \x01(\tR\nproducerId\x12\x1d\n\nnum_tokens\x18\x02 \x01(\x05R\tnumTokensB\x0e\n\x0cmessage_type\"\xbd\x04\n\nFromEngine\x12\x46\n\x08register\x18\x01 \x01(\x0b\x32(.gabriel_protocol.v1.FromEngine.RegisterH\x00R\x08register\x12\x35\n\x06result\x18\x02 \x01(\x0b\x32\x1b.gabriel_protocol.v1.ResultH\x00R\x06result\x12\x19\n\x08\x66rame_id\x18\x03 \x01(\x03R\x07\x66rameId\x12\x1f\n\x0bproducer_id\x18\x04 \x01(\tR\nproducerId\x12\x30\n\x05trace\x18\x05 \x01(\x0b\x32\x1a.gabriel_protocol.v1.TraceR\x05trace\x1a\xb1\x02\n\x08Register\x12\x1b\n\tengine_id\x18\x01 \x01(\tR\x08\x65ngineId\x12\x34\n\x16\x61ll_responses_required\x18\x02 \x01(\x08R\x14\x61llResponsesRequired\x12$\n\x0emax_batch_size\x18\x03 \x01(\rR\x0cmaxBatchSize\x12%\n\x0epipeline_depth\x18\x04 \x01(\rR\rpipelineDepth\x12\x33\n\x16\x63lient_info_cache_size\x18\x05 \x01(\rR\x13\x63lientInfoCacheSize\x12\'\n\x10max_input_age_ms\x18\x06 \x01(\rR\rmaxInputAgeMs\x12\'\n\x0fsupports_cancel\x18\x07 \x01(\x08R\x0esupportsCancelB\x0e\n\x0cmessage_type\"\xbb\x04\n\x08ToEngine\x12\x42\n\x0binput_frame\x18\x01 \x01(\x0b\x32\x1f.gabriel_protocol.v1.InputFrameH\x00R\ninputFrame\x12\x61\n\x15\x63lient_session_opened\x18\x06 \x01(\x0b\x32+.gabriel_protocol.v1.ToEngine.ClientSessionH\x00R\x13\x63lientSessionOpened\x12\x34\n\x15\x63lient_session_closed\x18\x07 \x01(\x04H\x00R\x13\x63lientSessionClosed\x12#\n\x0c\x63\x61ncel_input\x18\t \x01(\x08H\x00R\x0b\x63\x61ncelInput\x12\x35\n\x0b\x63lient_info\x18\x02 \x01(\x0b\x32\x14.google.protobuf.AnyR\nclientInfo\x12\x19\n\x08\x66rame_id\x18\x03 \x01(\x03R\x07\x66rameId\x12\x1f\n\x0bproducer_id\x18\x04 \x01(\tR\nproducerId\x12%\n\x0esession_handle\x18\x05 \x01(\x04R\rsessionHandle\x12\x14\n\x05trace\x18\x08 \x01(\x08R\x05trace\x1am\n\rClientSession\x12%\n\x0esession_handle\x18\x01 \x01(\x04R\rsessionHandle\x12\x35\n\x0b\x63lient_info\x18\x02 \x01(\x0b\x32\x14.google.protobuf.AnyR\nclientInfoB\x0e\n\x0cmessage_type\"\x8f\x03\n\x05Trace\x12$\n\x0e\x63lient_send_ns\x18\x01 \x01(\x03R\x0c\x63lientSendNs\x12*\n\x11server_receive_ns\x18\x02 \x01(\x03R\x0fserverReceiveNs\x12\x1d\n\nenqueue_ns\x18\x03 \x01(\x03R\tenqueueNs\x12\x1f\n\x0b\x64ispatch_ns\x18\x04 \x01(\x03R\ndispatchNs\x12*\n\x11\x65ngine_receive_ns\x18\x05 \x01(\x03R\x0f\x65ngineReceiveNs\x12&\n\x0fhandle_start_ns\x18\x06 \x01(\x03R\rhandleStartNs\x12\"\n\rhandle_end_ns\x18\x07 \x01(\x03R\x0bhandleEndNs\x12(\n\x10\x65ngine_result_ns\x18\x08 \x01(\x03R\x0e\x65ngineResultNs\x12&\n\x0fresult_write_ns\x18\t \x01(\x03R\rresultWriteNs\x12*\n\x11\x63lient_receive_ns\x18\n \x01(\x03R\x0f\x63lientReceiveNs*a\n\x0bPayloadType\x12\x1c\n\x18PAYLOAD_TYPE_UNSPECIFIED\x10\x00\x12\x08\n\x04TEXT\x10\x01\x12\t\n\x05IMAGE\x10\x02\x12\t\n\x05\x41UDIO\x10\x03\x12\t\n\x05VIDEO\x10\x04\x12\t\n\x05OTHER\x10\x64*\xfb\x01\n\nStatusCode\x12\x1b\n\x17STATUS_CODE_UNSPECIFIED\x10\x00\x12\x0b\n\x07SUCCESS\x10\x01\x12\x15\n\x11UNSPECIFIED_ERROR\x10\x02\x12\x10\n\x0c\x45NGINE_ERROR\x10\x03\x12\x16\n\x12WRONG_INPUT_FORMAT\x10\x04\x12\x17\n\x13NO_ENGINE_FOR_INPUT\x10\x05\x12\r\n\tNO_TOKENS\x10\x06\x12\x18\n\x14SERVER_DROPPED_FRAME\x10\x07\x12\x18\n\x14SERVER_EVICTED_FRAME\x10\x08\x12\x11\n\rFRAME_EXPIRED\x10\t\x12\x13\n\x0fINPUT_CANCELLED\x10\n2k\n\x14GabrielClientService\x12S\n\rClientSession\x12\x1f.gabriel_protocol.v1.FromClient\x1a\x1d.gabriel_protocol.v1.ToClient(\x01\x30\x01\x32k\n\x14GabrielEngineService\x12S\n\rEngineSession\x12\x1f.gabriel_protocol.v1.FromEngine\x1a\x1d.gabriel_protocol.v1.ToEngine(\x01\x30\x01\x42\x36Z4github.com/cmusatyalab/gabriel/protocol/go;gabrielpbb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -33,38 +33,44 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'gabriel_protocol.v1.gabriel
 if not _descriptor._USE_C_DESCRIPTORS:
   _globals['DESCRIPTOR']._loaded_options = None
   _globals['DESCRIPTOR']._serialized_options = b'Z4github.com/cmusatyalab/gabriel/protocol/go;gabrielpb'
-  _globals['_PAYLOADTYPE']._serialized_start=2086
-  _globals['_PAYLOADTYPE']._serialized_end=2183
-  _globals['_STATUSCODE']._serialized_start=2186
-  _globals['_STATUSCODE']._serialized_end=2371
+  _globals['_PAYLOADTYPE']._serialized_start=3614
+  _globals['_PAYLOADTYPE']._serialized_end=3711
+  _globals['_STATUSCODE']._serialized_start=3714
+  _globals['_STATUSCODE']._serialized_end=3965
   _globals['_INPUTFRAME']._serialized_start=86
   _globals['_INPUTFRAME']._serialized_end=313
   _globals['_FROMCLIENT']._serialized_start=316
-  _globals['_FROMCLIENT']._serialized_end=742
+  _globals['_FROMCLIENT']._serialized_end=914
   _globals['_FROMCLIENT_INPUT']._serialized_start=478
-  _globals['_FROMCLIENT_INPUT']._serialized_end=655
-  _globals['_FROMCLIENT_REGISTRATION']._serialized_start=657
-  _globals['_FROMCLIENT_REGISTRATION']._serialized_end=726
-  _globals['_STATUS']._serialized_start=744
-  _globals['_STATUS']._serialized_end=831
-  _globals['_RESULT']._serialized_start=834
-  _globals['_RESULT']._serialized_end=1106
-  _globals['_TOCLIENT']._serialized_start=1109
-  _globals['_TOCLIENT']._serialized_end=1679
-  _globals['_TOCLIENT_REGISTERED']._serialized_start=1376
-  _globals['_TOCLIENT_REGISTERED']._serialized_end=1474
-  _globals['_TOCLIENT_ENGINEIDSUPDATE']._serialized_start=1476
-  _globals['_TOCLIENT_ENGINEIDSUPDATE']._serialized_end=1524
-  _globals['_TOCLIENT_RESULTWRAPPER']._serialized_start=1527
-  _globals['_TOCLIENT_RESULTWRAPPER']._serialized_end=1663
-  _globals['_FROMENGINE']._serialized_start=1682
-  _globals['_FROMENGINE']._serialized_end=1932
-  _globals['_FROMENGINE_REGISTER']._serialized_start=1823
-  _globals['_FROMENGINE_REGISTER']._serialized_end=1916
-  _globals['_TOENGINE']._serialized_start=1935
-  _globals['_TOENGINE']._serialized_end=2084
-  _globals['_GABRIELCLIENTSERVICE']._serialized_start=2373
-  _globals['_GABRIELCLIENTSERVICE']._serialized_end=2480
-  _globals['_GABRIELENGINESERVICE']._serialized_start=2482
-  _globals['_GABRIELENGINESERVICE']._serialized_end=2589
+  _globals['_FROMCLIENT_INPUT']._serialized_end=827
+  _globals['_FROMCLIENT_REGISTRATION']._serialized_start=829
+  _globals['_FROMCLIENT_REGISTRATION']._serialized_end=898
+  _globals['_STATUS']._serialized_start=916
+  _globals['_STATUS']._serialized_end=1003
+  _globals['_RESULT']._serialized_start=1006
+  _globals['_RESULT']._serialized_end=1278
+  _globals['_TOCLIENT']._serialized_start=1281
+  _globals['_TOCLIENT']._serialized_end=2060
+  _globals['_TOCLIENT_REGISTERED']._serialized_start=1628
+  _globals['_TOCLIENT_REGISTERED']._serialized_end=1726
+  _globals['_TOCLIENT_ENGINEIDSUPDATE']._serialized_start=1728
+  _globals['_TOCLIENT_ENGINEIDSUPDATE']._serialized_end=1776
+  _globals['_TOCLIENT_RESULTWRAPPER']._serialized_start=1779
+  _globals['_TOCLIENT_RESULTWRAPPER']._serialized_end=1965
+  _globals['_TOCLIENT_TOKENUPDATE']._serialized_start=1967
+  _globals['_TOCLIENT_TOKENUPDATE']._serialized_end=2044
+  _globals['_FROMENGINE']._serialized_start=2063
+  _globals['_FROMENGINE']._serialized_end=2636
+  _globals['_FROMENGINE_REGISTER']._serialized_start=2315
+  _globals['_FROMENGINE_REGISTER']._serialized_end=2620
+  _globals['_TOENGINE']._serialized_start=2639
+  _globals['_TOENGINE']._serialized_end=3210
+  _globals['_TOENGINE_CLIENTSESSION']._serialized_start=3085
+  _globals['_TOENGINE_CLIENTSESSION']._serialized_end=3194
+  _globals['_TRACE']._serialized_start=3213
+  _globals['_TRACE']._serialized_end=3612
+  _globals['_GABRIELCLIENTSERVICE']._serialized_start=3967
+  _globals['_GABRIELCLIENTSERVICE']._serialized_end=4074
+  _globals['_GABRIELENGINESERVICE']._serialized_start=4076
+  _globals['_GABRIELENGINESERVICE']._serialized_end=4183
 # @@protoc_insertion_point(module_scope)
@@ -27,6 +27,9 @@ class StatusCode(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
     NO_ENGINE_FOR_INPUT: _ClassVar[StatusCode]
     NO_TOKENS: _ClassVar[StatusCode]
     SERVER_DROPPED_FRAME: _ClassVar[StatusCode]
+    SERVER_EVICTED_FRAME: _ClassVar[StatusCode]
+    FRAME_EXPIRED: _ClassVar[StatusCode]
+    INPUT_CANCELLED: _ClassVar[StatusCode]
 PAYLOAD_TYPE_UNSPECIFIED: PayloadType
 TEXT: PayloadType
 IMAGE: PayloadType
@@ -41,6 +44,9 @@ WRONG_INPUT_FORMAT: StatusCode
 NO_ENGINE_FOR_INPUT: StatusCode
 NO_TOKENS: StatusCode
 SERVER_DROPPED_FRAME: StatusCode
+SERVER_EVICTED_FRAME: StatusCode
+FRAME_EXPIRED: StatusCode
+INPUT_CANCELLED: StatusCode
 
 class InputFrame(_message.Message):
     __slots__ = ("payload_type", "string_payload", "byte_payload", "any_payload")
@@ -57,16 +63,26 @@ class InputFrame(_message.Message):
 class FromClient(_message.Message):
     __slots__ = ("input", "registration")
     class Input(_message.Message):
-        __slots__ = ("frame_id", "producer_id", "target_engine_ids", "input_frame")
+        __slots__ = ("frame_id", "producer_id", "target_engine_ids", "input_frame", "capture_time_us", "max_age_ms", "priority", "weight", "trace")
         FRAME_ID_FIELD_NUMBER: _ClassVar[int]
         PRODUCER_ID_FIELD_NUMBER: _ClassVar[int]
         TARGET_ENGINE_IDS_FIELD_NUMBER: _ClassVar[int]
         INPUT_FRAME_FIELD_NUMBER: _ClassVar[int]
+        CAPTURE_TIME_US_FIELD_NUMBER: _ClassVar[int]
+        MAX_AGE_MS_FIELD_NUMBER: _ClassVar[int]
+        PRIORITY_FIELD_NUMBER: _ClassVar[int]
+        WEIGHT_FIELD_NUMBER: _ClassVar[int]
+        TRACE_FIELD_NUMBER: _ClassVar[int]
         frame_id: int
         producer_id: str
         target_engine_ids: _containers.RepeatedScalarFieldContainer[str]
         input_frame: InputFrame
-        def __init__(self, frame_id: _Optional[int] = ..., producer_id: _Optional[str] = ..., target_engine_ids: _Optional[_Iterable[str]] = ..., input_frame: _Optional[_Union[InputFrame, _Mapping]] = ...) -> None: ...
+        capture_time_us: int
+        max_age_ms: int
+        priority: int
+        weight: int
+        trace: Trace
+        def __init__(self, frame_id: _Optional[int] = ..., producer_id: _Optional[str] = ..., target_engine_ids: _Optional[_Iterable[str]] = ..., input_frame: _Optional[_Union[InputFrame, _Mapping]] = ..., capture_time_us: _Optional[int] = ..., max_age_ms: _Optional[int] = ..., priority: _Optional[int] = ..., weight: _Optional[int] = ..., trace: _Optional[_Union[Trace, _Mapping]] = ...) -> None: ...
     class Registration(_message.Message):
         __slots__ = ("client_info",)
         CLIENT_INFO_FIELD_NUMBER: _ClassVar[int]
@@ -103,7 +119,7 @@ class Result(_message.Message):
     def __init__(self, status: _Optional[_Union[Status, _Mapping]] = ..., string_result: _Optional[str] = ..., bytes_result: _Optional[bytes] = ..., any_result: _Optional[_Union[_any_pb2.Any, _Mapping]] = ..., target_engine_id: _Optional[str] = ..., frame_id: _Optional[int] = ...) -> None: ...
 
 class ToClient(_message.Message):
-    __slots__ = ("registered", "result_wrapper", "engine_ids_update")
+    __slots__ = ("registered", "result_wrapper", "engine_ids_update", "token_update")
     class Registered(_message.Message):
         __slots__ = ("num_tokens_per_producer", "engine_ids")
         NUM_TOKENS_PER_PRODUCER_FIELD_NUMBER: _ClassVar[int]
@@ -117,41 +133,113 @@ class ToClient(_message.Message):
         engine_ids: _containers.RepeatedScalarFieldContainer[str]
         def __init__(self, engine_ids: _Optional[_Iterable[str]] = ...) -> None: ...
     class ResultWrapper(_message.Message):
-        __slots__ = ("producer_id", "return_token", "result")
+        __slots__ = ("producer_id", "return_token", "result", "trace")
         PRODUCER_ID_FIELD_NUMBER: _ClassVar[int]
         RETURN_TOKEN_FIELD_NUMBER: _ClassVar[int]
         RESULT_FIELD_NUMBER: _ClassVar[int]
+        TRACE_FIELD_NUMBER: _ClassVar[int]
         producer_id: str
         return_token: bool
         result: Result
-        def __init__(self, producer_id: _Optional[str] = ..., return_token: _Optional[bool] = ..., result: _Optional[_Union[Result, _Mapping]] = ...) -> None: ...
+        trace: Trace
+        def __init__(self, producer_id: _Optional[str] = ..., return_token: _Optional[bool] = ..., result: _Optional[_Union[Result, _Mapping]] = ..., trace: _Optional[_Union[Trace, _Mapping]] = ...) -> None: ...
+    class TokenUpdate(_message.Message):
+        __slots__ = ("producer_id", "num_tokens")
+        PRODUCER_ID_FIELD_NUMBER: _ClassVar[int]
+        NUM_TOKENS_FIELD_NUMBER: _ClassVar[int]
+        producer_id: str
+        num_tokens: int
+        def __init__(self, producer_id: _Optional[str] = ..., num_tokens: _Optional[int] = ...) -> None: ...
     REGISTERED_FIELD_NUMBER: _ClassVar[int]
     RESULT_WRAPPER_FIELD_NUMBER: _ClassVar[int]
     ENGINE_IDS_UPDATE_FIELD_NUMBER: _ClassVar[int]
+    TOKEN_UPDATE_FIELD_NUMBER: _ClassVar[int]
     registered: ToClient.Registered
     result_wrapper: ToClient.ResultWrapper
     engine_ids_update: ToClient.EngineIdsUpdate
-    def __init__(self, registered: _Optional[_Union[ToClient.Registered, _Mapping]] = ..., result_wrapper: _Optional[_Union[ToClient.ResultWrapper, _Mapping]] = ..., engine_ids_update: _Optional[_Union[ToClient.EngineIdsUpdate, _Mapping]] = ...) -> None: ...
+    token_update: ToClient.TokenUpdate
+    def __init__(self, registered: _Optional[_Union[ToClient.Registered, _Mapping]] = ..., result_wrapper: _Optional[_Union[ToClient.ResultWrapper, _Mapping]] = ..., engine_ids_update: _Optional[_Union[ToClient.EngineIdsUpdate, _Mapping]] = ..., token_update: _Optional[_Union[ToClient.TokenUpdate, _Mapping]] = ...) -> None: ...
 
 class FromEngine(_message.Message):
-    __slots__ = ("register", "result")
+    __slots__ = ("register", "result", "frame_id", "producer_id", "trace")
     class Register(_message.Message):
-        __slots__ = ("engine_id", "all_responses_required")
+        __slots__ = ("engine_id", "all_responses_required", "max_batch_size", "pipeline_depth", "client_info_cache_size", "max_input_age_ms", "supports_cancel")
         ENGINE_ID_FIELD_NUMBER: _ClassVar[int]
         ALL_RESPONSES_REQUIRED_FIELD_NUMBER: _ClassVar[int]
+        MAX_BATCH_SIZE_FIELD_NUMBER: _ClassVar[int]
+        PIPELINE_DEPTH_FIELD_NUMBER: _ClassVar[int]
+        CLIENT_INFO_CACHE_SIZE_FIELD_NUMBER: _ClassVar[int]
+        MAX_INPUT_AGE_MS_FIELD_NUMBER: _ClassVar[int]
+        SUPPORTS_CANCEL_FIELD_NUMBER: _ClassVar[int]
         engine_id: str
         all_responses_required: bool
-        def __init__(self, engine_id: _Optional[str] = ..., all_responses_required: _Optional[bool] = ...) -> None: ...
+        max_batch_size: int
+        pipeline_depth: int
+        client_info_cache_size: int
+        max_input_age_ms: int
+        supports_cancel: bool
+        def __init__(self, engine_id: _Optional[str] = ..., all_responses_required: _Optional[bool] = ..., max_batch_size: _Optional[int] = ..., pipeline_depth: _Optional[int] = ..., client_info_cache_size: _Optional[int] = ..., max_input_age_ms: _Optional[int] = ..., supports_cancel: _Optional[bool] = ...) -> None: ...
     REGISTER_FIELD_NUMBER: _ClassVar[int]
     RESULT_FIELD_NUMBER: _ClassVar[int]
+    FRAME_ID_FIELD_NUMBER: _ClassVar[int]
+    PRODUCER_ID_FIELD_NUMBER: _ClassVar[int]
+    TRACE_FIELD_NUMBER: _ClassVar[int]
     register: FromEngine.Register
     result: Result
-    def __init__(self, register: _Optional[_Union[FromEngine.Register, _Mapping]] = ..., result: _Optional[_Union[Result, _Mapping]] = ...) -> None: ...
+    frame_id: int
+    producer_id: str
+    trace: Trace
+    def __init__(self, register: _Optional[_Union[FromEngine.Register, _Mapping]] = ..., result: _Optional[_Union[Result, _Mapping]] = ..., frame_id: _Optional[int] = ..., producer_id: _Optional[str] = ..., trace: _Optional[_Union[Trace, _Mapping]] = ...) -> None: ...
 
 class ToEngine(_message.Message):
-    __slots__ = ("input_frame", "client_info")
+    __slots__ = ("input_frame", "client_session_opened", "client_session_closed", "cancel_input", "client_info", "frame_id", "producer_id", "session_handle", "trace")
+    class ClientSession(_message.Message):
+        __slots__ = ("session_handle", "client_info")
+        SESSION_HANDLE_FIELD_NUMBER: _ClassVar[int]
+        CLIENT_INFO_FIELD_NUMBER: _ClassVar[int]
+        session_handle: int
+        client_info: _any_pb2.Any
+        def __init__(self, session_handle: _Optional[int] = ..., client_info: _Optional[_Union[_any_pb2.Any, _Mapping]] = ...) -> None: ...
     INPUT_FRAME_FIELD_NUMBER: _ClassVar[int]
+    CLIENT_SESSION_OPENED_FIELD_NUMBER: _ClassVar[int]
+    CLIENT_SESSION_CLOSED_FIELD_NUMBER: _ClassVar[int]
+    CANCEL_INPUT_FIELD_NUMBER: _ClassVar[int]
     CLIENT_INFO_FIELD_NUMBER: _ClassVar[int]
+    FRAME_ID_FIELD_NUMBER: _ClassVar[int]
+    PRODUCER_ID_FIELD_NUMBER: _ClassVar[int]
+    SESSION_HANDLE_FIELD_NUMBER: _ClassVar[int]
+    TRACE_FIELD_NUMBER: _ClassVar[int]
     input_frame: InputFrame
+    client_session_opened: ToEngine.ClientSession
+    client_session_closed: int
+    cancel_input: bool
     client_info: _any_pb2.Any
-    def __init__(self, input_frame: _Optional[_Union[InputFrame, _Mapping]] = ..., client_info: _Optional[_Union[_any_pb2.Any, _Mapping]] = ...) -> None: ...
+    frame_id: int
+    producer_id: str
+    session_handle: int
+    trace: bool
+    def __init__(self, input_frame: _Optional[_Union[InputFrame, _Mapping]] = ..., client_session_opened: _Optional[_Union[ToEngine.ClientSession, _Mapping]] = ..., client_session_closed: _Optional[int] = ..., cancel_input: _Optional[bool] = ..., client_info: _Optional[_Union[_any_pb2.Any, _Mapping]] = ..., frame_id: _Optional[int] = ..., producer_id: _Optional[str] = ..., session_handle: _Optional[int] = ..., trace: _Optional[bool] = ...) -> None: ...
+
+class Trace(_message.Message):
+    __slots__ = ("client_send_ns", "server_receive_ns", "enqueue_ns", "dispatch_ns", "engine_receive_ns", "handle_start_ns", "handle_end_ns", "engine_result_ns", "result_write_ns", "client_receive_ns")
+    CLIENT_SEND_NS_FIELD_NUMBER: _ClassVar[int]
+    SERVER_RECEIVE_NS_FIELD_NUMBER: _ClassVar[int]
+    ENQUEUE_NS_FIELD_NUMBER: _ClassVar[int]
+    DISPATCH_NS_FIELD_NUMBER: _ClassVar[int]
+    ENGINE_RECEIVE_NS_FIELD_NUMBER: _ClassVar[int]
+    HANDLE_START_NS_FIELD_NUMBER: _ClassVar[int]
+    HANDLE_END_NS_FIELD_NUMBER: _ClassVar[int]
+    ENGINE_RESULT_NS_FIELD_NUMBER: _ClassVar[int]
+    RESULT_WRITE_NS_FIELD_NUMBER: _ClassVar[int]
+    CLIENT_RECEIVE_NS_FIELD_NUMBER: _ClassVar[int]
+    client_send_ns: int
+    server_receive_ns: int
+    enqueue_ns: int
+    dispatch_ns: int
+    engine_receive_ns: int
+    handle_start_ns: int
+    handle_end_ns: int
+    engine_result_ns: int
+    result_write_ns: int
+    client_receive_ns: int
+    def __init__(self, client_send_ns: _Optional[int] = ..., server_receive_ns: _Optional[int] = ..., enqueue_ns: _Optional[int] = ..., dispatch_ns: _Optional[int] = ..., engine_receive_ns: _Optional[int] = ..., handle_start_ns: _Optional[int] = ..., handle_end_ns: _Optional[int] = ..., engine_result_ns: _Optional[int] = ..., result_write_ns: _Optional[int] = ..., client_receive_ns: _Optional[int] = ...) -> None: ...
@@ -0,0 +1,250 @@
+"""Early discard of frames on the client, before they are sent.
+
+An EarlyDiscard runs a chain of filters on each frame that a producer
+produces, and drops the frames that any of them rejects, so that frames
+that would not tell an engine anything new cost neither uplink bandwidth
+nor engine time. A frame that is dropped does not use up a token: the
+producer is run again for the next frame.
+
+Each frame is converted once to a small grayscale image that all of the
+filters share, and the filters are computed on it with vectorized NumPy
+operations. Filters that compare a frame with the previous ones compare it
+with the frames that were kept, so that a scene that changes slowly is
+still sent once it has changed enough.
+"""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Sequence
+from typing import Optional
+
+import cv2
+import numpy as np
+from gabriel_protocol.v1.gabriel_pb2 import InputFrame, PayloadType
+
+# The size of the grayscale image that filters are computed on
+DEFAULT_ANALYSIS_SIZE = (160, 120)
+
+# The side of the image that a perceptual hash is computed from, and of the
+# block of its lowest frequencies that make up the hash
+_HASH_IMAGE_SIZE = 32
+_HASH_SIZE = 8
+
+
+class FrameFilter(ABC):
+    """A filter that decides whether a frame is worth sending."""
+
+    # The name of the filter, used to label the frames it drops
+    name = "filter"
+
+    @abstractmethod
+    def keep(self, gray: np.ndarray) -> bool:
+        """Return whether to keep a frame.
+
+        Args:
+            gray (np.ndarray): The frame as a float32 grayscale image of
+                the EarlyDiscard's analysis size
+        """
+
+    def frame_kept(self, gray: np.ndarray) -> None:  # noqa: B027
+        """Update the filter's state with a frame that all filters kept.
+
+        Filters that do not compare frames with the previous ones do not
+        need to override this.
+        """
+
+
+class MotionFilter(FrameFilter):
+    """Drops frames that differ too little from the last frame kept.
+
+    The difference is the mean absolute difference of the pixels, from 0 to
+    255, which is low for a static scene even with sensor noise.
+    """
+
+    name = "motion"
+
+    def __init__(self, threshold: float = 2.0):
+        """Initialize the filter.
+
+        Args:
+            threshold (float): The mean absolute difference that a frame
+                must reach to be kept
+        """
+        self._threshold = threshold
+        self._last_kept = None
+
+    def keep(self, gray: np.ndarray) -> bool:
+        """Return whether the frame moved enough since the last one kept."""
+        if self._last_kept is None or self._last_kept.shape != gray.shape:
+            return True
+        return np.abs(gray - self._last_kept).mean() >= self._threshold
+
+    def frame_kept(self, gray: np.ndarray) -> None:
+        """Compare the next frames with this one."""
+        self._last_kept = gray
+
+
+class SharpnessFilter(FrameFilter):
+    """Drops blurry frames, such as those taken while the camera moved.
+
+    Sharpness is measured as the variance of the image's Laplacian, which is
+    low when the image has few edges.
+    """
+
+    name = "sharpness"
+
+    def __init__(self, threshold: float = 50.0):
+        """Initialize the filter.
+
+        Args:
+            threshold (float): The variance of the Laplacian that a frame
+                must reach to be kept
+        """
+        self._threshold = threshold
+
+    def keep(self, gray: np.ndarray) -> bool:
+        """Return whether the frame is sharp enough."""
+        return sharpness(gray) >= self._threshold
+
+
+class DuplicateFilter(FrameFilter):
+    """Drops frames that look the same as one of the last frames kept.
+
+    Frames are compared by a 64-bit perceptual hash of their lowest spatial
+    frequencies, which changes little with noise, compression and small
+    changes in brightness.
+    """
+
+    name = "duplicate"
+
+    def __init__(self, max_distance: int = 4, history: int = 1):
+        """Initialize the filter.
+
+        Args:
+            max_distance (int): The largest number of bits that the hash of
+                a duplicate can differ from a kept frame's by
+            history (int): The number of the last frames kept to compare
+                frames with
+        """
+        self._max_distance = max_distance
+        self._hashes = deque(maxlen=history)
+        # The hash of the last frame checked, which is kept if all of the
+        # filters keep the frame
+        self._last_hash = None
+
+    def keep(self, gray: np.ndarray) -> bool:
+        """Return whether the frame is unlike the last frames kept."""
+        self._last_hash = perceptual_hash(gray)
+        return all(
+            np.count_nonzero(self._last_hash != kept_hash) > self._max_distance
+            for kept_hash in self._hashes
+        )
+
+    def frame_kept(self, gray: np.ndarray) -> None:
+        """Compare the next frames with this one."""
+        self._hashes.append(self._last_hash)
+
+
+def sharpness(gray: np.ndarray) -> float:
+    """Return the variance of the Laplacian of a grayscale image."""
+    laplacian = (
+        gray[:-2, 1:-1]
+        + gray[2:, 1:-1]
+        + gray[1:-1, :-2]
+        + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def _dct_matrix(n):
+    """Return the matrix of the orthonormal DCT-II of size n."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(_HASH_IMAGE_SIZE)
+
+
+def perceptual_hash(gray: np.ndarray) -> np.ndarray:
+    """Return the 64-bit perceptual hash of a grayscale image, as booleans.
+
+    The bits say which of the lowest frequencies of the image's discrete
+    cosine transform, other than its mean, are above their median.
+    """
+    small = cv2.resize(
+        gray,
+        (_HASH_IMAGE_SIZE, _HASH_IMAGE_SIZE),
+        interpolation=cv2.INTER_AREA,
+    )
+    frequencies = (_DCT @ small @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE]
+    frequencies = frequencies.reshape(-1)[1:]
+    return frequencies > np.median(frequencies)
+
+
+class EarlyDiscard:
+    """A chain of filters that a frame must pass to be sent.
+
+    Filters are run in order, and a frame is dropped by the first filter
+    that rejects it. The filters keep state about the frames that passed, so
+    an EarlyDiscard must only be used for the frames of one producer.
+    """
+
+    def __init__(
+        self,
+        filters: Sequence[FrameFilter],
+        analysis_size: tuple[int, int] = DEFAULT_ANALYSIS_SIZE,
+    ):
+        """Initialize the chain of filters.
+
+        Args:
+            filters (Sequence[FrameFilter]): The filters to run, in order
+            analysis_size (tuple[int, int]): The (width, height) of the
+                grayscale image that the filters are computed on
+        """
+        self._filters = list(filters)
+        self._analysis_size = analysis_size
+
+    def check(self, image: np.ndarray) -> Optional[str]:
+        """Run the filters on a BGR or grayscale image.
+
+        Returns:
+            The name of the filter that dropped the frame, or None if the
+            frame passed all of the filters
+        """
+        small = cv2.resize(
+            image, self._analysis_size, interpolation=cv2.INTER_AREA
+        )
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = small.astype(np.float32)
+        for frame_filter in self._filters:
+            if not frame_filter.keep(gray):
+                return frame_filter.name
+        for frame_filter in self._filters:
+            frame_filter.frame_kept(gray)
+        return None
+
+    def check_input(self, input_frame: InputFrame) -> Optional[str]:
+        """Run the filters on an encoded image input.
+
+        The image is decoded in grayscale and, where the format allows it,
+        at a reduced size. Inputs that are not images always pass.
+
+        Returns:
+            The name of the filter that dropped the frame, or None if the
+            frame passed all of the filters
+        """
+        if (
+            input_frame.payload_type != PayloadType.IMAGE
+            or not input_frame.byte_payload
+        ):
+            return None
+        np_data = np.frombuffer(input_frame.byte_payload, dtype=np.uint8)
+        image = cv2.imdecode(np_data, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if image is None:
+            return None
+        return self.check(image)
@@ -1,18 +1,37 @@
 """Abstract base class for a Gabriel client and related classes."""
 
 import asyncio
+import enum
+import inspect
 import logging
+import random
 import threading
 import time
 import uuid
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from collections.abc import Callable, Coroutine, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional, Union
 
-from gabriel_protocol.v1.gabriel_pb2 import FromClient, InputFrame, ToClient
+from gabriel_protocol.framing import encode_split_input
+from gabriel_protocol.tracing import (
+    NETWORK_STAGE,
+    SERVER_STAGE,
+    ChromeTraceWriter,
+    stage_durations,
+)
+from gabriel_protocol.v1.gabriel_pb2 import (
+    FromClient,
+    InputFrame,
+    StatusCode,
+    ToClient,
+)
 from google.protobuf.any_pb2 import Any as ProtoAny
 from prometheus_client import Counter, Gauge, Histogram
 
+from gabriel_client.early_discard import EarlyDiscard
+
 logger = logging.getLogger(__name__)
 
 # Default time to wait for a Registered acknowledgement before retrying the
@@ -20,6 +39,17 @@ logger = logging.getLogger(__name__)
 # registration_retry_interval_seconds constructor argument.
 DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS = 2
 
+# Default bounds on the inputs that the client waits for results for, used
+# unless overridden via the max_pending_inputs and
+# pending_input_timeout_seconds constructor arguments.
+DEFAULT_MAX_PENDING_INPUTS = 4096
+DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS = 30
+
+# Time that a prefetching producer waits before it is run again after it
+# produced no frame, so that a producer with nothing to send, such as a
+# camera between frames, does not keep the event loop busy
+PREFETCH_RETRY_INTERVAL_SECONDS = 0.005
+
 PRODUCER_TOKEN_COUNT = Gauge(
     "gabriel_producer_token_count",
     "Number of tokens remaining at each producer",
@@ -35,9 +65,51 @@ CLIENT_INPUTS_SENT_TOTAL = Counter(
 CLIENT_INPUT_PROCESSING_LATENCY = Histogram(
     "gabriel_client_input_processing_latency_seconds",
     "End-to-end client input processing latency",
+    ["producer_id", "engine_id", "status"],
+)
+
+CLIENT_PENDING_INPUTS_EXPIRED_TOTAL = Counter(
+    "gabriel_client_pending_inputs_expired_total",
+    "Total number of inputs sent that no result was received for",
+    ["producer_id", "reason"],
+)
+
+PRODUCER_TOKEN_WAIT_SECONDS = Histogram(
+    "gabriel_producer_token_wait_seconds",
+    "Time that a producer waited for a token before sending an input",
+    ["producer_id"],
+)
+
+PRODUCER_PREFETCHED_FRAMES_TOTAL = Counter(
+    "gabriel_producer_prefetched_frames_total",
+    "Total number of frames produced ahead of a token by a producer",
     ["producer_id"],
 )
 
+PRODUCER_PREFETCHED_FRAMES_DROPPED_TOTAL = Counter(
+    "gabriel_producer_prefetched_frames_dropped_total",
+    "Total number of frames produced ahead of a token that were not sent",
+    ["producer_id", "reason"],
+)
+
+PRODUCER_FRAMES_DISCARDED_TOTAL = Counter(
+    "gabriel_producer_frames_discarded_total",
+    "Total number of frames dropped by a producer's early discard filters",
+    ["producer_id", "filter"],
+)
+
+CLIENT_RESULTS_DROPPED_TOTAL = Counter(
+    "gabriel_client_results_dropped_total",
+    "Total number of results dropped from a full consumer queue",
+    ["engine_id"],
+)
+
+CLIENT_STAGE_LATENCY = Histogram(
+    "gabriel_client_stage_latency_seconds",
+    "Time that traced inputs spent on the network and on the server",
+    ["producer_id", "stage"],
+)
+
 
 class InputProducer:
     """An input producer that produces inputs to send to the server.
@@ -55,6 +127,16 @@ class InputProducer:
     safely at any time, including while the producer is running and
     concurrently with each other; a change takes effect on the next iteration
     of the producer loop.
+
+    With ``prefetch``, the producer is run in the background rather than
+    after a token is acquired, and keeps the latest frame it produced until a
+    token is available. The capture and encoding of a frame then overlap with
+    the round trip of the previous one, at the cost of producing frames that
+    are never sent.
+
+    With ``early_discard``, frames that its filters drop are not sent, and
+    the producer is run again for the next frame without a token being used
+    up (see gabriel_client.early_discard).
     """
 
     def __init__(
@@ -62,6 +144,11 @@ class InputProducer:
         producer: Callable[[], Coroutine[Any, Any, InputFrame | None]],
         target_engine_ids: Iterable[str],
         producer_name: Union[str, None] = None,
+        max_age_ms: Union[int, None] = None,
+        priority: int = 0,
+        weight: int = 1,
+        prefetch: bool = False,
+        early_discard: Optional[EarlyDiscard] = None,
     ):
         """Initialize the input producer.
 
@@ -72,6 +159,32 @@ class InputProducer:
                 Target engine IDs for the input
             producer_name (str, optional):
                 The name of the producer producing the input
+            max_age_ms (int, optional):
+                How long after it is produced an input stops being useful,
+                in milliseconds. The server returns the token of an input
+                that is older than this instead of sending it to an engine.
+                Inputs are sent with the time they were produced, by this
+                host's clock, which should be synchronized with the
+                server's.
+            priority (int, optional):
+                The priority of this producer, for servers that schedule
+                engines by priority. Inputs from producers with a higher
+                priority are sent to engines first.
+            weight (int, optional):
+                The weight of this producer, for servers that share engines
+                fairly between producers. Each producer gets a share of an
+                engine in proportion to its weight.
+            prefetch (bool, optional):
+                Whether to run the producer in the background and send the
+                latest frame it produced as soon as a token is available.
+                A frame that is not sent before the next one is produced is
+                dropped. The producer should wait for its source to have a
+                new frame, such as the next frame from a camera, since it is
+                run continuously.
+            early_discard (EarlyDiscard, optional):
+                Filters that image frames must pass to be sent. They are
+                run on a worker thread, on a grayscale decoding of the
+                frame.
         """
         self._running = threading.Event()
         self._running.set()
@@ -84,7 +197,21 @@ class InputProducer:
             if producer_name
             else str(uuid.uuid4())
         )
+        self.max_age_ms = max_age_ms
+        self.priority = priority
+        self.weight = weight
+        # When the last input was produced, in microseconds since the Unix
+        # epoch
+        self._capture_time_us = 0
         self._loop = None
+        self._prefetch = prefetch
+        self._prefetch_task = None
+        # The latest frame produced in the background and when it was
+        # produced, or None if it was sent or there is no frame yet
+        self._prefetched = None
+        self._prefetch_error = None
+        self._prefetched_event = asyncio.Event()
+        self._early_discard = early_discard
 
     async def produce(self) -> InputFrame | None:
         """Invoke the producer to generate input.
@@ -96,9 +223,129 @@ class InputProducer:
             raise Exception(
                 f"Producer {self.producer_name} called when not running"
             )
-        res = await self._producer()
+        if self._prefetch:
+            return await self._take_prefetched()
+        while True:
+            res = await self._producer()
+            capture_time_us = time.time_ns() // 1000
+            if res is None or not await self._is_discarded(res):
+                break
+            if not self._running.is_set():
+                return None
+        self._capture_time_us = capture_time_us
         return res
 
+    async def _is_discarded(self, input_frame: InputFrame) -> bool:
+        """Run the early discard filters on a frame, off the event loop."""
+        if self._early_discard is None:
+            return False
+        filter_name = await asyncio.get_running_loop().run_in_executor(
+            None, self._early_discard.check_input, input_frame
+        )
+        if filter_name is None:
+            return False
+        self._count_discarded(filter_name)
+        return True
+
+    def _count_discarded(self, filter_name: str) -> None:
+        PRODUCER_FRAMES_DISCARDED_TOTAL.labels(
+            producer_id=self.producer_id, filter=filter_name
+        ).inc()
+
+    async def _take_prefetched(self) -> InputFrame:
+        """Return the latest frame produced in the background.
+
+        Starts producing frames in the background on the first call, and
+        waits for a frame if none was produced since the last call. A frame
+        that is older than max_age_ms is dropped.
+        """
+        if self._prefetch_task is None:
+            self._prefetch_task = asyncio.create_task(self._prefetch_loop())
+        while True:
+            await self._prefetched_event.wait()
+            self._prefetched_event.clear()
+            if self._prefetch_error is not None:
+                error = self._prefetch_error
+                self._prefetch_error = None
+                self._prefetch_task = None
+                raise error
+            input_frame, capture_time_us = self._prefetched
+            self._prefetched = None
+            if (
+                self.max_age_ms
+                and time.time_ns() // 1000 - capture_time_us
+                > self.max_age_ms * 1000
+            ):
+                self._count_dropped("expired")
+                continue
+            self._capture_time_us = capture_time_us
+            return input_frame
+
+    async def _prefetch_loop(self) -> None:
+        """Run the producer, keeping the latest frame it produced."""
+        try:
+            while True:
+                if not self._running.is_set():
+                    self._discard_prefetched()
+                    await self._wait_for_running()
+                input_frame = await self._producer()
+                if input_frame is None or not input_frame.ByteSize():
+                    await asyncio.sleep(PREFETCH_RETRY_INTERVAL_SECONDS)
+                    continue
+                capture_time_us = time.time_ns() // 1000
+                if await self._is_discarded(input_frame):
+                    continue
+                PRODUCER_PREFETCHED_FRAMES_TOTAL.labels(
+                    producer_id=self.producer_id
+                ).inc()
+                if self._prefetched is not None:
+                    self._count_dropped("replaced")
+                self._prefetched = (input_frame, capture_time_us)
+                self._prefetched_event.set()
+        except Exception as e:
+            logger.exception(f"Producer {self.producer_name} failed")
+            self._prefetch_error = e
+            self._prefetched_event.set()
+
+    def _count_dropped(self, reason: str) -> None:
+        PRODUCER_PREFETCHED_FRAMES_DROPPED_TOTAL.labels(
+            producer_id=self.producer_id, reason=reason
+        ).inc()
+
+    def _discard_prefetched(self) -> None:
+        """Drop the frame produced in the background, if it was not sent."""
+        if self._prefetched is not None:
+            self._prefetched = None
+            self._prefetched_event.clear()
+            self._count_dropped("stopped")
+
+    async def _stop_prefetching(self) -> None:
+        """Stop producing frames in the background.
+
+        Called when the client that sends this producer's frames stops.
+        Frames are produced in the background again on the next call to
+        :meth:`produce`.
+        """
+        if self._prefetch_task is None:
+            return
+        self._prefetch_task.cancel()
+        await asyncio.gather(self._prefetch_task, return_exceptions=True)
+        self._prefetch_task = None
+        self._discard_prefetched()
+
+    def _set_input_metadata(self, client_input: FromClient.Input) -> None:
+        """Set the deadline and scheduling fields of the last input produced.
+
+        The capture time and maximum age are not set if this producer's
+        inputs do not expire, so that the server measures their age by its
+        own clock.
+        """
+        if self.max_age_ms:
+            client_input.capture_time_us = self._capture_time_us
+            client_input.max_age_ms = self.max_age_ms
+        client_input.priority = self.priority
+        client_input.weight = self.weight
+
     def resume(self) -> None:
         """Resume the producer."""
         if self._running.is_set():
@@ -191,7 +438,8 @@ class _TokenPool:
     """A pool of tokens.
 
     Used to limit the number of in-flight requests for a particular
-    input source.
+    input source. The server can change the number of tokens in the pool
+    while inputs are in flight (see :meth:`resize`).
     """
 
     def __init__(self, num_tokens: int, producer_id: str):
@@ -202,17 +450,31 @@ class _TokenPool:
             producer_id (str): The producer identifier
 
         """
+        self._initial_tokens = num_tokens
         self._max_tokens = num_tokens
-        self._sem = asyncio.BoundedSemaphore(num_tokens)
+        self._sem = asyncio.Semaphore(num_tokens)
+        # The number of tokens that the pool has been shrunk by and that
+        # have not been taken out of it yet
+        self._tokens_owed = 0
         self._producer_id = producer_id
-        PRODUCER_TOKEN_COUNT.labels(producer_id=producer_id).set(
+        # When the current wait for a token started. Kept if the wait is
+        # cancelled, such as by a timeout, so that the time waited is
+        # recorded once a token is acquired.
+        self._wait_start = None
+        self._update_token_count()
+
+    def _update_token_count(self) -> None:
+        PRODUCER_TOKEN_COUNT.labels(producer_id=self._producer_id).set(
             self.get_remaining_tokens()
         )
 
     def return_token(self) -> None:
         """Return a token to the pool."""
-        PRODUCER_TOKEN_COUNT.labels(producer_id=self._producer_id).inc()
-        self._sem.release()
+        if self._tokens_owed > 0:
+            self._tokens_owed -= 1
+        else:
+            self._sem.release()
+        self._update_token_count()
 
     async def get_token(self) -> None:
         """Acquire a token from the pool.
@@ -220,26 +482,214 @@ class _TokenPool:
         Wait if necessary until a token is available.
         """
         logger.debug("Waiting for token")
+        if self._wait_start is None:
+            self._wait_start = time.monotonic()
         await self._sem.acquire()
-        PRODUCER_TOKEN_COUNT.labels(producer_id=self._producer_id).set(
-            self.get_remaining_tokens()
-        )
+        while self._tokens_owed > 0:
+            # Take the tokens that the pool has been shrunk by out of it
+            # first
+            self._tokens_owed -= 1
+            await self._sem.acquire()
+        PRODUCER_TOKEN_WAIT_SECONDS.labels(
+            producer_id=self._producer_id
+        ).observe(time.monotonic() - self._wait_start)
+        self._wait_start = None
+        self._update_token_count()
         logger.debug("Token acquired")
 
+    def resize(self, num_tokens: int) -> None:
+        """Change the number of tokens in the pool, including those in use.
+
+        Tokens added are available immediately. When the pool shrinks,
+        tokens are taken out of it as they become available, either by
+        :meth:`get_token` or by :meth:`return_token`, so inputs in flight
+        are not affected.
+        """
+        change = num_tokens - self._max_tokens
+        self._max_tokens = num_tokens
+        if change < 0:
+            self._tokens_owed -= change
+        else:
+            repaid = min(change, self._tokens_owed)
+            self._tokens_owed -= repaid
+            for _ in range(change - repaid):
+                self._sem.release()
+        self._update_token_count()
+
     def is_locked(self) -> bool:
-        """Check if the semaphore is locked."""
-        return self._sem.locked()
+        """Check if there are no tokens available."""
+        return self.get_remaining_tokens() == 0
 
     def reset_tokens(self) -> None:
-        """Reset the number of tokens in the pool to the max number."""
+        """Reset the pool to the number of tokens it was created with."""
+        self._max_tokens = self._initial_tokens
         self._sem = asyncio.Semaphore(self._max_tokens)
-        PRODUCER_TOKEN_COUNT.labels(producer_id=self._producer_id).set(
-            self.get_remaining_tokens()
-        )
+        self._tokens_owed = 0
+        self._update_token_count()
 
     def get_remaining_tokens(self) -> int:
         """Return the number of remaining tokens in the pool."""
-        return self._sem._value
+        return max(self._sem._value - self._tokens_owed, 0)
+
+
+class ConsumerMode(enum.Enum):
+    """How a client passes results to its consumer."""
+
+    # Call the consumer as each result is read, before reading the next
+    INLINE = "inline"
+    # Await the consumer, a coroutine function, in a task for each engine
+    ASYNC = "async"
+    # Call the consumer on a worker thread for each engine
+    EXECUTOR = "executor"
+
+
+class _ResultQueue:
+    """The results from one engine that are waiting for the consumer.
+
+    Results are passed to the consumer one at a time, in the order they
+    arrived. When the queue is full, the oldest result is dropped to make
+    room for the newest.
+    """
+
+    def __init__(
+        self,
+        engine_id: str,
+        maxsize: int,
+        consume: Callable[[Any], Coroutine],
+    ):
+        self._engine_id = engine_id
+        self._maxsize = maxsize
+        self._consume = consume
+        self._results = deque()
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def put(self, result) -> None:
+        """Queue a result, dropping the oldest one if the queue is full."""
+        if len(self._results) >= self._maxsize:
+            self._results.popleft()
+            CLIENT_RESULTS_DROPPED_TOTAL.labels(
+                engine_id=self._engine_id
+            ).inc()
+        self._results.append(result)
+        self._ready.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._ready.wait()
+            while self._results:
+                result = self._results.popleft()
+                try:
+                    await self._consume(result)
+                except Exception:
+                    logger.exception(
+                        f"Consumer failed on a result from engine "
+                        f"{self._engine_id}"
+                    )
+            self._ready.clear()
+
+    async def stop(self) -> None:
+        """Stop passing results to the consumer, dropping those queued."""
+        self._results.clear()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class _PendingInput:
+    """An input sent to the server that results are still expected for."""
+
+    def __init__(self, send_time: float, target_engine_ids: Iterable[str]):
+        self.send_time = send_time
+        # The engines that have not returned a result for the input yet
+        self.engine_ids = set(target_engine_ids)
+        self.answered = False
+
+
+class _LatencyTracker:
+    """Records the latency of each result, from the time its input was sent.
+
+    An input is tracked until every engine it targets has returned a result
+    for it. Engines may never return a result, such as those that an input
+    is fanned out to that the server does not need all responses from, or
+    when the connection is lost. So the tracker holds at most max_pending
+    inputs, and forgets inputs sent more than timeout seconds ago. Inputs
+    that are forgotten before any result was received for them are counted
+    by gabriel_client_pending_inputs_expired_total.
+    """
+
+    def __init__(self, max_pending: int, timeout: float):
+        self._max_pending = max_pending
+        self._timeout = timeout
+        # Mapping from (producer_id, frame_id) to the _PendingInput, in the
+        # order that the inputs were sent. frame_id alone isn't unique across
+        # producers, since each producer numbers its own frames starting at 1.
+        self._pending = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def sent(
+        self,
+        producer_id: str,
+        frame_id: int,
+        target_engine_ids: Iterable[str],
+    ) -> None:
+        """Start tracking an input that was just sent."""
+        now = time.monotonic()
+        self._expire(now)
+        while len(self._pending) >= self._max_pending:
+            self._forget("capacity")
+        self._pending[(producer_id, frame_id)] = _PendingInput(
+            now, target_engine_ids
+        )
+
+    def received(self, producer_id: str, result) -> None:
+        """Record the latency of a result from an engine, whatever its status.
+
+        Results for inputs that are no longer tracked are ignored.
+        """
+        key = (producer_id, result.frame_id)
+        pending_input = self._pending.get(key)
+        if pending_input is None:
+            return
+        CLIENT_INPUT_PROCESSING_LATENCY.labels(
+            producer_id=producer_id,
+            engine_id=result.target_engine_id,
+            status=StatusCode.Name(result.status.code),
+        ).observe(time.monotonic() - pending_input.send_time)
+        pending_input.answered = True
+        if result.target_engine_id:
+            pending_input.engine_ids.discard(result.target_engine_id)
+        else:
+            # The server rejected the input before sending it to any engine
+            pending_input.engine_ids.clear()
+        if not pending_input.engine_ids:
+            del self._pending[key]
+
+    def clear(self, reason: str) -> None:
+        """Forget all of the inputs, such as when the connection was lost."""
+        while self._pending:
+            self._forget(reason)
+
+    def _expire(self, now: float) -> None:
+        """Forget the inputs sent more than timeout seconds ago."""
+        while self._pending:
+            pending_input = next(iter(self._pending.values()))
+            if now - pending_input.send_time <= self._timeout:
+                return
+            self._forget("timeout")
+
+    def _forget(self, reason: str) -> None:
+        """Forget the input sent the longest time ago."""
+        (producer_id, _), pending_input = self._pending.popitem(last=False)
+        if not pending_input.answered:
+            CLIENT_PENDING_INPUTS_EXPIRED_TOTAL.labels(
+                producer_id=producer_id, reason=reason
+            ).inc()
 
 
 class GabrielClient(ABC):
@@ -252,6 +702,15 @@ class GabrielClient(ABC):
         registration_retry_interval_seconds: float = (
             DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS
         ),
+        split_framing: bool = False,
+        trace_sample_rate: float = 0,
+        trace_file: Optional[str] = None,
+        consumer_mode: Optional[ConsumerMode] = None,
+        result_queue_size: int = 1,
+        max_pending_inputs: int = DEFAULT_MAX_PENDING_INPUTS,
+        pending_input_timeout_seconds: float = (
+            DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS
+        ),
     ):
         """Initialize the Gabriel client.
 
@@ -265,7 +724,52 @@ class GabrielClient(ABC):
             registration_retry_interval_seconds (float):
                 How long to wait for a Registered acknowledgement before
                 retrying the Registration message.
+            split_framing (bool):
+                Whether to send inputs with split framing (see
+                gabriel_protocol.framing), so that the server forwards each
+                input's payload to engines without parsing or re-encoding
+                it. Requires a server that supports split framing.
+            trace_sample_rate (float):
+                The fraction of inputs, between 0 and 1, that carry a Trace
+                through the server and the engine (see
+                gabriel_protocol.tracing). The time that traced inputs
+                spend on the network and on the server is recorded in the
+                gabriel_client_stage_latency_seconds histogram, and the
+                server records the time they spend in each of its stages.
+            trace_file (str, optional):
+                Path of a file to write traced inputs to, in the Chrome
+                trace event format, to be opened in Perfetto or
+                chrome://tracing. The file is closed when the client stops.
+            consumer_mode (ConsumerMode, optional):
+                How results are passed to the consumer. With INLINE, the
+                consumer is called before the next message from the server
+                is read. With ASYNC (the default for a coroutine function
+                consumer) or EXECUTOR, results are queued for the consumer,
+                which runs in a task or on a worker thread while the client
+                keeps reading messages and returning tokens. Defaults to
+                ASYNC for a coroutine function and INLINE otherwise. A
+                coroutine function consumer can only be run with ASYNC.
+            result_queue_size (int):
+                The number of results from each engine that can wait for
+                an ASYNC or EXECUTOR consumer. When the queue is full, the
+                oldest result is dropped for the newest, and counted by
+                gabriel_client_results_dropped_total.
+            max_pending_inputs (int):
+                The number of inputs sent that the client keeps the send
+                time of, to record the latency of their results in the
+                gabriel_client_input_processing_latency_seconds histogram.
+                When there are more, the oldest input is forgotten.
+            pending_input_timeout_seconds (float):
+                How long after an input was sent the client stops waiting
+                for results for it. Results that arrive later are not
+                recorded in the latency histogram.
         """
+        if not 0 <= trace_sample_rate <= 1:
+            raise ValueError("trace_sample_rate must be between 0 and 1")
+        if result_queue_size < 1:
+            raise ValueError("result_queue_size must be at least 1")
+        if max_pending_inputs < 1:
+            raise ValueError("max_pending_inputs must be at least 1")
         self._running = True
         # Whether a Registered message has been received from the server
         self._registered_event = asyncio.Event()
@@ -279,15 +783,24 @@ class GabrielClient(ABC):
         self._num_tokens_per_producer = None
         # Mapping from source id to tokens
         self._tokens = {}
-        # Mapping from (producer_id, frame_id) to the timestamp at which the
-        # input was sent to the server. frame_id alone isn't unique across
-        # producers, since each producer numbers its own frames starting at 1.
-        self._pending_results = {}
+        self._latency_tracker = _LatencyTracker(
+            max_pending_inputs, pending_input_timeout_seconds
+        )
         self._prometheus_port = prometheus_port
         self._client_info = client_info
         self._registration_retry_interval_seconds = (
             registration_retry_interval_seconds
         )
+        self._split_framing = split_framing
+        self._trace_sample_rate = trace_sample_rate
+        self._trace_writer = (
+            ChromeTraceWriter(trace_file) if trace_file is not None else None
+        )
+        self._consumer_mode = consumer_mode
+        self._result_queue_size = result_queue_size
+        # Mapping from engine id to the results waiting for the consumer
+        self._result_queues = {}
+        self._consumer_executor = None
 
     def launch(self) -> None:
         """Launch the client synchronously.
@@ -325,6 +838,76 @@ class GabrielClient(ABC):
                 continue
         return self._running
 
+    async def _stop_background_tasks(self) -> None:
+        """Stop the producers' prefetching and the queued consumers.
+
+        Also closes the trace file, if any.
+        """
+        for producer in self.input_producers:
+            await producer._stop_prefetching()
+        for result_queue in self._result_queues.values():
+            await result_queue.stop()
+        self._result_queues.clear()
+        if self._consumer_executor is not None:
+            self._consumer_executor.shutdown(wait=False, cancel_futures=True)
+            self._consumer_executor = None
+        if self._trace_writer is not None:
+            self._trace_writer.close()
+
+    def _check_consumer_mode(self) -> None:
+        """Raise ValueError if the consumer can't run in its consumer mode.
+
+        Called by subclasses once they have set the consumer. A coroutine
+        function consumer must be awaited, which only ASYNC does.
+        """
+        if self._consumer_mode in (
+            ConsumerMode.INLINE,
+            ConsumerMode.EXECUTOR,
+        ) and inspect.iscoroutinefunction(self.consumer):
+            raise ValueError(
+                f"A coroutine function consumer can't be run with "
+                f"{self._consumer_mode}; use {ConsumerMode.ASYNC}"
+            )
+
+    def _get_consumer_mode(self) -> ConsumerMode:
+        if self._consumer_mode is not None:
+            return self._consumer_mode
+        if inspect.iscoroutinefunction(self.consumer):
+            return ConsumerMode.ASYNC
+        return ConsumerMode.INLINE
+
+    async def _run_consumer_in_executor(self, result) -> None:
+        if self._consumer_executor is None:
+            self._consumer_executor = ThreadPoolExecutor(
+                thread_name_prefix="gabriel-consumer"
+            )
+        await asyncio.get_running_loop().run_in_executor(
+            self._consumer_executor, self.consumer, result
+        )
+
+    def _consume(self, result) -> None:
+        """Pass a successful result to the consumer.
+
+        Only an INLINE consumer is called before this returns. Otherwise,
+        the result is queued for the consumer of its engine.
+        """
+        consumer_mode = self._get_consumer_mode()
+        if consumer_mode == ConsumerMode.INLINE:
+            self.consumer(result)
+            return
+        engine_id = result.target_engine_id
+        result_queue = self._result_queues.get(engine_id)
+        if result_queue is None:
+            if consumer_mode == ConsumerMode.ASYNC:
+                consume = self.consumer
+            else:
+                consume = self._run_consumer_in_executor
+            result_queue = _ResultQueue(
+                engine_id, self._result_queue_size, consume
+            )
+            self._result_queues[engine_id] = result_queue
+        result_queue.put(result)
+
     def _build_registration_message(self) -> FromClient:
         """Build this client's Registration message."""
         from_client = FromClient()
@@ -373,25 +956,84 @@ class GabrielClient(ABC):
             self._reregistration_needed.clear()
             self._registered_event.clear()
 
+    def _serialize_input(
+        self, from_client: FromClient, input_frame: InputFrame
+    ) -> bytes:
+        """Serialize an input to send to the server.
+
+        Args:
+            from_client (FromClient):
+                The input's routing fields, without its input_frame
+            input_frame (InputFrame): The input's payload
+        """
+        if self._split_framing:
+            return encode_split_input(
+                from_client, input_frame.SerializeToString()
+            )
+        from_client.input.input_frame.CopyFrom(input_frame)
+        return from_client.SerializeToString()
+
     def _record_send_metrics(self, from_client: FromClient) -> bool:
-        """Record metrics related to sending of input to server."""
+        """Record metrics related to sending of input to server.
+
+        Called just before the input is serialized, so that a Trace is
+        attached to the sampled inputs.
+        """
         producer_id = from_client.input.producer_id
         CLIENT_INPUTS_SENT_TOTAL.labels(producer_id=producer_id).inc()
 
-        frame_id = from_client.input.frame_id
-        self._pending_results[(producer_id, frame_id)] = time.monotonic()
+        self._latency_tracker.sent(
+            producer_id,
+            from_client.input.frame_id,
+            from_client.input.target_engine_ids,
+        )
+
+        if (
+            self._trace_sample_rate
+            and random.random() < self._trace_sample_rate
+        ):
+            from_client.input.trace.client_send_ns = time.monotonic_ns()
 
     def _record_response_latency(self, result_wrapper: ToClient.ResultWrapper):
-        """Record the response latency for input."""
+        """Record the response latency for input.
+
+        Called for every result, whatever its status, so that inputs that
+        the server dropped or failed on are not tracked until they expire.
+        """
+        if result_wrapper.HasField("trace"):
+            self._record_trace(result_wrapper)
+
+        self._latency_tracker.received(
+            result_wrapper.producer_id, result_wrapper.result
+        )
+
+    def _record_trace(self, result_wrapper: ToClient.ResultWrapper):
+        """Record the stages of a traced input, once its result arrives."""
+        trace = result_wrapper.trace
+        trace.client_receive_ns = time.monotonic_ns()
         producer_id = result_wrapper.producer_id
-        result = result_wrapper.result
-        frame_id = result.frame_id
+        durations = stage_durations(trace)
+        for stage in (NETWORK_STAGE, SERVER_STAGE):
+            if stage in durations:
+                CLIENT_STAGE_LATENCY.labels(
+                    producer_id=producer_id, stage=stage
+                ).observe(durations[stage])
+        if self._trace_writer is not None:
+            self._trace_writer.write(
+                trace, producer_id, result_wrapper.result.frame_id
+            )
 
-        send_time = self._pending_results.pop((producer_id, frame_id), None)
-        if send_time is None:
+    def _process_token_update(self, token_update: ToClient.TokenUpdate):
+        """Resize a producer's token pool to the number the server set."""
+        token_pool = self._tokens.get(token_update.producer_id)
+        if token_pool is None:
+            logger.warning(
+                "Token update for unknown producer: "
+                f"{token_update.producer_id}"
+            )
             return
-        latency = time.monotonic() - send_time
-
-        CLIENT_INPUT_PROCESSING_LATENCY.labels(
-            producer_id=producer_id
-        ).observe(latency)
+        logger.debug(
+            f"Producer {token_update.producer_id} now has "
+            f"{token_update.num_tokens} tokens"
+        )
+        token_pool.resize(token_update.num_tokens)
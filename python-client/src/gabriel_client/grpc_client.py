@@ -11,7 +11,10 @@ from gabriel_protocol.tls_utils import build_channel_credentials
 from gabriel_protocol.v1 import gabriel_pb2, gabriel_pb2_grpc
 
 from gabriel_client.gabriel_client import (
+    DEFAULT_MAX_PENDING_INPUTS,
+    DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS,
     DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS,
+    ConsumerMode,
     GabrielClient,
     InputProducer,
     _TokenPool,
@@ -29,6 +32,13 @@ _STREAM_ROLE_METADATA_KEY = "stream-role"
 _STREAM_ROLE_CONTROL = "control"
 _STREAM_ROLE_PRODUCER = "producer"
 
+# Producer streams are opened without a request serializer, so that inputs
+# can be written already serialized, in either framing
+_CLIENT_SERVICE_NAME = gabriel_pb2.DESCRIPTOR.services_by_name[
+    "GabrielClientService"
+].full_name
+_CLIENT_SESSION_METHOD = f"/{_CLIENT_SERVICE_NAME}/ClientSession"
+
 # Default time to wait before attempting to reconnect after being
 # disconnected from the server. Overridden with the reconnect_interval_seconds
 # constructor argument.
@@ -90,6 +100,15 @@ class GrpcClient(GabrielClient):
         registration_retry_interval_seconds: float = (
             DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS
         ),
+        split_framing: bool = False,
+        trace_sample_rate: float = 0,
+        trace_file: Optional[str] = None,
+        consumer_mode: Optional[ConsumerMode] = None,
+        result_queue_size: int = 1,
+        max_pending_inputs: int = DEFAULT_MAX_PENDING_INPUTS,
+        pending_input_timeout_seconds: float = (
+            DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS
+        ),
     ):
         """Initialize the client.
 
@@ -101,7 +120,8 @@ class GrpcClient(GabrielClient):
                 An iterable of instances of InputProducer for the inputs
                 produced by this client
             consumer (Callable[[gabriel_pb2.Result], None]):
-                Callback for results from server
+                Callback for results from server, or a coroutine function
+                that is awaited for each result
             prometheus_port (int):
                 Port for Prometheus metrics.
             tls_ca_cert (str, optional):
@@ -130,6 +150,28 @@ class GrpcClient(GabrielClient):
             registration_retry_interval_seconds (float):
                 How long to wait before retrying registration with the
                 server.
+            split_framing (bool):
+                Whether to send inputs with split framing, so that the
+                server forwards their payloads to engines without parsing
+                them.
+            trace_sample_rate (float):
+                The fraction of inputs to trace through the server and the
+                engine (see gabriel_protocol.tracing).
+            trace_file (str, optional):
+                If set, traced inputs are written to this file as Chrome
+                trace events.
+            consumer_mode (ConsumerMode, optional):
+                How results are passed to the consumer (see
+                GabrielClient).
+            result_queue_size (int):
+                The number of results from each engine that can wait for
+                a consumer that is not INLINE.
+            max_pending_inputs (int):
+                The number of inputs sent that the client keeps the send
+                time of, to record the latency of their results.
+            pending_input_timeout_seconds (float):
+                How long after an input was sent the client stops waiting
+                for results for it (see GabrielClient).
         """
         super().__init__(
             prometheus_port,
@@ -137,6 +179,13 @@ class GrpcClient(GabrielClient):
             registration_retry_interval_seconds=(
                 registration_retry_interval_seconds
             ),
+            split_framing=split_framing,
+            trace_sample_rate=trace_sample_rate,
+            trace_file=trace_file,
+            consumer_mode=consumer_mode,
+            result_queue_size=result_queue_size,
+            max_pending_inputs=max_pending_inputs,
+            pending_input_timeout_seconds=pending_input_timeout_seconds,
         )
         self._server_endpoint = server_endpoint
         self._credentials = build_channel_credentials(
@@ -147,6 +196,7 @@ class GrpcClient(GabrielClient):
 
         self.input_producers = set(input_producers)
         self.consumer = consumer
+        self._check_consumer_mode()
         # Whether the client is connected to the server
         self._connected = asyncio.Event()
         self._channel = None
@@ -189,6 +239,8 @@ class GrpcClient(GabrielClient):
         self._registered_event = asyncio.Event()
         self._connected.clear()
         self._tokens = {}
+        # Results for the inputs sent on a previous stream will not arrive
+        self._latency_tracker.clear("reconnect")
         self._engine_ids = []
         self._channel = (
             grpc.aio.secure_channel(
@@ -240,6 +292,7 @@ class GrpcClient(GabrielClient):
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
         finally:
+            await self._stop_background_tasks()
             await self._channel.close()
 
     async def _consumer_handler(self):
@@ -267,6 +320,8 @@ class GrpcClient(GabrielClient):
                 logger.info("Received engine ids update from server")
                 self._engine_ids = to_client.engine_ids_update.engine_ids
                 logger.info(f"Updating engine ids to: {self._engine_ids}")
+            elif to_client.HasField("token_update"):
+                self._process_token_update(to_client.token_update)
             else:
                 logger.critical(
                     "Fatal error: empty to_client message received from server"
@@ -303,10 +358,10 @@ class GrpcClient(GabrielClient):
         result_status = result.status
         code = result_status.code
         msg = result_status.message
+        self._record_response_latency(result_wrapper)
         if code == gabriel_pb2.StatusCode.SUCCESS:
-            self._record_response_latency(result_wrapper)
             try:
-                self.consumer(result)
+                self._consume(result)
             except Exception as e:
                 logger.error(f"Error processing response from server: {e}")
                 raise
@@ -318,6 +373,17 @@ class GrpcClient(GabrielClient):
                 f"Engine {result.target_engine_id} dropped frame from "
                 f"producer {result_wrapper.producer_id}: {msg}"
             )
+        elif code == gabriel_pb2.StatusCode.SERVER_EVICTED_FRAME:
+            # Expected when the server's queue policy favours fresh frames
+            logger.debug(
+                f"Server evicted frame from producer "
+                f"{result_wrapper.producer_id}: {msg}"
+            )
+        elif code == gabriel_pb2.StatusCode.FRAME_EXPIRED:
+            logger.debug(
+                f"Frame from producer {result_wrapper.producer_id} expired: "
+                f"{msg}"
+            )
         else:
             status_name = gabriel_pb2.StatusCode.Name(code)
             logger.error(
@@ -350,7 +416,11 @@ class GrpcClient(GabrielClient):
             return
 
         # Open a stream dedicated to this producer
-        call = self._stub.ClientSession(
+        call = self._channel.stream_stream(
+            _CLIENT_SESSION_METHOD,
+            request_serializer=None,
+            response_deserializer=gabriel_pb2.ToClient.FromString,
+        )(
             metadata=(
                 (_SESSION_ID_METADATA_KEY, self._session_id),
                 (_STREAM_ROLE_METADATA_KEY, _STREAM_ROLE_PRODUCER),
@@ -377,7 +447,7 @@ class GrpcClient(GabrielClient):
                 token_pool.return_token()
                 logger.debug("Received None from producer")
                 continue
-            if not input_frame.SerializeToString():
+            if not input_frame.ByteSize():
                 token_pool.return_token()
                 logger.error("Input producer produced empty frame")
                 continue
@@ -386,6 +456,7 @@ class GrpcClient(GabrielClient):
             from_client.input.frame_id = frame_id
             frame_id += 1
             from_client.input.producer_id = producer.producer_id
+            producer._set_input_metadata(from_client.input)
 
             target_engines = set(producer.get_target_engines())
             available_engines = set(self._engine_ids)
@@ -402,21 +473,25 @@ class GrpcClient(GabrielClient):
             from_client.input.target_engine_ids.extend(
                 producer.get_target_engines()
             )
-            from_client.input.input_frame.CopyFrom(input_frame)
 
             # Send input to server
             logger.debug(
                 f"Sending input to server; producer={producer.producer_id}"
             )
             try:
-                await self._send_to_server(from_client, call)
+                await self._send_to_server(from_client, input_frame, call)
             except (grpc.aio.AioRpcError, asyncio.InvalidStateError) as e:
                 raise _DisconnectedError(str(e)) from e
 
-    async def _send_to_server(self, from_client: gabriel_pb2.FromClient, call):
-        """Send a frame to the server on the given stream."""
+    async def _send_to_server(
+        self,
+        from_client: gabriel_pb2.FromClient,
+        input_frame: gabriel_pb2.InputFrame,
+        call,
+    ):
+        """Send a frame to the server on the given producer stream."""
         self._record_send_metrics(from_client)
-        await call.write(from_client)
+        await call.write(self._serialize_input(from_client, input_frame))
 
     async def _send_registration(self, from_client: gabriel_pb2.FromClient):
         """Write a Registration message to the server.
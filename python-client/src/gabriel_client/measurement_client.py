@@ -56,8 +56,8 @@ class MeasurementClient(WebsocketClient):
                 response_time,
             )
 
-    async def _send_from_client(self, from_client):
-        await super()._send_from_client(from_client)
+    async def _send_from_client(self, from_client, input_frame):
+        await super()._send_from_client(from_client, input_frame)
         send_time = time.time()
         source_measurement = self._get_source_measurement(
             from_client.input.producer_id
@@ -1,18 +1,57 @@
 """Adapter to integrate OpenCV with Gabriel client framework."""
 
+import asyncio
+import enum
+import functools
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import cv2
 import numpy as np
 from gabriel_protocol.v1 import gabriel_pb2
 
+from gabriel_client.early_discard import EarlyDiscard
 from gabriel_client.gabriel_client import InputProducer
 
 logger = logging.getLogger(__name__)
 
 
+class ImageCodec(enum.Enum):
+    """The formats that OpencvAdapter can encode frames in."""
+
+    JPEG = "jpeg"
+    PNG = "png"
+    WEBP = "webp"
+
+
+# The file extension that selects each codec in cv2.imencode, and the
+# encoding parameter that its quality sets along with its range
+_CODEC_PARAMS = {
+    ImageCodec.JPEG: (".jpg", cv2.IMWRITE_JPEG_QUALITY, 0, 100),
+    ImageCodec.PNG: (".png", cv2.IMWRITE_PNG_COMPRESSION, 0, 9),
+    ImageCodec.WEBP: (".webp", cv2.IMWRITE_WEBP_QUALITY, 1, 100),
+}
+
+
 class OpencvAdapter:
-    """Adapter to integrate OpenCV with the Gabriel client framework."""
+    """Adapter to integrate OpenCV with the Gabriel client framework.
+
+    Frames are captured, preprocessed, resized and encoded on a pool of
+    worker threads rather than on the event loop, so that the client keeps
+    reading results and sending heartbeats while a frame is prepared. Frames
+    are captured one at a time, in order, on a thread of their own. With a
+    pipeline_depth above 0, the next frames are prepared while the current
+    one is sent, so that num_workers frames can be encoded at once. The
+    buffers that frames are captured and resized into are reused. Frames
+    dropped by early discard are dropped on the capture thread.
+
+    Results are decoded on the same pool, and passed to consume_frame on the
+    event loop's thread. A result that is decoded after a newer one has been
+    consumed is dropped.
+    """
 
     def __init__(
         self,
@@ -20,49 +59,196 @@ class OpencvAdapter:
         consume_frame,
         video_capture,
         engine_name,
+        codec: ImageCodec = ImageCodec.JPEG,
+        quality: Optional[int] = None,
+        resize: Optional[tuple[int, int]] = None,
+        num_workers: int = 1,
+        pipeline_depth: int = 0,
+        prefetch: bool = False,
+        early_discard: Optional[EarlyDiscard] = None,
     ):
         """Initialize the adapter.
 
         Args:
-            preprocess: A function to preprocess the video frame.
+            preprocess: A function to preprocess the video frame. It is
+                called on the worker threads, so it must be thread-safe if
+                num_workers is more than 1.
             consume_frame:
                 A function to consume the output frame from the server.
             video_capture: The OpenCV video capture object.
             engine_name: The name of the video processing engine.
-
+            codec (ImageCodec): The format to encode frames in.
+            quality (int, optional):
+                The quality to encode frames with, from 0 to 100 for JPEG
+                and from 1 to 100 for WebP. For PNG, which is lossless, this
+                is the compression level from 0 to 9. OpenCV's default is
+                used if it is not set.
+            resize (tuple[int, int], optional):
+                The (width, height) to resize preprocessed frames to before
+                they are encoded.
+            num_workers (int): The number of threads that encode frames and
+                decode results.
+            pipeline_depth (int):
+                The number of frames to capture and encode ahead of the
+                client asking for one. Frames prepared ahead are older when
+                they are sent, so this trades latency for throughput.
+            prefetch (bool):
+                Whether the InputProducer prefetches frames (see
+                InputProducer).
+            early_discard (EarlyDiscard, optional):
+                Filters that frames must pass to be sent. They are run on
+                the captured frames, before preprocess, so that dropped
+                frames are not encoded.
         """
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        if pipeline_depth < 0:
+            raise ValueError("pipeline_depth must not be negative")
+        extension, quality_param, min_quality, max_quality = _CODEC_PARAMS[
+            codec
+        ]
+        self._extension = extension
+        self._encode_params = []
+        if quality is not None:
+            if not min_quality <= quality <= max_quality:
+                raise ValueError(
+                    f"{codec.value} quality must be between {min_quality} "
+                    f"and {max_quality}, got {quality}"
+                )
+            self._encode_params = [quality_param, quality]
         self._preprocess = preprocess
         self._consume_frame = consume_frame
         self._video_capture = video_capture
         self._engine_name = engine_name
+        self._resize = resize
+        self._pipeline_depth = pipeline_depth
+        self._prefetch = prefetch
+        self._early_discard = early_discard
+        self._capture_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="opencv-capture"
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="opencv-encode"
+        )
+        # Frames being prepared, oldest first
+        self._pending = deque()
+        # A buffer to capture into for each frame that can be in the
+        # pipeline at once, used in turn
+        self._capture_buffers = [None] * (pipeline_depth + 1)
+        self._next_capture_buffer = 0
+        # The buffer that each worker thread resizes frames into
+        self._resize_buffers = threading.local()
+        self._num_results = 0
+        self._last_result_consumed = 0
+
+    def _capture(self, buffer_index):
+        buffer = self._capture_buffers[buffer_index]
+        if buffer is None:
+            _, frame = self._video_capture.read()
+        else:
+            _, frame = self._video_capture.read(buffer)
+        if frame is None:
+            return None, None
+        self._capture_buffers[buffer_index] = frame
+        if self._early_discard is not None:
+            return frame, self._early_discard.check(frame)
+        return frame, None
+
+    def _encode(self, frame):
+        frame = self._preprocess(frame)
+        if self._resize is not None:
+            frame = cv2.resize(
+                frame,
+                self._resize,
+                dst=getattr(self._resize_buffers, "frame", None),
+                interpolation=cv2.INTER_AREA,
+            )
+            self._resize_buffers.frame = frame
+        _, encoded = cv2.imencode(self._extension, frame, self._encode_params)
+
+        input_frame = gabriel_pb2.InputFrame()
+        input_frame.payload_type = gabriel_pb2.PayloadType.IMAGE
+        input_frame.byte_payload = encoded.tobytes()
+        return input_frame
+
+    async def _prepare_frame(self, buffer_index):
+        loop = asyncio.get_running_loop()
+        frame, discarded_by = await loop.run_in_executor(
+            self._capture_executor, self._capture, buffer_index
+        )
+        if frame is None or discarded_by is not None:
+            return None, discarded_by
+        input_frame = await loop.run_in_executor(
+            self._executor, self._encode, frame
+        )
+        return input_frame, None
+
+    def _fill_pipeline(self):
+        while len(self._pending) <= self._pipeline_depth:
+            buffer_index = self._next_capture_buffer
+            self._next_capture_buffer = (buffer_index + 1) % len(
+                self._capture_buffers
+            )
+            self._pending.append(
+                asyncio.create_task(self._prepare_frame(buffer_index))
+            )
 
     def get_producer_wrappers(self):
         """Get the producer wrappers for the video source."""
 
         async def producer():
-            _, frame = self._video_capture.read()
-            if frame is None:
-                return None
-
-            frame = self._preprocess(frame)
-            _, jpeg_frame = cv2.imencode(".jpg", frame)
-
-            input_frame = gabriel_pb2.InputFrame()
-            input_frame.payload_type = gabriel_pb2.PayloadType.IMAGE
-            input_frame.byte_payload = jpeg_frame.tobytes()
-
-            return input_frame
-
-        return [
-            InputProducer(
-                producer=producer, target_engine_ids=[self._engine_name]
-            )
-        ]
+            while True:
+                self._fill_pipeline()
+                next_frame = self._pending[0]
+                try:
+                    # The frame is only removed once it is ready, so that it
+                    # is not lost if the client cancels this call
+                    input_frame, discarded_by = await asyncio.shield(
+                        next_frame
+                    )
+                finally:
+                    if next_frame.done():
+                        self._pending.popleft()
+                        self._fill_pipeline()
+                if discarded_by is None:
+                    return input_frame
+                input_producer._count_discarded(discarded_by)
+
+        input_producer = InputProducer(
+            producer=producer,
+            target_engine_ids=[self._engine_name],
+            prefetch=self._prefetch,
+        )
+        return [input_producer]
+
+    def _decode(self, image_bytes):
+        np_data = np.frombuffer(image_bytes, dtype=np.uint8)
+        return cv2.imdecode(np_data, cv2.IMREAD_COLOR)
+
+    def _frame_decoded(self, result_number, future):
+        if future.cancelled():
+            return
+        if result_number < self._last_result_consumed:
+            logger.debug("Dropping a result decoded after a newer one")
+            return
+        self._last_result_consumed = result_number
+        self._consume_frame(future.result())
 
     def consumer(self, result):
         """Consume the output frame from the server."""
         assert result.WhichOneof("payload") == "bytes_result"
-        np_data = np.frombuffer(result.bytes_result, dtype=np.uint8)
-        frame = cv2.imdecode(np_data, cv2.IMREAD_COLOR)
-
-        self._consume_frame(frame)
+        self._num_results += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._decode, result.bytes_result
+        )
+        future.add_done_callback(
+            functools.partial(self._frame_decoded, self._num_results)
+        )
+
+    def close(self):
+        """Stop preparing frames and shut down the worker threads."""
+        for task in self._pending:
+            task.cancel()
+        self._pending.clear()
+        self._capture_executor.shutdown(wait=False, cancel_futures=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
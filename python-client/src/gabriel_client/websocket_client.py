@@ -2,7 +2,7 @@
 
 import asyncio
 import logging
-from typing import Callable
+from typing import Callable, Optional
 from urllib.parse import urlparse
 
 import websockets
@@ -10,7 +10,10 @@ import websockets.client
 from gabriel_protocol.v1 import gabriel_pb2
 
 from gabriel_client.gabriel_client import (
+    DEFAULT_MAX_PENDING_INPUTS,
+    DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS,
     DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS,
+    ConsumerMode,
     GabrielClient,
     InputProducer,
     _TokenPool,
@@ -43,6 +46,15 @@ class WebsocketClient(GabrielClient):
         registration_retry_interval_seconds: float = (
             DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS
         ),
+        split_framing: bool = False,
+        trace_sample_rate: float = 0,
+        trace_file: Optional[str] = None,
+        consumer_mode: Optional[ConsumerMode] = None,
+        result_queue_size: int = 1,
+        max_pending_inputs: int = DEFAULT_MAX_PENDING_INPUTS,
+        pending_input_timeout_seconds: float = (
+            DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS
+        ),
     ):
         """Initialize the client.
 
@@ -54,7 +66,8 @@ class WebsocketClient(GabrielClient):
             A list of instances of InputProducer for the inputs
             produced by this client
         consumer (Callable[[gabriel_pb2.Result], None]):
-            Callback for results from server
+            Callback for results from server, or a coroutine function
+            that is awaited for each result
         prometheus_port (int):
             Port for Prometheus metrics.
         client_info (optional):
@@ -62,6 +75,27 @@ class WebsocketClient(GabrielClient):
         registration_retry_interval_seconds (float):
             How long to wait before retrying registration with the
             server.
+        split_framing (bool):
+            Whether to send inputs with split framing, so that the server
+            forwards their payloads to engines without parsing them.
+        trace_sample_rate (float):
+            The fraction of inputs to trace through the server and the
+            engine (see gabriel_protocol.tracing).
+        trace_file (str, optional):
+            If set, traced inputs are written to this file as Chrome
+            trace events.
+        consumer_mode (ConsumerMode, optional):
+            How results are passed to the consumer (see
+            GabrielClient).
+        result_queue_size (int):
+            The number of results from each engine that can wait for
+            a consumer that is not INLINE.
+        max_pending_inputs (int):
+            The number of inputs sent that the client keeps the send
+            time of, to record the latency of their results.
+        pending_input_timeout_seconds (float):
+            How long after an input was sent the client stops waiting
+            for results for it (see GabrielClient).
 
         """
         super().__init__(
@@ -70,8 +104,16 @@ class WebsocketClient(GabrielClient):
             registration_retry_interval_seconds=(
                 registration_retry_interval_seconds
             ),
+            split_framing=split_framing,
+            trace_sample_rate=trace_sample_rate,
+            trace_file=trace_file,
+            consumer_mode=consumer_mode,
+            result_queue_size=result_queue_size,
+            max_pending_inputs=max_pending_inputs,
+            pending_input_timeout_seconds=pending_input_timeout_seconds,
         )
         self.consumer = consumer
+        self._check_consumer_mode()
         self.input_producers = set(input_producers)
 
         self.server_endpoint = server_endpoint
@@ -107,11 +149,13 @@ class WebsocketClient(GabrielClient):
                 for task in all_tasks:
                     task.cancel()
                 await asyncio.gather(*all_tasks, return_exceptions=True)
+                await self._stop_background_tasks()
                 raise
             for task in all_tasks:
                 if task not in done:
                     task.cancel()
             await asyncio.gather(*all_tasks, return_exceptions=True)
+            await self._stop_background_tasks()
             logger.info("Disconnected From Server")
 
     async def _consumer_handler(self):
@@ -133,6 +177,8 @@ class WebsocketClient(GabrielClient):
                 logger.info("Received engine ids update from server")
                 self._engine_ids = to_client.engine_ids_update.engine_ids
                 logger.info(f"Updating engine ids to: {self._engine_ids}")
+            elif to_client.HasField("token_update"):
+                self._process_token_update(to_client.token_update)
             else:
                 raise Exception("Empty to_client message")
 
@@ -143,11 +189,15 @@ class WebsocketClient(GabrielClient):
 
     def _process_response(self, result_wrapper):
         result = result_wrapper.result
+        self._record_response_latency(result_wrapper)
         if result.status.code == gabriel_pb2.StatusCode.SUCCESS:
-            self._record_response_latency(result_wrapper)
-            self.consumer(result_wrapper.result)
+            self._consume(result_wrapper.result)
         elif result.status.code == gabriel_pb2.StatusCode.NO_ENGINE_FOR_INPUT:
             raise Exception("No engine for input")
+        elif result.status.code == gabriel_pb2.StatusCode.SERVER_EVICTED_FRAME:
+            logger.debug("Server evicted frame: %s", result.status.message)
+        elif result.status.code == gabriel_pb2.StatusCode.FRAME_EXPIRED:
+            logger.debug("Frame expired: %s", result.status.message)
         else:
             status = gabriel_pb2.StatusCode.Name(result.status.code)
             logger.error("Output status was: %s", status)
@@ -188,6 +238,7 @@ class WebsocketClient(GabrielClient):
             from_client.input.frame_id = frame_id
             frame_id += 1
             from_client.input.producer_id = producer.producer_id
+            producer._set_input_metadata(from_client.input)
 
             target_engines = set(producer.get_target_engines())
             available_engines = set(self._engine_ids)
@@ -203,21 +254,22 @@ class WebsocketClient(GabrielClient):
             from_client.input.target_engine_ids.extend(
                 producer.get_target_engines()
             )
-            from_client.input.input_frame.CopyFrom(input_frame)
 
             # Send input to server
             logger.debug(
                 f"Sending input to server; producer={producer.producer_id}"
             )
             try:
-                await self._send_from_client(from_client)
+                await self._send_from_client(from_client, input_frame)
             except websockets.exceptions.ConnectionClosed:
                 return  # stop the handler
 
-    async def _send_from_client(self, from_client):
+    async def _send_from_client(self, from_client, input_frame):
         self._record_send_metrics(from_client)
         # Removing this method will break measurement_client
-        await self._send_raw(from_client)
+        await self._websocket.send(
+            self._serialize_input(from_client, input_frame)
+        )
 
     async def _send_raw(self, from_client):
         """Send a message to the server without recording input metrics."""
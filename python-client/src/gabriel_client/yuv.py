@@ -0,0 +1,77 @@
+"""Vectorized conversion of BGR frames to planar and semi-planar YUV 4:2:0.
+
+OpenCV converts BGR to I420 (a Y plane, then a U plane, then a V plane) but
+has no BGR to NV21 or NV12 conversion, which interleave the chroma planes
+(VU for NV21, UV for NV12) after the Y plane. These functions build on the
+I420 conversion and interleave the chroma with strided NumPy assignments.
+See https://wiki.videolan.org/YUV for details about these formats.
+
+Each function accepts any BGR image that OpenCV does, including a slice of a
+larger frame, with an even width and height. The result has the same layout
+as the output of cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420): a uint8 array
+of height * 3 // 2 rows and width columns. Pass out to write the result into
+a preallocated array of that shape instead of allocating a new one.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+def _check_output(frame, out):
+    height, width = frame.shape[:2]
+    if height % 2 or width % 2:
+        raise ValueError(
+            f"Frame width and height must be even, got {width}x{height}"
+        )
+    shape = (height * 3 // 2, width)
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+    if out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(
+            f"Output buffer must be a uint8 array of shape {shape}, got "
+            f"{out.dtype} array of shape {out.shape}"
+        )
+    if not out.flags.c_contiguous:
+        raise ValueError("Output buffer must be C-contiguous")
+    return out
+
+
+def bgr_to_i420(
+    frame: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Convert a BGR frame to I420 (Y, then U, then V planes)."""
+    out = _check_output(frame, out)
+    cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=out)
+    return out
+
+
+def _bgr_to_semi_planar(frame, out, v_first):
+    out = bgr_to_i420(frame, out)
+    height, width = frame.shape[:2]
+    luma_size = height * width
+    chroma_size = luma_size // 4
+
+    flat = out.reshape(-1)
+    # The chroma planes are overwritten as they are interleaved, so copy them
+    # out first
+    u_plane, v_plane = np.split(flat[luma_size:].copy(), [chroma_size])
+    first, second = (v_plane, u_plane) if v_first else (u_plane, v_plane)
+    flat[luma_size::2] = first
+    flat[luma_size + 1 :: 2] = second
+    return out
+
+
+def bgr_to_nv21(
+    frame: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Convert a BGR frame to NV21 (Y plane, then interleaved V and U)."""
+    return _bgr_to_semi_planar(frame, out, v_first=True)
+
+
+def bgr_to_nv12(
+    frame: np.ndarray, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Convert a BGR frame to NV12 (Y plane, then interleaved U and V)."""
+    return _bgr_to_semi_planar(frame, out, v_first=False)
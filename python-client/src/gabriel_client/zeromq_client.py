@@ -4,7 +4,7 @@ import asyncio
 import logging
 import time
 from collections.abc import Iterable
-from typing import Callable
+from typing import Callable, Optional
 from urllib.parse import urlparse
 
 import zmq
@@ -13,7 +13,10 @@ from gabriel_protocol.v1 import gabriel_pb2
 from google.protobuf.message import DecodeError
 
 from gabriel_client.gabriel_client import (
+    DEFAULT_MAX_PENDING_INPUTS,
+    DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS,
     DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS,
+    ConsumerMode,
     GabrielClient,
     InputProducer,
     _TokenPool,
@@ -51,6 +54,15 @@ class ZeroMQClient(GabrielClient):
         registration_retry_interval_seconds: float = (
             DEFAULT_REGISTRATION_RETRY_INTERVAL_SECONDS
         ),
+        split_framing: bool = False,
+        trace_sample_rate: float = 0,
+        trace_file: Optional[str] = None,
+        consumer_mode: Optional[ConsumerMode] = None,
+        result_queue_size: int = 1,
+        max_pending_inputs: int = DEFAULT_MAX_PENDING_INPUTS,
+        pending_input_timeout_seconds: float = (
+            DEFAULT_PENDING_INPUT_TIMEOUT_SECONDS
+        ),
     ):
         """Initialize the client.
 
@@ -63,7 +75,8 @@ class ZeroMQClient(GabrielClient):
             An iterable of instances of InputProducer for the inputs
             produced by this client
         consumer (Callable[[gabriel_pb2.Result], None]):
-            Callback for results from server
+            Callback for results from server, or a coroutine function
+            that is awaited for each result
         prometheus_port (int):
             Port for Prometheus metrics.
         client_info (optional):
@@ -71,6 +84,27 @@ class ZeroMQClient(GabrielClient):
         registration_retry_interval_seconds (float):
             How long to wait before retrying registration with the
             server.
+        split_framing (bool):
+            Whether to send inputs with split framing, so that the server
+            forwards their payloads to engines without parsing them.
+        trace_sample_rate (float):
+            The fraction of inputs to trace through the server and the
+            engine (see gabriel_protocol.tracing).
+        trace_file (str, optional):
+            If set, traced inputs are written to this file as Chrome
+            trace events.
+        consumer_mode (ConsumerMode, optional):
+            How results are passed to the consumer (see
+            GabrielClient).
+        result_queue_size (int):
+            The number of results from each engine that can wait for
+            a consumer that is not INLINE.
+        max_pending_inputs (int):
+            The number of inputs sent that the client keeps the send
+            time of, to record the latency of their results.
+        pending_input_timeout_seconds (float):
+            How long after an input was sent the client stops waiting
+            for results for it (see GabrielClient).
 
         """
         super().__init__(
@@ -79,6 +113,13 @@ class ZeroMQClient(GabrielClient):
             registration_retry_interval_seconds=(
                 registration_retry_interval_seconds
             ),
+            split_framing=split_framing,
+            trace_sample_rate=trace_sample_rate,
+            trace_file=trace_file,
+            consumer_mode=consumer_mode,
+            result_queue_size=result_queue_size,
+            max_pending_inputs=max_pending_inputs,
+            pending_input_timeout_seconds=pending_input_timeout_seconds,
         )
         # Socket used for communicating with the server
         self._ctx = zmq.asyncio.Context()
@@ -95,6 +136,7 @@ class ZeroMQClient(GabrielClient):
 
         self.input_producers = set(input_producers)
         self.consumer = consumer
+        self._check_consumer_mode()
         # Whether the client is connected to the server
         self._connected = asyncio.Event()
         # Indicates that a heartbeat was sent to the server but a heartbeat
@@ -144,6 +186,7 @@ class ZeroMQClient(GabrielClient):
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
         finally:
+            await self._stop_background_tasks()
             self._sock.close()
             self._ctx.term()
 
@@ -180,6 +223,9 @@ class ZeroMQClient(GabrielClient):
                 # Reset tokens for all producers
                 for token_pool in self._tokens.values():
                     token_pool.reset_tokens()
+                # Results for the inputs sent before the connection was lost
+                # will not arrive
+                self._latency_tracker.clear("reconnect")
                 # The new socket has a fresh identity, so the server sees
                 # this as a brand new, unregistered client.
                 self._reregistration_needed.set()
@@ -208,6 +254,8 @@ class ZeroMQClient(GabrielClient):
                 logger.info("Received engine ids update from server")
                 self._engine_ids = to_client.engine_ids_update.engine_ids
                 logger.info(f"Updating engine ids to: {self._engine_ids}")
+            elif to_client.HasField("token_update"):
+                self._process_token_update(to_client.token_update)
             else:
                 logger.critical(
                     "Fatal error: empty to_client message received from server"
@@ -243,10 +291,10 @@ class ZeroMQClient(GabrielClient):
         result_status = result.status
         code = result_status.code
         msg = result_status.message
+        self._record_response_latency(result_wrapper)
         if code == gabriel_pb2.StatusCode.SUCCESS:
-            self._record_response_latency(result_wrapper)
             try:
-                self.consumer(result)
+                self._consume(result)
             except Exception as e:
                 logger.error(f"Error processing response from server: {e}")
                 raise
@@ -258,6 +306,17 @@ class ZeroMQClient(GabrielClient):
                 f"Engine {result.target_engine_id} dropped frame from "
                 f"producer {result_wrapper.producer_id}: {msg}"
             )
+        elif code == gabriel_pb2.StatusCode.SERVER_EVICTED_FRAME:
+            # Expected when the server's queue policy favours fresh frames
+            logger.debug(
+                f"Server evicted frame from producer "
+                f"{result_wrapper.producer_id}: {msg}"
+            )
+        elif code == gabriel_pb2.StatusCode.FRAME_EXPIRED:
+            logger.debug(
+                f"Frame from producer {result_wrapper.producer_id} expired: "
+                f"{msg}"
+            )
         else:
             status_name = gabriel_pb2.StatusCode.Name(code)
             logger.error(
@@ -364,7 +423,7 @@ class ZeroMQClient(GabrielClient):
                     token_pool.return_token()
                     logger.debug("Received None from producer")
                     continue
-                if not input_frame.SerializeToString():
+                if not input_frame.ByteSize():
                     token_pool.return_token()
                     logger.error("Input producer produced empty frame")
                     continue
@@ -373,6 +432,7 @@ class ZeroMQClient(GabrielClient):
                 from_client.input.frame_id = frame_id
                 frame_id += 1
                 from_client.input.producer_id = producer.producer_id
+                producer._set_input_metadata(from_client.input)
 
                 target_engines = set(producer.get_target_engines())
                 available_engines = set(self._engine_ids)
@@ -389,13 +449,12 @@ class ZeroMQClient(GabrielClient):
                 from_client.input.target_engine_ids.extend(
                     producer.get_target_engines()
                 )
-                from_client.input.input_frame.CopyFrom(input_frame)
 
                 # Send input to server
                 logger.debug(
                     f"Sending input to server; producer={producer.producer_id}"
                 )
-                await self._send_to_server(from_client)
+                await self._send_to_server(from_client, input_frame)
 
                 logger.debug(
                     "Semaphore for %s is %s",
@@ -407,10 +466,14 @@ class ZeroMQClient(GabrielClient):
                 producer_task.cancel()
                 asyncio.gather(producer_task, return_exceptions=True)
 
-    async def _send_to_server(self, from_client: gabriel_pb2.FromClient):
+    async def _send_to_server(
+        self,
+        from_client: gabriel_pb2.FromClient,
+        input_frame: gabriel_pb2.InputFrame,
+    ):
         """Send a frame to the server."""
         self._record_send_metrics(from_client)
-        await self._send_raw(from_client)
+        await self._sock.send(self._serialize_input(from_client, input_frame))
 
     async def _send_raw(self, from_client: gabriel_pb2.FromClient):
         """Send a message to the server without recording input metrics."""
@@ -10,7 +10,13 @@
 import argparse
 import logging
 
-from gabriel_server.network_engine.server_runner import ServerRunner, Transport
+from gabriel_server.network_engine.server_runner import (
+    DEFAULT_PRODUCER_IDLE_TIMEOUT,
+    QueuePolicy,
+    SchedulingPolicy,
+    ServerRunner,
+    Transport,
+)
 
 DEFAULT_PORT = 9099
 DEFAULT_NUM_TOKENS = 2
@@ -33,6 +39,13 @@ def main():
         help="number of tokens",
     )
 
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        help="Adapt the number of tokens of each producer between 1 and "
+        "this number, starting from --tokens",
+    )
+
     parser.add_argument(
         "-p",
         "--client_port",
@@ -115,6 +128,44 @@ def main():
         "Defaults to gRPC's own default (64KiB) if not given.",
     )
 
+    parser.add_argument(
+        "--engine-replicas",
+        action="store_true",
+        help="Let engines that register with an already connected engine "
+        "id join a pool of replicas for that id, rather than replacing the "
+        "connected engine. Each input is sent to one idle replica.",
+    )
+
+    parser.add_argument(
+        "--queue-policy",
+        choices=[policy.value for policy in QueuePolicy],
+        default=QueuePolicy.DROP_NEWEST.value,
+        help="What to do with an input when its producer's queue is full",
+    )
+
+    parser.add_argument(
+        "--producer-queue-policy",
+        action="append",
+        default=[],
+        metavar="PRODUCER_ID=POLICY",
+        help="Queue policy for a specific producer, overriding "
+        "--queue-policy. Can be given more than once.",
+    )
+
+    parser.add_argument(
+        "--scheduling-policy",
+        choices=[policy.value for policy in SchedulingPolicy],
+        default=SchedulingPolicy.ROUND_ROBIN.value,
+        help="How an engine chooses the producer to send its next input from",
+    )
+
+    parser.add_argument(
+        "--producer-idle-timeout",
+        type=float,
+        default=DEFAULT_PRODUCER_IDLE_TIMEOUT,
+        help="Seconds after which an idle producer's state is removed",
+    )
+
     args, _ = parser.parse_known_args()
 
     logging.basicConfig(
@@ -146,6 +197,15 @@ def main():
         args.engine_port if not args.engine_path else args.engine_path
     )
 
+    producer_queue_policies = {}
+    for producer_queue_policy in args.producer_queue_policy:
+        producer_id, sep, policy = producer_queue_policy.rpartition("=")
+        if not sep or not producer_id:
+            raise ValueError(
+                f"Invalid producer queue policy: {producer_queue_policy}"
+            )
+        producer_queue_policies[producer_id] = QueuePolicy(policy)
+
     server_runner = ServerRunner(
         client_endpoint=client_endpoint,
         engine_endpoint=engine_endpoint,
@@ -159,6 +219,12 @@ def main():
         tls_key=args.tls_key,
         tls_client_ca_cert=args.tls_client_ca_cert,
         http2_stream_window_bytes=args.http2_stream_window_bytes,
+        engine_replicas=args.engine_replicas,
+        queue_policy=QueuePolicy(args.queue_policy),
+        producer_queue_policies=producer_queue_policies,
+        scheduling_policy=SchedulingPolicy(args.scheduling_policy),
+        max_num_tokens=args.max_tokens,
+        producer_idle_timeout=args.producer_idle_timeout,
     )
     server_runner.run()
 
@@ -33,3 +33,55 @@ class Engine(ABC):
         Return an instance of Result.
         """
         pass
+
+    def handle_payload_view(
+        self,
+        input_frame: gabriel_pb2.InputFrame,
+        client_info: ProtoAny,
+        payload: memoryview,
+    ) -> Result:
+        """Process an input whose byte payload is in shared memory.
+
+        Called by LocalEngine instead of handle() when it is run with
+        use_shared_memory=True and the input has a byte payload, which is
+        cleared from input_frame. Override this to read the payload in
+        place, e.g. with numpy.frombuffer(). The default implementation
+        copies the payload back into input_frame and calls handle().
+
+        Args:
+            input_frame: The input to process, without its byte payload.
+            client_info: The Any registered by the producing client's
+                Registration message, or an empty Any if it registered none.
+            payload: A read-only view of the byte payload. The memory is
+                reused for later inputs, so the view must not be used after
+                this method returns.
+
+        Return an instance of Result.
+        """
+        input_frame.byte_payload = bytes(payload)
+        return self.handle(input_frame, client_info)
+
+    def handle_batch(
+        self,
+        input_frames: list[gabriel_pb2.InputFrame],
+        client_infos: list[ProtoAny],
+    ) -> list[Result]:
+        """Process a batch of gabriel_pb2.InputFrame().
+
+        Only called when the engine runner is configured with a maximum
+        batch size greater than one. Override this to process the whole
+        batch at once, e.g. in a single forward pass of a model. The
+        default implementation calls handle() for each input in turn.
+
+        Args:
+            input_frames: The inputs to process, oldest first.
+            client_infos: The Any registered by the producing client of
+                each input, in the same order as input_frames.
+
+        Return a list with one Result for each input, in the same order
+        as input_frames.
+        """
+        return [
+            self.handle(input_frame, client_info)
+            for input_frame, client_info in zip(input_frames, client_infos)
+        ]
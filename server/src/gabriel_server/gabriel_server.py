@@ -5,20 +5,23 @@ Connects Gabriel cognitive engines to clients.
 
 import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
 from collections import namedtuple
-from collections.abc import Callable
-from typing import Union
+from collections.abc import Awaitable, Callable
+from typing import Optional, Union
 
 from gabriel_protocol.v1.gabriel_pb2 import (
     FromClient,
     Result,
     StatusCode,
     ToClient,
+    Trace,
 )
 from google.protobuf.any_pb2 import Any
 
 from gabriel_server.result_manager import ResultManager
+from gabriel_server.token_controller import TokenController
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +44,10 @@ class GabrielServer(ABC):
         num_tokens_per_producer: int,
         engine_cb: Callable[[FromClient, str, Any], ToClient.ResultWrapper],
         engine_ids: set[str],
+        client_disconnected_cb: Optional[
+            Callable[[str], Awaitable[None]]
+        ] = None,
+        max_tokens_per_producer: Optional[int] = None,
     ):
         """Initialize the Gabriel server.
 
@@ -51,6 +58,16 @@ class GabrielServer(ABC):
                 Callback invoked for each input received from a client.
             engine_ids:
                 The ids of the engines connected to the server
+            client_disconnected_cb:
+                Coroutine function called with the identifier of each client
+                that disconnects, after it is removed
+            max_tokens_per_producer (int, optional):
+                If set, the number of tokens of each producer is adapted
+                between 1 and this number, starting from
+                num_tokens_per_producer, to the number that keeps engines
+                busy without inputs waiting in queues (see
+                gabriel_server.token_controller). Clients are sent a
+                TokenUpdate message whenever a producer's number changes.
         """
         # Metadata for each client. 'tokens_for_producer' is a dictionary that
         # stores the tokens available for each producer. 'task' is an async
@@ -77,8 +94,14 @@ class GabrielServer(ABC):
         self._start_event = asyncio.Event()
         self._is_running = False
         self._engine_cb = engine_cb
+        self._client_disconnected_cb = client_disconnected_cb
         self.result_manager = ResultManager()
         self._engine_ids = engine_ids
+        self._token_controller = (
+            TokenController(num_tokens_per_producer, max_tokens_per_producer)
+            if max_tokens_per_producer is not None
+            else None
+        )
 
     def launch(
         self,
@@ -140,6 +163,18 @@ class GabrielServer(ABC):
             client_info=[None],
         )
 
+    def is_client_connected(self, address) -> bool:
+        """Checks whether the client at address is connected."""
+        return address in self._clients
+
+    async def _remove_client(self, address):
+        """Remove a client that has disconnected."""
+        del self._clients[address]
+        if self._token_controller is not None:
+            self._token_controller.remove_client(address)
+        if self._client_disconnected_cb is not None:
+            await self._client_disconnected_cb(address)
+
     async def send_result(
         self,
         address: str,
@@ -147,6 +182,7 @@ class GabrielServer(ABC):
         engine_id: str,
         result: Result,
         return_token: bool,
+        trace: Optional[Trace] = None,
     ) -> bool:
         """Send result to client at address.
 
@@ -157,6 +193,10 @@ class GabrielServer(ABC):
             engine_id (str): The id of the engine that generated the result
             result (Result): The result payload to send to the client
             return_token (bool): Whether to return a token to the client
+            trace (Trace, optional):
+                The trace of the input that the result is for, if the input
+                is traced. Its result_write_ns is set to the time the result
+                is sent, and it is returned to the client with the result.
 
         Returns True if send succeeded.
         """
@@ -165,6 +205,7 @@ class GabrielServer(ABC):
             logger.warning("Send request to invalid address: %s", address)
             return False
 
+        num_tokens = None
         if producer_id not in client.tokens_for_producer:
             logger.warning(
                 "Send request with invalid producer: %s", producer_id
@@ -172,23 +213,57 @@ class GabrielServer(ABC):
             # Still send so client gets back token
         elif return_token:
             client.tokens_for_producer[producer_id] += 1
+            if self._token_controller is not None:
+                old_num_tokens = self._token_controller.get_num_tokens(
+                    address, producer_id
+                )
+                num_tokens = self._token_controller.token_returned(
+                    address,
+                    producer_id,
+                    result.frame_id,
+                    processed=result.status.code == StatusCode.SUCCESS,
+                    starved=client.tokens_for_producer[producer_id] == 1,
+                )
+                if num_tokens is not None:
+                    # The tokens that the producer has available change by
+                    # the same amount here and on the client once it
+                    # receives the TokenUpdate, so the two stay in step
+                    # however many inputs are in flight
+                    client.tokens_for_producer[producer_id] += (
+                        num_tokens - old_num_tokens
+                    )
+
+        sent = True
+        if num_tokens is not None:
+            # Sent before the result, so that the client resizes its pool
+            # before it gets the token back. Otherwise, if the pool shrank,
+            # the client could send with a token that the server no longer
+            # counts.
+            to_client = ToClient()
+            to_client.token_update.producer_id = producer_id
+            to_client.token_update.num_tokens = num_tokens
+            sent = await self._send_via_transport(address, to_client)
 
         to_client = ToClient()
         to_client.result_wrapper.producer_id = producer_id
         to_client.result_wrapper.return_token = return_token
         to_client.result_wrapper.result.CopyFrom(result)
+        if trace is not None:
+            trace.result_write_ns = time.monotonic_ns()
+            to_client.result_wrapper.trace.CopyFrom(trace)
 
-        return await self._send_via_transport(
-            address, to_client.SerializeToString()
-        )
+        return await self._send_via_transport(address, to_client) and sent
 
     @abstractmethod
-    async def _send_via_transport(self, address, payload) -> bool:
-        """Send a payload to the client at the specified address.
+    async def _send_via_transport(self, address, to_client) -> bool:
+        """Send a message to the client at the specified address.
+
+        The message is passed through unserialized so that each transport
+        encodes it exactly once, in whatever way suits the transport.
 
         Args:
-            address: the identifier of the client to send the payload to
-            payload (str): the string payload to send to the client
+            address: the identifier of the client to send the message to
+            to_client (ToClient): the message to send to the client
         """
         pass
 
@@ -217,11 +292,12 @@ class GabrielServer(ABC):
         """Indicates that a new server connected or disconnected."""
         to_client = ToClient()
         to_client.engine_ids_update.engine_ids.extend(self._engine_ids)
-        msg = to_client.SerializeToString()
         for address in self._clients:
-            await self._send_via_transport(address, msg)
+            await self._send_via_transport(address, to_client)
 
-    async def _consumer_helper(self, client, address, from_client):
+    async def _consumer_helper(
+        self, client, address, from_client, input_frame=None
+    ):
         """Process a single message from a client.
 
         Handles both message types a client can send: a Registration, which
@@ -231,6 +307,9 @@ class GabrielServer(ABC):
             client: The client that the message is from
             address: The identifier of the client
             from_client: A FromClient protobuf message
+            input_frame: The serialized InputFrame of an input sent with
+                split framing (see gabriel_protocol.framing), or None if
+                from_client carries the whole input
         """
         if from_client.WhichOneof("message_type") == "registration":
             client.client_info[0] = from_client.registration.client_info
@@ -244,6 +323,9 @@ class GabrielServer(ABC):
                 "Client must register before sending input",
             )
 
+        if from_client.input.HasField("trace"):
+            from_client.input.trace.server_receive_ns = time.monotonic_ns()
+
         producer_id = from_client.input.producer_id
 
         if producer_id not in client.tokens_for_producer:
@@ -258,10 +340,31 @@ class GabrielServer(ABC):
             )
             return (StatusCode.NO_TOKENS, "No tokens for producer")
 
+        frame_id = from_client.input.frame_id
+        # Deducted and recorded before the input is sent to an engine, which
+        # may return its token before _engine_cb returns
+        client.tokens_for_producer[producer_id] -= 1
+        if self._token_controller is not None:
+            self._token_controller.input_received(
+                address, producer_id, frame_id
+            )
+
         logger.debug(f"Sending input from client {address} to engine")
-        return await self._engine_cb(
-            from_client, address, client.client_info[0]
+        status, status_msg = await self._engine_cb(
+            from_client, address, client.client_info[0], input_frame
         )
+        if status != StatusCode.SUCCESS:
+            # The caller returns the token with an error response
+            client.tokens_for_producer[producer_id] += 1
+            if self._token_controller is not None:
+                self._token_controller.token_returned(
+                    address,
+                    producer_id,
+                    frame_id,
+                    processed=False,
+                    starved=False,
+                )
+        return (status, status_msg)
 
     def _make_registered(self) -> ToClient:
         """Construct a Registered message."""
@@ -4,6 +4,7 @@ import asyncio
 import logging
 
 import grpc
+from gabriel_protocol.framing import decode_from_client
 from gabriel_protocol.tls_utils import build_server_credentials
 from gabriel_protocol.v1 import gabriel_pb2, gabriel_pb2_grpc
 
@@ -19,6 +20,10 @@ STREAM_ROLE_METADATA_KEY = "stream-role"
 STREAM_ROLE_CONTROL = "control"
 STREAM_ROLE_PRODUCER = "producer"
 
+_CLIENT_SERVICE_NAME = gabriel_pb2.DESCRIPTOR.services_by_name[
+    "GabrielClientService"
+].full_name
+
 
 class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
     """A Gabriel server that uses gRPC for communication with clients."""
@@ -28,6 +33,8 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
         num_tokens_per_producer,
         engine_cb,
         engine_ids,
+        client_disconnected_cb=None,
+        max_tokens_per_producer=None,
         tls_cert=None,
         tls_key=None,
         tls_client_ca_cert=None,
@@ -42,6 +49,12 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
                 Callback invoked when an engine connects or disconnects.
             engine_ids:
                 Set of ids of engines expected to connect.
+            client_disconnected_cb:
+                Coroutine function called with the session id of each
+                client that disconnects.
+            max_tokens_per_producer:
+                If set, the number of tokens of each producer is adapted
+                up to this number (see GabrielServer).
             tls_cert:
                 Optional path to a PEM certificate chain for the server to
                 present. If either tls_cert or tls_key is omitted, the
@@ -61,7 +74,13 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
                 stalls on bandwidth-constrained/high-latency links. Defaults
                 to gRPC's own default (64KiB) if not given.
         """
-        super().__init__(num_tokens_per_producer, engine_cb, engine_ids)
+        super().__init__(
+            num_tokens_per_producer,
+            engine_cb,
+            engine_ids,
+            client_disconnected_cb,
+            max_tokens_per_producer,
+        )
         self._is_running = False
         self._server = None
         self._tls_cert = tls_cert
@@ -119,8 +138,25 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
                 ("grpc.max_receive_message_length", self._message_max_size)
             )
         server = grpc.aio.server(options=options)
-        gabriel_pb2_grpc.add_GabrielClientServiceServicer_to_server(
-            self, server
+        # Registered by hand rather than with
+        # add_GabrielClientServiceServicer_to_server, so that requests are
+        # parsed with decode_from_client, which accepts split inputs
+        rpc_method_handlers = {
+            "ClientSession": grpc.stream_stream_rpc_method_handler(
+                self.ClientSession,
+                request_deserializer=decode_from_client,
+                response_serializer=gabriel_pb2.ToClient.SerializeToString,
+            ),
+        }
+        server.add_generic_rpc_handlers(
+            (
+                grpc.method_handlers_generic_handler(
+                    _CLIENT_SERVICE_NAME, rpc_method_handlers
+                ),
+            )
+        )
+        server.add_registered_method_handlers(
+            _CLIENT_SERVICE_NAME, rpc_method_handlers
         )
         target = (
             f"unix://{self._port_or_path}"
@@ -164,15 +200,13 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
         """Rebind on the same address after _close_server_socket."""
         await self._start_grpc_server()
 
-    async def _send_via_transport(self, address, payload):
+    async def _send_via_transport(self, address, to_client):
         client = self._clients.get(address)
         write_lock = self._write_locks.get(address)
         if client is None or write_lock is None:
             return False
 
-        to_client = gabriel_pb2.ToClient()
-        to_client.ParseFromString(payload)
-
+        # gRPC serializes the message itself, so it is written as is
         logger.debug("Sending result to client %s", address)
         try:
             async with write_lock:
@@ -205,7 +239,9 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
         upload-only stream per input producer, identified via the session-id
         and stream-role metadata attached when the stream was opened. Splitting
         producers across separate streams lets gRPC's HTTP/2 transport
-        interleave frames from different producers.
+        interleave frames from different producers. Each request is a
+        FromClient and, for an input sent with split framing, its serialized
+        InputFrame, as parsed by decode_from_client.
         """
         invocation_metadata = dict(context.invocation_metadata())
         session_id = invocation_metadata.get(SESSION_ID_METADATA_KEY)
@@ -234,18 +270,20 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
         try:
             await self._consumer(request_iterator, context, session_id, client)
         finally:
-            del self._clients[session_id]
             del self._write_locks[session_id]
+            # gRPC cancels this call's task when the client goes away, which
+            # would interrupt the cleanup at its first await
+            await asyncio.shield(self._remove_client(session_id))
             logger.info(f"Client disconnected: {context.peer()}")
 
     _client_handler = ClientSession
 
     async def _consumer(self, request_iterator, context, session_id, client):
         """Consume a client's control stream, which carries Registration."""
-        async for from_client in request_iterator:
+        async for from_client, input_frame in request_iterator:
             logger.debug(f"Received input from {context.peer()}")
             await self._handle_from_client(
-                from_client, context, session_id, client
+                from_client, input_frame, context, session_id, client
             )
 
     async def _producer_stream(self, request_iterator, session_id):
@@ -254,7 +292,7 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
         Errors and results for input received here are still sent back over the
         client's control stream (via client.websocket).
         """
-        async for from_client in request_iterator:
+        async for from_client, input_frame in request_iterator:
             client = self._clients.get(session_id)
             if client is None:
                 logger.error(
@@ -264,22 +302,20 @@ class GrpcServer(GabrielServer, gabriel_pb2_grpc.GabrielClientServiceServicer):
                 return
             logger.debug(f"Received input from producer stream {session_id}")
             await self._handle_from_client(
-                from_client, client.websocket, session_id, client
+                from_client, input_frame, client.websocket, session_id, client
             )
 
     async def _handle_from_client(
-        self, from_client, context, session_id, client
+        self, from_client, input_frame, context, session_id, client
     ):
         """Process one FromClient message and send back a response, if any."""
         status, status_msg = await self._consumer_helper(
-            client, session_id, from_client
+            client, session_id, from_client, input_frame
         )
         if status == gabriel_pb2.StatusCode.SUCCESS:
-            if from_client.WhichOneof("message_type") == "registration":
-                response = self._make_registered()
-            else:
-                client.tokens_for_producer[from_client.input.producer_id] -= 1
+            if from_client.WhichOneof("message_type") != "registration":
                 return
+            response = self._make_registered()
         else:
             status_name = gabriel_pb2.StatusCode.Name(status)
             logger.error(
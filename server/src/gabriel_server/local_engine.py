@@ -6,6 +6,10 @@ Starts a local server and connects the engine to it.
 import asyncio
 import logging
 import multiprocessing
+import struct
+import time
+from collections import deque
+from multiprocessing import shared_memory
 from typing import Optional
 
 from gabriel_protocol.v1 import gabriel_pb2
@@ -17,9 +21,21 @@ from gabriel_server.zeromq_server import ZeroMQServer
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SHARED_MEMORY_SLOT_SIZE = 8 * 1024 * 1024
+DEFAULT_SHARED_MEMORY_SLOTS = 2
+
+# Sent over the pipe ahead of each input in shared memory mode: the slot that
+# holds the input's byte payload (or -1 if it was sent over the pipe), and
+# the length of the payload
+_SLOT_DESCRIPTOR = struct.Struct("!iI")
+
 
 class LocalEngine:
-    """Runs a single cognitive engine with a local server."""
+    """Runs a single cognitive engine with a local server.
+
+    The engine can be run in a pool of worker processes, each with its own
+    instance of the engine, to process several inputs in parallel.
+    """
 
     def __init__(
         self,
@@ -31,6 +47,11 @@ class LocalEngine:
         message_max_size: int = None,
         use_zeromq: bool = False,
         ipc_path: Optional[str] = None,
+        use_shared_memory: bool = False,
+        shared_memory_slot_size: int = DEFAULT_SHARED_MEMORY_SLOT_SIZE,
+        shared_memory_slots: int = DEFAULT_SHARED_MEMORY_SLOTS,
+        num_workers: int = 1,
+        max_num_tokens: Optional[int] = None,
     ):
         """Initialize the local engine.
 
@@ -46,6 +67,27 @@ class LocalEngine:
                 Whether to use ZeroMQ or WebSocket for communication.
             ipc_path (str, optional):
                 If provided, use IPC with the given path instead of TCP.
+            use_shared_memory (bool):
+                Whether to pass the byte payloads of inputs to the engine
+                process through a ring of shared memory slots, rather than
+                through the pipe to the engine process. The payload is
+                copied into a slot once, and the engine's
+                handle_payload_view() reads it in place.
+            shared_memory_slot_size (int):
+                The size of each shared memory slot in bytes. Payloads that
+                do not fit in a slot are sent through the pipe.
+            shared_memory_slots (int):
+                The number of shared memory slots. At least num_workers
+                slots are allocated.
+            num_workers (int):
+                The number of engine processes to run. engine_factory is
+                called once in each of them, and each input is sent to an
+                idle worker.
+            max_num_tokens (int, optional):
+                If set, the number of tokens of each producer is adapted
+                between 1 and max_num_tokens, starting from num_tokens, to
+                the number that keeps the engine busy without inputs
+                waiting in its queue.
         """
         self.engine_factory = engine_factory
         self.input_queue_maxsize = input_queue_maxsize
@@ -55,6 +97,14 @@ class LocalEngine:
         self.use_zeromq = use_zeromq
         self.ipc_path = ipc_path
         self.engine_id = engine_id
+        self.use_shared_memory = use_shared_memory
+        self.shared_memory_slot_size = shared_memory_slot_size
+        self.shared_memory_slots = shared_memory_slots
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.num_workers = num_workers
+        self.max_num_tokens = max_num_tokens
+        self._ring = None
 
     def run(self):
         """Starts the local server and the cognitive engine synchronously."""
@@ -62,18 +112,31 @@ class LocalEngine:
 
     async def run_async(self):
         """Starts the local server and the cognitive engine."""
-        self.engine_conn, server_conn = multiprocessing.Pipe()
+        pipes = [multiprocessing.Pipe() for _ in range(self.num_workers)]
+        if self.use_shared_memory:
+            self._ring = _SharedMemoryRing(
+                max(self.shared_memory_slots, self.num_workers),
+                self.shared_memory_slot_size,
+            )
 
         local_server = _LocalServer(
             self.num_tokens,
             self.input_queue_maxsize,
-            server_conn,
+            [server_conn for _, server_conn in pipes],
             self.use_zeromq,
             self.engine_id,
+            self._ring,
+            self.max_num_tokens,
         )
 
-        engine_process = multiprocessing.Process(target=self._run_engine)
-        engine_process.start()
+        engine_processes = [
+            multiprocessing.Process(
+                target=self._run_engine, args=(engine_conn,)
+            )
+            for engine_conn, _ in pipes
+        ]
+        for engine_process in engine_processes:
+            engine_process.start()
 
         try:
             await local_server.launch_async(
@@ -82,26 +145,42 @@ class LocalEngine:
                 use_ipc=(self.ipc_path is not None),
             )
         except (asyncio.CancelledError, KeyboardInterrupt):
-            engine_process.terminate()
-            engine_process.join()
+            for engine_process in engine_processes:
+                engine_process.terminate()
+            for engine_process in engine_processes:
+                engine_process.join()
             raise
+        finally:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring.unlink()
 
         raise Exception("Server stopped")
 
-    def _run_engine(self):
+    def _run_engine(self, engine_conn):
         engine = self.engine_factory()
         logger.info("Cognitive engine started")
         while True:
+            slot = -1
+            if self._ring is not None:
+                slot, length = _SLOT_DESCRIPTOR.unpack(
+                    engine_conn.recv_bytes()
+                )
             from_client = gabriel_pb2.FromClient()
-            from_client.ParseFromString(self.engine_conn.recv_bytes())
+            from_client.ParseFromString(engine_conn.recv_bytes())
             client_info = Any()
-            client_info_bytes = self.engine_conn.recv_bytes()
+            client_info_bytes = engine_conn.recv_bytes()
             if client_info_bytes:
                 client_info.ParseFromString(client_info_bytes)
 
             input_frame = from_client.input.input_frame
 
-            result = engine.handle(input_frame, client_info)
+            if slot >= 0:
+                result = engine.handle_payload_view(
+                    input_frame, client_info, self._ring.view(slot, length)
+                )
+            else:
+                result = engine.handle(input_frame, client_info)
             result_proto = gabriel_pb2.Result()
             result_proto.frame_id = from_client.input.frame_id
             result_proto.target_engine_id = self.engine_id
@@ -115,7 +194,7 @@ class LocalEngine:
                 logger.error(error_msg)
                 result_proto.status.code = gabriel_pb2.StatusCode.ENGINE_ERROR
                 result_proto.status.message = error_msg
-                self.engine_conn.send_bytes(result_proto.SerializeToString())
+                engine_conn.send_bytes(result_proto.SerializeToString())
                 continue
 
             if not isinstance(result.status, gabriel_pb2.Status):
@@ -127,13 +206,13 @@ class LocalEngine:
                 logger.error(error_msg)
                 result_proto.status.code = gabriel_pb2.StatusCode.ENGINE_ERROR
                 result_proto.status.message = error_msg
-                self.engine_conn.send_bytes(result_proto.SerializeToString())
+                engine_conn.send_bytes(result_proto.SerializeToString())
                 continue
             result_proto.status.CopyFrom(result.status)
 
             if result.status.code != gabriel_pb2.StatusCode.SUCCESS:
                 logger.debug(f"{self.engine_id} sending error to server")
-                self.engine_conn.send_bytes(result_proto.SerializeToString())
+                engine_conn.send_bytes(result_proto.SerializeToString())
                 continue
 
             if result.status.code == gabriel_pb2.StatusCode.SUCCESS:
@@ -146,9 +225,7 @@ class LocalEngine:
                         gabriel_pb2.StatusCode.ENGINE_ERROR
                     )
                     result_proto.status.message = error_msg
-                    self.engine_conn.send_bytes(
-                        result_proto.SerializeToString()
-                    )
+                    engine_conn.send_bytes(result_proto.SerializeToString())
                     continue
 
                 if isinstance(payload, str):
@@ -167,13 +244,56 @@ class LocalEngine:
                         gabriel_pb2.StatusCode.ENGINE_ERROR
                     )
                     result_proto.status.message = error_msg
-                    self.engine_conn.send_bytes(
-                        result_proto.SerializeToString()
-                    )
+                    engine_conn.send_bytes(result_proto.SerializeToString())
                     continue
 
             logger.debug(f"{self.engine_id} sending result to server")
-            self.engine_conn.send_bytes(result_proto.SerializeToString())
+            engine_conn.send_bytes(result_proto.SerializeToString())
+
+
+class _SharedMemoryRing:
+    """A ring of fixed-size slots in a block of shared memory.
+
+    The server process copies the byte payload of an input into a free slot,
+    and the engine process reads it in place, so only a small descriptor of
+    the slot has to go through the pipe between them. The block is created
+    before the engine process is started, which inherits it.
+    """
+
+    def __init__(self, num_slots, slot_size):
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=num_slots * slot_size
+        )
+        self._slot_size = slot_size
+        # Only used by the server process
+        self._free_slots = deque(range(num_slots))
+
+    def can_hold(self, length):
+        return length <= self._slot_size
+
+    def acquire(self):
+        """Take a free slot, or return None if every slot is in use."""
+        if not self._free_slots:
+            return None
+        return self._free_slots.popleft()
+
+    def release(self, slot):
+        self._free_slots.append(slot)
+
+    def write(self, slot, data):
+        offset = slot * self._slot_size
+        self._shm.buf[offset : offset + len(data)] = data
+
+    def view(self, slot, length):
+        """Return a read-only view of a payload, without copying it."""
+        offset = slot * self._slot_size
+        return self._shm.buf[offset : offset + length].toreadonly()
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
 
 
 class _LocalServer:
@@ -181,20 +301,28 @@ class _LocalServer:
         self,
         num_tokens_per_producer,
         input_queue_maxsize,
-        conn,
+        conns,
         use_zeromq,
         engine_id,
+        ring=None,
+        max_num_tokens=None,
     ):
         self._input_queue = asyncio.Queue(input_queue_maxsize)
-        self._conn = conn
-        self._result_ready = asyncio.Event()
+        # One connection to each engine worker process
+        self._conns = conns
+        self._ring = ring
         self._engine_ids = {engine_id}
         self._server = (ZeroMQServer if use_zeromq else WebsocketServer)(
-            num_tokens_per_producer, self._send_to_engine, self._engine_ids
+            num_tokens_per_producer,
+            self._send_to_engine,
+            self._engine_ids,
+            max_tokens_per_producer=max_num_tokens,
         )
         self.engine_id = engine_id
 
-    async def _send_to_engine(self, from_client, address, client_info):
+    async def _send_to_engine(
+        self, from_client, address, client_info, input_frame
+    ):
         logger.debug("Received input from client %s", address)
         if self._input_queue.full():
             return (
@@ -202,7 +330,23 @@ class _LocalServer:
                 "Input queue is full, dropping input",
             )
 
-        self._input_queue.put_nowait((from_client, address, client_info))
+        if input_frame is not None:
+            # The engine process is sent the whole FromClient, so an input
+            # sent with split framing is put back together here
+            from_client.input.input_frame.ParseFromString(input_frame)
+
+        deadline = None
+        if from_client.input.max_age_ms:
+            now = time.time()
+            capture_time = now
+            if from_client.input.capture_time_us:
+                capture_time = min(
+                    from_client.input.capture_time_us / 1e6, now
+                )
+            deadline = capture_time + from_client.input.max_age_ms / 1000
+        self._input_queue.put_nowait(
+            (from_client, address, client_info, deadline)
+        )
         return (gabriel_pb2.StatusCode.SUCCESS, "")
 
     def launch(self, port_or_path, message_max_size, use_ipc=False):
@@ -214,40 +358,73 @@ class _LocalServer:
         self, port_or_path, message_max_size, use_ipc=False
     ):
         logger.info(f"Starting local server on port {port_or_path}")
-        asyncio.get_event_loop().add_reader(
-            self._conn.fileno(), self._result_ready.set
-        )
-        comm_task = asyncio.create_task(self._engine_comm())
+        # Each engine worker gets its own task, which takes the next input
+        # from the shared input queue whenever its worker is idle
+        comm_tasks = []
+        for conn in self._conns:
+            result_ready = asyncio.Event()
+            asyncio.get_event_loop().add_reader(
+                conn.fileno(), result_ready.set
+            )
+            comm_tasks.append(
+                asyncio.create_task(self._engine_comm(conn, result_ready))
+            )
         server_task = asyncio.create_task(
             self._server.launch_async(
                 port_or_path, message_max_size, use_ipc=use_ipc
             )
         )
-        await asyncio.gather(comm_task, server_task)
+        await asyncio.gather(*comm_tasks, server_task)
 
-    async def _engine_comm(self):
+    async def _engine_comm(self, conn, result_ready):
         await self._server.wait_for_start()
         loop = asyncio.get_running_loop()
         while self._server.is_running():
-            from_client, address, client_info = await self._input_queue.get()
+            queued_input = await self._input_queue.get()
+            from_client, address, client_info, deadline = queued_input
+            if not self._server.is_client_connected(address):
+                logger.debug(
+                    f"Discarding input from disconnected client {address}"
+                )
+                continue
+            if deadline is not None and time.time() >= deadline:
+                # Return the token of an input that is no longer useful
+                # rather than having the engine process it
+                result = gabriel_pb2.Result()
+                result.status.code = gabriel_pb2.StatusCode.FRAME_EXPIRED
+                result.status.message = "Input expired in the queue"
+                result.frame_id = from_client.input.frame_id
+                await self._server.send_result(
+                    address,
+                    from_client.input.producer_id,
+                    self.engine_id,
+                    result,
+                    return_token=True,
+                )
+                continue
+            slot = None
+            if self._ring is not None:
+                slot = await self._send_slot_descriptor(conn, from_client)
             await loop.run_in_executor(
                 None,
-                self._conn.send_bytes,
+                conn.send_bytes,
                 from_client.SerializeToString(),
             )
             await loop.run_in_executor(
                 None,
-                self._conn.send_bytes,
+                conn.send_bytes,
                 client_info.SerializeToString(),
             )
             result = gabriel_pb2.Result()
 
-            await self._result_ready.wait()
-            self._result_ready.clear()
+            await result_ready.wait()
+            result_ready.clear()
 
             # Get the result from the engine
-            data = await loop.run_in_executor(None, self._conn.recv_bytes)
+            data = await loop.run_in_executor(None, conn.recv_bytes)
             result.ParseFromString(data)
+            if slot is not None:
+                self._ring.release(slot)
 
             await self._server.send_result(
                 address,
@@ -256,3 +433,35 @@ class _LocalServer:
                 result,
                 return_token=True,
             )
+
+    async def _send_slot_descriptor(self, conn, from_client):
+        """Move the byte payload of an input into a shared memory slot.
+
+        Clears the payload from from_client and sends the descriptor of the
+        slot to the engine. The payload stays in from_client, and is sent
+        through the pipe, if it is not a byte payload or if there is no slot
+        that can hold it. Returns the slot, or None if no slot was used.
+        """
+        input_frame = from_client.input.input_frame
+        slot = None
+        length = 0
+        if input_frame.WhichOneof("payload") == "byte_payload":
+            payload = input_frame.byte_payload
+            if self._ring.can_hold(len(payload)):
+                slot = self._ring.acquire()
+            if slot is not None:
+                self._ring.write(slot, payload)
+                input_frame.ClearField("byte_payload")
+                length = len(payload)
+            else:
+                logger.debug(
+                    f"No shared memory slot for payload of {len(payload)} "
+                    f"bytes, sending it through the pipe"
+                )
+
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            conn.send_bytes,
+            _SLOT_DESCRIPTOR.pack(-1 if slot is None else slot, length),
+        )
+        return slot
@@ -6,16 +6,22 @@ Handles communication between the cognitive engine and the server.
 import asyncio
 import logging
 import threading
+import time
+from collections import OrderedDict
 
 import grpc
+from gabriel_protocol.framing import decode_to_engine
 from gabriel_protocol.tls_utils import build_channel_credentials
-from gabriel_protocol.v1 import gabriel_pb2, gabriel_pb2_grpc
+from gabriel_protocol.v1 import gabriel_pb2
 from google.protobuf.any_pb2 import Any
+from prometheus_client import Histogram
 
 from gabriel_server import cognitive_engine
 
 TEN_SECONDS = 10
 REQUEST_RETRIES = 3
+# Default maximum number of client sessions whose client_info is cached
+DEFAULT_CLIENT_INFO_CACHE_SIZE = 1024
 
 # gRPC keepalive ping interval/timeout for the channel to the server. Detects a
 # dead connection without relying on an application-level heartbeat. The
@@ -24,6 +30,11 @@ REQUEST_RETRIES = 3
 KEEPALIVE_TIME_MS = 10_000
 KEEPALIVE_TIMEOUT_MS = 5_000
 
+_ENGINE_SERVICE_NAME = gabriel_pb2.DESCRIPTOR.services_by_name[
+    "GabrielEngineService"
+].full_name
+_ENGINE_SESSION_METHOD = f"/{_ENGINE_SERVICE_NAME}/EngineSession"
+
 # The server also pings this channel itself. This must be at least as
 # permissive as that interval, or the channel will tear down the connection for
 # "too_many_pings" in the other direction.
@@ -31,6 +42,13 @@ KEEPALIVE_MIN_PING_INTERVAL_MS = 5_000
 
 logger = logging.getLogger(__name__)
 
+ENGINE_BATCH_SIZE = Histogram(
+    "gabriel_engine_batch_size",
+    "Number of inputs processed together in one batch by an engine",
+    ["engine_id"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
 
 class _EngineHandlerError(Exception):
     """Raised when the engine's handle() call returns something malformed.
@@ -62,6 +80,11 @@ class EngineRunner:
         tls_ca_cert: str = None,
         tls_client_cert: str = None,
         tls_client_key: str = None,
+        max_batch_size: int = 1,
+        max_batch_wait_ms: float = 0,
+        pipeline_depth: int = 1,
+        client_info_cache_size: int = DEFAULT_CLIENT_INFO_CACHE_SIZE,
+        max_input_age_ms: int = 0,
     ):
         """Initializes the engine runner.
 
@@ -92,6 +115,31 @@ class EngineRunner:
                 Path to a PEM client private key presented to the server
                 for mutual TLS. Must be given together with
                 tls_client_cert.
+            max_batch_size (int):
+                The maximum number of inputs passed to the engine's
+                handle_batch() at once. The server keeps up to this many
+                inputs in flight to the engine. If 1, the engine's handle()
+                is called for each input instead.
+            max_batch_wait_ms (float):
+                How long to wait, in milliseconds, for more inputs to fill
+                a batch once the first input of the batch has arrived.
+            pipeline_depth (int):
+                The maximum number of inputs the server sends to the engine
+                before it has returned results for them. Values above 1 let
+                the next inputs reach the engine while it is still
+                processing the current ones, hiding the round trip to the
+                server. The server keeps at least max_batch_size inputs in
+                flight regardless.
+            client_info_cache_size (int):
+                The maximum number of client sessions whose client_info is
+                kept. The server sends the client_info of a session once,
+                and again only if it has been evicted from this cache since.
+            max_input_age_ms (int):
+                The maximum age of an input, in milliseconds since it was
+                captured, for the engine to process it. The server returns
+                the tokens of older inputs instead of sending them to the
+                engine. If 0, inputs are processed however old they are,
+                unless the client set a maximum age for them.
         """
         self.engine = engine
         self.engine_id = engine_id
@@ -99,6 +147,19 @@ class EngineRunner:
         self.all_responses_required = all_responses_required
         self.timeout = timeout
         self.request_retries = request_retries
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait_ms = max_batch_wait_ms
+        if pipeline_depth < 1:
+            raise ValueError("pipeline_depth must be at least 1")
+        self.pipeline_depth = pipeline_depth
+        if client_info_cache_size < 1:
+            raise ValueError("client_info_cache_size must be at least 1")
+        self.client_info_cache_size = client_info_cache_size
+        if max_input_age_ms < 0:
+            raise ValueError("max_input_age_ms must not be negative")
+        self.max_input_age_ms = max_input_age_ms
         self.credentials = build_channel_credentials(
             tls_ca_cert, tls_client_cert, tls_client_key
         )
@@ -153,8 +214,15 @@ class EngineRunner:
                     continue
 
                 try:
-                    stub = gabriel_pb2_grpc.GabrielEngineServiceStub(channel)
-                    call = stub.EngineSession()
+                    # Called without GabrielEngineServiceStub, so that
+                    # inputs are parsed with decode_to_engine
+                    call = channel.stream_stream(
+                        _ENGINE_SESSION_METHOD,
+                        request_serializer=(
+                            gabriel_pb2.FromEngine.SerializeToString
+                        ),
+                        response_deserializer=decode_to_engine,
+                    )()
                     await self.engine_loop(call)
                     retries_left = self.request_retries
                 except grpc.aio.AioRpcError as e:
@@ -178,6 +246,11 @@ class EngineRunner:
         register = gabriel_pb2.FromEngine.Register(
             engine_id=self.engine_id,
             all_responses_required=self.all_responses_required,
+            max_batch_size=self.max_batch_size,
+            pipeline_depth=self.pipeline_depth,
+            client_info_cache_size=self.client_info_cache_size,
+            max_input_age_ms=self.max_input_age_ms,
+            supports_cancel=True,
         )
         write_lock = asyncio.Lock()
         async with write_lock:
@@ -188,6 +261,14 @@ class EngineRunner:
         )
 
         frame_queue = asyncio.Queue()
+        # The client_info of each client session announced by the server,
+        # least recently used first. The server evicts sessions from its
+        # copy of this cache in the same order.
+        client_infos = OrderedDict()
+        # The (producer id, frame id) of the inputs in frame_queue, and of
+        # those of them that the server cancelled
+        waiting = set()
+        cancelled = set()
 
         async def reader():
             while True:
@@ -197,12 +278,56 @@ class EngineRunner:
                     logger.info(f"{self.engine_id}: server closed the session")
                     return
 
+                message_type = (
+                    to_engine.WhichOneof("message_type")
+                    if to_engine is not None
+                    else None
+                )
+                if message_type == "client_session_opened":
+                    client_session = to_engine.client_session_opened
+                    client_infos[client_session.session_handle] = (
+                        client_session.client_info
+                    )
+                    if len(client_infos) > self.client_info_cache_size:
+                        client_infos.popitem(last=False)
+                    continue
+                if message_type == "client_session_closed":
+                    client_infos.pop(to_engine.client_session_closed, None)
+                    continue
+                if message_type == "cancel_input":
+                    # An input that the engine has started to process is
+                    # finished as usual
+                    input_key = (to_engine.producer_id, to_engine.frame_id)
+                    if input_key in waiting:
+                        cancelled.add(input_key)
+                    continue
+
                 logger.debug(f"{self.engine_id} received input from server")
 
+                if message_type != "input_frame":
+                    await self._send_malformed_input_error(
+                        call, write_lock, to_engine
+                    )
+                    continue
+
+                client_info = to_engine.client_info
+                if to_engine.session_handle:
+                    if to_engine.session_handle in client_infos:
+                        client_infos.move_to_end(to_engine.session_handle)
+                        client_info = client_infos[to_engine.session_handle]
+                    else:
+                        logger.error(
+                            f"{self.engine_id}: no client_info for client "
+                            f"session {to_engine.session_handle}"
+                        )
+
+                # The time is only recorded for traced inputs
+                receive_ns = time.monotonic_ns() if to_engine.trace else 0
                 try:
                     frame_queue.put_nowait(
-                        (to_engine.input_frame, to_engine.client_info)
+                        (to_engine, client_info, receive_ns)
                     )
+                    waiting.add((to_engine.producer_id, to_engine.frame_id))
                 except asyncio.QueueFull:
                     logger.error(f"{self.engine_id}: queue is full")
 
@@ -215,25 +340,55 @@ class EngineRunner:
 
         async def worker():
             while True:
-                input_frame, client_info = await frame_queue.get()
+                batch = []
+                for queued_input in await self._get_batch(frame_queue):
+                    to_engine = queued_input[0]
+                    input_key = (to_engine.producer_id, to_engine.frame_id)
+                    waiting.discard(input_key)
+                    if input_key in cancelled:
+                        cancelled.remove(input_key)
+                        await self._send_cancelled_result(
+                            call, write_lock, to_engine
+                        )
+                    else:
+                        batch.append(queued_input)
+                if not batch:
+                    continue
+                ENGINE_BATCH_SIZE.labels(engine_id=self.engine_id).observe(
+                    len(batch)
+                )
                 try:
                     # Run the engine handle() in a separate thread, so we do
                     # not block reading from the stream
-                    result_proto = await asyncio.to_thread(
-                        self._build_result_proto, input_frame, client_info
-                    )
+                    (
+                        result_protos,
+                        handle_start_ns,
+                        handle_end_ns,
+                    ) = await asyncio.to_thread(self._run_batch, batch)
                 except _EngineHandlerError as e:
+                    # Without the ids of an input, the server matches the
+                    # error to the oldest input it has in flight
                     async with write_lock:
                         await call.write(
                             gabriel_pb2.FromEngine(result=e.result_proto)
                         )
                     raise Exception(str(e)) from e
 
-                logger.debug(f"{self.engine_id} sending result to server")
+                logger.debug(f"{self.engine_id} sending results to server")
                 async with write_lock:
-                    await call.write(
-                        gabriel_pb2.FromEngine(result=result_proto)
-                    )
+                    for (to_engine, _, receive_ns), result_proto in zip(
+                        batch, result_protos
+                    ):
+                        from_engine = gabriel_pb2.FromEngine(
+                            result=result_proto,
+                            frame_id=to_engine.frame_id,
+                            producer_id=to_engine.producer_id,
+                        )
+                        if to_engine.trace:
+                            from_engine.trace.engine_receive_ns = receive_ns
+                            from_engine.trace.handle_start_ns = handle_start_ns
+                            from_engine.trace.handle_end_ns = handle_end_ns
+                        await call.write(from_engine)
 
         # Reads from the gRPC stream
         reader_task = asyncio.create_task(reader())
@@ -259,14 +414,128 @@ class EngineRunner:
             if exc is not None:
                 raise exc
 
-    def _build_result_proto(self, input_frame, client_info):
-        """Run the engine's handle() and build the FromEngine result.
+    async def _send_malformed_input_error(self, call, write_lock, to_engine):
+        """Return an error for an input whose InputFrame could not be parsed.
+
+        to_engine is the rest of the input, parsed by decode_to_engine, or
+        None if gRPC could not parse any of it. Without the ids of an input,
+        the server matches the error to the oldest input it has in flight.
+        """
+        logger.error(f"{self.engine_id}: could not parse input from server")
+        result = gabriel_pb2.Result(target_engine_id=self.engine_id)
+        result.status.code = gabriel_pb2.StatusCode.WRONG_INPUT_FORMAT
+        result.status.message = "Could not parse input frame"
+        from_engine = gabriel_pb2.FromEngine(result=result)
+        if to_engine is not None:
+            from_engine.frame_id = to_engine.frame_id
+            from_engine.producer_id = to_engine.producer_id
+        async with write_lock:
+            await call.write(from_engine)
+
+    async def _send_cancelled_result(self, call, write_lock, to_engine):
+        """Return a result for an input that the server cancelled."""
+        logger.debug(
+            f"{self.engine_id}: frame {to_engine.frame_id} from "
+            f"{to_engine.producer_id} was cancelled"
+        )
+        result = gabriel_pb2.Result(target_engine_id=self.engine_id)
+        result.status.code = gabriel_pb2.StatusCode.INPUT_CANCELLED
+        result.status.message = "Input cancelled by the server"
+        from_engine = gabriel_pb2.FromEngine(
+            result=result,
+            frame_id=to_engine.frame_id,
+            producer_id=to_engine.producer_id,
+        )
+        async with write_lock:
+            await call.write(from_engine)
+
+    async def _get_batch(self, frame_queue):
+        """Wait for the next batch of inputs from the frame queue.
+
+        Waits for the first input, then for up to max_batch_wait_ms for more
+        inputs, until the batch has max_batch_size inputs.
+        """
+        batch = [await frame_queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_batch_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            if not frame_queue.empty():
+                batch.append(frame_queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(frame_queue.get(), timeout)
+                )
+            except (TimeoutError, asyncio.TimeoutError):
+                break
+        return batch
+
+    def _run_batch(self, batch):
+        """Run the engine on a batch of inputs, timing the engine.
+
+        Returns the results, and the time.monotonic_ns() before and after
+        the engine processed the batch.
+        """
+        handle_start_ns = time.monotonic_ns()
+        result_protos = self._build_result_protos(batch)
+        return result_protos, handle_start_ns, time.monotonic_ns()
+
+    def _build_result_protos(self, batch):
+        """Run the engine on a batch of inputs and build the results.
+
+        Each input in the batch is a ToEngine, paired with the client_info
+        of its client session and the time.monotonic_ns() at which it was
+        received, if it is traced.
+
+        Calls the engine's handle() if batching is disabled, and its
+        handle_batch() otherwise.
 
         Raises _EngineHandlerError, carrying an ENGINE_ERROR result proto, if
         the engine returns something malformed.
         """
-        result = self.engine.handle(input_frame, client_info)
+        if self.max_batch_size == 1:
+            ((to_engine, client_info, _),) = batch
+            return [
+                self._build_result_proto(
+                    self.engine.handle(to_engine.input_frame, client_info)
+                )
+            ]
+
+        input_frames = [to_engine.input_frame for to_engine, _, _ in batch]
+        client_infos = [client_info for _, client_info, _ in batch]
+        results = self.engine.handle_batch(input_frames, client_infos)
+
+        error_msg = None
+        if not isinstance(results, list):
+            error_msg = (
+                f"Incorrect type returned by engine handle_batch(). "
+                f"Expected a list, found {type(results)}"
+            )
+        elif len(results) != len(batch):
+            error_msg = (
+                f"Incorrect number of results returned by engine "
+                f"handle_batch(). Expected {len(batch)}, found "
+                f"{len(results)}"
+            )
+        if error_msg is not None:
+            logger.error(error_msg)
+            result_proto = gabriel_pb2.Result()
+            result_proto.target_engine_id = self.engine_id
+            result_proto.status.code = gabriel_pb2.StatusCode.ENGINE_ERROR
+            result_proto.status.message = error_msg
+            raise _EngineHandlerError(error_msg, result_proto)
+
+        return [self._build_result_proto(result) for result in results]
+
+    def _build_result_proto(self, result):
+        """Build the FromEngine result for a value returned by the engine.
 
+        Raises _EngineHandlerError, carrying an ENGINE_ERROR result proto, if
+        the engine returns something malformed.
+        """
         result_proto = gabriel_pb2.Result()
         result_proto.target_engine_id = self.engine_id
 
@@ -0,0 +1,238 @@
+"""Policies for choosing which producer an engine is sent its next input from.
+
+Each engine id has a scheduler, shared by all of its replicas. The scheduler
+keeps track of the producers that may have an input for the engine. A
+producer is added whenever it receives an input that targets the engine,
+and is discarded once the engine finds that it has nothing left to send,
+so the cost of choosing a producer does not depend on the number of idle
+producers.
+"""
+
+import enum
+import heapq
+import itertools
+import math
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class SchedulingPolicy(enum.Enum):
+    """How an engine chooses the producer to send its next input from."""
+
+    # Take turns between producers
+    ROUND_ROBIN = "round_robin"
+    # Share the engine between producers in proportion to their weights
+    WEIGHTED_FAIR = "weighted_fair"
+    # Always serve the producers with the highest priority first, taking
+    # turns between producers with the same priority
+    PRIORITY = "priority"
+    # Serve the producer whose next input has the earliest deadline first
+    EARLIEST_DEADLINE = "earliest_deadline"
+
+
+class Scheduler(ABC):
+    """Abstract base class for schedulers.
+
+    Producers passed to a scheduler provide get_priority(), get_weight() and
+    get_next_deadline().
+    """
+
+    @abstractmethod
+    def add(self, producer):
+        """Add a producer that may have an input to send.
+
+        Adding a producer that has already been added has no effect.
+        """
+        pass
+
+    @abstractmethod
+    def discard(self, producer):
+        """Discard a producer that has no input to send, if it was added."""
+        pass
+
+    def remove(self, producer):
+        """Forget a producer that will not be added again.
+
+        Unlike discard, no state is kept for the producer to be added back
+        with.
+        """
+        self.discard(producer)
+
+    @abstractmethod
+    def peek(self):
+        """Return the producer to send the next input from, or None."""
+        pass
+
+    @abstractmethod
+    def sent(self, producer):
+        """Record that an input from the producer returned by peek was sent.
+
+        The producer stays added, since it may have more inputs to send.
+        """
+        pass
+
+
+class RoundRobinScheduler(Scheduler):
+    """Takes turns between producers, in the order they were added."""
+
+    def __init__(self):
+        """Initialize the round-robin scheduler."""
+        self._producers = OrderedDict()
+
+    def add(self, producer):
+        """Add a producer after the producers that were already added."""
+        self._producers.setdefault(producer)
+
+    def discard(self, producer):
+        """Discard a producer."""
+        self._producers.pop(producer, None)
+
+    def peek(self):
+        """Return the producer whose turn it is."""
+        return next(iter(self._producers), None)
+
+    def sent(self, producer):
+        """Move the producer to the back of the line."""
+        if producer in self._producers:
+            self._producers.move_to_end(producer)
+
+
+class _HeapScheduler(Scheduler):
+    """Serves the producer with the smallest key, kept in a binary heap.
+
+    Entries are invalidated rather than removed from the heap when a
+    producer is discarded or its key changes, and invalid entries are
+    dropped when they reach the top of the heap. The heap is rebuilt once
+    it holds more invalid entries than valid ones, so each operation takes
+    O(log n) amortized time for n producers.
+    """
+
+    def __init__(self):
+        # Entries are [key, sequence number, producer], and the producer of
+        # an invalid entry is None. The sequence number breaks ties in the
+        # order that entries were pushed.
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    @abstractmethod
+    def _key(self, producer, sent):
+        """Return the key of a producer that was added or had an input sent."""
+        pass
+
+    def _push(self, producer, key):
+        entry = [key, next(self._counter), producer]
+        self._entries[producer] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _invalidate(self, producer):
+        entry = self._entries.pop(producer, None)
+        if entry is None:
+            return False
+        entry[-1] = None
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+        return True
+
+    def add(self, producer):
+        if producer not in self._entries:
+            self._push(producer, self._key(producer, sent=False))
+
+    def discard(self, producer):
+        self._invalidate(producer)
+
+    def peek(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][-1] if self._heap else None
+
+    def sent(self, producer):
+        if self._invalidate(producer):
+            self._push(producer, self._key(producer, sent=True))
+
+
+class PriorityScheduler(_HeapScheduler):
+    """Serves the producers with the highest priority first.
+
+    Producers with the same priority take turns.
+    """
+
+    def _key(self, producer, sent):
+        return -producer.get_priority()
+
+
+class WeightedFairScheduler(_HeapScheduler):
+    """Shares the engine between producers in proportion to their weights.
+
+    Uses start-time fair queueing, with each input counting as one unit of
+    work. A producer's start tag is the virtual time at which it would
+    next be served. Serving the producer with the smallest start tag
+    advances the virtual time to that tag, and the producer's next tag by
+    the reciprocal of its weight. A producer that is added after being idle
+    starts at the current virtual time, so it cannot save up a share of the
+    engine while it has nothing to send.
+    """
+
+    def __init__(self):
+        """Initialize the weighted fair scheduler."""
+        super().__init__()
+        self._virtual_time = 0.0
+        # Next start tags of producers that were discarded before reaching
+        # them
+        self._finish_tags = {}
+
+    def _key(self, producer, sent):
+        if sent:
+            return self._finish_tags.pop(producer)
+        return max(self._virtual_time, self._finish_tags.pop(producer, 0.0))
+
+    def discard(self, producer):
+        """Discard a producer, keeping its start tag if it is ahead."""
+        entry = self._entries.get(producer)
+        if entry is not None and entry[0] > self._virtual_time:
+            self._finish_tags[producer] = entry[0]
+        super().discard(producer)
+
+    def remove(self, producer):
+        """Forget a producer, along with its start tag."""
+        self._invalidate(producer)
+        self._finish_tags.pop(producer, None)
+
+    def sent(self, producer):
+        """Advance the virtual time and the producer's start tag."""
+        entry = self._entries.get(producer)
+        if entry is None:
+            return
+        self._virtual_time = max(self._virtual_time, entry[0])
+        self._finish_tags[producer] = self._virtual_time + 1 / max(
+            producer.get_weight(), 1
+        )
+        super().sent(producer)
+
+
+class EarliestDeadlineScheduler(_HeapScheduler):
+    """Serves the producer whose next input has the earliest deadline.
+
+    Producers whose next input has no deadline are served after all of the
+    ones with a deadline, in turn. A producer's key is only updated when it
+    is added or has an input sent, so it reflects the deadline of its next
+    input at that time.
+    """
+
+    def _key(self, producer, sent):
+        deadline = producer.get_next_deadline()
+        return math.inf if deadline is None else deadline
+
+
+_SCHEDULER_CLASSES = {
+    SchedulingPolicy.ROUND_ROBIN: RoundRobinScheduler,
+    SchedulingPolicy.WEIGHTED_FAIR: WeightedFairScheduler,
+    SchedulingPolicy.PRIORITY: PriorityScheduler,
+    SchedulingPolicy.EARLIEST_DEADLINE: EarliestDeadlineScheduler,
+}
+
+
+def make_scheduler(scheduling_policy):
+    """Create a scheduler for the scheduling policy."""
+    return _SCHEDULER_CLASSES[scheduling_policy]()
@@ -2,24 +2,36 @@
 
 import asyncio
 import enum
+import itertools
 import logging
 import time
-from collections import deque, namedtuple
+from collections import OrderedDict, deque, namedtuple
 from typing import Optional, Union
 
 import grpc
+from gabriel_protocol.framing import encode_to_engine
 from gabriel_protocol.tls_utils import build_server_credentials
+from gabriel_protocol.tracing import stage_durations
 from gabriel_protocol.v1 import gabriel_pb2, gabriel_pb2_grpc
 from gabriel_protocol.v1.gabriel_pb2 import StatusCode
 from prometheus_client import Counter, Gauge, Histogram, start_http_server
 
 from gabriel_server.grpc_server import GrpcServer
+from gabriel_server.network_engine.scheduler import (
+    RoundRobinScheduler,
+    SchedulingPolicy,
+    make_scheduler,
+)
 from gabriel_server.websocket_server import WebsocketServer
 from gabriel_server.zeromq_server import ZeroMQServer
 
 FIVE_SECONDS = 5
 ENGINE_SERVER_STOP_GRACE_SECONDS = 1
 
+# Seconds that a producer can go without inputs before its state on the
+# server is removed
+DEFAULT_PRODUCER_IDLE_TIMEOUT = 60
+
 # Must permit pings at least as often as the engine's
 # engine_runner.KEEPALIVE_TIME_MS, or gRPC will kill the connection for
 # "too_many_pings" instead of letting the keepalive do its job.
@@ -32,6 +44,10 @@ ENGINE_KEEPALIVE_MIN_PING_INTERVAL_MS = 5_000
 ENGINE_KEEPALIVE_TIME_MS = 10_000
 ENGINE_KEEPALIVE_TIMEOUT_MS = 5_000
 
+_ENGINE_SERVICE_NAME = gabriel_pb2.DESCRIPTOR.services_by_name[
+    "GabrielEngineService"
+].full_name
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,6 +59,17 @@ class Transport(enum.Enum):
     GRPC = "grpc"
 
 
+class QueuePolicy(enum.Enum):
+    """What to do with an input when its producer's queue is full."""
+
+    # Drop the new input
+    DROP_NEWEST = "drop_newest"
+    # Evict the oldest queued input to make room for the new one
+    DROP_OLDEST = "drop_oldest"
+    # Only queue the newest input, evicting any input already queued
+    KEEP_LATEST_ONLY = "keep_latest_only"
+
+
 _TRANSPORT_CLASSES = {
     Transport.ZEROMQ: ZeroMQServer,
     Transport.WEBSOCKET: WebsocketServer,
@@ -57,13 +84,51 @@ _Metadata = namedtuple(
         "producer_id",
         "client_address",
         "target_engine_ids",
-        "client_info",
+        "client_session",
+        # When the input was captured, in seconds since the Unix epoch
+        "capture_time",
+        # When the input expires, in seconds since the Unix epoch, or None
+        # if it does not expire
+        "deadline",
+        # The Trace of the input, with the times recorded when the server
+        # accepted it, or None if the input is not traced
+        "trace",
     ],
 )
 
+# The client_info registered by a connected client, and the handle that
+# engines are sent it under. The handle is zero if the client registered no
+# client_info, in which case nothing is sent to engines.
+_ClientSession = namedtuple("_ClientSession", ["handle", "client_info"])
+
 
+# An input together with its serialized ToEngine. The ToEngine is encoded
+# once per input and the same bytes are written to every engine the input is
+# sent to, and are released along with the input.
 _MetadataPayload = namedtuple("_MetadataPayload", ["metadata", "payload"])
 
+# An input sent to an engine that has not returned a result yet, with the
+# time.perf_counter() and, for traced inputs, the time.monotonic_ns() at which
+# it was sent
+_InFlightInput = namedtuple(
+    "_InFlightInput", ["metadata", "send_time", "dispatch_ns"]
+)
+
+
+def _input_expired(metadata, now, max_input_age=None):
+    """Return whether an input is too old to be sent to an engine.
+
+    An input expires at its own deadline, or once it is older than the
+    engine's max_input_age (in seconds), whichever comes first.
+    """
+    if metadata.deadline is not None and now >= metadata.deadline:
+        return True
+    return (
+        max_input_age is not None
+        and now - metadata.capture_time >= max_input_age
+    )
+
+
 ENGINE_LATENCY = Histogram(
     "gabriel_engine_processing_latency_seconds",
     "End-to-end engine processing latency",
@@ -76,6 +141,18 @@ PRODUCER_QUEUE_LENGTH = Gauge(
     ["producer_id"],
 )
 
+PRODUCER_QUEUE_DROPPED_TOTAL = Counter(
+    "gabriel_producer_queue_dropped_total",
+    "Total number of inputs dropped or evicted from a full producer queue",
+    ["producer_id", "policy"],
+)
+
+PRODUCER_INPUTS_EXPIRED_TOTAL = Counter(
+    "gabriel_producer_inputs_expired_total",
+    "Total number of inputs that expired before they were sent to an engine",
+    ["producer_id"],
+)
+
 CLIENT_INPUTS_RECEIVED_TOTAL = Counter(
     "gabriel_producer_inputs_received_total",
     "Total number of client inputs received by the Gabriel server from a "
@@ -83,6 +160,13 @@ CLIENT_INPUTS_RECEIVED_TOTAL = Counter(
     ["producer_id"],
 )
 
+DISCONNECTED_CLIENT_INPUTS_TOTAL = Counter(
+    "gabriel_disconnected_client_inputs_total",
+    "Total number of inputs whose client disconnected before they were "
+    "processed, discarded from a queue or cancelled on an engine",
+    ["state"],
+)
+
 ENGINE_INPUTS_RECEIVED_TOTAL = Counter(
     "gabriel_engine_inputs_received_total",
     "Total number of client inputs received that target an engine",
@@ -95,6 +179,41 @@ ENGINE_INPUTS_PROCESSED_TOTAL = Counter(
     ["engine_id"],
 )
 
+ENGINE_INPUTS_IN_FLIGHT = Gauge(
+    "gabriel_engine_inputs_in_flight",
+    "Number of inputs sent to an engine that it has not returned results for",
+    ["engine_id"],
+)
+
+ENGINE_REPLICAS = Gauge(
+    "gabriel_engine_replicas",
+    "Number of connected replicas for each engine id",
+    ["engine_id"],
+)
+
+STAGE_LATENCY = Histogram(
+    "gabriel_stage_latency_seconds",
+    "Time that traced inputs spent in each stage of their processing",
+    ["engine_id", "stage"],
+    buckets=(
+        0.0001,
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    ),
+)
+
 
 class ServerRunner:
     """Runs the Gabriel server that connects clients to engines."""
@@ -114,6 +233,12 @@ class ServerRunner:
         tls_key: Optional[str] = None,
         tls_client_ca_cert: Optional[str] = None,
         http2_stream_window_bytes: Optional[int] = None,
+        engine_replicas: bool = False,
+        queue_policy: QueuePolicy = QueuePolicy.DROP_NEWEST,
+        producer_queue_policies: Optional[dict[str, QueuePolicy]] = None,
+        scheduling_policy: SchedulingPolicy = SchedulingPolicy.ROUND_ROBIN,
+        max_num_tokens: Optional[int] = None,
+        producer_idle_timeout: Optional[float] = DEFAULT_PRODUCER_IDLE_TIMEOUT,
     ):
         """Initialize the server runner.
 
@@ -161,7 +286,44 @@ class ServerRunner:
                 Override for the HTTP/2 per-stream flow-control window used
                 by the client-facing gRPC server. Only applies when
                 client_transport is Transport.GRPC.
+            engine_replicas (bool):
+                Whether engines that register with an engine id that is
+                already connected join a replica pool for that id, rather
+                than replacing the connected engine. Each input is sent to
+                a single idle replica, so adding replicas scales the
+                throughput of an engine id while clients still see one
+                logical engine.
+            queue_policy (QueuePolicy):
+                What to do with an input that arrives while every engine it
+                targets is busy and its producer's queue is full. Inputs
+                evicted from the queue are returned to their client with
+                the SERVER_EVICTED_FRAME status, and inputs that are dropped
+                on arrival with SERVER_DROPPED_FRAME.
+            producer_queue_policies (dict[str, QueuePolicy], optional):
+                Queue policies for specific producer ids, overriding
+                queue_policy.
+            scheduling_policy (SchedulingPolicy):
+                How each engine chooses the producer to send its next input
+                from, when inputs from several producers are waiting for it.
+                Producers set the priority and weight used by the
+                PRIORITY and WEIGHTED_FAIR policies on each input.
+            max_num_tokens (int, optional):
+                If set, the number of tokens of each producer is adapted
+                between 1 and max_num_tokens, starting from num_tokens, to
+                the number that keeps engines busy without inputs waiting
+                in queues. Clients are told each producer's number of
+                tokens as it changes.
+            producer_idle_timeout (float, optional):
+                Seconds after which the state the server keeps for a
+                producer, including its queue and its metric label series,
+                is removed, once every client that sent inputs from it has
+                disconnected, or it has no inputs queued or in flight. The
+                time is counted from the producer's last input or the
+                disconnection of its last client. If None, producers are
+                never removed.
         """
+        if producer_idle_timeout is not None and producer_idle_timeout <= 0:
+            raise ValueError("producer_idle_timeout must be positive")
         self.client_endpoint = client_endpoint
         self.engine_endpoint = engine_endpoint
         self.num_tokens = num_tokens
@@ -175,6 +337,12 @@ class ServerRunner:
         self.tls_key = tls_key
         self.tls_client_ca_cert = tls_client_ca_cert
         self.http2_stream_window_bytes = http2_stream_window_bytes
+        self.engine_replicas = engine_replicas
+        self.queue_policy = queue_policy
+        self.producer_queue_policies = producer_queue_policies or {}
+        self.scheduling_policy = scheduling_policy
+        self.max_num_tokens = max_num_tokens
+        self.producer_idle_timeout = producer_idle_timeout
 
     def run(self):
         """Run the Gabriel server."""
@@ -201,6 +369,12 @@ class ServerRunner:
             self.tls_key,
             self.tls_client_ca_cert,
             self.http2_stream_window_bytes,
+            self.engine_replicas,
+            self.queue_policy,
+            self.producer_queue_policies,
+            self.scheduling_policy,
+            self.max_num_tokens,
+            self.producer_idle_timeout,
         )
         self.server = server.server
         try:
@@ -230,14 +404,34 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
         tls_key=None,
         tls_client_ca_cert=None,
         http2_stream_window_bytes=None,
+        engine_replicas=False,
+        queue_policy=QueuePolicy.DROP_NEWEST,
+        producer_queue_policies=None,
+        scheduling_policy=SchedulingPolicy.ROUND_ROBIN,
+        max_num_tokens=None,
+        producer_idle_timeout=None,
     ):
         self._engine_endpoint = engine_endpoint
         self._use_engine_ipc = use_engine_ipc
+        # Mapping from an engine's gRPC context to its engine worker
         self._engine_workers = {}
+        # Mapping from engine id to the pool of replicas for that id
+        self._engine_pools: dict[str, _EnginePool] = {}
+        self._engine_replicas = engine_replicas
         self._engine_ids = set()
         # Mapping from producer id to producer info
         self._producer_infos: dict[str, _ProducerInfo] = {}
+        # Mapping from client address to the ids of the producers that the
+        # client sent inputs from
+        self._client_producer_ids: dict[str, set[str]] = {}
+        self._producer_idle_timeout = producer_idle_timeout
+        # Mapping from client address to the client's session
+        self._client_sessions: dict[str, _ClientSession] = {}
+        self._session_handles = itertools.count(1)
         self._size_for_queues = size_for_queues
+        self._queue_policy = queue_policy
+        self._producer_queue_policies = producer_queue_policies or {}
+        self._scheduling_policy = scheduling_policy
         self._tls_cert = tls_cert
         self._tls_key = tls_key
         self._tls_client_ca_cert = tls_client_ca_cert
@@ -254,6 +448,8 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
             num_tokens,
             self._send_to_engine,
             self._engine_ids,
+            client_disconnected_cb=self._client_disconnected,
+            max_tokens_per_producer=max_num_tokens,
             **transport_kwargs,
         )
         self.client_transport = client_transport
@@ -270,6 +466,14 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
                 await asyncio.sleep(10)
                 logger.info(f"Connected engines: {self._engine_ids}")
 
+        async def collect_idle_producers():
+            await self.server.wait_for_start()
+            while self.server.is_running():
+                await asyncio.sleep(
+                    min(self._producer_idle_timeout, FIVE_SECONDS)
+                )
+                await self._collect_idle_producers()
+
         options = [
             # Permit the engine's own keepalive pings (see engine_runner.py's
             # KEEPALIVE_TIME_MS) on an otherwise idle stream, so the server
@@ -294,8 +498,26 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
             )
 
         self._engine_grpc_server = grpc.aio.server(options=options)
-        gabriel_pb2_grpc.add_GabrielEngineServiceServicer_to_server(
-            self, self._engine_grpc_server
+        # Registered by hand rather than with
+        # add_GabrielEngineServiceServicer_to_server, so that ToEngine
+        # messages can be written already serialized (see
+        # _EngineWorker.send_payload)
+        rpc_method_handlers = {
+            "EngineSession": grpc.stream_stream_rpc_method_handler(
+                self.EngineSession,
+                request_deserializer=gabriel_pb2.FromEngine.FromString,
+                response_serializer=None,
+            ),
+        }
+        self._engine_grpc_server.add_generic_rpc_handlers(
+            (
+                grpc.method_handlers_generic_handler(
+                    _ENGINE_SERVICE_NAME, rpc_method_handlers
+                ),
+            )
+        )
+        self._engine_grpc_server.add_registered_method_handlers(
+            _ENGINE_SERVICE_NAME, rpc_method_handlers
         )
         target = (
             f"unix://{self._engine_endpoint}"
@@ -324,6 +546,8 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
         log_engines_task = asyncio.create_task(log_connected_engines())
 
         tasks = [log_engines_task, server_task]
+        if self._producer_idle_timeout is not None:
+            tasks.append(asyncio.create_task(collect_idle_producers()))
 
         try:
             await asyncio.gather(*tasks)
@@ -377,10 +601,8 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
                 logger.info(f"Engine {engine_id} stream closed")
                 await self._remove_engine_worker(context)
 
-    async def _calculate_engine_metrics(self, engine_worker):
-        processing_latency = (
-            time.perf_counter() - engine_worker.get_last_payload_send_time()
-        )
+    async def _calculate_engine_metrics(self, engine_worker, send_time):
+        processing_latency = time.perf_counter() - send_time
         logger.info(
             f"Engine {engine_worker.get_engine_id()} processing latency: "
             f"{processing_latency:.2f} seconds"
@@ -400,20 +622,33 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
             logger.error("Engine sent duplicate register message")
             return
 
-        await self._calculate_engine_metrics(engine_worker)
         logger.debug(
             f"Received result from engine {engine_worker.get_engine_id()}"
         )
 
+        result = from_engine.result
+
+        in_flight_input = engine_worker.pop_in_flight_input(
+            from_engine.frame_id, from_engine.producer_id
+        )
+        if result.status.code == StatusCode.INPUT_CANCELLED:
+            # The input's client disconnected, and the engine skipped it
+            await engine_worker.send_next_input()
+            return
+
         ENGINE_INPUTS_PROCESSED_TOTAL.labels(
             engine_id=engine_worker.get_engine_id()
         ).inc()
-
-        result = from_engine.result
-
-        engine_worker_metadata = engine_worker.get_current_input_metadata()
-        if engine_worker_metadata is not None:
+        engine_worker_metadata = None
+        trace = None
+        if in_flight_input is not None:
+            await self._calculate_engine_metrics(
+                engine_worker, in_flight_input.send_time
+            )
+            engine_worker_metadata = in_flight_input.metadata
             result.frame_id = engine_worker_metadata.frame_id
+            if engine_worker_metadata.trace is not None:
+                trace = self._trace_result(in_flight_input, from_engine)
 
         # Pass the result to the result manager for sending to any result sinks
         await self.server.result_manager.process_result(result)
@@ -426,269 +661,682 @@ class _Server(gabriel_pb2_grpc.GabrielEngineServiceServicer):
             engine_worker_metadata.producer_id
         )
         if producer_info is None:
-            logger.error("Producer info not found")
+            # The producer was removed while the engine processed its input
+            logger.debug(
+                f"Producer {engine_worker_metadata.producer_id} was removed"
+            )
+            await engine_worker.send_next_input()
             return
 
-        # Check if the result corresponds to the latest input that was
-        # available for this engine from this producer
-
-        latest_input = producer_info.latest_input_sent_to_engine
-
-        # Check if this engine is the first to finish processing the latest
-        # input. If so, it should get the next input from the queue.
-        if (
-            producer_info.pending_token_return
-            and latest_input.metadata == engine_worker_metadata
-        ):
+        # Check if this engine is the first to finish processing this input.
+        # If so, the result returns the producer's token for the input.
+        token_key = (
+            engine_worker_metadata.client_address,
+            engine_worker_metadata.frame_id,
+        )
+        if token_key in producer_info.pending_token_returns:
             # Send response to client
             logger.debug(
                 f"Sending result from engine {engine_worker.get_engine_id()}"
                 f" to client {engine_worker_metadata.client_address}"
             )
-            producer_info.pending_token_return = False
+            producer_info.pending_token_returns.discard(token_key)
             await self.server.send_result(
                 engine_worker_metadata.client_address,
                 producer_info.get_name(),
                 engine_worker.get_engine_id(),
                 result,
                 return_token=True,
+                trace=trace,
             )
+            self._observe_trace(engine_worker, trace)
 
+            # Engines of the producer's other target pools may be waiting for
+            # this token before they dequeue its next input
+            await producer_info.send_queued_inputs(engine_worker.get_pool())
             # Send the next input to the engine from the queue
             await engine_worker.send_next_input()
             return
 
-        if engine_worker.get_all_responses_required():
+        if (
+            engine_worker.get_all_responses_required()
+            and self.server.is_client_connected(
+                engine_worker_metadata.client_address
+            )
+        ):
             await self.server.send_result(
                 engine_worker_metadata.client_address,
                 producer_info.get_name(),
                 engine_worker.get_engine_id(),
                 result,
                 return_token=False,
+                trace=trace,
             )
+            self._observe_trace(engine_worker, trace)
         await engine_worker.send_next_input()
 
+    @staticmethod
+    def _trace_result(in_flight_input, from_engine):
+        """Return the Trace of a traced input that an engine returned.
+
+        The input's Trace is copied, since the input may have been sent to
+        several engines, and completed with the times recorded by the engine
+        and the times the input was sent to it and its result received.
+        """
+        trace = gabriel_pb2.Trace()
+        trace.CopyFrom(in_flight_input.metadata.trace)
+        trace.MergeFrom(from_engine.trace)
+        trace.dispatch_ns = in_flight_input.dispatch_ns
+        trace.engine_result_ns = time.monotonic_ns()
+        return trace
+
+    @staticmethod
+    def _observe_trace(engine_worker, trace):
+        """Record the time a traced input spent in each stage."""
+        if trace is None:
+            return
+        engine_id = engine_worker.get_engine_id()
+        for stage, duration in stage_durations(trace).items():
+            STAGE_LATENCY.labels(engine_id=engine_id, stage=stage).observe(
+                duration
+            )
+
     async def _add_engine_worker(self, context, register):
         engine_id = register.engine_id
+        engine_pool = self._engine_pools.get(engine_id)
 
-        # An engine with this id is already connected, remove that engine
-        # worker from the server
-        if engine_id in self._engine_ids:
+        # An engine with this id is already connected. Unless replica pools
+        # are enabled, remove that engine worker from the server
+        if engine_pool is not None and not self._engine_replicas:
             logger.warning(f"Engine with id {engine_id} is already connected!")
-            for existing_context, worker in list(self._engine_workers.items()):
-                if worker.get_engine_id() == engine_id:
-                    await self._remove_engine_worker(existing_context)
-                    break
+            for existing_worker in list(engine_pool.replicas):
+                await self._remove_engine_worker(existing_worker.get_context())
+            engine_pool = None
 
         logger.info(f"New engine {engine_id} connected")
 
+        if engine_pool is None:
+            engine_pool = _EnginePool(
+                engine_id, make_scheduler(self._scheduling_policy)
+            )
+            self._engine_pools[engine_id] = engine_pool
+            self._invalidate_target_engines()
+
         engine_worker = _EngineWorker(
             context,
-            engine_id,
+            engine_pool,
             register.all_responses_required,
             self._size_for_queues,
+            max(register.pipeline_depth, register.max_batch_size, 1),
+            max(register.client_info_cache_size, 1),
+            (
+                register.max_input_age_ms / 1000
+                if register.max_input_age_ms
+                else None
+            ),
+            register.supports_cancel,
         )
+        engine_pool.add_replica(engine_worker)
         self._engine_workers[context] = engine_worker
+        ENGINE_REPLICAS.labels(engine_id=engine_id).set(
+            len(engine_pool.replicas)
+        )
+
+        if engine_id in self._engine_ids:
+            logger.info(
+                f"Engine {engine_id} now has {len(engine_pool.replicas)} "
+                f"replicas"
+            )
+            return
+
         self._engine_ids.add(engine_id)
         await self.server._engines_updated_cb()
 
     async def _remove_engine_worker(self, context):
         """Remove an engine worker once it is disconnected.
 
-        Cleans up metrics and, if the engine was in the middle of processing a
-        frame when it disconnected, returns a token for that frame to the
-        client so it isn't left waiting forever.
+        Cleans up metrics and, for every frame the engine was in the middle
+        of processing when it disconnected, returns a token for that frame to
+        the client so it isn't left waiting forever.
         """
         engine_worker = self._engine_workers[context]
         engine_id = engine_worker.get_engine_id()
 
-        ENGINE_INPUTS_RECEIVED_TOTAL.remove(engine_id)
-        ENGINE_INPUTS_PROCESSED_TOTAL.remove(engine_id)
-
-        current_input_metadata = engine_worker.get_current_input_metadata()
-        if current_input_metadata is not None:
+        # Producers whose pending tokens this returns
+        token_returned = set()
+        for current_input_metadata in engine_worker.get_in_flight_metadata():
             producer_info = self._producer_infos.get(
                 current_input_metadata.producer_id
             )
             if producer_info is None:
-                logger.error("Source info not found")
-            else:
-                latest_input = producer_info.latest_input_sent_to_engine
-                if (
-                    latest_input is not None
-                    and current_input_metadata == latest_input.metadata
-                    and (
-                        producer_info.pending_token_return
-                        or engine_worker.get_all_responses_required()
-                    )
-                ):
-                    return_token = producer_info.pending_token_return
-                    # Clear the flag first so that other engines targeted by
-                    # the same input don't also return a token for it if
-                    # they disconnect too.
-                    producer_info.pending_token_return = False
-
-                    result = gabriel_pb2.Result()
-                    result.status.code = gabriel_pb2.StatusCode.ENGINE_ERROR
-                    result.status.message = f"Engine {engine_id} disconnected"
-                    result.target_engine_id = engine_id
-                    result.frame_id = current_input_metadata.frame_id
-
-                    await self.server.send_result(
-                        current_input_metadata.client_address,
-                        producer_info.get_name(),
-                        engine_id,
-                        result,
-                        return_token=return_token,
-                    )
+                # The producer was removed while the engine processed its
+                # input
+                continue
+            token_key = (
+                current_input_metadata.client_address,
+                current_input_metadata.frame_id,
+            )
+            return_token = token_key in producer_info.pending_token_returns
+            if return_token or engine_worker.get_all_responses_required():
+                # Clear the pending token return first so that other engines
+                # targeted by the same input don't also return a token for
+                # it if they disconnect too.
+                producer_info.pending_token_returns.discard(token_key)
+                if return_token:
+                    token_returned.add(producer_info)
+
+                result = gabriel_pb2.Result()
+                result.status.code = gabriel_pb2.StatusCode.ENGINE_ERROR
+                result.status.message = f"Engine {engine_id} disconnected"
+                result.target_engine_id = engine_id
+                result.frame_id = current_input_metadata.frame_id
+
+                await self.server.send_result(
+                    current_input_metadata.client_address,
+                    producer_info.get_name(),
+                    engine_id,
+                    result,
+                    return_token=return_token,
+                )
 
-        self._engine_ids.remove(engine_id)
         del self._engine_workers[context]
+        ENGINE_INPUTS_IN_FLIGHT.labels(engine_id=engine_id).dec(
+            engine_worker.get_num_in_flight()
+        )
+        engine_pool = engine_worker.get_pool()
+        engine_pool.remove_replica(engine_worker)
+        for producer_info in token_returned:
+            await producer_info.send_queued_inputs()
+        if engine_pool.replicas:
+            # Other replicas still serve this engine id
+            ENGINE_REPLICAS.labels(engine_id=engine_id).set(
+                len(engine_pool.replicas)
+            )
+            return
+
+        ENGINE_INPUTS_RECEIVED_TOTAL.remove(engine_id)
+        ENGINE_INPUTS_PROCESSED_TOTAL.remove(engine_id)
+        ENGINE_INPUTS_IN_FLIGHT.remove(engine_id)
+        ENGINE_REPLICAS.remove(engine_id)
+
+        del self._engine_pools[engine_id]
+        self._invalidate_target_engines()
+        self._engine_ids.remove(engine_id)
         await self.server._engines_updated_cb()
 
-    async def _send_to_engine(self, from_client, client_address, client_info):
+    def _invalidate_target_engines(self):
+        """Make every producer resolve its target engines again.
+
+        Called when an engine pool is added or removed. Producers cache the
+        pools that their target engine ids resolve to, so that dispatching
+        an input costs the same however many engines are connected.
+        """
+        for producer_info in self._producer_infos.values():
+            producer_info.invalidate_target_engines()
+
+    async def _get_client_session(self, client_address, client_info):
+        """Return the session of a client, starting one if needed.
+
+        A client that registers again gets a new session, and the session
+        for its previous client_info is closed.
+        """
+        client_session = self._client_sessions.get(client_address)
+        if (
+            client_session is not None
+            and client_session.client_info is client_info
+        ):
+            return client_session
+        if client_session is not None:
+            await self._close_client_session(client_session)
+
+        handle = next(self._session_handles) if client_info.ByteSize() else 0
+        client_session = _ClientSession(handle, client_info)
+        self._client_sessions[client_address] = client_session
+        return client_session
+
+    async def _close_client_session(self, client_session):
+        """Tell the engines that were sent a client session that it ended."""
+        if not client_session.handle:
+            return
+        for engine_worker in list(self._engine_workers.values()):
+            await engine_worker.close_client_session(client_session.handle)
+
+    async def _client_disconnected(self, client_address):
+        """Discard the work left for a client that has disconnected.
+
+        The client's queued inputs are removed, and engines that support it
+        are told to cancel its inputs in flight.
+        """
+        for producer_id in self._client_producer_ids.pop(client_address, ()):
+            producer_info = self._producer_infos.get(producer_id)
+            if producer_info is not None:
+                DISCONNECTED_CLIENT_INPUTS_TOTAL.labels(state="queued").inc(
+                    producer_info.discard_client_inputs(client_address)
+                )
+                producer_info.remove_client(client_address)
+        for engine_worker in list(self._engine_workers.values()):
+            DISCONNECTED_CLIENT_INPUTS_TOTAL.labels(state="cancelled").inc(
+                await engine_worker.cancel_client_inputs(client_address)
+            )
+        client_session = self._client_sessions.pop(client_address, None)
+        if client_session is not None:
+            await self._close_client_session(client_session)
+
+    async def _collect_idle_producers(self, now=None):
+        """Remove the producers that have been idle for too long.
+
+        See _ProducerInfo.is_idle.
+        """
+        if now is None:
+            now = time.monotonic()
+        idle_producers = [
+            producer_info
+            for producer_info in self._producer_infos.values()
+            if producer_info.is_idle(now, self._producer_idle_timeout)
+        ]
+        for producer_info in idle_producers:
+            self._remove_producer(producer_info)
+
+    def _remove_producer(self, producer_info):
+        """Remove all of the state the server keeps for a producer.
+
+        If the producer's clients send more inputs from it, it is added
+        again as a new producer.
+        """
+        producer_id = producer_info.get_name()
+        logger.debug(f"Removing idle producer {producer_id}")
+        del self._producer_infos[producer_id]
+        for client_address in producer_info.get_clients():
+            producer_ids = self._client_producer_ids.get(client_address)
+            if producer_ids is not None:
+                producer_ids.discard(producer_id)
+        producer_info.close()
+
+    async def _return_discarded_input(
+        self, producer_info, metadata, code, message
+    ):
+        """Return the token of a queued input that will not be processed."""
+        result = gabriel_pb2.Result()
+        result.status.code = code
+        result.status.message = message
+        result.frame_id = metadata.frame_id
+        await self.server.send_result(
+            metadata.client_address,
+            producer_info.get_name(),
+            "",
+            result,
+            return_token=True,
+        )
+
+    async def _send_to_engine(
+        self, from_client, client_address, client_info, input_frame
+    ):
         logger.debug(
             f"Received input from client {client_address} with source ID "
             f"{from_client.input.producer_id} and frame id "
             f"{from_client.input.frame_id}; target engines: "
             f"{from_client.input.target_engine_ids}"
         )
-        if from_client.input.producer_id not in self._producer_infos:
-            self._producer_infos[from_client.input.producer_id] = (
-                _ProducerInfo(
-                    from_client.input.producer_id,
-                    self._engine_workers,
-                    self._size_for_queues,
-                )
+        producer_id = from_client.input.producer_id
+        if producer_id not in self._producer_infos:
+            self._producer_infos[producer_id] = _ProducerInfo(
+                producer_id,
+                self._engine_pools,
+                self._size_for_queues,
+                self._producer_queue_policies.get(
+                    producer_id, self._queue_policy
+                ),
+                self._return_discarded_input,
             )
-        producer_info = self._producer_infos[from_client.input.producer_id]
+        producer_info = self._producer_infos[producer_id]
+        producer_info.add_client(client_address)
+        self._client_producer_ids.setdefault(client_address, set()).add(
+            producer_id
+        )
+        client_session = await self._get_client_session(
+            client_address, client_info
+        )
         return await producer_info.process_input_from_client(
-            from_client, client_address, client_info
+            from_client, client_address, client_session, input_frame
+        )
+
+
+class _EnginePool:
+    """The replicas of a cognitive engine that share an engine id.
+
+    Replicas are interchangeable, so each input is dispatched to a single
+    replica. The scheduler that decides which producer the engine is sent
+    its next input from and the record of the latest input processed for
+    each producer are kept per engine id rather than per replica, so that
+    clients see one logical engine however many replicas are connected.
+    """
+
+    def __init__(self, engine_id, scheduler=None):
+        self._engine_id = engine_id
+        self.replicas = deque()
+        # Producers that target this engine id
+        self._producers = set()
+        self.scheduler = (
+            scheduler if scheduler is not None else RoundRobinScheduler()
         )
 
+        # Latest input processed by any replica, for each producer
+        self.latest_input_processed = {}
+
+    def get_engine_id(self):
+        return self._engine_id
+
+    def add_replica(self, engine_worker):
+        self.replicas.append(engine_worker)
+
+    def remove_replica(self, engine_worker):
+        self.replicas.remove(engine_worker)
+
+    def get_available_replica(self):
+        """Return the least loaded replica that can accept another input.
+
+        Returns None if every replica is busy. The replicas are rotated
+        first, so that ties are broken in round-robin order.
+        """
+        self.replicas.rotate(-1)
+        available = None
+        for engine_worker in self.replicas:
+            if engine_worker.has_capacity() and (
+                available is None
+                or engine_worker.get_num_in_flight()
+                < available.get_num_in_flight()
+            ):
+                available = engine_worker
+        return available
+
+    def add_producer(self, producer_info):
+        self._producers.add(producer_info)
+
+    def remove_producer(self, producer_info):
+        if producer_info in self._producers:
+            self._producers.remove(producer_info)
+            self.scheduler.remove(producer_info)
+            self.latest_input_processed.pop(producer_info.get_name(), None)
+
 
 class _EngineWorker:
     """Information about a cognitive engine worker.
 
-    A cognitive enginer worker processes inputs from clients.
+    A cognitive enginer worker processes inputs from clients. It is one
+    replica in the _EnginePool for its engine id. An engine can have
+    several inputs in flight at once, up to the larger of its pipeline depth
+    and its batch size, so that it receives its next inputs while it is
+    still processing the current ones.
+
+    The engine is sent the client_info of a client session once, before the
+    first input from the session, and keeps it in a cache of at most
+    client_info_cache_size sessions, evicting the least recently used one.
+    The worker tracks the same cache, so it can send a client session again
+    once the engine has evicted it.
     """
 
     def __init__(
         self,
         context,
-        engine_id,
+        engine_pool,
         all_responses_required,
         fresh_inputs_queue_size,
+        max_in_flight=1,
+        client_info_cache_size=1,
+        max_input_age=None,
+        supports_cancel=False,
     ):
         self._context = context
-        self._engine_id = engine_id
+        self._engine_pool = engine_pool
+        self._engine_id = engine_pool.get_engine_id()
         self._all_responses_required = all_responses_required
-        self._last_payload_send_time = 0
-        self._current_input_metadata = None
+        # Inputs sent to the engine without a result yet, oldest first
+        self._in_flight = deque()
+        self._max_in_flight = max_in_flight
         # Maximum size for each source queue
         self._size_for_queues = fresh_inputs_queue_size
-        self._producers = deque()
-
-        # Latest input processed for each producer
-        self._latest_input_processed = {}
+        # Handles of the client sessions cached by the engine, least
+        # recently used first
+        self._client_sessions = OrderedDict()
+        self._client_info_cache_size = client_info_cache_size
+        # Held while the client session cache is updated and the messages
+        # for the update are written, so that the engine receives them in
+        # the order the cache was updated in
+        self._write_lock = asyncio.Lock()
+        # Inputs older than this, in seconds, are not sent to the engine
+        self._max_input_age = max_input_age
+        # Whether the engine can be told to cancel inputs in flight
+        self._supports_cancel = supports_cancel
 
     def get_engine_id(self):
         return self._engine_id
 
-    def get_current_input_metadata(self):
-        return self._current_input_metadata
+    def get_context(self):
+        return self._context
+
+    def get_pool(self):
+        return self._engine_pool
 
     def get_all_responses_required(self):
         return self._all_responses_required
 
-    def clear_current_input_metadata(self):
-        self._current_input_metadata = None
+    def get_max_input_age(self):
+        return self._max_input_age
 
-    def get_last_payload_send_time(self):
-        return self._last_payload_send_time
+    def has_capacity(self):
+        return len(self._in_flight) < self._max_in_flight
+
+    def get_num_in_flight(self):
+        return len(self._in_flight)
+
+    def get_in_flight_metadata(self):
+        return [
+            in_flight_input.metadata for in_flight_input in self._in_flight
+        ]
+
+    def pop_in_flight_input(self, frame_id, producer_id):
+        """Remove and return the in-flight input that a result is for.
+
+        Results are matched to inputs by frame id and producer id. Engines
+        that do not return these ids process inputs in the order they were
+        sent, so their results are matched to the oldest input in flight.
+        Returns None if no input in flight matches.
+        """
+        if not self._in_flight:
+            return None
+        if not producer_id:
+            ENGINE_INPUTS_IN_FLIGHT.labels(engine_id=self._engine_id).dec()
+            return self._in_flight.popleft()
+        for i, in_flight_input in enumerate(self._in_flight):
+            metadata = in_flight_input.metadata
+            if (
+                metadata.producer_id == producer_id
+                and metadata.frame_id == frame_id
+            ):
+                del self._in_flight[i]
+                ENGINE_INPUTS_IN_FLIGHT.labels(engine_id=self._engine_id).dec()
+                return in_flight_input
+        logger.error(
+            f"Engine {self._engine_id} returned a result for frame "
+            f"{frame_id} from producer {producer_id}, which is not in flight"
+        )
+        return None
 
     async def _send_helper(self, to_engine):
         """Send the message to the cognitive engine."""
         await self._context.write(to_engine)
-        self._last_payload_send_time = time.perf_counter()
         logger.debug(f"Sent payload to engine {self._engine_id}")
 
     async def send_payload(self, metadata_payload):
         metadata = metadata_payload.metadata
-        self._current_input_metadata = metadata
-        self._latest_input_processed[metadata.producer_id] = metadata
-        to_engine = gabriel_pb2.ToEngine(
-            input_frame=metadata_payload.payload,
-            client_info=metadata.client_info,
+        self._in_flight.append(
+            _InFlightInput(
+                metadata=metadata,
+                send_time=time.perf_counter(),
+                dispatch_ns=(
+                    time.monotonic_ns() if metadata.trace is not None else 0
+                ),
+            )
         )
-        await self._send_helper(to_engine)
+        ENGINE_INPUTS_IN_FLIGHT.labels(engine_id=self._engine_id).inc()
+        self._engine_pool.latest_input_processed[metadata.producer_id] = (
+            metadata
+        )
+        client_session = metadata.client_session
+        async with self._write_lock:
+            if client_session is not None and client_session.handle:
+                await self._open_client_session(client_session)
+            await self._send_helper(metadata_payload.payload)
+
+    async def _open_client_session(self, client_session):
+        """Send the engine a client session, unless it has it cached."""
+        handle = client_session.handle
+        if handle in self._client_sessions:
+            self._client_sessions.move_to_end(handle)
+            return
+        self._client_sessions[handle] = None
+        if len(self._client_sessions) > self._client_info_cache_size:
+            self._client_sessions.popitem(last=False)
+
+        to_engine = gabriel_pb2.ToEngine()
+        to_engine.client_session_opened.session_handle = handle
+        to_engine.client_session_opened.client_info.CopyFrom(
+            client_session.client_info
+        )
+        await self._send_helper(to_engine.SerializeToString())
 
-    async def send_next_input(self):
-        """Send this engine its next input, rotating fairly across producers.
-
-        Producers are tried in round-robin order (self._producers.rotate),
-        and returning as soon as one has something to send leaves the deque
-        rotated for next time, so a busy producer can't monopolize this
-        engine's attention.
-
-        Each producer has at most one "in-flight" frame at a time: the frame
-        most recently dispatched to any of its target engines, for which no
-        engine has yet returned a result (producer.pending_token_return is
-        True while it's in flight, producer.latest_input_sent_to_engine holds
-        it). Whichever engine finishes the in-flight frame first returns its
-        token, which clears pending_token_return and lets this engine dequeue
-        the next frame - making that the new in-flight frame. Any engine that
-        asks for work while a frame is still in flight doesn't pull from the
-        queue at all; it just picks up that same in-flight frame, as long as
-        it hasn't already been sent it. This is what lets a slower engine
-        skip straight to the newest input instead of working through a
-        backlog.
+    async def close_client_session(self, handle):
+        """Tell the engine that a client session ended, if it has it cached.
+
+        Args:
+            handle: The handle of the client session.
         """
-        for _ in range(len(self._producers)):
-            self._producers.rotate(-1)
-            producer = self._producers[0]
-
-            # If a token return is pending, that means no engine has returned
-            # a result for the current input for this producer. So we cannot
-            # get a new item from the queue yet.
-            if not producer.pending_token_return:
-                # Send the next input from the queue
-                metadata_payload = await producer.get_input_from_queue(
-                    self._engine_id
-                )
-                if metadata_payload is not None:
-                    await self.send_payload(metadata_payload)
-                    return
-
-            # Send the latest available frame from this producer if we haven't
-            # processed it yet.
-            metadata_payload = producer.latest_input_sent_to_engine
-            if metadata_payload is None:
-                continue
-            producer_id = producer._producer_id
-            latest_processed_frame = self._latest_input_processed.get(
-                producer_id, None
-            )
-            if (
-                latest_processed_frame is not None
-                and metadata_payload.metadata.frame_id
-                > latest_processed_frame.frame_id
-            ):
-                await self.send_payload(metadata_payload)
+        async with self._write_lock:
+            if handle not in self._client_sessions:
                 return
+            del self._client_sessions[handle]
+            to_engine = gabriel_pb2.ToEngine(client_session_closed=handle)
+            await self._send_helper(to_engine.SerializeToString())
 
-        # No input available
-        self.clear_current_input_metadata()
+    async def cancel_client_inputs(self, client_address):
+        """Cancel the inputs in flight from a client that has disconnected.
 
-    async def add_producer(self, producer_info):
-        if producer_info in self._producers:
-            return
-        self._producers.append(producer_info)
+        The inputs stay in flight until the engine returns a result for
+        them, either with the INPUT_CANCELLED status or, if it had already
+        started to process them, as usual. Engines that do not support
+        cancelling inputs are not told anything.
 
-    async def remove_producer(self, producer_info):
-        if producer_info in self._producers:
-            self._producers.remove(producer_info)
-            del self._latest_input_processed[producer_info._producer_id]
+        Returns the number of inputs cancelled.
+        """
+        if not self._supports_cancel:
+            return 0
+        cancelled = [
+            in_flight_input.metadata
+            for in_flight_input in self._in_flight
+            if in_flight_input.metadata.client_address == client_address
+        ]
+        async with self._write_lock:
+            for metadata in cancelled:
+                to_engine = gabriel_pb2.ToEngine(
+                    cancel_input=True,
+                    frame_id=metadata.frame_id,
+                    producer_id=metadata.producer_id,
+                )
+                await self._send_helper(to_engine.SerializeToString())
+        return len(cancelled)
+
+    async def send_next_input(self):
+        """Send this engine inputs until it has no capacity left.
+
+        Each free slot is filled by _send_next_input_helper, which keeps a
+        pipelined or batching engine supplied with inputs while it computes.
+        """
+        while self.has_capacity():
+            if not await self._send_next_input_helper():
+                return
+
+    async def _send_next_input_helper(self):
+        """Send this engine its next input, from the producer scheduled next.
+
+        The pool's scheduler decides which producer to try next, for
+        example by rotating through producers so that a busy producer can't
+        monopolize this engine's attention. The scheduler is shared by all
+        replicas of the engine id, so the schedule covers the whole pool. A
+        producer that turns out to have nothing to send is discarded from
+        the scheduler until its next input arrives.
+
+        Each producer has a latest "in-flight" frame: the frame most
+        recently dispatched to any of its target engines
+        (producer.latest_input_sent_to_engine holds it). Whichever engine
+        finishes a frame first returns its token (the frame id is removed
+        from producer.pending_token_returns). An engine only dequeues the
+        next frame once it has been sent the latest in-flight frame, which
+        makes the dequeued frame the new in-flight frame. An engine that is
+        behind - one that asks for work while the latest in-flight frame was
+        only sent to other engines - doesn't pull from the queue at all; it
+        just picks up that same in-flight frame. An engine that has not been
+        sent any of the producer's frames waits for the in-flight frames'
+        tokens to be returned before it dequeues one. This is what lets a
+        slower engine skip straight to the newest input instead of working
+        through a backlog, while an engine that keeps up can pipeline the
+        frames that are queued.
+
+        Returns whether an input was sent.
+        """
+        scheduler = self._engine_pool.scheduler
+        while True:
+            producer = scheduler.peek()
+            if producer is None:
+                # No input available
+                return False
+            if await self._send_input_from_producer(producer):
+                scheduler.sent(producer)
+                return True
+            scheduler.discard(producer)
+
+    async def _send_input_from_producer(self, producer):
+        """Send this engine the next input from producer, if it has one.
+
+        Returns whether an input was sent.
+        """
+        # Send the latest available frame from this producer if we haven't
+        # processed it yet.
+        metadata_payload = producer.latest_input_sent_to_engine
+        latest_processed_frame = self._engine_pool.latest_input_processed.get(
+            producer.get_name(), None
+        )
+        if (
+            metadata_payload is not None
+            and latest_processed_frame is not None
+            and metadata_payload.metadata.frame_id
+            > latest_processed_frame.frame_id
+        ):
+            if not _input_expired(
+                metadata_payload.metadata, time.time(), self._max_input_age
+            ):
+                await self.send_payload(metadata_payload)
+                return True
+            # The frame is too old for this engine. Another engine is
+            # processing it and will return its token, so this engine just
+            # skips it.
+            self._engine_pool.latest_input_processed[producer.get_name()] = (
+                metadata_payload.metadata
+            )
+        elif latest_processed_frame is None and producer.pending_token_returns:
+            # This engine has not been sent any of the producer's frames,
+            # and another engine has not returned the token of the frame in
+            # flight yet, so the next frame can't be dequeued
+            return False
+
+        # This engine has been sent the latest frame, so it can move on to
+        # the next input from the queue
+        metadata_payload = await producer.get_input_from_queue(
+            self._engine_id, self._max_input_age
+        )
+        if metadata_payload is None:
+            return False
+        await self.send_payload(metadata_payload)
+        return True
 
 
 class _ProducerInfo:
@@ -698,29 +1346,205 @@ class _ProducerInfo:
     engines.
     """
 
-    def __init__(self, producer_id, engine_workers, size_for_queues):
+    def __init__(
+        self,
+        producer_id,
+        engine_pools,
+        size_for_queues,
+        queue_policy=QueuePolicy.DROP_NEWEST,
+        discarded_input_cb=None,
+    ):
         self._producer_id = producer_id
-        self._engine_workers = engine_workers
+        self._engine_pools = engine_pools
+        self._queue_policy = queue_policy
+        if queue_policy == QueuePolicy.KEEP_LATEST_ONLY:
+            size_for_queues = 1
         self._input_queue = deque(maxlen=size_for_queues)
         self._size_for_queues = size_for_queues
+        # Called with this producer info, the metadata of each input that is
+        # removed from the queue without being sent to an engine, and the
+        # status code and message to return the input's token with
+        self._discarded_input_cb = discarded_input_cb
         # The "in-flight" input: the latest input from this source that was
         # sent to at least one engine.
         self.latest_input_sent_to_engine = None
-        self.target_engines = None
-
-        # Whether the in-flight input above is still awaiting its token
-        # return, i.e. no engine has returned a result for it yet. See
-        # _EngineWorker.send_next_input for how this gates the input queue.
-        self.pending_token_return = None
+        # The engine pools this producer's inputs are dispatched to, resolved
+        # from the target engine ids of its latest input. The resolution is
+        # cached until the target ids or the connected engine ids change.
+        self.target_engines = set()
+        self._target_engine_ids = None
+
+        # (client address, frame id) of the inputs sent to engines that are
+        # still awaiting their token return, i.e. no engine has returned a
+        # result for them yet. Frame ids are only unique per client, and
+        # several clients can share a producer id. See
+        # _EngineWorker._send_next_input_helper.
+        self.pending_token_returns = set()
+        # Scheduling parameters, as set on this producer's latest input
+        self._priority = 0
+        self._weight = 1
+        # Addresses of the connected clients that sent inputs from this
+        # producer
+        self._clients = set()
+        # The time.monotonic() of this producer's latest input, or of the
+        # disconnection of its last client if that came later
+        self._last_active = time.monotonic()
 
     def get_name(self):
         return self._producer_id
 
+    def get_priority(self):
+        return self._priority
+
+    def get_weight(self):
+        return self._weight
+
+    def get_clients(self):
+        return self._clients
+
+    def add_client(self, client_address):
+        self._clients.add(client_address)
+
+    def remove_client(self, client_address):
+        """Forget a client that has disconnected."""
+        self._clients.discard(client_address)
+        if not self._clients:
+            self._last_active = time.monotonic()
+
+    def discard_client_inputs(self, client_address):
+        """Discard the inputs from a client that has disconnected.
+
+        The client's queued inputs are removed without returning their
+        tokens, and its input in flight is no longer sent to the engines
+        that have not been sent it yet.
+
+        Returns the number of queued inputs removed.
+        """
+        kept = [
+            metadata_payload
+            for metadata_payload in self._input_queue
+            if metadata_payload.metadata.client_address != client_address
+        ]
+        num_discarded = len(self._input_queue) - len(kept)
+        if num_discarded:
+            self._input_queue.clear()
+            self._input_queue.extend(kept)
+            PRODUCER_QUEUE_LENGTH.labels(producer_id=self._producer_id).set(
+                len(self._input_queue)
+            )
+        latest = self.latest_input_sent_to_engine
+        if (
+            latest is not None
+            and latest.metadata.client_address == client_address
+        ):
+            self.latest_input_sent_to_engine = None
+        self.pending_token_returns = {
+            token_key
+            for token_key in self.pending_token_returns
+            if token_key[0] != client_address
+        }
+        return num_discarded
+
+    async def send_queued_inputs(self, returning_pool=None):
+        """Send queued inputs to the target engines gated on a token return.
+
+        An engine that has not been sent any of this producer's inputs does
+        not dequeue one while a token is pending, and this producer is
+        discarded from its pool's scheduler meanwhile (see
+        _EngineWorker._send_input_from_producer). Called when a token is
+        returned. Once no token is pending, this producer is scheduled again
+        in its target pools other than returning_pool, and their replicas
+        are sent inputs. The engine returning the token is sent its next
+        input afterwards, so that it picks up the input dequeued here
+        instead of dequeuing one itself and gating the others again.
+        """
+        if self.pending_token_returns or not self._input_queue:
+            return
+        for engine_pool in self.target_engines:
+            if engine_pool is returning_pool:
+                continue
+            engine_pool.scheduler.add(self)
+            for engine_worker in list(engine_pool.replicas):
+                await engine_worker.send_next_input()
+
+    def is_idle(self, now, idle_timeout):
+        """Return whether this producer can be removed from the server.
+
+        A producer is idle once it has had no input for idle_timeout
+        seconds, and either all of its clients have disconnected or it has
+        no inputs queued or waiting for a result.
+        """
+        if now - self._last_active < idle_timeout:
+            return False
+        return not self._clients or (
+            not self._input_queue and not self.pending_token_returns
+        )
+
+    def close(self):
+        """Release this producer's queued inputs and its metric series.
+
+        The tokens of the queued inputs are not returned, since a producer
+        is only closed once its clients have disconnected or it has no
+        queued inputs.
+        """
+        self._input_queue.clear()
+        self.latest_input_sent_to_engine = None
+        self.pending_token_returns.clear()
+        for engine_pool in self.target_engines:
+            engine_pool.remove_producer(self)
+        self.target_engines = set()
+        self._target_engine_ids = None
+        PRODUCER_QUEUE_LENGTH.remove(self._producer_id)
+        PRODUCER_QUEUE_DROPPED_TOTAL.remove(
+            self._producer_id, self._queue_policy.value
+        )
+        PRODUCER_INPUTS_EXPIRED_TOTAL.remove(self._producer_id)
+        CLIENT_INPUTS_RECEIVED_TOTAL.remove(self._producer_id)
+
+    def get_next_deadline(self):
+        """Return the deadline of the next input an engine would be sent.
+
+        Returns None if the input does not expire, or if there is no input.
+        """
+        if self._input_queue:
+            return self._input_queue[0].metadata.deadline
+        if self.latest_input_sent_to_engine is not None:
+            return self.latest_input_sent_to_engine.metadata.deadline
+        return None
+
+    def invalidate_target_engines(self):
+        """Resolve the target engines again for the next input.
+
+        Called whenever an engine id connects or disconnects, so that the
+        cached target engines never hold a pool that has been removed or
+        miss one that has been added.
+        """
+        self._target_engine_ids = None
+
+    def _resolve_target_engines(self, target_engine_ids):
+        """Look up the engine pools for target_engine_ids and cache them.
+
+        This producer is added to each pool it now targets, and removed from
+        any pool that it no longer targets.
+        """
+        target_engines = {
+            self._engine_pools[engine_id]
+            for engine_id in target_engine_ids
+            if engine_id in self._engine_pools
+        }
+        for engine_pool in self.target_engines - target_engines:
+            engine_pool.remove_producer(self)
+        for engine_pool in target_engines:
+            engine_pool.add_producer(self)
+        self.target_engines = target_engines
+        self._target_engine_ids = target_engine_ids
+
     async def process_input_from_client(
         self,
         from_client: gabriel_pb2.FromClient,
         client_address: str,
-        client_info,
+        client_session,
+        input_frame=None,
     ):
         """Process input received from a client.
 
@@ -729,8 +1553,12 @@ class _ProducerInfo:
         Args:
             from_client: The client input to process.
             client_address: The address of the client.
-            client_info: The Any registered by the client, forwarded to
-                engine workers alongside the input.
+            client_session: The _ClientSession of the client, which engines
+                look the client's client_info up by.
+            input_frame: The serialized InputFrame, if the client sent the
+                input with split framing. It is forwarded to engines as is.
+                Otherwise, the InputFrame in from_client is serialized once
+                here.
         """
         logger.debug(
             f"Processing input from client {client_address} with source ID "
@@ -742,33 +1570,71 @@ class _ProducerInfo:
         CLIENT_INPUTS_RECEIVED_TOTAL.labels(
             producer_id=self._producer_id
         ).inc()
-
+        self._last_active = time.monotonic()
+        self._priority = from_client.input.priority
+        self._weight = from_client.input.weight or 1
+
+        now = time.time()
+        capture_time = now
+        if from_client.input.capture_time_us:
+            # A capture time ahead of the server's clock can only be due to
+            # clock skew
+            capture_time = min(from_client.input.capture_time_us / 1e6, now)
+        deadline = None
+        if from_client.input.max_age_ms:
+            deadline = capture_time + from_client.input.max_age_ms / 1000
+        trace = None
+        if from_client.input.HasField("trace"):
+            trace = gabriel_pb2.Trace()
+            trace.CopyFrom(from_client.input.trace)
+            trace.enqueue_ns = time.monotonic_ns()
         metadata = _Metadata(
             frame_id=from_client.input.frame_id,
             producer_id=self._producer_id,
             client_address=client_address,
             target_engine_ids=from_client.input.target_engine_ids,
-            client_info=client_info,
+            client_session=client_session,
+            capture_time=capture_time,
+            deadline=deadline,
+            trace=trace,
+        )
+        if _input_expired(metadata, now):
+            PRODUCER_INPUTS_EXPIRED_TOTAL.labels(
+                producer_id=self._producer_id
+            ).inc()
+            return (
+                StatusCode.FRAME_EXPIRED,
+                f"Input from {self._producer_id} expired before it reached "
+                f"the server",
+            )
+        if input_frame is None:
+            input_frame = from_client.input.input_frame.SerializeToString()
+        # The serialized InputFrame is spliced into the serialized ToEngine,
+        # rather than parsed and copied into a ToEngine message. Every field
+        # of the ToEngine is the same for all target engines, so it is only
+        # encoded once here.
+        to_engine = encode_to_engine(
+            input_frame,
+            gabriel_pb2.ToEngine(
+                frame_id=metadata.frame_id,
+                producer_id=metadata.producer_id,
+                session_handle=(
+                    client_session.handle if client_session else 0
+                ),
+                trace=trace is not None,
+            ),
+        )
+        metadata_payload = _MetadataPayload(
+            metadata=metadata, payload=to_engine
         )
-        payload = from_client.input.input_frame
-        metadata_payload = _MetadataPayload(metadata=metadata, payload=payload)
 
-        target_engines = set()
-        for engine_worker in self._engine_workers.values():
-            if (
-                engine_worker.get_engine_id()
-                in from_client.input.target_engine_ids
-            ):
-                target_engines.add(engine_worker)
-                ENGINE_INPUTS_RECEIVED_TOTAL.labels(
-                    engine_id=engine_worker.get_engine_id()
-                ).inc()
+        target_engine_ids = tuple(from_client.input.target_engine_ids)
+        if target_engine_ids != self._target_engine_ids:
+            self._resolve_target_engines(target_engine_ids)
+        target_engines = self.target_engines
 
         if not target_engines:
-            available_engine_ids = [
-                worker.get_engine_id()
-                for worker in self._engine_workers.values()
-            ]
+            available_engine_ids = list(self._engine_pools)
 
             # TODO: better error handling
             logger.error(
@@ -783,39 +1649,49 @@ class _ProducerInfo:
                 f"{available_engine_ids}",
             )
 
-        # Remove this source from any engines that are no longer targeted
-        if self.target_engines != target_engines:
-            removed_targets = (
-                self.target_engines - target_engines
-                if self.target_engines
-                else set()
-            )
-            for engine in removed_targets:
-                engine_worker = self._engine_workers.get(engine)
-                if engine_worker:
-                    engine_worker.remove_producer(self)
-            self.target_engines = target_engines
-
         logger.debug(
             f"Targeting engines {[e.get_engine_id() for e in target_engines]}"
         )
 
-        # Dispatch to every idle target engine right away, rather than
-        # picking just one, so a frame can be processed by more than one
-        # engine at once. Only if every target engine is currently busy does
-        # it fall back to this producer's queue, to be picked up later via
-        # send_next_input.
+        # Dispatch to a replica of every target engine that has capacity
+        # right away, so a frame can be processed by more than one engine at
+        # once. Only if every target engine is busy does it fall back to this
+        # producer's queue, to be picked up later via send_next_input.
         all_engines_busy = True
-        for engine_worker in set(target_engines):
-            await engine_worker.add_producer(self)
-            # If the engine is idle, send the input immediately
-            if engine_worker.get_current_input_metadata() is None:
-                all_engines_busy = False
-                await engine_worker.send_payload(metadata_payload)
+        busy_engines = []
+        num_expired = 0
+        for engine_pool in target_engines:
+            ENGINE_INPUTS_RECEIVED_TOTAL.labels(
+                engine_id=engine_pool.get_engine_id()
+            ).inc()
+            # If a replica has capacity, send the input immediately
+            engine_worker = engine_pool.get_available_replica()
+            if engine_worker is None:
+                busy_engines.append(engine_pool)
+                continue
+            if _input_expired(
+                metadata, now, engine_worker.get_max_input_age()
+            ):
+                num_expired += 1
+                continue
+            all_engines_busy = False
+            await engine_worker.send_payload(metadata_payload)
+
+        if num_expired == len(target_engines):
+            PRODUCER_INPUTS_EXPIRED_TOTAL.labels(
+                producer_id=self._producer_id
+            ).inc()
+            return (
+                StatusCode.FRAME_EXPIRED,
+                f"Input from {self._producer_id} is older than the maximum "
+                f"input age of its target engines",
+            )
 
         if all_engines_busy:
             success = await self.add_input_to_queue(metadata_payload)
             if success:
+                for engine_pool in target_engines:
+                    engine_pool.scheduler.add(self)
                 return (StatusCode.SUCCESS, "")
             return (
                 StatusCode.SERVER_DROPPED_FRAME,
@@ -825,33 +1701,100 @@ class _ProducerInfo:
         # Latest input is only set if the input was sent to at least one
         # engine
         self.latest_input_sent_to_engine = metadata_payload
-        self.pending_token_return = True
+        self.pending_token_returns.add(
+            (metadata.client_address, metadata.frame_id)
+        )
+        # The busy engines can pick the input up once they are free
+        for engine_pool in busy_engines:
+            engine_pool.scheduler.add(self)
         return (StatusCode.SUCCESS, "")
 
     async def add_input_to_queue(self, metadata_payload):
-        # Add input to the queue if it is not full
+        """Queue an input, applying the queue policy if the queue is full.
+
+        Returns whether the input was queued.
+        """
+        evicted = None
         if len(self._input_queue) == self._input_queue.maxlen:
-            logger.warning(
-                f"Input queue for {self._producer_id} is full, dropping input"
+            PRODUCER_QUEUE_DROPPED_TOTAL.labels(
+                producer_id=self._producer_id,
+                policy=self._queue_policy.value,
+            ).inc()
+            if self._queue_policy == QueuePolicy.DROP_NEWEST:
+                logger.warning(
+                    f"Input queue for {self._producer_id} is full, dropping "
+                    f"input"
+                )
+                return False
+            evicted = self._input_queue.popleft()
+            logger.debug(
+                f"Input queue for {self._producer_id} is full, evicting "
+                f"frame {evicted.metadata.frame_id}"
             )
-            return False
         self._input_queue.append(metadata_payload)
         PRODUCER_QUEUE_LENGTH.labels(producer_id=self._producer_id).set(
             len(self._input_queue)
         )
+        # The evicted input's token is returned once the new input is
+        # queued, so that the queue is consistent while this awaits
+        if evicted is not None and self._discarded_input_cb is not None:
+            await self._discarded_input_cb(
+                self,
+                evicted.metadata,
+                StatusCode.SERVER_EVICTED_FRAME,
+                f"Input evicted from the queue for {self._producer_id} by a "
+                f"newer input",
+            )
         return True
 
-    async def get_input_from_queue(self, engine_id):
+    async def get_input_from_queue(self, engine_id, max_input_age=None):
+        """Remove and return the oldest queued input that has not expired.
+
+        Inputs that have expired, either at their own deadline or because
+        they are older than max_input_age (in seconds), are removed from the
+        queue and their tokens are returned. Other engines targeted by these
+        inputs would skip them anyway, since an engine is only sent the
+        latest input dispatched from a producer or a newer one.
+
+        Returns None if there is no input to send.
+        """
         logger.debug(
             f"Getting input from queue for engine {engine_id} and producer id "
             f"{self._producer_id}"
         )
-        if not self._input_queue:
+        now = time.time()
+        while self._input_queue:
+            metadata_payload = self._input_queue.popleft()
+            if not _input_expired(
+                metadata_payload.metadata, now, max_input_age
+            ):
+                break
+            await self._expire_input(metadata_payload.metadata, engine_id)
+        else:
             logger.debug(
                 f"Input queue is empty for producer id {self._producer_id}"
             )
             return None
-        metadata_payload = self._input_queue[0]
         self.latest_input_sent_to_engine = metadata_payload
-        self.pending_token_return = True
-        return self._input_queue.popleft()
+        metadata = metadata_payload.metadata
+        self.pending_token_returns.add(
+            (metadata.client_address, metadata.frame_id)
+        )
+        return metadata_payload
+
+    async def _expire_input(self, metadata, engine_id):
+        """Return the token of a queued input that has expired."""
+        logger.debug(
+            f"Frame {metadata.frame_id} from {self._producer_id} expired "
+            f"before engine {engine_id} could be sent it"
+        )
+        PRODUCER_INPUTS_EXPIRED_TOTAL.labels(
+            producer_id=self._producer_id
+        ).inc()
+        if self._discarded_input_cb is not None:
+            await self._discarded_input_cb(
+                self,
+                metadata,
+                StatusCode.FRAME_EXPIRED,
+                f"Input from {self._producer_id} expired in the queue",
+            )
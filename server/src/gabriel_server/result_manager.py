@@ -1,15 +1,55 @@
 """Manages results returned by cognitive engines."""
 
+import asyncio
+import contextlib
+import enum
 import logging
+import os
+import urllib.parse
+import uuid
 from abc import ABC, abstractmethod
-from typing import Union
+from typing import Optional, Union
 
 import zmq
 import zmq.asyncio
 from gabriel_protocol.v1 import gabriel_pb2
+from prometheus_client import Counter, Gauge
+
+DEFAULT_SINK_QUEUE_SIZE = 100
+DEFAULT_SINK_DRAIN_TIMEOUT = 5
+DEFAULT_DB_BATCH_ROWS = 100
+DEFAULT_DB_BATCH_WAIT_MS = 1000
 
 logger = logging.getLogger(__name__)
 
+RESULT_SINK_QUEUE_DEPTH = Gauge(
+    "gabriel_result_sink_queue_depth",
+    "Number of results waiting to be processed by a result sink",
+    ["sink"],
+)
+
+RESULT_SINK_DROPPED_TOTAL = Counter(
+    "gabriel_result_sink_dropped_total",
+    "Total number of results dropped because a result sink's queue was full",
+    ["sink"],
+)
+
+DB_RESULT_ROWS_DROPPED_TOTAL = Counter(
+    "gabriel_db_result_rows_dropped_total",
+    "Total number of result rows that could not be inserted into the database",
+)
+
+
+class OverflowPolicy(enum.Enum):
+    """What to do with a result when a result sink's queue is full."""
+
+    # Drop the oldest queued result to make room for the new one
+    DROP_OLDEST = "drop_oldest"
+    # Drop the new result
+    DROP_NEWEST = "drop_newest"
+    # Wait for the sink to make room, holding up the engine result path
+    BLOCK = "block"
+
 
 class ResultSink(ABC):
     """Abstract base class for result sinks."""
@@ -56,44 +96,388 @@ class ZeroMQSink(ResultSink):
         self._context.term()
 
 
+class BlobStore(ABC):
+    """Abstract base class for stores of result payloads."""
+
+    @abstractmethod
+    def get_bucket(self) -> str:
+        """Return the name of the bucket that payloads are stored in."""
+        pass
+
+    @abstractmethod
+    async def put(self, object_key: str, data: bytes):
+        """Store data under object_key in the bucket."""
+        pass
+
+
+class LocalBlobStore(BlobStore):
+    """Stores result payloads as files in a local directory."""
+
+    def __init__(self, root_dir: Union[str, os.PathLike]):
+        """Initialize the local blob store.
+
+        Args:
+            root_dir (str | os.PathLike):
+                The directory to store payloads in, which is also used as
+                the bucket name. Created if it does not exist.
+        """
+        self._root_dir = os.path.abspath(root_dir)
+        os.makedirs(self._root_dir, exist_ok=True)
+
+    def get_bucket(self):
+        """Return the directory that payloads are stored in."""
+        return self._root_dir
+
+    async def put(self, object_key, data):
+        """Write data to the file object_key under the root directory."""
+        await asyncio.to_thread(self._write, object_key, data)
+
+    def _write(self, object_key, data):
+        root_dir = os.path.realpath(self._root_dir)
+        path = os.path.realpath(os.path.join(root_dir, object_key))
+        if os.path.commonpath([root_dir, path]) != root_dir:
+            raise ValueError(
+                f"Object key {object_key} is outside of {self._root_dir}"
+            )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _quote_key_component(name: str) -> str:
+    """Quote name so that it is a single component of an object key.
+
+    Slashes are escaped, as are the dots of "." and "..", so the component
+    can't refer to another directory. An empty name is replaced with "_",
+    since an empty component would make the key absolute.
+    """
+    quoted = urllib.parse.quote(name, safe="")
+    if quoted in (".", ".."):
+        return quoted.replace(".", "%2E")
+    return quoted or "_"
+
+
+class DatabaseResultSink(ResultSink):
+    """Records results in the engine_results table.
+
+    Each result payload is written to a blob store, and a row referring to
+    it is added to the table. Rows are inserted in batches, with a single
+    multi-row INSERT whenever max_batch_rows rows are waiting or the oldest
+    waiting row has waited max_batch_wait_ms, so that the database is sent
+    one statement per batch rather than one per result. Results without a
+    payload are not recorded.
+
+    Requires SQLAlchemy with an async driver for the database, e.g. asyncpg
+    for PostgreSQL or aiosqlite for SQLite.
+    """
+
+    def __init__(
+        self,
+        blob_store: BlobStore,
+        session_factory=None,
+        max_batch_rows: int = DEFAULT_DB_BATCH_ROWS,
+        max_batch_wait_ms: int = DEFAULT_DB_BATCH_WAIT_MS,
+    ):
+        """Initialize the database result sink.
+
+        Args:
+            blob_store (BlobStore): The store to write result payloads to
+            session_factory (async_sessionmaker):
+                Creates the sessions used to insert rows. Defaults to
+                gabriel_server.db.AsyncSessionLocal.
+            max_batch_rows (int):
+                The number of waiting rows that triggers an insert
+            max_batch_wait_ms (int):
+                The longest time in milliseconds that a row waits before it
+                is inserted
+        """
+        # Imported here so that only servers using this sink need SQLAlchemy
+        from sqlalchemy import insert
+
+        from gabriel_server.models import EngineResult
+
+        if session_factory is None:
+            from gabriel_server.db import AsyncSessionLocal
+
+            session_factory = AsyncSessionLocal
+
+        if max_batch_rows < 1:
+            raise ValueError("max_batch_rows must be at least 1")
+        if max_batch_wait_ms < 0:
+            raise ValueError("max_batch_wait_ms must not be negative")
+
+        self._blob_store = blob_store
+        self._session_factory = session_factory
+        self._max_batch_rows = max_batch_rows
+        self._max_batch_wait_ms = max_batch_wait_ms
+        self._insert = insert(EngineResult)
+        self._rows = []
+        # Flushes the current batch once it has waited max_batch_wait_ms
+        self._flush_task = None
+
+    async def process_result(self, result):
+        """Store the result payload and queue its row for insertion."""
+        payload_field = result.WhichOneof("payload")
+        if payload_field is None:
+            return
+        if payload_field == "string_result":
+            data = result.string_result.encode()
+            content_type = "text/plain; charset=utf-8"
+        elif payload_field == "bytes_result":
+            data = result.bytes_result
+            content_type = "application/octet-stream"
+        else:
+            data = result.any_result.SerializeToString()
+            content_type = "application/x-protobuf"
+
+        # Frame ids are only unique per client, so a random suffix keeps
+        # results for different clients from overwriting each other
+        object_key = (
+            f"{_quote_key_component(result.target_engine_id)}/"
+            f"{result.frame_id}-{uuid.uuid4().hex}"
+        )
+        await self._blob_store.put(object_key, data)
+
+        self._rows.append(
+            {
+                "engine_id": result.target_engine_id,
+                "frame_id": result.frame_id,
+                "bucket": self._blob_store.get_bucket(),
+                "object_key": object_key,
+                "content_type": content_type,
+                "size_bytes": len(data),
+            }
+        )
+        if len(self._rows) >= self._max_batch_rows:
+            await self._flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_wait())
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self._max_batch_wait_ms / 1000)
+        self._flush_task = None
+        try:
+            await self._flush()
+        except Exception:
+            logger.exception("Failed to insert engine results")
+            if self._rows and self._flush_task is None:
+                # Try again once another max_batch_wait_ms has passed
+                self._flush_task = asyncio.create_task(
+                    self._flush_after_wait()
+                )
+
+    async def _flush(self):
+        """Insert every waiting row with a single statement.
+
+        If the insert fails, the rows are kept to be inserted with the next
+        batch.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self._rows:
+            return
+        rows = self._rows
+        self._rows = []
+        try:
+            async with self._session_factory() as session:
+                await session.execute(self._insert.values(rows))
+                await session.commit()
+        except Exception:
+            # Rows may have been added while the insert was running
+            self._rows = rows + self._rows
+            raise
+
+    async def cleanup(self):
+        """Insert any rows still waiting.
+
+        Rows that can't be inserted are counted in
+        gabriel_db_result_rows_dropped_total.
+        """
+        try:
+            await self._flush()
+        except Exception:
+            logger.exception(
+                "Dropping %d engine results that failed to insert",
+                len(self._rows),
+            )
+            DB_RESULT_ROWS_DROPPED_TOTAL.inc(len(self._rows))
+            self._rows = []
+
+
+class _SinkWorker:
+    """Feeds results to a result sink from a bounded queue.
+
+    The worker task is started when the first result is queued, so that a
+    sink can be registered before the server's event loop is running.
+    """
+
+    def __init__(self, result_sink, name, max_queue_size, overflow_policy):
+        self._result_sink = result_sink
+        self._name = name
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._overflow_policy = overflow_policy
+        self._task = None
+        # Export both metrics from the start, rather than from the first
+        # result queued or dropped
+        RESULT_SINK_QUEUE_DEPTH.labels(sink=name).set(0)
+        RESULT_SINK_DROPPED_TOTAL.labels(sink=name)
+
+    def get_result_sink(self):
+        return self._result_sink
+
+    def get_name(self):
+        return self._name
+
+    async def put(self, result):
+        """Queue a result for the sink, applying the overflow policy."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+        if self._overflow_policy == OverflowPolicy.BLOCK:
+            await self._queue.put(result)
+        elif not self._queue.full():
+            self._queue.put_nowait(result)
+        else:
+            RESULT_SINK_DROPPED_TOTAL.labels(sink=self._name).inc()
+            if self._overflow_policy == OverflowPolicy.DROP_NEWEST:
+                return
+            self._queue.get_nowait()
+            self._queue.put_nowait(result)
+        RESULT_SINK_QUEUE_DEPTH.labels(sink=self._name).set(
+            self._queue.qsize()
+        )
+
+    async def _run(self):
+        while True:
+            result = await self._queue.get()
+            RESULT_SINK_QUEUE_DEPTH.labels(sink=self._name).set(
+                self._queue.qsize()
+            )
+            try:
+                await self._result_sink.process_result(result)
+            except Exception as e:
+                logger.error(e)
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, drain_timeout):
+        """Stop the worker task once the sink has processed queued results.
+
+        Results still queued after drain_timeout seconds are discarded. The
+        sink is not called again once this returns.
+        """
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "Discarding %d results queued for sink %s",
+                    self._queue.qsize(),
+                    self._name,
+                )
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        self._remove_metrics()
+
+    def cancel(self):
+        """Cancel the worker task, discarding any results still queued."""
+        if self._task is not None:
+            self._task.cancel()
+        self._remove_metrics()
+
+    def _remove_metrics(self):
+        RESULT_SINK_QUEUE_DEPTH.remove(self._name)
+        RESULT_SINK_DROPPED_TOTAL.remove(self._name)
+
+
 class ResultManager:
     """Manages result sinks.
 
     Each server instance has a result manager instance associated with it. Do
     not instantiate a result manager separately.
+
+    Every sink is fed from its own bounded queue by a separate task, so a
+    slow sink never holds up results being returned to clients or inputs
+    being sent to engines, unless it is registered with OverflowPolicy.BLOCK.
     """
 
     def __init__(self):
         """Initialize internal data structures."""
-        self._sinks = set()
+        # Mapping from result sink to the worker that feeds it
+        self._sinks: dict[ResultSink, _SinkWorker] = {}
 
-    def register_result_sink(self, result_sink: ResultSink):
+    def register_result_sink(
+        self,
+        result_sink: ResultSink,
+        max_queue_size: int = DEFAULT_SINK_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        name: Optional[str] = None,
+    ):
         """Register a sink to send engine results to.
 
         Not thread-safe. Must be called from the same asyncio loop that
         the server is running on.
+
+        Args:
+            result_sink (ResultSink): The sink to send engine results to
+            max_queue_size (int):
+                The maximum number of results waiting for the sink
+            overflow_policy (OverflowPolicy):
+                What to do with a result when the sink's queue is full
+            name (str):
+                The sink's label in the queue depth and drop metrics, which
+                must be unique among the registered sinks. Defaults to the
+                name of the sink's class, followed by "-2", "-3" and so on
+                if a sink of the same class is already registered.
         """
-        self._sinks.add(result_sink)
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be at least 1")
+        if result_sink in self._sinks:
+            return
+        names = {
+            sink_worker.get_name() for sink_worker in self._sinks.values()
+        }
+        if name is None:
+            name = type(result_sink).__name__
+            suffix = 1
+            while name in names:
+                suffix += 1
+                name = f"{type(result_sink).__name__}-{suffix}"
+        elif name in names:
+            raise ValueError(
+                f"A result sink named {name} is already registered"
+            )
+        self._sinks[result_sink] = _SinkWorker(
+            result_sink, name, max_queue_size, overflow_policy
+        )
 
     def unregister_result_sink(self, result_sink: ResultSink):
         """Unregister a result sink.
 
+        Results still queued for the sink are discarded.
+
         Not thread-safe. Must be called from the same asyncio loop that
         the server is running on.
         """
-        self._sinks.discard(result_sink)
+        sink_worker = self._sinks.pop(result_sink, None)
+        if sink_worker is not None:
+            sink_worker.cancel()
 
     async def process_result(self, result: gabriel_pb2.Result):
-        """Process an engine result, invoked by the server."""
+        """Queue an engine result for every sink, invoked by the server."""
         if result.status.code != gabriel_pb2.StatusCode.SUCCESS:
             return
-        for sink in self._sinks:
-            try:
-                await sink.process_result(result)
-            except Exception as e:
-                logger.error(e)
+        for sink_worker in list(self._sinks.values()):
+            await sink_worker.put(result)
 
-    async def cleanup(self):
-        """Cleanup logic, invoked by the server."""
-        for sink in self._sinks:
-            await sink.cleanup()
+    async def cleanup(self, drain_timeout: float = DEFAULT_SINK_DRAIN_TIMEOUT):
+        """Cleanup logic, invoked by the server.
+
+        Each sink is given up to drain_timeout seconds to process the
+        results queued for it before its cleanup() is called.
+        """
+        for sink_worker in self._sinks.values():
+            await sink_worker.stop(drain_timeout)
+            await sink_worker.get_result_sink().cleanup()
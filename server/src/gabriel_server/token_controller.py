@@ -0,0 +1,189 @@
+"""Adapts the number of tokens that each producer of a client holds.
+
+A producer needs enough tokens to keep the engines busy while a token makes
+its round trip to the client and back, but every token beyond that only
+adds an input waiting in a queue on the server. TokenController estimates
+the number of tokens that fills this pipeline for each producer, from
+three measurements:
+
+* The turnaround time, from a token being returned to a producer that had
+  run out of tokens until its next input arrives. This covers the network
+  round trip and the time the client takes to produce the input.
+* The service time, the shortest time an input spent on the server, from
+  its arrival until its token was returned, among recent inputs.
+* The queueing delay, the time that inputs spent on the server beyond the
+  service time, which grows once inputs wait in a queue.
+
+The producer's number of tokens is then moved one token at a time towards
+1 + turnaround time / service time, and is lowered instead while inputs
+wait in a queue for more than half a service time.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# The number of recent inputs to take the service time from
+SERVICE_TIME_WINDOW = 32
+# The gain of the moving averages of the turnaround time and queueing delay
+AVERAGE_GAIN = 1 / 8
+
+
+class _ProducerTokens:
+    """The tokens and measurements of one producer of one client."""
+
+    def __init__(self, num_tokens: int):
+        self.num_tokens = num_tokens
+        # When each input that has not had its token returned arrived, by
+        # frame id
+        self.arrival_times = {}
+        self.times_on_server = deque(maxlen=SERVICE_TIME_WINDOW)
+        self.turnaround_time = None
+        self.queueing_delay = 0.0
+        # When a token was returned to the producer while it had no others,
+        # or None if the producer had tokens left
+        self.starved_since = None
+        # The number of tokens to be returned before the number of tokens
+        # is changed again, so that the effect of the last change is seen
+        # first
+        self.returns_until_update = num_tokens
+
+
+class TokenController:
+    """Adapts the number of tokens of each producer to its pipeline."""
+
+    def __init__(
+        self,
+        num_tokens: int,
+        max_num_tokens: int,
+        min_num_tokens: int = 1,
+    ):
+        """Initialize the token controller.
+
+        Args:
+            num_tokens (int):
+                The number of tokens that each producer starts with
+            max_num_tokens (int):
+                The most tokens that a producer is given
+            min_num_tokens (int):
+                The fewest tokens that a producer is given
+        """
+        if not min_num_tokens <= num_tokens <= max_num_tokens:
+            raise ValueError(
+                "num_tokens must be between min_num_tokens and max_num_tokens"
+            )
+        self._num_tokens = num_tokens
+        self._max_num_tokens = max_num_tokens
+        self._min_num_tokens = min_num_tokens
+        # Mapping from client address to a mapping from producer id to the
+        # producer's _ProducerTokens
+        self._clients = {}
+
+    def _get_producer(self, address, producer_id):
+        producers = self._clients.setdefault(address, {})
+        producer = producers.get(producer_id)
+        if producer is None:
+            producer = _ProducerTokens(self._num_tokens)
+            producers[producer_id] = producer
+        return producer
+
+    def get_num_tokens(self, address, producer_id) -> int:
+        """Return the number of tokens that a producer holds."""
+        producer = self._clients.get(address, {}).get(producer_id)
+        return self._num_tokens if producer is None else producer.num_tokens
+
+    def input_received(
+        self, address, producer_id: str, frame_id: int, now=None
+    ) -> None:
+        """Record that an input was accepted, taking one of its tokens."""
+        now = time.monotonic() if now is None else now
+        producer = self._get_producer(address, producer_id)
+        producer.arrival_times[frame_id] = now
+        if producer.starved_since is not None:
+            turnaround_time = now - producer.starved_since
+            producer.starved_since = None
+            if producer.turnaround_time is None:
+                producer.turnaround_time = turnaround_time
+            else:
+                producer.turnaround_time += AVERAGE_GAIN * (
+                    turnaround_time - producer.turnaround_time
+                )
+
+    def token_returned(
+        self,
+        address,
+        producer_id: str,
+        frame_id: int,
+        processed: bool,
+        starved: bool,
+        now=None,
+    ) -> Optional[int]:
+        """Record that the token of an input was returned.
+
+        Args:
+            address: The identifier of the client
+            producer_id (str): The id of the producer
+            frame_id (int): The frame id of the input
+            processed (bool):
+                Whether an engine processed the input, rather than the
+                server discarding it
+            starved (bool):
+                Whether the producer had no other tokens left
+            now (float, optional):
+                The current time.monotonic(), for testing
+
+        Returns the producer's new number of tokens if it changed, or None.
+        """
+        now = time.monotonic() if now is None else now
+        producer = self._clients.get(address, {}).get(producer_id)
+        if producer is None:
+            return None
+        if starved:
+            producer.starved_since = now
+        arrival_time = producer.arrival_times.pop(frame_id, None)
+        if arrival_time is None or not processed:
+            return None
+
+        time_on_server = now - arrival_time
+        producer.times_on_server.append(time_on_server)
+        service_time = min(producer.times_on_server)
+        producer.queueing_delay += AVERAGE_GAIN * (
+            time_on_server - service_time - producer.queueing_delay
+        )
+
+        producer.returns_until_update -= 1
+        if producer.returns_until_update > 0 or service_time <= 0:
+            return None
+
+        num_tokens = producer.num_tokens
+        if producer.queueing_delay > service_time / 2:
+            num_tokens -= 1
+        elif producer.turnaround_time is not None:
+            # Round to the nearest number of tokens, since a token that
+            # would only be used for a small part of each round trip adds
+            # more queueing delay than it saves
+            target = 1 + int(producer.turnaround_time / service_time + 0.5)
+            if target > num_tokens:
+                num_tokens += 1
+            elif target < num_tokens:
+                num_tokens -= 1
+        num_tokens = max(
+            self._min_num_tokens, min(self._max_num_tokens, num_tokens)
+        )
+        producer.returns_until_update = num_tokens
+        if num_tokens == producer.num_tokens:
+            return None
+
+        logger.debug(
+            f"Changing the number of tokens of producer {producer_id} of "
+            f"client {address} from {producer.num_tokens} to {num_tokens}"
+        )
+        producer.num_tokens = num_tokens
+        return num_tokens
+
+    def remove_client(self, address) -> None:
+        """Forget the producers of a client that has disconnected."""
+        self._clients.pop(address, None)
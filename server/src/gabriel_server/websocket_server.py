@@ -5,6 +5,7 @@ import logging
 import socket
 
 import websockets
+from gabriel_protocol.framing import decode_from_client
 from gabriel_protocol.v1 import gabriel_pb2
 from websockets.asyncio.server import serve, unix_serve
 
@@ -16,9 +17,22 @@ logger = logging.getLogger(__name__)
 class WebsocketServer(GabrielServer):
     """A Gabriel server that uses Websockets for communication with clients."""
 
-    def __init__(self, num_tokens_per_producer, engine_cb, engine_ids):
+    def __init__(
+        self,
+        num_tokens_per_producer,
+        engine_cb,
+        engine_ids,
+        client_disconnected_cb=None,
+        max_tokens_per_producer=None,
+    ):
         """Initialize the Websocket server."""
-        super().__init__(num_tokens_per_producer, engine_cb, engine_ids)
+        super().__init__(
+            num_tokens_per_producer,
+            engine_cb,
+            engine_ids,
+            client_disconnected_cb,
+            max_tokens_per_producer,
+        )
         self._server = None
         # websockets doesn't allow concurrent send()s on the same connection,
         # so use a lock to ensure that we do not interleave sends. The map is
@@ -50,7 +64,7 @@ class WebsocketServer(GabrielServer):
         else:
             return unix_serve(handler, path=port_or_path)
 
-    async def _send_via_transport(self, address, payload):
+    async def _send_via_transport(self, address, to_client):
         client = self._clients.get(address)
         write_lock = self._write_locks.get(address)
         if client is None or write_lock is None:
@@ -59,7 +73,7 @@ class WebsocketServer(GabrielServer):
         logger.debug("Sending to address: %s", address)
         try:
             async with write_lock:
-                await client.websocket.send(payload)
+                await client.websocket.send(to_client.SerializeToString())
         except websockets.exceptions.ConnectionClosed:
             logger.info("No connection to address: %s", address)
             return False
@@ -88,8 +102,8 @@ class WebsocketServer(GabrielServer):
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
-            del self._clients[address]
             del self._write_locks[address]
+            await self._remove_client(address)
             logger.info(f"Client disconnected: {address}")
 
     async def _consumer(self, websocket, client):
@@ -97,11 +111,10 @@ class WebsocketServer(GabrielServer):
         async for raw_input in websocket:
             logger.debug(f"Received input from {address}")
 
-            from_client = gabriel_pb2.FromClient()
-            from_client.ParseFromString(raw_input)
+            from_client, input_frame = decode_from_client(raw_input)
 
             status, status_msg = await self._consumer_helper(
-                client, address, from_client
+                client, address, from_client, input_frame
             )
             if status == gabriel_pb2.StatusCode.SUCCESS:
                 if from_client.WhichOneof("message_type") == "registration":
@@ -109,11 +122,6 @@ class WebsocketServer(GabrielServer):
                         await websocket.send(
                             self._make_registered().SerializeToString()
                         )
-                else:
-                    # Deduct a token when you get a new input from the client
-                    client.tokens_for_producer[
-                        from_client.input.producer_id
-                    ] -= 1
                 continue
 
             # Send error message
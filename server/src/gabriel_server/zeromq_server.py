@@ -10,6 +10,7 @@ from collections.abc import Callable
 
 import zmq
 import zmq.asyncio
+from gabriel_protocol.framing import decode_from_client
 from gabriel_protocol.v1 import gabriel_pb2
 from google.protobuf.message import DecodeError
 
@@ -38,6 +39,8 @@ class ZeroMQServer(GabrielServer):
         num_tokens_per_producer: int,
         engine_cb: Callable[[gabriel_pb2.InputFrame], gabriel_pb2.Result],
         engine_ids: set[str],
+        client_disconnected_cb=None,
+        max_tokens_per_producer=None,
     ):
         """Initialize the ZeroMQ server.
 
@@ -48,8 +51,20 @@ class ZeroMQServer(GabrielServer):
                 Callback invoked for each input received from a client.
             engine_ids:
                 The ids of the engines connected to the server
+            client_disconnected_cb:
+                Coroutine function called with the address of each client
+                that disconnects
+            max_tokens_per_producer (int, optional):
+                If set, the number of tokens of each producer is adapted
+                up to this number (see GabrielServer)
         """
-        super().__init__(num_tokens_per_producer, engine_cb, engine_ids)
+        super().__init__(
+            num_tokens_per_producer,
+            engine_cb,
+            engine_ids,
+            client_disconnected_cb,
+            max_tokens_per_producer,
+        )
         self._is_running = False
         self._ctx = zmq.asyncio.Context()
         # The socket used for communicating with all clients
@@ -94,11 +109,13 @@ class ZeroMQServer(GabrielServer):
             self._ctx.term()
             await self.result_manager.cleanup()
 
-    async def _send_via_transport(self, address, payload):
+    async def _send_via_transport(self, address, to_client):
         if self._simulate_disconnection:
             return False
         logger.debug("Sending result to client %s", address)
-        await self._sock.send_multipart([address, payload])
+        await self._sock.send_multipart(
+            [address, to_client.SerializeToString()]
+        )
         return True
 
     def is_running(self):
@@ -127,7 +144,12 @@ class ZeroMQServer(GabrielServer):
                 continue
             # Listen for client messages
             try:
-                address, raw_input = await self._sock.recv_multipart()
+                # Receive without copying, so that the payload of a split
+                # input reaches the engines without ever being copied into a
+                # bytes object
+                address_frame, input_frame = await self._sock.recv_multipart(
+                    copy=False
+                )
             except zmq.ZMQError as error:
                 logging.error(
                     f"Error '{error.msg}' when receiving on ZeroMQ socket"
@@ -138,6 +160,8 @@ class ZeroMQServer(GabrielServer):
                     continue
                 raise
 
+            address = address_frame.bytes
+            raw_input = input_frame.buffer
             logger.debug(f"Received message from client {address}")
 
             client = self._clients.get(address)
@@ -177,7 +201,7 @@ class ZeroMQServer(GabrielServer):
                 )
             except (TimeoutError, asyncio.TimeoutError):
                 logger.info(f"Client disconnected: {address}")
-                del self._clients[address]
+                await self._remove_client(address)
                 return
 
             # Received heartbeat, send back heartbeat
@@ -189,9 +213,8 @@ class ZeroMQServer(GabrielServer):
                 await self._sock.send_multipart([address, HEARTBEAT])
                 continue
 
-            from_client = gabriel_pb2.FromClient()
             try:
-                from_client.ParseFromString(raw_input)
+                from_client, input_frame = decode_from_client(raw_input)
             except DecodeError as e:
                 logger.error(
                     f"Failed to parse input from client {address}: {e}"
@@ -200,7 +223,7 @@ class ZeroMQServer(GabrielServer):
 
             # Consume input
             status, status_msg = await self._consumer_helper(
-                client, address, from_client
+                client, address, from_client, input_frame
             )
 
             if status == gabriel_pb2.StatusCode.SUCCESS:
@@ -211,10 +234,6 @@ class ZeroMQServer(GabrielServer):
                     await self._sock.send_multipart(
                         [address, self._make_registered().SerializeToString()]
                     )
-                else:
-                    client.tokens_for_producer[
-                        from_client.input.producer_id
-                    ] -= 1
                 continue
 
             # Send error message
@@ -0,0 +1,84 @@
+"""Microbenchmark for the cost of the early discard filters per frame.
+
+Measures the time that an EarlyDiscard with each filter, and with all of
+them chained, takes to check a 1080p BGR frame (as OpencvAdapter does,
+before encoding) and a 1080p JPEG input (as InputProducer does). The
+filters run on a small grayscale copy of the frame, so their cost is
+dominated by downsampling the frame or decoding the JPEG.
+
+Run with: python bench_early_discard.py [--iterations N]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+from gabriel_client.early_discard import (
+    DuplicateFilter,
+    EarlyDiscard,
+    MotionFilter,
+    SharpnessFilter,
+)
+from gabriel_protocol.v1 import gabriel_pb2
+
+WIDTH = 1920
+HEIGHT = 1080
+
+
+def _make_frames(num_frames):
+    """Return frames of a scene that shifts by a pixel each frame."""
+    rng = np.random.default_rng(0)
+    blocks = rng.integers(0, 256, (54, 96 + num_frames, 3), dtype=np.uint8)
+    scene = cv2.resize(
+        blocks,
+        (WIDTH + num_frames * 20, HEIGHT),
+        interpolation=cv2.INTER_NEAREST,
+    )
+    return [scene[:, i : i + WIDTH].copy() for i in range(num_frames)]
+
+
+def _encode(frame):
+    _, encoded = cv2.imencode(".jpg", frame)
+    return gabriel_pb2.InputFrame(
+        payload_type=gabriel_pb2.PayloadType.IMAGE,
+        byte_payload=encoded.tobytes(),
+    )
+
+
+def _time_per_frame(make_filters, check, frames, iterations):
+    early_discard = EarlyDiscard(make_filters())
+    start = time.perf_counter()
+    for i in range(iterations):
+        check(early_discard, frames[i % len(frames)])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    """Print the time per frame of each filter."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    frames = _make_frames(10)
+    inputs = [_encode(frame) for frame in frames]
+    filter_sets = {
+        "motion": lambda: [MotionFilter()],
+        "sharpness": lambda: [SharpnessFilter()],
+        "duplicate": lambda: [DuplicateFilter()],
+        "all": lambda: [MotionFilter(), SharpnessFilter(), DuplicateFilter()],
+    }
+
+    print(f"{'filters':>10} {'BGR (ms)':>9} {'JPEG (ms)':>10}")
+    for name, make_filters in filter_sets.items():
+        bgr_time = _time_per_frame(
+            make_filters, EarlyDiscard.check, frames, args.iterations
+        )
+        jpeg_time = _time_per_frame(
+            make_filters, EarlyDiscard.check_input, inputs, args.iterations
+        )
+        print(f"{name:>10} {bgr_time * 1000:>9.2f} {jpeg_time * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
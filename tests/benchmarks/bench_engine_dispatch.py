@@ -0,0 +1,83 @@
+"""Microbenchmark for dispatching a client input to its target engine.
+
+Measures the CPU time that _ProducerInfo.process_input_from_client spends
+per input as the number of connected engines grows, with the input always
+targeting a single one of them. Dispatch looks the target up by engine id
+and caches the result, so the cost should stay flat from 1 to 1000
+engines.
+
+Run with: python bench_engine_dispatch.py [--iterations N]
+"""
+
+import argparse
+import asyncio
+import time
+
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    _EnginePool,
+    _EngineWorker,
+    _ProducerInfo,
+)
+
+NUM_ENGINES = [1, 10, 100, 1000]
+
+
+class _NullContext:
+    """Stands in for an engine's gRPC stream, discarding what is sent."""
+
+    async def write(self, message):
+        pass
+
+
+async def _cpu_time_per_input(num_engines, iterations):
+    engine_pools = {}
+    for i in range(num_engines):
+        engine_pool = _EnginePool(f"engine-{i}")
+        engine_pool.add_replica(
+            _EngineWorker(_NullContext(), engine_pool, False, 1)
+        )
+        engine_pools[engine_pool.get_engine_id()] = engine_pool
+    target_engine_id = f"engine-{num_engines - 1}"
+    engine_worker = engine_pools[target_engine_id].replicas[0]
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = "producer"
+    from_client.input.target_engine_ids.append(target_engine_id)
+    from_client.input.input_frame.string_payload = "input"
+
+    async def dispatch(frame_id):
+        from_client.input.frame_id = frame_id
+        await producer_info.process_input_from_client(
+            from_client, "client", None
+        )
+        # Stand in for the engine's result, to free the worker up again
+        engine_worker.pop_in_flight_input(frame_id, "producer")
+        producer_info.pending_token_returns.clear()
+
+    await dispatch(0)
+    start = time.process_time()
+    for frame_id in range(1, iterations + 1):
+        await dispatch(frame_id)
+    return (time.process_time() - start) / iterations
+
+
+async def main_async(iterations):
+    """Run the benchmark and print the CPU time per input."""
+    print(f"{'engines':>8} {'per input (us)':>15}")
+    for num_engines in NUM_ENGINES:
+        cpu_time = await _cpu_time_per_input(num_engines, iterations)
+        print(f"{num_engines:>8} {cpu_time * 1e6:>15.1f}")
+
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Microbenchmark for fanning a client input out to several engines.
+
+Measures the CPU time that _ProducerInfo.process_input_from_client spends
+per input as the number of engines it targets grows, and compares it with
+encoding a separate ToEngine for each target engine, as dispatch did
+before the encoded ToEngine was shared by every engine.
+
+Run with: python bench_engine_fanout.py [--iterations N]
+"""
+
+import argparse
+import asyncio
+import time
+
+from gabriel_protocol.framing import encode_to_engine
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    _EnginePool,
+    _EngineWorker,
+    _ProducerInfo,
+)
+
+NUM_TARGET_ENGINES = [1, 2, 5]
+PAYLOAD_SIZE = 2 * 1024 * 1024
+
+
+class _NullContext:
+    """Stands in for an engine's gRPC stream, discarding what is sent."""
+
+    async def write(self, message):
+        pass
+
+
+def _make_input(num_engines):
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = "producer"
+    from_client.input.target_engine_ids.extend(
+        f"engine-{i}" for i in range(num_engines)
+    )
+    from_client.input.input_frame.byte_payload = b"\x00" * PAYLOAD_SIZE
+    return from_client
+
+
+async def _cpu_time_per_input(num_engines, iterations):
+    engine_pools = {}
+    for i in range(num_engines):
+        engine_pool = _EnginePool(f"engine-{i}")
+        engine_pool.add_replica(
+            _EngineWorker(_NullContext(), engine_pool, False, 1)
+        )
+        engine_pools[engine_pool.get_engine_id()] = engine_pool
+    engine_workers = [pool.replicas[0] for pool in engine_pools.values()]
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    from_client = _make_input(num_engines)
+
+    async def dispatch(frame_id):
+        from_client.input.frame_id = frame_id
+        await producer_info.process_input_from_client(
+            from_client, "client", None
+        )
+        # Stand in for the engines' results, to free the workers up again
+        for engine_worker in engine_workers:
+            engine_worker.pop_in_flight_input(frame_id, "producer")
+        producer_info.pending_token_returns.clear()
+
+    await dispatch(0)
+    start = time.process_time()
+    for frame_id in range(1, iterations + 1):
+        await dispatch(frame_id)
+    return (time.process_time() - start) / iterations
+
+
+def _cpu_time_per_engine_encoding(num_engines, iterations):
+    from_client = _make_input(num_engines)
+    start = time.process_time()
+    for frame_id in range(iterations):
+        input_frame = from_client.input.input_frame.SerializeToString()
+        for _ in range(num_engines):
+            encode_to_engine(
+                input_frame,
+                gabriel_pb2.ToEngine(frame_id=frame_id, producer_id="p"),
+            )
+    return (time.process_time() - start) / iterations
+
+
+async def main_async(iterations):
+    """Run the benchmark and print the CPU time per input."""
+    print(f"{'engines':>8} {'per engine (us)':>16} {'shared (us)':>12}")
+    for num_engines in NUM_TARGET_ENGINES:
+        per_engine = _cpu_time_per_engine_encoding(num_engines, iterations)
+        shared = await _cpu_time_per_input(num_engines, iterations)
+        print(
+            f"{num_engines:>8} {per_engine * 1e6:>16.1f} {shared * 1e6:>12.1f}"
+        )
+
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
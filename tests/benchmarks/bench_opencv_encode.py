@@ -0,0 +1,102 @@
+"""Benchmark for the frame rate that OpencvAdapter can encode frames at.
+
+Produces frames from an OpencvAdapter as fast as it can encode them, with a
+stand-in video capture that returns a noisy 1080p frame, and reports the
+frames per second for each number of worker threads. It also reports how
+long the event loop went without running while frames were encoded: the
+encoding runs on the worker threads, so the loop stays responsive however
+long a frame takes to encode. The frame rate grows with the number of
+workers up to the number of cores.
+
+Run with: python bench_opencv_encode.py [--frames N] [--codec jpeg]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+from gabriel_client.opencv_adapter import ImageCodec, OpencvAdapter
+
+WIDTH = 1920
+HEIGHT = 1080
+
+
+class _NoisyCapture:
+    """Stands in for a camera, returning the same noisy frame each time."""
+
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self._frame = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+    def read(self, image=None):
+        if image is None:
+            return True, self._frame.copy()
+        np.copyto(image, self._frame)
+        return True, image
+
+
+async def _max_loop_stall(stop_event):
+    """Return the longest time that the event loop did not run for."""
+    max_stall = 0
+    last = time.perf_counter()
+    while not stop_event.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        max_stall = max(max_stall, now - last - 0.001)
+        last = now
+    return max_stall
+
+
+async def _run(num_workers, num_frames, codec):
+    adapter = OpencvAdapter(
+        lambda frame: frame,
+        lambda frame: None,
+        _NoisyCapture(),
+        "engine",
+        codec=codec,
+        num_workers=num_workers,
+        pipeline_depth=num_workers,
+    )
+    (input_producer,) = adapter.get_producer_wrappers()
+    stop_event = asyncio.Event()
+    stall_task = asyncio.create_task(_max_loop_stall(stop_event))
+
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        await input_producer.produce()
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    max_stall = await stall_task
+    adapter.close()
+    return num_frames / elapsed, max_stall
+
+
+async def main_async(num_frames, codec):
+    """Print the frame rate for each number of worker threads."""
+    print(f"{'workers':>8} {'fps':>8} {'max loop stall (ms)':>20}")
+    num_workers = 1
+    while num_workers <= (os.cpu_count() or 1):
+        fps, max_stall = await _run(num_workers, num_frames, codec)
+        print(f"{num_workers:>8} {fps:>8.1f} {max_stall * 1000:>20.1f}")
+        num_workers *= 2
+
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument(
+        "--codec",
+        type=ImageCodec,
+        choices=list(ImageCodec),
+        default=ImageCodec.JPEG,
+    )
+    args = parser.parse_args()
+    asyncio.run(main_async(args.frames, args.codec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Soak benchmark for the server's memory use under client churn.
+
+Replays many short client sessions against the server's dispatch logic,
+without any network. Each session connects with its own client_info, sends
+a few inputs from a new producer id (as InputProducer does), has an engine
+return a result for each, and disconnects. The server's idle producers are
+collected periodically on a simulated clock, as the server does with
+producer_idle_timeout. Reports the resident memory of the process, the
+number of producers the server keeps and the number of producer label
+series in the Prometheus registry as the sessions go by. These stay flat
+once the first producers are collected, and grow with the number of
+sessions with --no-gc.
+
+Only runs on Linux, where the resident memory is read from /proc.
+
+Run with: python bench_producer_churn.py [--sessions N] [--no-gc]
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import time
+import uuid
+
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    Transport,
+    _EnginePool,
+    _EngineWorker,
+    _Server,
+)
+from google.protobuf import any_pb2, wrappers_pb2
+from prometheus_client import REGISTRY
+
+IDLE_TIMEOUT = 60
+# Sessions between collections of idle producers
+GC_INTERVAL = 1000
+NUM_REPORTS = 10
+
+
+class _NullContext:
+    """Stands in for an engine's gRPC stream, discarding what is sent."""
+
+    async def write(self, message):
+        pass
+
+
+def _rss_mib():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _num_producer_series():
+    """Return the number of label sets of the producer metrics."""
+    return sum(
+        len({tuple(sample.labels.items()) for sample in metric.samples})
+        for metric in REGISTRY.collect()
+        if metric.name.startswith("gabriel_producer_")
+    )
+
+
+async def _run_session(server, context, session, inputs_per_session):
+    client_address = f"client-{session}"
+    client_info = any_pb2.Any()
+    client_info.Pack(wrappers_pb2.StringValue(value=client_address))
+    producer_id = f"producer-{uuid.uuid4()}"
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = producer_id
+    from_client.input.target_engine_ids.append("engine")
+    from_client.input.input_frame.byte_payload = b"\x00" * 1024
+    for frame_id in range(1, inputs_per_session + 1):
+        from_client.input.frame_id = frame_id
+        await server._send_to_engine(
+            from_client, client_address, client_info, None
+        )
+        from_engine = gabriel_pb2.FromEngine(
+            frame_id=frame_id, producer_id=producer_id
+        )
+        from_engine.result.status.code = gabriel_pb2.StatusCode.SUCCESS
+        await server._handle_from_engine(context, from_engine)
+    await server._client_disconnected(client_address)
+
+
+async def main_async(sessions, inputs_per_session, collect):
+    """Run the sessions and print the memory use as they go by."""
+    server = _Server(
+        1,
+        0,
+        2,
+        Transport.GRPC,
+        False,
+        False,
+        producer_idle_timeout=IDLE_TIMEOUT,
+    )
+    engine_pool = _EnginePool("engine")
+    context = _NullContext()
+    engine_worker = _EngineWorker(
+        context, engine_pool, False, 1, client_info_cache_size=1024
+    )
+    engine_pool.add_replica(engine_worker)
+    server._engine_pools["engine"] = engine_pool
+    server._engine_workers[context] = engine_worker
+
+    print(f"{'sessions':>9} {'rss (MiB)':>10} {'producers':>10} {'series':>7}")
+    report_interval = max(sessions // NUM_REPORTS, 1)
+    for session in range(1, sessions + 1):
+        await _run_session(server, context, session, inputs_per_session)
+        if collect and session % GC_INTERVAL == 0:
+            await server._collect_idle_producers(
+                time.monotonic() + IDLE_TIMEOUT
+            )
+        if session % report_interval == 0:
+            gc.collect()
+            print(
+                f"{session:>9} {_rss_mib():>10.1f} "
+                f"{len(server._producer_infos):>10} "
+                f"{_num_producer_series():>7}"
+            )
+
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--inputs-per-session", type=int, default=5)
+    parser.add_argument(
+        "--no-gc",
+        action="store_true",
+        help="Never collect idle producers",
+    )
+    args = parser.parse_args()
+    # Results for disconnected clients are logged as warnings
+    logging.getLogger("gabriel_server").setLevel(logging.ERROR)
+    asyncio.run(
+        main_async(args.sessions, args.inputs_per_session, not args.no_gc)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Benchmark for the staleness of inputs under each producer queue policy.
+
+Replays a bursty arrival pattern against _ProducerInfo on a simulated
+clock. A single engine takes a fixed time to process each input, and picks
+its next input up from the producer's queue as soon as it is free. Each
+burst overflows the queue, so drop_newest drops inputs on arrival and
+drop_oldest and keep_latest_only evict queued inputs. Reports the number of
+inputs dropped and evicted, and the time that the processed inputs spent
+waiting in the queue, which with drop_newest and drop_oldest grows with the
+length of the backlog, and with keep_latest_only stays below the engine's
+processing time.
+
+Run with: python bench_queue_policy.py [--bursts N]
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    QueuePolicy,
+    _EnginePool,
+    _EngineWorker,
+    _ProducerInfo,
+)
+
+# Seconds the engine takes to process each input
+PROCESSING_TIME = 0.05
+# Inputs in each burst, and seconds between inputs within a burst
+BURST_SIZE = 30
+BURST_INTERVAL = 0.005
+# Seconds between the start of each burst
+BURST_PERIOD = 1.0
+# Smaller than BURST_SIZE, so that each burst overflows the queue and
+# drop_newest and drop_oldest drop inputs
+QUEUE_SIZE = 10
+
+
+class _NullContext:
+    """Stands in for an engine's gRPC stream, discarding what is sent."""
+
+    async def write(self, message):
+        pass
+
+
+def _arrival_times(bursts):
+    return [
+        burst * BURST_PERIOD + i * BURST_INTERVAL
+        for burst in range(bursts)
+        for i in range(BURST_SIZE)
+    ]
+
+
+async def _queue_waits(queue_policy, arrival_times):
+    engine_pool = _EnginePool("engine")
+    engine_worker = _EngineWorker(_NullContext(), engine_pool, False, 1)
+    engine_pool.add_replica(engine_worker)
+    evicted = []
+
+    async def discarded_input_cb(producer_info, metadata, code, message):
+        evicted.append(metadata.frame_id)
+
+    producer_info = _ProducerInfo(
+        "producer",
+        {"engine": engine_pool},
+        QUEUE_SIZE,
+        queue_policy,
+        discarded_input_cb,
+    )
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = "producer"
+    from_client.input.target_engine_ids.append("engine")
+
+    waits = []
+    num_dropped = 0
+    busy_until = 0.0
+    in_flight = None
+
+    async def finish_input(now):
+        # The engine returns its result and picks up its next input
+        nonlocal busy_until, in_flight
+        engine_worker.pop_in_flight_input(in_flight, "producer")
+        producer_info.pending_token_returns.clear()
+        in_flight = None
+        await engine_worker.send_next_input()
+        if engine_worker.get_num_in_flight():
+            in_flight = engine_worker.get_in_flight_metadata()[0].frame_id
+            waits.append(now - arrival_times[in_flight])
+            busy_until = now + PROCESSING_TIME
+
+    for frame_id, arrival_time in enumerate(arrival_times):
+        while in_flight is not None and busy_until <= arrival_time:
+            await finish_input(busy_until)
+        from_client.input.frame_id = frame_id
+        status, _ = await producer_info.process_input_from_client(
+            from_client, "client", None
+        )
+        if status == gabriel_pb2.StatusCode.SERVER_DROPPED_FRAME:
+            num_dropped += 1
+        if in_flight is None and engine_worker.get_num_in_flight():
+            in_flight = frame_id
+            waits.append(0.0)
+            busy_until = arrival_time + PROCESSING_TIME
+    while in_flight is not None:
+        await finish_input(busy_until)
+    return waits, num_dropped, len(evicted)
+
+
+async def main_async(bursts):
+    """Run the benchmark and print the queue wait of processed inputs."""
+    arrival_times = _arrival_times(bursts)
+    print(
+        f"{'policy':>17} {'processed':>10} {'dropped':>8} {'evicted':>8} "
+        f"{'mean (ms)':>10} {'max (ms)':>9}"
+    )
+    for queue_policy in QueuePolicy:
+        waits, num_dropped, num_evicted = await _queue_waits(
+            queue_policy, arrival_times
+        )
+        print(
+            f"{queue_policy.value:>17} {len(waits):>10} {num_dropped:>8} "
+            f"{num_evicted:>8} {statistics.mean(waits) * 1e3:>10.1f} "
+            f"{max(waits) * 1e3:>9.1f}"
+        )
+
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bursts", type=int, default=10)
+    args = parser.parse_args()
+    # Each dropped input is logged as a warning
+    logging.getLogger("gabriel_server").setLevel(logging.ERROR)
+    asyncio.run(main_async(args.bursts))
+
+
+if __name__ == "__main__":
+    main()
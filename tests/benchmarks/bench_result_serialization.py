@@ -0,0 +1,73 @@
+"""Microbenchmark for encoding a result on its way to a client.
+
+Compares the CPU time spent per result by the old result path, which
+serialized the ToClient in GabrielServer.send_result only for
+GrpcServer to parse it back and have gRPC serialize it again, with the
+current one, where the ToClient is passed to the transport and encoded
+exactly once.
+
+Run with: python bench_result_serialization.py [--iterations N]
+"""
+
+import argparse
+import time
+
+from gabriel_protocol.v1 import gabriel_pb2
+
+PAYLOAD_SIZES = [100 * 1024, 1024 * 1024]
+
+
+def _make_result(payload_size):
+    result = gabriel_pb2.Result()
+    result.status.code = gabriel_pb2.StatusCode.SUCCESS
+    result.target_engine_id = "engine"
+    result.bytes_result = b"\x00" * payload_size
+    return result
+
+
+def _build_to_client(result):
+    to_client = gabriel_pb2.ToClient()
+    to_client.result_wrapper.producer_id = "producer"
+    to_client.result_wrapper.return_token = True
+    to_client.result_wrapper.result.CopyFrom(result)
+    return to_client
+
+
+def _old_path(result):
+    payload = _build_to_client(result).SerializeToString()
+    to_client = gabriel_pb2.ToClient()
+    to_client.ParseFromString(payload)
+    return to_client.SerializeToString()
+
+
+def _new_path(result):
+    return _build_to_client(result).SerializeToString()
+
+
+def _cpu_time_per_call(fn, result, iterations):
+    fn(result)
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(result)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    """Run the benchmark and print the CPU time per result."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'payload':>10} {'old (us)':>10} {'new (us)':>10} {'saved':>8}")
+    for payload_size in PAYLOAD_SIZES:
+        result = _make_result(payload_size)
+        old = _cpu_time_per_call(_old_path, result, args.iterations)
+        new = _cpu_time_per_call(_new_path, result, args.iterations)
+        print(
+            f"{payload_size // 1024:>8}KB {old * 1e6:>10.1f} "
+            f"{new * 1e6:>10.1f} {1 - new / old:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Microbenchmark for the cost of choosing which producer an engine serves.
+
+Measures the CPU time that each scheduling policy spends per input sent, as
+the number of producers waiting for an engine grows. Each input sent takes a
+peek and a sent call, and one producer in ten is discarded and added again,
+as happens when a producer runs out of inputs and a new one arrives. The
+round-robin scheduler takes constant time, and the others take time that
+grows with the logarithm of the number of producers.
+
+Run with: python bench_scheduler.py [--iterations N]
+"""
+
+import argparse
+import random
+import time
+
+from gabriel_server.network_engine.scheduler import (
+    SchedulingPolicy,
+    make_scheduler,
+)
+
+NUM_PRODUCERS = [10, 100, 1000, 10000]
+
+
+class _Producer:
+    """Stands in for a _ProducerInfo, with random scheduling parameters."""
+
+    def __init__(self, rng):
+        self._priority = rng.randrange(4)
+        self._weight = rng.randrange(1, 5)
+        self._deadline = rng.random()
+
+    def get_priority(self):
+        return self._priority
+
+    def get_weight(self):
+        return self._weight
+
+    def get_next_deadline(self):
+        self._deadline += 1
+        return self._deadline
+
+
+def _cpu_time_per_input(scheduling_policy, num_producers, iterations):
+    rng = random.Random(0)
+    scheduler = make_scheduler(scheduling_policy)
+    producers = [_Producer(rng) for _ in range(num_producers)]
+    for producer in producers:
+        scheduler.add(producer)
+
+    start = time.process_time()
+    for i in range(iterations):
+        producer = scheduler.peek()
+        if i % 10 == 0:
+            scheduler.discard(producer)
+            scheduler.add(producer)
+        else:
+            scheduler.sent(producer)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    """Parse arguments, run the benchmark, and print the time per input."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(
+        f"{'policy':>17} "
+        + " ".join(f"{n:>8}" for n in NUM_PRODUCERS)
+        + "  (us per input, by number of producers)"
+    )
+    for scheduling_policy in SchedulingPolicy:
+        times = [
+            _cpu_time_per_input(scheduling_policy, n, args.iterations)
+            for n in NUM_PRODUCERS
+        ]
+        print(
+            f"{scheduling_policy.value:>17} "
+            + " ".join(f"{t * 1e6:>8.2f}" for t in times)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Microbenchmark for forwarding an input from a client to an engine.
+
+Compares the server CPU time spent per input when the client sends a full
+FromClient, which the server parses before copying its InputFrame into a
+ToEngine and serializing that, with the time spent when the client sends
+the input with split framing, where the server parses only the header and
+splices the InputFrame bytes into the ToEngine unchanged.
+
+Run with: python bench_split_framing.py [--iterations N]
+"""
+
+import argparse
+import time
+
+from gabriel_protocol.framing import (
+    decode_from_client,
+    encode_split_input,
+    encode_to_engine,
+)
+from gabriel_protocol.v1 import gabriel_pb2
+
+PAYLOAD_SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+
+
+def _make_inputs(payload_size):
+    input_frame = gabriel_pb2.InputFrame()
+    input_frame.byte_payload = b"\x00" * payload_size
+    header = gabriel_pb2.FromClient()
+    header.input.producer_id = "producer"
+    header.input.frame_id = 1
+    header.input.target_engine_ids.append("engine")
+    split = encode_split_input(header, input_frame.SerializeToString())
+    header.input.input_frame.CopyFrom(input_frame)
+    return header.SerializeToString(), split
+
+
+def _full_path(data):
+    from_client = gabriel_pb2.FromClient.FromString(data)
+    to_engine = gabriel_pb2.ToEngine()
+    to_engine.frame_id = from_client.input.frame_id
+    to_engine.producer_id = from_client.input.producer_id
+    to_engine.input_frame.CopyFrom(from_client.input.input_frame)
+    return to_engine.SerializeToString()
+
+
+def _split_path(data):
+    from_client, input_frame = decode_from_client(data)
+    to_engine = gabriel_pb2.ToEngine()
+    to_engine.frame_id = from_client.input.frame_id
+    to_engine.producer_id = from_client.input.producer_id
+    return encode_to_engine(input_frame, to_engine)
+
+
+def _cpu_time_per_call(fn, data, iterations):
+    fn(data)
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(data)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    """Run the benchmark and print the CPU time per input."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'payload':>10} {'full (us)':>10} {'split (us)':>10} {'saved':>8}")
+    for payload_size in PAYLOAD_SIZES:
+        full_data, split_data = _make_inputs(payload_size)
+        full = _cpu_time_per_call(_full_path, full_data, args.iterations)
+        split = _cpu_time_per_call(_split_path, split_data, args.iterations)
+        print(
+            f"{payload_size // 1024:>8}KB {full * 1e6:>10.1f} "
+            f"{split * 1e6:>10.1f} {1 - split / full:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
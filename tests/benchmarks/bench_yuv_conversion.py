@@ -0,0 +1,85 @@
+"""Microbenchmark for converting BGR frames to NV21.
+
+Compares the per-pixel Python loop that the one_way_yuv example used to
+convert frames with, with the vectorized gabriel_client.yuv.bgr_to_nv21,
+with and without a preallocated output buffer.
+
+Run with: python bench_yuv_conversion.py [--iterations N]
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+from gabriel_client.yuv import bgr_to_nv21
+
+RESOLUTIONS = [(640, 480), (1280, 720)]
+
+
+def _loop_bgr_to_nv21(frame):
+    """The conversion previously used by the one_way_yuv example."""
+    bgr_height, width, _ = frame.shape
+    yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+    yuv_height = yuv.shape[0]
+
+    chrominance = []
+    chrominance_height = yuv_height - bgr_height
+    u_height = int(chrominance_height / 2)
+    for y in range(u_height):
+        for x in range(width):
+            chrominance.append(yuv[bgr_height + u_height + y, x])
+            chrominance.append(yuv[bgr_height + y, x])
+
+    chrominance = iter(chrominance)
+    for y in range(chrominance_height):
+        for x in range(width):
+            yuv[bgr_height + y, x] = next(chrominance)
+
+    return yuv
+
+
+def _time_per_call(fn, fn_args, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(*fn_args)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    """Run the benchmark and print the time per frame."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument(
+        "--loop-iterations",
+        type=int,
+        default=1,
+        help="Iterations for the much slower Python loop",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'resolution':>10} {'loop (ms)':>10} {'numpy (ms)':>11} "
+        f"{'numpy+out (ms)':>15}"
+    )
+    for width, height in RESOLUTIONS:
+        frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        out = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        assert np.array_equal(_loop_bgr_to_nv21(frame), bgr_to_nv21(frame))
+
+        loop = _time_per_call(
+            _loop_bgr_to_nv21, (frame,), args.loop_iterations
+        )
+        vectorized = _time_per_call(bgr_to_nv21, (frame,), args.iterations)
+        preallocated = _time_per_call(
+            bgr_to_nv21, (frame, out), args.iterations
+        )
+        print(
+            f"{f'{width}x{height}':>10} {loop * 1e3:>10.1f} "
+            f"{vectorized * 1e3:>11.2f} {preallocated * 1e3:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -121,6 +121,24 @@ def num_tokens():
     return DEFAULT_NUM_TOKENS
 
 
+@pytest.fixture
+def engine_replicas():
+    """Whether engines with the same id join a replica pool."""
+    return False
+
+
+@pytest.fixture
+def queue_policy():
+    """The server's policy for full producer queues."""
+    return server_runner.QueuePolicy.DROP_NEWEST
+
+
+@pytest.fixture
+def max_num_tokens():
+    """The most tokens the server adapts a producer's tokens up to."""
+    return None
+
+
 @pytest_asyncio.fixture
 async def run_server(
     server_frontend_port,
@@ -131,6 +149,9 @@ async def run_server(
     use_engine_ipc,
     client_ipc_path,
     engine_ipc_path,
+    engine_replicas,
+    queue_policy,
+    max_num_tokens,
 ):
     """Run a server with the specified configuration."""
     logger.info(
@@ -154,6 +175,9 @@ async def run_server(
         prometheus_port=prometheus_server_port,
         use_client_ipc=use_client_ipc,
         use_engine_ipc=use_engine_ipc,
+        engine_replicas=engine_replicas,
+        queue_policy=queue_policy,
+        max_num_tokens=max_num_tokens,
     )
     task = asyncio.create_task(server_run.run_async())
     task.add_done_callback(lambda t: t.result() if not t.cancelled() else None)
@@ -190,6 +214,18 @@ def engine_ids():
     return None
 
 
+@pytest.fixture
+def max_batch_size():
+    """Maximum number of inputs each engine processes in one batch."""
+    return 1
+
+
+@pytest.fixture
+def pipeline_depth():
+    """Maximum number of inputs each engine has in flight."""
+    return 1
+
+
 @pytest.fixture
 def run_engines_threaded():
     """Run engines in a different thread."""
@@ -206,6 +242,8 @@ async def run_engines(
     engine_ids,
     run_engines_threaded,
     engine_ipc_path,
+    max_batch_size,
+    pipeline_depth,
 ):
     """Run engines connected to the server backend port.
 
@@ -226,7 +264,14 @@ async def run_engines(
         else:
             engine_address = f"localhost:{server_backend_port}"
         engine_id = engine_ids[i] if engine_ids else i
-        engine = Engine(engine_id, engine_address, handle_method)
+        engine = Engine(
+            engine_id,
+            engine_address,
+            handle_method,
+            max_batch_size=max_batch_size,
+            max_batch_wait_ms=50 if max_batch_size > 1 else 0,
+            pipeline_depth=pipeline_depth,
+        )
         expected_names.add(engine.engine_name)
         engines.append(engine)
         if run_engines_threaded:
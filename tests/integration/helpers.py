@@ -120,6 +120,9 @@ class Engine(cognitive_engine.Engine, threading.Thread):
         tls_ca_cert=None,
         tls_client_cert=None,
         tls_client_key=None,
+        max_batch_size=1,
+        max_batch_wait_ms=0,
+        pipeline_depth=1,
     ):
         """Initialize the engine and engine runner."""
         super().__init__(daemon=True)
@@ -135,6 +138,9 @@ class Engine(cognitive_engine.Engine, threading.Thread):
             tls_ca_cert=tls_ca_cert,
             tls_client_cert=tls_client_cert,
             tls_client_key=tls_client_key,
+            max_batch_size=max_batch_size,
+            max_batch_wait_ms=max_batch_wait_ms,
+            pipeline_depth=pipeline_depth,
         )
         self.handle_method = handle_method
 
@@ -8,12 +8,21 @@ disconnection/reconnection.
 import asyncio
 import contextlib
 import logging
+import os
+import threading
+import time
 
 import pytest
+from gabriel_client.gabriel_client import (
+    PREFETCH_RETRY_INTERVAL_SECONDS,
+    ConsumerMode,
+    InputProducer,
+)
 from gabriel_client.grpc_client import GrpcClient
 from gabriel_client.websocket_client import WebsocketClient
 from gabriel_client.zeromq_client import ZeroMQClient
 from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.cognitive_engine import Result
 from gabriel_server.local_engine import LocalEngine
 from gabriel_server.network_engine.server_runner import Transport
 from helpers import (
@@ -26,9 +35,33 @@ from helpers import (
     get_multiple_engine_consumer,
     wait_until,
 )
+from prometheus_client import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+# Larger than the default pipe buffer, so that it would take several writes to
+# pass through the pipe to a local engine
+SHARED_MEMORY_PAYLOAD = bytes(range(256)) * 4096
+
+
+class _PayloadViewEngine(Engine):
+    """An engine that describes the payload views that it is passed."""
+
+    def handle_payload_view(self, input_frame, client_info, payload):
+        """Describe the view of the payload, without copying it."""
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        matches = payload == SHARED_MEMORY_PAYLOAD
+        return Result(status, f"{len(payload)}:{payload.readonly}:{matches}")
+
+
+def _handle_with_pid(input_frame, client_info):
+    """Return the id of the engine process that processed the input."""
+    time.sleep(0.2)
+    status = gabriel_pb2.Status()
+    status.code = gabriel_pb2.StatusCode.SUCCESS
+    return Result(status, str(os.getpid()))
+
 
 @pytest.mark.asyncio
 async def test_zeromq_client(
@@ -115,6 +148,389 @@ async def test_grpc_client(
     assert result.string_result == "hello"
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "transport", [Transport.ZEROMQ, Transport.WEBSOCKET, Transport.GRPC]
+)
+async def test_split_framing(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+    transport,
+):
+    """Test that clients can send inputs with split framing."""
+    response_state.clear()
+    response_state["received"] = False
+
+    consumer = get_consumer(response_state)
+    if transport == Transport.ZEROMQ:
+        client = ZeroMQClient(
+            f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+            input_producer,
+            consumer,
+            prometheus_client_port,
+            split_framing=True,
+        )
+    elif transport == Transport.WEBSOCKET:
+        client = WebsocketClient(
+            f"ws://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+            input_producer,
+            consumer,
+            prometheus_client_port,
+            split_framing=True,
+        )
+    else:
+        client = GrpcClient(
+            f"localhost:{server_frontend_port}",
+            input_producer,
+            consumer,
+            prometheus_port=prometheus_client_port,
+            split_framing=True,
+        )
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: response_state["received"])
+    await cancel_and_wait(task)
+
+    assert response_state["received"]
+
+    result = response_state["result"]
+    assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+    assert result.string_result == "hello"
+
+
+def _make_client(
+    transport,
+    server_frontend_port,
+    input_producers,
+    consumer,
+    prometheus_client_port,
+    **kwargs,
+):
+    """Make a client for the transport that the server uses."""
+    if transport == Transport.ZEROMQ:
+        return ZeroMQClient(
+            f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+            input_producers,
+            consumer,
+            prometheus_client_port,
+            **kwargs,
+        )
+    if transport == Transport.WEBSOCKET:
+        return WebsocketClient(
+            f"ws://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+            input_producers,
+            consumer,
+            prometheus_client_port,
+            **kwargs,
+        )
+    return GrpcClient(
+        f"localhost:{server_frontend_port}",
+        input_producers,
+        consumer,
+        prometheus_port=prometheus_client_port,
+        **kwargs,
+    )
+
+
+def _make_counting_producer(interval):
+    """Build a producer whose frames carry how many frames it produced."""
+    num_produced = 0
+
+    async def producer():
+        nonlocal num_produced
+        await asyncio.sleep(interval)
+        num_produced += 1
+        frame = gabriel_pb2.InputFrame()
+        frame.payload_type = gabriel_pb2.PayloadType.TEXT
+        frame.string_payload = str(num_produced)
+        return frame
+
+    return producer
+
+
+def _prefetched_dropped_total(producer_id, reason):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_producer_prefetched_frames_dropped_total",
+            {"producer_id": producer_id, "reason": reason},
+        )
+        or 0
+    )
+
+
+@pytest.mark.asyncio
+async def test_prefetch_latest_frame():
+    """Test that a prefetching producer returns the latest frame it made."""
+    input_producer = InputProducer(
+        producer=_make_counting_producer(0.01),
+        target_engine_ids=["Engine-0"],
+        prefetch=True,
+    )
+    producer_id = input_producer.producer_id
+
+    first = await input_producer.produce()
+    assert first.string_payload == "1"
+    await asyncio.sleep(0.2)
+    # The frame is already waiting, so it is returned without producing
+    latest = await asyncio.wait_for(input_producer.produce(), timeout=0.005)
+    assert int(latest.string_payload) > 5
+    assert (
+        _prefetched_dropped_total(producer_id, "replaced")
+        == int(latest.string_payload) - 2
+    )
+
+    await asyncio.sleep(0.05)
+    await input_producer._stop_prefetching()
+    assert _prefetched_dropped_total(producer_id, "stopped") == 1
+    assert input_producer._prefetch_task is None
+
+
+@pytest.mark.asyncio
+async def test_prefetch_drops_expired_frame():
+    """Test that a prefetched frame older than max_age_ms is not returned."""
+    input_producer = InputProducer(
+        producer=_make_counting_producer(0.1),
+        target_engine_ids=["Engine-0"],
+        max_age_ms=50,
+        prefetch=True,
+    )
+
+    await input_producer.produce()
+    await asyncio.sleep(0.19)
+    # The second frame expired while waiting, so the third is returned
+    frame = await input_producer.produce()
+    await input_producer._stop_prefetching()
+
+    assert frame.string_payload == "3"
+    assert (
+        _prefetched_dropped_total(input_producer.producer_id, "expired") == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_prefetch_backs_off_without_frames():
+    """Test that a producer with no frame is not run in a busy loop."""
+    num_calls = 0
+
+    async def producer():
+        nonlocal num_calls
+        num_calls += 1
+
+    input_producer = InputProducer(
+        producer=producer,
+        target_engine_ids=["Engine-0"],
+        prefetch=True,
+    )
+
+    produce_task = asyncio.create_task(input_producer.produce())
+    await asyncio.sleep(0.1)
+    await input_producer._stop_prefetching()
+    await cancel_and_wait(produce_task)
+
+    assert 0 < num_calls <= 0.1 / PREFETCH_RETRY_INTERVAL_SECONDS + 1
+
+
+def _slow_handle(input_frame, client_info):
+    time.sleep(0.05)
+    status = gabriel_pb2.Status()
+    status.code = gabriel_pb2.StatusCode.SUCCESS
+    return Result(status, input_frame.string_payload)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "transport", [Transport.ZEROMQ, Transport.WEBSOCKET, Transport.GRPC]
+)
+@pytest.mark.parametrize("handle_method", [_slow_handle])
+@pytest.mark.parametrize("run_engines_threaded", [True])
+async def test_prefetch_end_to_end(
+    run_engines,
+    server_frontend_port,
+    prometheus_client_port,
+    transport,
+):
+    """Test that clients send the latest frame of a prefetching producer."""
+    results = []
+    input_producer = InputProducer(
+        producer=_make_counting_producer(0.005),
+        target_engine_ids=["Engine-0"],
+        prefetch=True,
+    )
+
+    def consumer(result):
+        results.append(int(result.string_result))
+
+    client = _make_client(
+        transport,
+        server_frontend_port,
+        [input_producer],
+        consumer,
+        prometheus_client_port,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: len(results) >= 10, timeout=10)
+    await cancel_and_wait(task)
+
+    assert len(results) >= 10
+    # Frames produced while the engine was busy were replaced by newer ones
+    assert results[-1] > 2 * len(results)
+    assert (
+        _prefetched_dropped_total(input_producer.producer_id, "replaced") > 0
+    )
+    assert input_producer._prefetch_task is None
+
+
+def _results_dropped_total(engine_id):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_client_results_dropped_total", {"engine_id": engine_id}
+        )
+        or 0
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "transport", [Transport.ZEROMQ, Transport.WEBSOCKET, Transport.GRPC]
+)
+@pytest.mark.parametrize(
+    "consumer_mode", [ConsumerMode.ASYNC, ConsumerMode.EXECUTOR]
+)
+async def test_slow_consumer_does_not_hold_tokens(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    prometheus_client_port,
+    transport,
+    consumer_mode,
+):
+    """Test that results are read while a queued consumer is busy."""
+    consumed = []
+    consumer_threads = set()
+
+    if consumer_mode == ConsumerMode.ASYNC:
+
+        async def consumer(result):
+            await asyncio.sleep(0.5)
+            consumed.append(result)
+
+    else:
+
+        def consumer(result):
+            consumer_threads.add(threading.current_thread())
+            time.sleep(0.5)
+            consumed.append(result)
+
+    client = _make_client(
+        transport,
+        server_frontend_port,
+        input_producer,
+        consumer,
+        prometheus_client_port,
+        consumer_mode=consumer_mode,
+        result_queue_size=2,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: len(consumed) >= 2, timeout=10)
+    await cancel_and_wait(task)
+
+    (producer,) = input_producer
+    inputs_sent = REGISTRY.get_sample_value(
+        "gabriel_producer_inputs_sent_total",
+        {"producer_id": producer.producer_id},
+    )
+    # Tokens came back while the consumer was busy, so the producer kept
+    # sending inputs
+    assert inputs_sent > 2 * len(consumed) + 2
+    assert _results_dropped_total("Engine-0") > 0
+    assert [result.string_result for result in consumed] == ["hello"] * len(
+        consumed
+    )
+    if consumer_mode == ConsumerMode.EXECUTOR:
+        assert threading.current_thread() not in consumer_threads
+        # The executor's threads exit once the client stops
+        assert client._consumer_executor is None
+        await wait_until(
+            lambda: not any(thread.is_alive() for thread in consumer_threads),
+            timeout=2,
+        )
+    assert client._result_queues == {}
+
+
+@pytest.mark.parametrize(
+    "transport", [Transport.ZEROMQ, Transport.WEBSOCKET, Transport.GRPC]
+)
+@pytest.mark.parametrize(
+    "consumer_mode", [ConsumerMode.INLINE, ConsumerMode.EXECUTOR]
+)
+def test_coroutine_consumer_requires_async_mode(
+    input_producer,
+    server_frontend_port,
+    prometheus_client_port,
+    transport,
+    consumer_mode,
+):
+    """Test that a coroutine consumer is rejected outside of ASYNC mode."""
+
+    async def consumer(result):
+        pass
+
+    with pytest.raises(ValueError, match="coroutine function consumer"):
+        _make_client(
+            transport,
+            server_frontend_port,
+            input_producer,
+            consumer,
+            prometheus_client_port,
+            consumer_mode=consumer_mode,
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("target_engines", [["local_engine"]])
+async def test_local_engine_split_framing(
+    input_producer,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that a local engine is passed inputs sent with split framing."""
+    response_state.clear()
+    response_state["received"] = False
+
+    engine = LocalEngine(
+        lambda: Engine(0, None),
+        port=server_frontend_port,
+        num_tokens=DEFAULT_NUM_TOKENS,
+        input_queue_maxsize=INPUT_QUEUE_MAXSIZE,
+        use_zeromq=True,
+    )
+    engine_task = asyncio.create_task(engine.run_async())
+    await asyncio.sleep(0)
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        get_consumer(response_state),
+        prometheus_client_port,
+        split_framing=True,
+    )
+    client_task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: response_state["received"])
+
+    await cancel_and_wait(client_task)
+    await cancel_and_wait(engine_task)
+
+    assert response_state["received"]
+    assert response_state["result"].string_result == "hello"
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("transport", [Transport.GRPC])
 @pytest.mark.parametrize(
@@ -298,6 +714,101 @@ async def test_local_server(
     assert response_state["received"]
 
 
+@pytest.mark.asyncio
+async def test_local_engine_shared_memory(
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that a local engine reads byte payloads from shared memory."""
+    response_state.clear()
+    response_state["received"] = False
+
+    async def producer():
+        frame = gabriel_pb2.InputFrame()
+        frame.payload_type = gabriel_pb2.PayloadType.IMAGE
+        frame.byte_payload = SHARED_MEMORY_PAYLOAD
+        await asyncio.sleep(0.1)
+        return frame
+
+    input_producer = InputProducer(
+        producer=producer, target_engine_ids=["local_engine"]
+    )
+
+    engine = LocalEngine(
+        lambda: _PayloadViewEngine(0, None),
+        port=server_frontend_port,
+        num_tokens=DEFAULT_NUM_TOKENS,
+        input_queue_maxsize=INPUT_QUEUE_MAXSIZE,
+        use_zeromq=True,
+        use_shared_memory=True,
+    )
+    engine_task = asyncio.create_task(engine.run_async())
+    await asyncio.sleep(0)
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        [input_producer],
+        get_consumer(response_state),
+        prometheus_client_port,
+    )
+    client_task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: response_state["received"], timeout=5)
+
+    engine_task.cancel()
+    await cancel_and_wait(client_task)
+    await cancel_and_wait(engine_task)
+    input_producer.stop()
+
+    assert response_state["received"]
+    result = response_state["result"]
+    assert result.string_result == f"{len(SHARED_MEMORY_PAYLOAD)}:True:True"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("target_engines", [["local_engine"]])
+async def test_local_engine_workers(
+    multiple_input_producers,
+    server_frontend_port,
+    prometheus_client_port,
+):
+    """Test that a local engine spreads inputs across worker processes."""
+    pids = set()
+
+    def consumer(result):
+        assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+        pids.add(result.string_result)
+
+    engine = LocalEngine(
+        lambda: Engine(0, None, _handle_with_pid),
+        port=server_frontend_port,
+        num_tokens=DEFAULT_NUM_TOKENS,
+        input_queue_maxsize=INPUT_QUEUE_MAXSIZE,
+        use_zeromq=True,
+        num_workers=2,
+    )
+    engine_task = asyncio.create_task(engine.run_async())
+    await asyncio.sleep(0)
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        multiple_input_producers,
+        consumer,
+        prometheus_client_port,
+    )
+    client_task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: len(pids) == 2, timeout=5)
+
+    engine_task.cancel()
+    await cancel_and_wait(client_task)
+    await cancel_and_wait(engine_task)
+
+    assert len(pids) == 2
+    assert str(os.getpid()) not in pids
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("target_engines", [["local_engine"]])
 async def test_ipc_local_engine(
@@ -0,0 +1,216 @@
+"""Tests for the database result sink.
+
+Skipped unless the server's db extra (SQLAlchemy and aiosqlite) is installed.
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from gabriel_protocol.v1 import gabriel_pb2  # noqa: E402
+from gabriel_server.models import Base, EngineResult  # noqa: E402
+from gabriel_server.result_manager import (  # noqa: E402
+    DatabaseResultSink,
+    LocalBlobStore,
+)
+from prometheus_client import REGISTRY  # noqa: E402
+from sqlalchemy import event, select  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    async_sessionmaker,
+    create_async_engine,
+)
+
+
+async def _make_db_engine(tmp_path):
+    db_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'results.db'}"
+    )
+    async with db_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return db_engine
+
+
+def _make_result(frame_id, engine_id="Engine-0"):
+    result = gabriel_pb2.Result(
+        target_engine_id=engine_id,
+        frame_id=frame_id,
+        bytes_result=b"x" * frame_id,
+    )
+    result.status.code = gabriel_pb2.StatusCode.SUCCESS
+    return result
+
+
+async def _get_frame_ids(session_factory):
+    async with session_factory() as session:
+        rows = await session.scalars(
+            select(EngineResult).order_by(EngineResult.frame_id)
+        )
+        return [row.frame_id for row in rows.all()]
+
+
+def _make_flaky_session_factory(session_factory, num_failures):
+    """Wrap session_factory so that its first num_failures calls fail."""
+    num_calls = 0
+
+    def flaky_session_factory():
+        nonlocal num_calls
+        num_calls += 1
+        if num_calls <= num_failures:
+            raise RuntimeError("Database unavailable")
+        return session_factory()
+
+    return flaky_session_factory
+
+
+@pytest.mark.asyncio
+async def test_database_result_sink(tmp_path):
+    """Test that results are recorded with one INSERT per batch."""
+    db_engine = await _make_db_engine(tmp_path)
+    inserts = []
+
+    @event.listens_for(db_engine.sync_engine, "before_cursor_execute")
+    def record_insert(conn, cursor, statement, *args):
+        if statement.startswith("INSERT"):
+            inserts.append(statement)
+
+    session_factory = async_sessionmaker(db_engine)
+    blob_store = LocalBlobStore(tmp_path / "blobs")
+    sink = DatabaseResultSink(
+        blob_store, session_factory, max_batch_rows=3, max_batch_wait_ms=100
+    )
+
+    for frame_id in range(1, 5):
+        result = gabriel_pb2.Result(
+            target_engine_id="Engine-0",
+            frame_id=frame_id,
+            bytes_result=b"x" * frame_id,
+        )
+        result.status.code = gabriel_pb2.StatusCode.SUCCESS
+        await sink.process_result(result)
+    # A result without a payload is not recorded
+    await sink.process_result(gabriel_pb2.Result(frame_id=5))
+
+    async def get_rows():
+        async with session_factory() as session:
+            rows = await session.scalars(
+                select(EngineResult).order_by(EngineResult.frame_id)
+            )
+            return rows.all()
+
+    # The first three rows fill a batch; the fourth waits for the timeout
+    assert [row.frame_id for row in await get_rows()] == [1, 2, 3]
+    await asyncio.sleep(0.3)
+    rows = await get_rows()
+    assert [row.frame_id for row in rows] == [1, 2, 3, 4]
+    assert len(inserts) == 2
+
+    for row in rows:
+        assert row.bucket == blob_store.get_bucket()
+        assert row.size_bytes == row.frame_id
+        with open(tmp_path / "blobs" / row.object_key, "rb") as f:
+            assert f.read() == b"x" * row.frame_id
+
+    await sink.cleanup()
+    await db_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_is_retried(tmp_path):
+    """Test that rows are kept and inserted later if an insert fails."""
+    db_engine = await _make_db_engine(tmp_path)
+    session_factory = async_sessionmaker(db_engine)
+    sink = DatabaseResultSink(
+        LocalBlobStore(tmp_path / "blobs"),
+        _make_flaky_session_factory(session_factory, 1),
+        max_batch_rows=2,
+        max_batch_wait_ms=100,
+    )
+
+    await sink.process_result(_make_result(1))
+    with pytest.raises(RuntimeError):
+        await sink.process_result(_make_result(2))
+    # The batch that failed is inserted along with the next one
+    await sink.process_result(_make_result(3))
+    await asyncio.sleep(0.15)
+    assert await _get_frame_ids(session_factory) == [1, 2, 3]
+
+    await sink.cleanup()
+    await db_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_wait_flush_is_retried(tmp_path):
+    """Test that a batch flushed after waiting is retried if it fails."""
+    db_engine = await _make_db_engine(tmp_path)
+    session_factory = async_sessionmaker(db_engine)
+    sink = DatabaseResultSink(
+        LocalBlobStore(tmp_path / "blobs"),
+        _make_flaky_session_factory(session_factory, 1),
+        max_batch_wait_ms=100,
+    )
+
+    await sink.process_result(_make_result(1))
+    await asyncio.sleep(0.15)
+    assert await _get_frame_ids(session_factory) == []
+    await asyncio.sleep(0.1)
+    assert await _get_frame_ids(session_factory) == [1]
+
+    await sink.cleanup()
+    await db_engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_rows_dropped_on_cleanup_are_counted(tmp_path):
+    """Test that rows that can't be inserted on cleanup are counted."""
+    db_engine = await _make_db_engine(tmp_path)
+    sink = DatabaseResultSink(
+        LocalBlobStore(tmp_path / "blobs"),
+        _make_flaky_session_factory(async_sessionmaker(db_engine), 1),
+    )
+    dropped_before = REGISTRY.get_sample_value(
+        "gabriel_db_result_rows_dropped_total"
+    )
+
+    await sink.process_result(_make_result(1))
+    await sink.process_result(_make_result(2))
+    await sink.cleanup()
+
+    assert (
+        REGISTRY.get_sample_value("gabriel_db_result_rows_dropped_total")
+        == dropped_before + 2
+    )
+    await db_engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine_id", ["../../escaped", "/escaped", "..", ""])
+async def test_engine_id_stays_in_blob_dir(tmp_path, engine_id):
+    """Test that an engine id can't place a payload outside the blob dir."""
+    db_engine = await _make_db_engine(tmp_path)
+    session_factory = async_sessionmaker(db_engine)
+    blob_dir = tmp_path / "data" / "blobs"
+    sink = DatabaseResultSink(LocalBlobStore(blob_dir), session_factory)
+
+    await sink.process_result(_make_result(1, engine_id))
+    await sink.cleanup()
+
+    async with session_factory() as session:
+        row = await session.scalar(select(EngineResult))
+    assert row.engine_id == engine_id
+    assert (blob_dir / row.object_key).parent.parent == blob_dir
+    assert (blob_dir / row.object_key).read_bytes() == b"x"
+    await db_engine.dispose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("object_key", ["../escaped", "/escaped", "a/../.."])
+async def test_local_blob_store_rejects_outside_keys(tmp_path, object_key):
+    """Test that LocalBlobStore refuses keys that resolve outside it."""
+    blob_store = LocalBlobStore(tmp_path / "blobs")
+
+    with pytest.raises(ValueError):
+        await blob_store.put(object_key, b"x")
+    assert not (tmp_path / "escaped").exists()
@@ -0,0 +1,186 @@
+"""Tests for dropping frames on the client with early discard filters."""
+
+import cv2
+import numpy as np
+import pytest
+from gabriel_client.early_discard import (
+    DuplicateFilter,
+    EarlyDiscard,
+    MotionFilter,
+    SharpnessFilter,
+    perceptual_hash,
+)
+from gabriel_client.gabriel_client import InputProducer
+from gabriel_client.opencv_adapter import OpencvAdapter
+from gabriel_protocol.v1 import gabriel_pb2
+from prometheus_client import REGISTRY
+
+
+def _scene(seed, noise_seed=None):
+    """Return a BGR frame of random blocks, with optional sensor noise."""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    frame = cv2.resize(blocks, (320, 240), interpolation=cv2.INTER_NEAREST)
+    if noise_seed is not None:
+        noise = np.random.default_rng(noise_seed).integers(-3, 4, frame.shape)
+        frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+    return frame
+
+
+def _encode(frame):
+    _, encoded = cv2.imencode(".jpg", frame)
+    input_frame = gabriel_pb2.InputFrame()
+    input_frame.payload_type = gabriel_pb2.PayloadType.IMAGE
+    input_frame.byte_payload = encoded.tobytes()
+    return input_frame
+
+
+def _discarded_total(producer_id, filter_name):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_producer_frames_discarded_total",
+            {"producer_id": producer_id, "filter": filter_name},
+        )
+        or 0
+    )
+
+
+def test_motion_filter():
+    """Test that frames of a static scene are dropped until it changes."""
+    early_discard = EarlyDiscard([MotionFilter()])
+
+    assert early_discard.check(_scene(0, noise_seed=1)) is None
+    assert early_discard.check(_scene(0, noise_seed=2)) == "motion"
+    assert early_discard.check(_scene(1)) is None
+
+
+def test_sharpness_filter():
+    """Test that blurry frames are dropped."""
+    early_discard = EarlyDiscard([SharpnessFilter()])
+    frame = _scene(0)
+
+    assert early_discard.check(frame) is None
+    assert early_discard.check(cv2.GaussianBlur(frame, (31, 31), 0)) == (
+        "sharpness"
+    )
+
+
+def test_duplicate_filter():
+    """Test that frames that look like a recent kept frame are dropped."""
+    early_discard = EarlyDiscard([DuplicateFilter(history=2)])
+
+    assert early_discard.check(_scene(0)) is None
+    assert early_discard.check(_scene(1)) is None
+    # Brighter and noisy, but the same scene as a recent frame
+    brighter = cv2.convertScaleAbs(_scene(0, noise_seed=1), alpha=1.1)
+    assert early_discard.check(brighter) == "duplicate"
+    assert early_discard.check(_scene(2)) is None
+    # The first scene is no longer in the history
+    assert early_discard.check(_scene(0)) is None
+
+
+def test_perceptual_hash_distance():
+    """Test that the hashes of different scenes differ in many bits."""
+    hashes = [
+        perceptual_hash(
+            cv2.cvtColor(_scene(seed), cv2.COLOR_BGR2GRAY).astype(np.float32)
+        )
+        for seed in range(2)
+    ]
+
+    assert hashes[0].shape == (63,)
+    assert np.count_nonzero(hashes[0] != hashes[1]) > 16
+
+
+def test_filters_only_compare_kept_frames():
+    """Test that a frame dropped by a later filter is not compared with."""
+    early_discard = EarlyDiscard([MotionFilter(), SharpnessFilter()])
+    frame = _scene(0)
+
+    assert early_discard.check(frame) is None
+    # The blurred frame differs enough to pass the motion filter
+    assert early_discard.check(cv2.GaussianBlur(frame, (31, 31), 0)) == (
+        "sharpness"
+    )
+    # So the same frame is still compared with the first one
+    assert early_discard.check(frame) == "motion"
+
+
+def test_check_input_skips_non_images():
+    """Test that inputs that are not images always pass."""
+    early_discard = EarlyDiscard([MotionFilter()])
+    input_frame = gabriel_pb2.InputFrame(
+        payload_type=gabriel_pb2.PayloadType.TEXT, string_payload="hello"
+    )
+
+    assert early_discard.check_input(input_frame) is None
+    assert early_discard.check_input(input_frame) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch", [False, True])
+async def test_input_producer_early_discard(prefetch):
+    """Test that produce skips the frames that the filters drop."""
+    frames = [_scene(0, noise_seed=i) for i in range(5)] + [_scene(1)]
+    num_produced = 0
+
+    async def producer():
+        nonlocal num_produced
+        frame = frames[min(num_produced, len(frames) - 1)]
+        num_produced += 1
+        return _encode(frame)
+
+    input_producer = InputProducer(
+        producer=producer,
+        target_engine_ids=["Engine-0"],
+        prefetch=prefetch,
+        early_discard=EarlyDiscard([MotionFilter()]),
+    )
+
+    await input_producer.produce()
+    input_frame = await input_producer.produce()
+    await input_producer._stop_prefetching()
+
+    assert input_frame.byte_payload == _encode(frames[-1]).byte_payload
+    assert _discarded_total(input_producer.producer_id, "motion") == 4
+
+
+class _SceneCapture:
+    """A video capture that returns a list of frames, then the last one."""
+
+    def __init__(self, frames):
+        self._frames = frames
+        self.num_read = 0
+
+    def read(self, image=None):
+        frame = self._frames[min(self.num_read, len(self._frames) - 1)]
+        self.num_read += 1
+        return True, frame.copy()
+
+
+@pytest.mark.asyncio
+async def test_opencv_adapter_early_discard():
+    """Test that frames dropped by the adapter's filters are not encoded."""
+    encoded = []
+
+    def preprocess(frame):
+        encoded.append(frame)
+        return frame
+
+    frames = [_scene(0, noise_seed=i) for i in range(3)] + [_scene(1)]
+    adapter = OpencvAdapter(
+        preprocess,
+        lambda frame: None,
+        _SceneCapture(frames),
+        "engine",
+        early_discard=EarlyDiscard([DuplicateFilter()]),
+    )
+    (input_producer,) = adapter.get_producer_wrappers()
+
+    await input_producer.produce()
+    await input_producer.produce()
+    adapter.close()
+
+    assert len(encoded) == 2
+    assert np.array_equal(encoded[-1], frames[-1])
+    assert _discarded_total(input_producer.producer_id, "duplicate") == 2
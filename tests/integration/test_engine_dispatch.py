@@ -0,0 +1,455 @@
+"""Tests for dispatching client inputs to engine workers on the server."""
+
+import time
+
+import pytest
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    QueuePolicy,
+    Transport,
+    _ClientSession,
+    _EnginePool,
+    _EngineWorker,
+    _ProducerInfo,
+    _Server,
+)
+from google.protobuf import any_pb2, wrappers_pb2
+from prometheus_client import REGISTRY
+
+
+class _RecordingContext:
+    """Stands in for an engine's gRPC stream, recording what is sent."""
+
+    def __init__(self):
+        self.written = []
+
+    async def write(self, message):
+        self.written.append(message)
+
+
+def _make_engines(engine_ids, client_info_cache_size=1, max_input_age=None):
+    engine_pools = {}
+    contexts = {}
+    for engine_id in engine_ids:
+        engine_pool = _EnginePool(engine_id)
+        contexts[engine_id] = _RecordingContext()
+        engine_pool.add_replica(
+            _EngineWorker(
+                contexts[engine_id],
+                engine_pool,
+                False,
+                1,
+                client_info_cache_size=client_info_cache_size,
+                max_input_age=max_input_age,
+            )
+        )
+        engine_pools[engine_id] = engine_pool
+    return engine_pools, contexts
+
+
+def _make_input(frame_id, target_engine_ids, age_ms=0, max_age_ms=0):
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = "producer"
+    from_client.input.frame_id = frame_id
+    from_client.input.target_engine_ids.extend(target_engine_ids)
+    from_client.input.input_frame.byte_payload = b"\x00" * 1024
+    if age_ms:
+        from_client.input.capture_time_us = (
+            time.time_ns() // 1000 - age_ms * 1000
+        )
+    from_client.input.max_age_ms = max_age_ms
+    return from_client
+
+
+@pytest.mark.asyncio
+async def test_fan_out_encodes_once():
+    """Test that every target engine is sent the same encoded ToEngine."""
+    engine_ids = ["engine-0", "engine-1", "engine-2"]
+    engine_pools, contexts = _make_engines(engine_ids)
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    from_client = _make_input(1, engine_ids)
+
+    await producer_info.process_input_from_client(from_client, "client", None)
+
+    written = [contexts[engine_id].written for engine_id in engine_ids]
+    assert all(len(messages) == 1 for messages in written)
+    to_engine = written[0][0]
+    assert all(messages[0] is to_engine for messages in written)
+
+    expected = gabriel_pb2.ToEngine()
+    expected.input_frame.CopyFrom(from_client.input.input_frame)
+    expected.frame_id = 1
+    expected.producer_id = "producer"
+    assert gabriel_pb2.ToEngine.FromString(to_engine) == expected
+
+
+@pytest.mark.asyncio
+async def test_in_flight_pickup_reuses_encoding():
+    """Test that an engine picking up the in-flight input reuses its bytes."""
+    engine_ids = ["engine-0", "engine-1"]
+    engine_pools, contexts = _make_engines(engine_ids)
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    fast_worker = engine_pools["engine-0"].replicas[0]
+    slow_worker = engine_pools["engine-1"].replicas[0]
+
+    await producer_info.process_input_from_client(
+        _make_input(1, engine_ids), "client", None
+    )
+    fast_worker.pop_in_flight_input(1, "producer")
+    # engine-1 is still busy with frame 1 when frame 2 arrives, so frame 2
+    # is only sent to engine-0
+    await producer_info.process_input_from_client(
+        _make_input(2, engine_ids), "client", None
+    )
+    slow_worker.pop_in_flight_input(1, "producer")
+    await slow_worker.send_next_input()
+
+    assert len(contexts["engine-0"].written) == 2
+    assert len(contexts["engine-1"].written) == 2
+    assert contexts["engine-1"].written[1] is contexts["engine-0"].written[1]
+
+
+@pytest.mark.asyncio
+async def test_new_engine_waits_for_token_return():
+    """Test that a producer has one frame in flight across engines."""
+    engine_ids = ["engine-0", "engine-1"]
+    engine_pools, contexts = _make_engines(engine_ids)
+    producer_info = _ProducerInfo("producer", engine_pools, 2)
+    other_producer_info = _ProducerInfo("other", engine_pools, 1)
+    fast_worker = engine_pools["engine-0"].replicas[0]
+    busy_worker = engine_pools["engine-1"].replicas[0]
+
+    # engine-1 is busy with another producer's frame, so frame 1 is only
+    # sent to engine-0
+    other_input = _make_input(1, ["engine-1"])
+    other_input.input.producer_id = "other"
+    await other_producer_info.process_input_from_client(
+        other_input, "client", None
+    )
+    await producer_info.process_input_from_client(
+        _make_input(1, engine_ids), "client", None
+    )
+    await producer_info.process_input_from_client(
+        _make_input(2, engine_ids), "client", None
+    )
+    busy_worker.pop_in_flight_input(1, "other")
+    await busy_worker.send_next_input()
+
+    # Frame 1's token has not been returned, so frame 2 stays queued
+    assert len(contexts["engine-1"].written) == 1
+    assert busy_worker.get_num_in_flight() == 0
+
+    # engine-0 returns frame 1's token, then takes frame 2
+    fast_worker.pop_in_flight_input(1, "producer")
+    producer_info.pending_token_returns.discard(("client", 1))
+    await fast_worker.send_next_input()
+
+    assert [m.frame_id for m in fast_worker.get_in_flight_metadata()] == [2]
+
+
+@pytest.mark.asyncio
+async def test_gated_engine_sent_input_on_token_return():
+    """Test that an engine waiting for a token dequeues once it returns."""
+    engine_ids = ["engine-0", "engine-1"]
+    engine_pools, contexts = _make_engines(engine_ids)
+    server = _Server(1, 0, 2, Transport.GRPC, False, False)
+    server._engine_pools.update(engine_pools)
+    for engine_id in engine_ids:
+        server._engine_workers[contexts[engine_id]] = engine_pools[
+            engine_id
+        ].replicas[0]
+    fast_worker = engine_pools["engine-0"].replicas[0]
+    busy_worker = engine_pools["engine-1"].replicas[0]
+
+    async def return_result(engine_id, producer_id, frame_id):
+        from_engine = gabriel_pb2.FromEngine(
+            frame_id=frame_id, producer_id=producer_id
+        )
+        from_engine.result.status.code = gabriel_pb2.StatusCode.SUCCESS
+        await server._handle_from_engine(contexts[engine_id], from_engine)
+
+    # engine-1 is busy with another producer's frame, so frame 1 is only
+    # sent to engine-0, and frame 2 is queued
+    other_input = _make_input(1, ["engine-1"])
+    other_input.input.producer_id = "other"
+    await server._send_to_engine(other_input, "client", any_pb2.Any(), None)
+    for frame_id in (1, 2):
+        await server._send_to_engine(
+            _make_input(frame_id, engine_ids), "client", any_pb2.Any(), None
+        )
+
+    # engine-1 is free, but waits for frame 1's token
+    await return_result("engine-1", "other", 1)
+    assert busy_worker.get_num_in_flight() == 0
+
+    # Returning the token sends frame 2 to both engines, without another
+    # input arriving
+    await return_result("engine-0", "producer", 1)
+    assert [m.frame_id for m in busy_worker.get_in_flight_metadata()] == [2]
+    assert [m.frame_id for m in fast_worker.get_in_flight_metadata()] == [2]
+    assert contexts["engine-1"].written[-1] is contexts["engine-0"].written[-1]
+
+
+def _make_client_session(handle):
+    client_info = any_pb2.Any()
+    client_info.Pack(wrappers_pb2.StringValue(value=f"client-{handle}"))
+    return _ClientSession(handle, client_info)
+
+
+@pytest.mark.asyncio
+async def test_client_session_sent_once():
+    """Test that an engine is sent a client's info once, before its input."""
+    engine_pools, contexts = _make_engines(["engine"], 2)
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    engine_worker = engine_pools["engine"].replicas[0]
+    client_sessions = [_make_client_session(1), _make_client_session(2)]
+
+    for frame_id in range(1, 5):
+        client_session = client_sessions[frame_id % 2]
+        await producer_info.process_input_from_client(
+            _make_input(frame_id, ["engine"]), "client", client_session
+        )
+        engine_worker.pop_in_flight_input(frame_id, "producer")
+
+    written = [
+        gabriel_pb2.ToEngine.FromString(message)
+        for message in contexts["engine"].written
+    ]
+    message_types = [
+        to_engine.WhichOneof("message_type") for to_engine in written
+    ]
+    assert message_types == [
+        "client_session_opened",
+        "input_frame",
+        "client_session_opened",
+        "input_frame",
+        "input_frame",
+        "input_frame",
+    ]
+    assert written[0].client_session_opened.session_handle == 2
+    assert written[0].client_session_opened.client_info == (
+        client_sessions[1].client_info
+    )
+    assert written[1].session_handle == 2
+    assert not written[1].HasField("client_info")
+    assert written[2].client_session_opened.session_handle == 1
+
+
+@pytest.mark.asyncio
+async def test_evicted_client_session_sent_again():
+    """Test that a session evicted from the engine's cache is resent."""
+    engine_pools, contexts = _make_engines(["engine"], 1)
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    engine_worker = engine_pools["engine"].replicas[0]
+
+    for frame_id, handle in enumerate([1, 2, 1], start=1):
+        await producer_info.process_input_from_client(
+            _make_input(frame_id, ["engine"]),
+            "client",
+            _make_client_session(handle),
+        )
+        engine_worker.pop_in_flight_input(frame_id, "producer")
+
+    opened = [
+        to_engine.client_session_opened.session_handle
+        for to_engine in map(
+            gabriel_pb2.ToEngine.FromString, contexts["engine"].written
+        )
+        if to_engine.HasField("client_session_opened")
+    ]
+    assert opened == [1, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_close_client_session():
+    """Test that an engine is told when a session it was sent ends."""
+    engine_pools, contexts = _make_engines(["engine"], 2)
+    producer_info = _ProducerInfo("producer", engine_pools, 1)
+    engine_worker = engine_pools["engine"].replicas[0]
+
+    await producer_info.process_input_from_client(
+        _make_input(1, ["engine"]), "client", _make_client_session(1)
+    )
+    await engine_worker.close_client_session(1)
+    # The engine was never sent this session, so there is nothing to close
+    await engine_worker.close_client_session(2)
+
+    last = gabriel_pb2.ToEngine.FromString(contexts["engine"].written[-1])
+    assert len(contexts["engine"].written) == 3
+    assert last.client_session_closed == 1
+
+
+async def _fill_queue(queue_policy, size_for_queues, num_frames):
+    """Send inputs to a busy engine, returning the inputs left queued."""
+    engine_pools, _ = _make_engines(["engine"])
+    evicted = []
+
+    async def discarded_input_cb(producer_info, metadata, code, message):
+        assert code == gabriel_pb2.StatusCode.SERVER_EVICTED_FRAME
+        evicted.append(metadata.frame_id)
+
+    producer_info = _ProducerInfo(
+        "producer",
+        engine_pools,
+        size_for_queues,
+        queue_policy,
+        discarded_input_cb,
+    )
+    statuses = []
+    # Frame 0 keeps the engine busy, so every later frame is queued
+    for frame_id in range(num_frames):
+        status, _ = await producer_info.process_input_from_client(
+            _make_input(frame_id, ["engine"]), "client", None
+        )
+        statuses.append(status)
+
+    queued = []
+    while True:
+        metadata_payload = await producer_info.get_input_from_queue("engine")
+        if metadata_payload is None:
+            break
+        queued.append(metadata_payload.metadata.frame_id)
+    return statuses, queued, evicted
+
+
+def _dropped_total(policy):
+    return REGISTRY.get_sample_value(
+        "gabriel_producer_queue_dropped_total",
+        {"producer_id": "producer", "policy": policy.value},
+    )
+
+
+@pytest.mark.asyncio
+async def test_queue_policy_drop_newest():
+    """Test that a full queue rejects new inputs by default."""
+    statuses, queued, evicted = await _fill_queue(
+        QueuePolicy.DROP_NEWEST, 2, 6
+    )
+
+    assert (
+        statuses
+        == [gabriel_pb2.StatusCode.SUCCESS] * 3
+        + [gabriel_pb2.StatusCode.SERVER_DROPPED_FRAME] * 3
+    )
+    assert queued == [1, 2]
+    assert evicted == []
+    assert _dropped_total(QueuePolicy.DROP_NEWEST) == 3
+
+
+@pytest.mark.asyncio
+async def test_queue_policy_drop_oldest():
+    """Test that a full queue evicts its oldest input for a new one."""
+    statuses, queued, evicted = await _fill_queue(
+        QueuePolicy.DROP_OLDEST, 2, 6
+    )
+
+    assert statuses == [gabriel_pb2.StatusCode.SUCCESS] * 6
+    assert queued == [4, 5]
+    assert evicted == [1, 2, 3]
+    assert _dropped_total(QueuePolicy.DROP_OLDEST) == 3
+
+
+@pytest.mark.asyncio
+async def test_queue_policy_keep_latest_only():
+    """Test that only the newest input is kept, whatever the queue size."""
+    statuses, queued, evicted = await _fill_queue(
+        QueuePolicy.KEEP_LATEST_ONLY, 60, 6
+    )
+
+    assert statuses == [gabriel_pb2.StatusCode.SUCCESS] * 6
+    assert queued == [5]
+    assert evicted == [1, 2, 3, 4]
+    assert _dropped_total(QueuePolicy.KEEP_LATEST_ONLY) == 4
+
+
+def _expired_total():
+    return REGISTRY.get_sample_value(
+        "gabriel_producer_inputs_expired_total", {"producer_id": "producer"}
+    )
+
+
+async def _make_busy_producer(max_input_age=None):
+    """Return a producer whose engine is busy, and its discarded inputs."""
+    engine_pools, _ = _make_engines(["engine"], max_input_age=max_input_age)
+    discarded = []
+
+    async def discarded_input_cb(producer_info, metadata, code, message):
+        discarded.append((metadata.frame_id, code))
+
+    producer_info = _ProducerInfo(
+        "producer",
+        engine_pools,
+        10,
+        discarded_input_cb=discarded_input_cb,
+    )
+    await producer_info.process_input_from_client(
+        _make_input(0, ["engine"]), "client", None
+    )
+    return producer_info, engine_pools["engine"].replicas[0], discarded
+
+
+@pytest.mark.asyncio
+async def test_input_expired_on_arrival():
+    """Test that an input past its deadline on arrival is not queued."""
+    producer_info, _, discarded = await _make_busy_producer()
+
+    status, _ = await producer_info.process_input_from_client(
+        _make_input(1, ["engine"], age_ms=200, max_age_ms=100),
+        "client",
+        None,
+    )
+
+    assert status == gabriel_pb2.StatusCode.FRAME_EXPIRED
+    assert await producer_info.get_input_from_queue("engine") is None
+    assert discarded == []
+    assert _expired_total() == 1
+
+
+@pytest.mark.asyncio
+async def test_input_expired_in_queue():
+    """Test that queued inputs past their deadline are skipped."""
+    producer_info, engine_worker, discarded = await _make_busy_producer()
+
+    for frame_id in (1, 2):
+        await producer_info.process_input_from_client(
+            _make_input(frame_id, ["engine"], max_age_ms=50), "client", None
+        )
+    await producer_info.process_input_from_client(
+        _make_input(3, ["engine"], max_age_ms=10000), "client", None
+    )
+    time.sleep(0.1)
+    engine_worker.pop_in_flight_input(0, "producer")
+    await engine_worker.send_next_input()
+
+    expired = gabriel_pb2.StatusCode.FRAME_EXPIRED
+    assert discarded == [(1, expired), (2, expired)]
+    assert [m.frame_id for m in engine_worker.get_in_flight_metadata()] == [3]
+    assert _expired_total() == 2
+
+
+@pytest.mark.asyncio
+async def test_engine_max_input_age():
+    """Test that an engine is not sent inputs older than its maximum age."""
+    producer_info, engine_worker, discarded = await _make_busy_producer(
+        max_input_age=0.1
+    )
+
+    await producer_info.process_input_from_client(
+        _make_input(1, ["engine"], age_ms=200), "client", None
+    )
+    await producer_info.process_input_from_client(
+        _make_input(2, ["engine"]), "client", None
+    )
+    engine_worker.pop_in_flight_input(0, "producer")
+    await engine_worker.send_next_input()
+
+    assert discarded == [(1, gabriel_pb2.StatusCode.FRAME_EXPIRED)]
+    assert [m.frame_id for m in engine_worker.get_in_flight_metadata()] == [2]
+
+    # An input that is already too old when the engine is idle is not sent
+    engine_worker.pop_in_flight_input(2, "producer")
+    status, _ = await producer_info.process_input_from_client(
+        _make_input(3, ["engine"], age_ms=200), "client", None
+    )
+    assert status == gabriel_pb2.StatusCode.FRAME_EXPIRED
+    assert engine_worker.get_num_in_flight() == 0
@@ -2,7 +2,9 @@
 
 Covers: targeting an engine that isn't connected, engines returning bad values
 from handle(), an engine disconnecting/reconnecting mid-session, duplicate
-engine ids, and the ZeroMQ result-sink pipeline.
+engine ids (with and without replica pools), cancelling the inputs of
+clients that disconnect, the ZeroMQ result-sink pipeline, and result sinks
+that fall behind.
 """
 
 import asyncio
@@ -13,11 +15,21 @@ import time
 import pytest
 import zmq
 import zmq.asyncio
+from gabriel_client.grpc_client import GrpcClient
 from gabriel_client.zeromq_client import ZeroMQClient
 from gabriel_protocol.v1 import gabriel_pb2
 from gabriel_server import cognitive_engine
 from gabriel_server.cognitive_engine import Result
-from gabriel_server.result_manager import ZeroMQSink
+from gabriel_server.network_engine.server_runner import (
+    QueuePolicy,
+    Transport,
+)
+from gabriel_server.result_manager import (
+    OverflowPolicy,
+    ResultManager,
+    ResultSink,
+    ZeroMQSink,
+)
 from google.protobuf import any_pb2, wrappers_pb2
 from helpers import (
     DEFAULT_SERVER_HOST,
@@ -27,6 +39,7 @@ from helpers import (
     get_multiple_engine_consumer,
     wait_until,
 )
+from prometheus_client import REGISTRY
 
 logger = logging.getLogger(__name__)
 
@@ -335,6 +348,52 @@ async def test_client_info_propagated_to_engine(
     assert unpacked.value == "test-client-info"
 
 
+@pytest.mark.asyncio
+async def test_client_info_per_session(
+    run_engines,
+    multiple_input_producers,
+    server_frontend_port,
+    monkeypatch,
+    prometheus_client_port_generator,
+):
+    """Test that each input reaches the engine with its client's info."""
+    received_values = []
+
+    def capture_client_info_handle(self, input_frame, client_info):
+        unpacked = wrappers_pb2.StringValue()
+        client_info.Unpack(unpacked)
+        received_values.append(unpacked.value)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    monkeypatch.setattr(Engine, "handle", capture_client_info_handle)
+
+    tasks = []
+    for i in range(2):
+        client_info = any_pb2.Any()
+        client_info.Pack(wrappers_pb2.StringValue(value=f"client-{i}"))
+        client = ZeroMQClient(
+            f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+            [multiple_input_producers[i]],
+            lambda result_wrapper: None,
+            next(prometheus_client_port_generator),
+            client_info=client_info,
+        )
+        tasks.append(asyncio.create_task(client.launch_async()))
+
+    received = await wait_until(
+        lambda: all(
+            received_values.count(f"client-{i}") >= 3 for i in range(2)
+        )
+    )
+    for task in tasks:
+        await cancel_and_wait(task)
+
+    assert received
+    assert set(received_values) == {"client-0", "client-1"}
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("target_engines", [[]])
 async def test_target_no_engines(
@@ -486,6 +545,131 @@ async def test_server_dropped_frame(
     assert "Engine Engine-0 dropped frame from producer" in caplog.text
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("queue_policy", [QueuePolicy.KEEP_LATEST_ONLY])
+async def test_keep_latest_only_queue(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that a slow engine is only sent the newest queued input."""
+    frame_ids = []
+    evicted_frame_ids = []
+
+    def handle(input_frame, client_info):
+        time.sleep(0.2)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    def consumer(result):
+        assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+        frame_ids.append(result.frame_id)
+
+    run_engines[0].handle_method = handle
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        consumer,
+        prometheus_client_port,
+    )
+    process_response = client._process_response
+
+    def record_evicted(result_wrapper):
+        if (
+            result_wrapper.result.status.code
+            == gabriel_pb2.StatusCode.SERVER_EVICTED_FRAME
+        ):
+            evicted_frame_ids.append(result_wrapper.result.frame_id)
+        process_response(result_wrapper)
+
+    client._process_response = record_evicted
+    task = asyncio.create_task(client.launch_async())
+
+    # The client's tokens keep coming back, both with results and with
+    # evicted inputs, so it keeps sending
+    await wait_until(lambda: len(frame_ids) >= 4, timeout=10)
+    assert len(frame_ids) >= 4
+    assert not task.done()
+    await cancel_and_wait(task)
+
+    assert evicted_frame_ids
+    assert not set(evicted_frame_ids) & set(frame_ids)
+    # The engine skips the inputs that were evicted while it was busy
+    assert frame_ids == sorted(frame_ids)
+    assert frame_ids[-1] - frame_ids[-2] > 1
+    assert REGISTRY.get_sample_value(
+        "gabriel_producer_queue_dropped_total",
+        {
+            "producer_id": input_producer[0].producer_id,
+            "policy": "keep_latest_only",
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_expired_inputs(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that inputs that expire in the server's queue are not sent."""
+    frame_ids = []
+    expired_frame_ids = []
+
+    def handle(input_frame, client_info):
+        time.sleep(0.4)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    def consumer(result):
+        assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+        frame_ids.append(result.frame_id)
+
+    run_engines[0].handle_method = handle
+    # Inputs are produced every 100ms, so several queue up while the engine
+    # processes each one, and expire before it is free again
+    input_producer[0].max_age_ms = 250
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        consumer,
+        prometheus_client_port,
+    )
+    process_response = client._process_response
+
+    def record_expired(result_wrapper):
+        if (
+            result_wrapper.result.status.code
+            == gabriel_pb2.StatusCode.FRAME_EXPIRED
+        ):
+            expired_frame_ids.append(result_wrapper.result.frame_id)
+        process_response(result_wrapper)
+
+    client._process_response = record_expired
+    task = asyncio.create_task(client.launch_async())
+
+    # Tokens of expired inputs are returned, so the client keeps sending
+    await wait_until(lambda: len(frame_ids) >= 4, timeout=10)
+    assert len(frame_ids) >= 4
+    assert not task.done()
+    await cancel_and_wait(task)
+
+    assert expired_frame_ids
+    assert not set(expired_frame_ids) & set(frame_ids)
+    assert REGISTRY.get_sample_value(
+        "gabriel_producer_inputs_expired_total",
+        {"producer_id": input_producer[0].producer_id},
+    )
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("num_engines", [2])
 @pytest.mark.parametrize("engine_ids", [[0, 0]])
@@ -517,6 +701,228 @@ async def test_duplicate_engine_id(
     await cancel_and_wait(task)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("num_engines", [2])
+@pytest.mark.parametrize("engine_ids", [[0, 0]])
+@pytest.mark.parametrize("engine_replicas", [True])
+async def test_engine_replicas(
+    run_engines,
+    run_server,
+    multiple_input_producers,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that engines with the same id share the load as replicas."""
+    response_state.clear()
+    server = run_server.server
+
+    def num_replicas():
+        return REGISTRY.get_sample_value(
+            "gabriel_engine_replicas", {"engine_id": "Engine-0"}
+        )
+
+    assert num_replicas() == 2
+    assert server._engine_ids == {"Engine-0"}
+
+    handled = [0, 0]
+
+    def make_handle(index):
+        def handle(input_frame, client_info):
+            handled[index] += 1
+            time.sleep(0.05)
+            status = gabriel_pb2.Status()
+            status.code = gabriel_pb2.StatusCode.SUCCESS
+            return Result(status, "hello")
+
+        return handle
+
+    for index, engine in enumerate(run_engines):
+        engine.handle_method = make_handle(index)
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        multiple_input_producers,
+        get_multiple_engine_consumer(response_state),
+        prometheus_client_port,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: min(handled) >= 5, timeout=10)
+    assert min(handled) >= 5
+
+    # Stopping one replica keeps the engine id available to clients
+    await run_engines[0].stop()
+    await wait_until(lambda: num_replicas() == 1, timeout=10)
+    assert num_replicas() == 1
+    assert server._engine_ids == {"Engine-0"}
+
+    handled_before = handled[1]
+    await wait_until(lambda: handled[1] >= handled_before + 5, timeout=10)
+    assert handled[1] >= handled_before + 5
+    assert not task.done()
+
+    await cancel_and_wait(task)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_batch_size", [3])
+async def test_batched_engine(
+    run_engines,
+    multiple_input_producers,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that an engine batches inputs from several producers."""
+    response_state.clear()
+    engine = run_engines[0]
+    batch_sizes = []
+    handle_batch = engine.handle_batch
+
+    def record_batch(input_frames, client_infos):
+        batch_sizes.append(len(input_frames))
+        time.sleep(0.2)
+        return handle_batch(input_frames, client_infos)
+
+    engine.handle_batch = record_batch
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        multiple_input_producers,
+        get_multiple_engine_consumer(response_state),
+        prometheus_client_port,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    # While the engine processes a batch, inputs from the other producers
+    # are sent to it, so later batches hold more than one input
+    await wait_until(
+        lambda: response_state.get("Engine-0", 0) >= 10, timeout=10
+    )
+    assert response_state.get("Engine-0", 0) >= 10
+    assert max(batch_sizes) > 1
+    assert max(batch_sizes) <= 3
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_engine_batch_size_count", {"engine_id": "Engine-0"}
+        )
+        > 0
+    )
+
+    await cancel_and_wait(task)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pipeline_depth", [2])
+async def test_pipelined_engine(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    response_state,
+    prometheus_client_port,
+):
+    """Test that an engine is sent its next input before it returns."""
+    response_state.clear()
+    frame_ids = []
+
+    def handle(input_frame, client_info):
+        time.sleep(0.3)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    def consumer(result):
+        assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+        frame_ids.append(result.frame_id)
+
+    run_engines[0].handle_method = handle
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        consumer,
+        prometheus_client_port,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    def num_in_flight():
+        return REGISTRY.get_sample_value(
+            "gabriel_engine_inputs_in_flight", {"engine_id": "Engine-0"}
+        )
+
+    # A second input from the same producer is sent to the engine while it
+    # processes the first one
+    await wait_until(lambda: num_in_flight() == 2, timeout=5)
+    assert num_in_flight() == 2
+
+    # Every result is matched to its own input, and tokens keep coming back
+    await wait_until(lambda: len(frame_ids) >= 6, timeout=10)
+    assert len(frame_ids) >= 6
+    assert frame_ids == sorted(set(frame_ids))
+    assert not task.done()
+
+    await cancel_and_wait(task)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("transport", [Transport.GRPC])
+@pytest.mark.parametrize("pipeline_depth", [2])
+async def test_disconnected_client_input_cancelled(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    prometheus_client_port,
+):
+    """Test that an engine skips the waiting input of a gone client."""
+    handled = []
+
+    def handle(input_frame, client_info):
+        handled.append(input_frame.string_payload)
+        time.sleep(0.5)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    run_engines[0].handle_method = handle
+
+    def num_in_flight():
+        return REGISTRY.get_sample_value(
+            "gabriel_engine_inputs_in_flight", {"engine_id": "Engine-0"}
+        )
+
+    def num_cancelled():
+        return (
+            REGISTRY.get_sample_value(
+                "gabriel_disconnected_client_inputs_total",
+                {"state": "cancelled"},
+            )
+            or 0
+        )
+
+    cancelled = num_cancelled()
+    client = GrpcClient(
+        f"localhost:{server_frontend_port}",
+        input_producer,
+        lambda result: None,
+        prometheus_port=prometheus_client_port,
+    )
+    task = asyncio.create_task(client.launch_async())
+
+    # One input is processed while the next one waits on the engine
+    await wait_until(lambda: num_in_flight() == 2, timeout=5)
+    num_handled = len(handled)
+    await cancel_and_wait(task)
+
+    await wait_until(lambda: num_cancelled() >= cancelled + 2, timeout=5)
+    assert num_cancelled() == cancelled + 2
+    await wait_until(lambda: num_in_flight() == 0, timeout=5)
+    assert num_in_flight() == 0
+    # The input that was processing when the client disconnected finished,
+    # but the waiting input was never processed
+    assert len(handled) == num_handled
+
+
 @pytest.mark.asyncio
 async def test_zeromq_result_output(
     run_engines,
@@ -562,3 +968,131 @@ async def test_zeromq_result_output(
     assert result.target_engine_id == "Engine-0"
     assert result.string_result == "hello"
     assert result.frame_id == 1
+
+
+class _BlockedSink(ResultSink):
+    """A result sink that cannot process results until it is unblocked."""
+
+    def __init__(self):
+        self.unblocked = asyncio.Event()
+        self.frame_ids = []
+
+    async def process_result(self, result):
+        await self.unblocked.wait()
+        self.frame_ids.append(result.frame_id)
+
+    async def cleanup(self):
+        pass
+
+
+@pytest.mark.parametrize(
+    "overflow_policy, expected_frame_ids",
+    [
+        (OverflowPolicy.DROP_OLDEST, [4, 5]),
+        (OverflowPolicy.DROP_NEWEST, [1, 2]),
+        (OverflowPolicy.BLOCK, [1, 2, 3, 4, 5]),
+    ],
+)
+@pytest.mark.asyncio
+async def test_slow_result_sink(overflow_policy, expected_frame_ids):
+    """Test that a sink that falls behind is fed by its overflow policy."""
+    result_manager = ResultManager()
+    sink = _BlockedSink()
+    result_manager.register_result_sink(
+        sink, max_queue_size=2, overflow_policy=overflow_policy, name="slow"
+    )
+
+    async def process_results():
+        for frame_id in range(1, 6):
+            result = gabriel_pb2.Result(frame_id=frame_id)
+            result.status.code = gabriel_pb2.StatusCode.SUCCESS
+            await result_manager.process_result(result)
+
+    task = asyncio.create_task(process_results())
+    await asyncio.sleep(0.1)
+    # Only the blocking policy holds up the results being processed
+    assert task.done() == (overflow_policy != OverflowPolicy.BLOCK)
+
+    sink.unblocked.set()
+    await task
+    await wait_until(
+        lambda: len(sink.frame_ids) == len(expected_frame_ids), timeout=1
+    )
+    assert sink.frame_ids == expected_frame_ids
+    assert REGISTRY.get_sample_value(
+        "gabriel_result_sink_dropped_total", {"sink": "slow"}
+    ) == 5 - len(expected_frame_ids)
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_result_sink_queue_depth", {"sink": "slow"}
+        )
+        == 0
+    )
+
+    await result_manager.cleanup()
+
+
+class _RecordingSink(ResultSink):
+    """A slow result sink that records when it is cleaned up."""
+
+    def __init__(self):
+        self.frame_ids = []
+        self.frame_ids_at_cleanup = None
+
+    async def process_result(self, result):
+        await asyncio.sleep(0.05)
+        self.frame_ids.append(result.frame_id)
+
+    async def cleanup(self):
+        self.frame_ids_at_cleanup = list(self.frame_ids)
+
+
+@pytest.mark.asyncio
+async def test_result_sink_drained_on_cleanup():
+    """Test that queued results reach a sink before it is cleaned up."""
+    result_manager = ResultManager()
+    sink = _RecordingSink()
+    result_manager.register_result_sink(sink)
+
+    for frame_id in range(1, 4):
+        result = gabriel_pb2.Result(frame_id=frame_id)
+        result.status.code = gabriel_pb2.StatusCode.SUCCESS
+        await result_manager.process_result(result)
+
+    await result_manager.cleanup()
+    assert sink.frame_ids_at_cleanup == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_result_sink_names_are_unique():
+    """Test that sinks of the same class get their own metric labels."""
+    result_manager = ResultManager()
+    sinks = [_RecordingSink(), _RecordingSink()]
+    for sink in sinks:
+        result_manager.register_result_sink(sink)
+    with pytest.raises(ValueError):
+        result_manager.register_result_sink(
+            _RecordingSink(), name="_RecordingSink"
+        )
+
+    result = gabriel_pb2.Result(frame_id=1)
+    result.status.code = gabriel_pb2.StatusCode.SUCCESS
+    await result_manager.process_result(result)
+    await wait_until(lambda: all(sink.frame_ids for sink in sinks), timeout=1)
+
+    result_manager.unregister_result_sink(sinks[0])
+    # Removing the first sink's series leaves the second sink's in place
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_result_sink_queue_depth", {"sink": "_RecordingSink"}
+        )
+        is None
+    )
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_result_sink_queue_depth", {"sink": "_RecordingSink-2"}
+        )
+        == 0
+    )
+
+    await result_manager.cleanup()
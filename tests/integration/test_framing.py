@@ -0,0 +1,102 @@
+"""Tests for the split input framing in gabriel_protocol.framing."""
+
+import pytest
+from gabriel_protocol.framing import (
+    decode_from_client,
+    decode_to_engine,
+    encode_split_input,
+    encode_to_engine,
+)
+from gabriel_protocol.v1 import gabriel_pb2
+from google.protobuf.message import DecodeError
+
+
+@pytest.fixture
+def input_frame():
+    """An input frame with a payload large enough for a multibyte length."""
+    input_frame = gabriel_pb2.InputFrame()
+    input_frame.byte_payload = bytes(range(256)) * 1024
+    return input_frame
+
+
+@pytest.fixture
+def header():
+    """The routing fields of an input, without its input frame."""
+    header = gabriel_pb2.FromClient()
+    header.input.producer_id = "producer"
+    header.input.frame_id = 7
+    header.input.target_engine_ids.append("engine")
+    return header
+
+
+def test_split_input_round_trip(header, input_frame):
+    """Test that a split input decodes to its header and payload view."""
+    serialized_input_frame = input_frame.SerializeToString()
+
+    from_client, view = decode_from_client(
+        encode_split_input(header, serialized_input_frame)
+    )
+
+    assert from_client == header
+    assert isinstance(view, memoryview)
+    assert view == serialized_input_frame
+
+
+def test_full_from_client(header, input_frame):
+    """Test that a FromClient sent in full is still decoded."""
+    header.input.input_frame.CopyFrom(input_frame)
+
+    from_client, view = decode_from_client(header.SerializeToString())
+
+    assert from_client == header
+    assert view is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x00",
+        b"\x00\x80",
+        b"\x00\x10\x12",
+    ],
+)
+def test_truncated_split_input(data):
+    """Test that a truncated split input fails to decode."""
+    with pytest.raises(DecodeError):
+        decode_from_client(data)
+
+
+def test_split_header_without_input():
+    """Test that a split header must carry an input."""
+    header = gabriel_pb2.FromClient()
+    header.registration.SetInParent()
+
+    with pytest.raises(DecodeError):
+        decode_from_client(encode_split_input(header, b""))
+
+
+def test_encode_to_engine(input_frame):
+    """Test that a spliced ToEngine matches one serialized in full."""
+    to_engine = gabriel_pb2.ToEngine()
+    to_engine.frame_id = 3
+    to_engine.producer_id = "producer"
+    to_engine.client_info.value = b"info"
+
+    data = encode_to_engine(input_frame.SerializeToString(), to_engine)
+
+    to_engine.input_frame.CopyFrom(input_frame)
+    assert data == to_engine.SerializeToString()
+    assert decode_to_engine(data) == to_engine
+
+
+def test_decode_to_engine_malformed_input_frame():
+    """Test that a malformed input frame is dropped, keeping the ids."""
+    to_engine = gabriel_pb2.ToEngine()
+    to_engine.frame_id = 3
+    to_engine.producer_id = "producer"
+
+    decoded = decode_to_engine(encode_to_engine(b"\xff\xff", to_engine))
+
+    assert not decoded.HasField("input_frame")
+    assert decoded.frame_id == 3
+    assert decoded.producer_id == "producer"
@@ -0,0 +1,150 @@
+"""Tests for capturing, encoding and decoding frames with OpencvAdapter."""
+
+import asyncio
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from gabriel_client.opencv_adapter import ImageCodec, OpencvAdapter
+from gabriel_protocol.v1 import gabriel_pb2
+
+
+class _FakeCapture:
+    """A video capture whose frames are filled with their frame number."""
+
+    def __init__(self, width=64, height=48):
+        self.num_read = 0
+        self.buffers = []
+        self.thread_names = set()
+        self._shape = (height, width, 3)
+
+    def read(self, image=None):
+        self.thread_names.add(threading.current_thread().name)
+        self.num_read += 1
+        if image is None:
+            image = np.empty(self._shape, dtype=np.uint8)
+        image.fill(self.num_read)
+        self.buffers.append(image)
+        return True, image
+
+
+def _decode(input_frame):
+    np_data = np.frombuffer(input_frame.byte_payload, dtype=np.uint8)
+    return cv2.imdecode(np_data, cv2.IMREAD_UNCHANGED)
+
+
+def _make_adapter(capture, **kwargs):
+    return OpencvAdapter(
+        lambda frame: frame, lambda frame: None, capture, "engine", **kwargs
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "codec, magic",
+    [
+        (ImageCodec.JPEG, b"\xff\xd8"),
+        (ImageCodec.PNG, b"\x89PNG"),
+        (ImageCodec.WEBP, b"RIFF"),
+    ],
+)
+async def test_codecs(codec, magic):
+    """Test that frames are encoded with the codec they are asked for."""
+    capture = _FakeCapture()
+    adapter = _make_adapter(capture, codec=codec, resize=(32, 24))
+    (input_producer,) = adapter.get_producer_wrappers()
+
+    input_frame = await input_producer.produce()
+    adapter.close()
+
+    assert input_frame.payload_type == gabriel_pb2.PayloadType.IMAGE
+    assert input_frame.byte_payload.startswith(magic)
+    assert _decode(input_frame).shape == (24, 32, 3)
+    assert capture.thread_names == {"opencv-capture_0"}
+
+
+def test_quality_range():
+    """Test that a quality outside of the codec's range is rejected."""
+    _make_adapter(_FakeCapture(), codec=ImageCodec.PNG, quality=9).close()
+    with pytest.raises(ValueError):
+        _make_adapter(_FakeCapture(), codec=ImageCodec.PNG, quality=10)
+    with pytest.raises(ValueError):
+        _make_adapter(_FakeCapture(), codec=ImageCodec.WEBP, quality=0)
+
+
+@pytest.mark.asyncio
+async def test_lower_quality_smaller():
+    """Test that the quality is passed to the encoder."""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    sizes = []
+    for quality in (10, 90):
+        adapter = OpencvAdapter(
+            lambda _: frame,
+            lambda _: None,
+            _FakeCapture(),
+            "engine",
+            quality=quality,
+        )
+        (input_producer,) = adapter.get_producer_wrappers()
+        sizes.append(len((await input_producer.produce()).byte_payload))
+        adapter.close()
+
+    assert sizes[0] < sizes[1]
+
+
+@pytest.mark.asyncio
+async def test_pipelined_frames_in_order():
+    """Test that frames prepared ahead are returned in capture order."""
+    capture = _FakeCapture()
+    adapter = _make_adapter(
+        capture, codec=ImageCodec.PNG, num_workers=4, pipeline_depth=3
+    )
+    (input_producer,) = adapter.get_producer_wrappers()
+
+    values = []
+    for _ in range(10):
+        input_frame = await input_producer.produce()
+        values.append(int(_decode(input_frame)[0, 0, 0]))
+    # Let the frames being prepared ahead finish
+    await asyncio.gather(*adapter._pending)
+    adapter.close()
+
+    assert values == list(range(1, 11))
+    assert capture.num_read == 14
+    # Each frame in the pipeline has its own buffer, which is reused
+    assert len({id(buffer) for buffer in capture.buffers}) == 4
+
+
+@pytest.mark.asyncio
+async def test_consumer_decodes_off_loop():
+    """Test that results are decoded on the pool and consumed in order."""
+    consumed = []
+    consumer_threads = set()
+
+    def consume_frame(frame):
+        consumer_threads.add(threading.current_thread())
+        consumed.append(int(frame[0, 0, 0]))
+
+    adapter = OpencvAdapter(
+        lambda frame: frame,
+        consume_frame,
+        _FakeCapture(),
+        "engine",
+        num_workers=2,
+    )
+    for value in range(1, 6):
+        _, encoded = cv2.imencode(
+            ".png", np.full((8, 8, 3), value, dtype=np.uint8)
+        )
+        adapter.consumer(gabriel_pb2.Result(bytes_result=encoded.tobytes()))
+    for _ in range(100):
+        if consumed and consumed[-1] == 5:
+            break
+        await asyncio.sleep(0.01)
+    adapter.close()
+
+    assert consumed[-1] == 5
+    assert consumed == sorted(consumed)
+    assert consumer_threads == {threading.current_thread()}
@@ -0,0 +1,216 @@
+"""Tests for releasing the server's state for clients and producers."""
+
+import time
+
+import pytest
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.server_runner import (
+    Transport,
+    _EnginePool,
+    _EngineWorker,
+    _Server,
+)
+from google.protobuf import any_pb2
+from prometheus_client import REGISTRY
+
+IDLE_TIMEOUT = 60
+
+
+class _RecordingContext:
+    """Stands in for an engine's gRPC stream, recording what is sent."""
+
+    def __init__(self):
+        self.written = []
+
+    async def write(self, message):
+        self.written.append(message)
+
+
+def _make_server(supports_cancel=False):
+    """Make a server with one engine, without launching it."""
+    server = _Server(
+        1,
+        0,
+        2,
+        Transport.GRPC,
+        False,
+        False,
+        producer_idle_timeout=IDLE_TIMEOUT,
+    )
+    engine_pool = _EnginePool("engine")
+    context = _RecordingContext()
+    engine_worker = _EngineWorker(
+        context, engine_pool, False, 2, supports_cancel=supports_cancel
+    )
+    engine_pool.add_replica(engine_worker)
+    server._engine_pools["engine"] = engine_pool
+    server._engine_workers[context] = engine_worker
+    return server, engine_pool, context
+
+
+async def _send_input(server, client_address, producer_id, frame_id):
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = producer_id
+    from_client.input.frame_id = frame_id
+    from_client.input.target_engine_ids.append("engine")
+    from_client.input.input_frame.byte_payload = b"\x00" * 1024
+    return await server._send_to_engine(
+        from_client, client_address, any_pb2.Any(), None
+    )
+
+
+def _disconnected_total(state):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_disconnected_client_inputs_total", {"state": state}
+        )
+        or 0
+    )
+
+
+async def _return_result(server, context, producer_id, frame_id, code):
+    from_engine = gabriel_pb2.FromEngine(
+        frame_id=frame_id, producer_id=producer_id
+    )
+    from_engine.result.status.code = code
+    await server._handle_from_engine(context, from_engine)
+
+
+def _inputs_received_total(producer_id):
+    return REGISTRY.get_sample_value(
+        "gabriel_producer_inputs_received_total",
+        {"producer_id": producer_id},
+    )
+
+
+@pytest.mark.asyncio
+async def test_disconnected_producers_removed():
+    """Test that state is not kept for producers of past client sessions."""
+    server, engine_pool, _ = _make_server()
+
+    for i in range(1000):
+        client_address = f"client-{i}"
+        # The engine is busy with the first input, so the rest are queued
+        await _send_input(server, client_address, f"producer-{i}", 1)
+        await server._client_disconnected(client_address)
+
+    assert len(server._producer_infos) == 1000
+    assert _inputs_received_total("producer-999") == 1
+    # The producers are kept until they have been idle for the timeout
+    await server._collect_idle_producers()
+    assert len(server._producer_infos) == 1000
+
+    await server._collect_idle_producers(time.monotonic() + IDLE_TIMEOUT)
+
+    assert server._producer_infos == {}
+    assert server._client_producer_ids == {}
+    assert engine_pool._producers == set()
+    assert engine_pool.latest_input_processed == {}
+    assert engine_pool.scheduler.peek() is None
+    assert _inputs_received_total("producer-0") is None
+    assert _inputs_received_total("producer-999") is None
+
+
+@pytest.mark.asyncio
+async def test_connected_producer_kept_while_busy():
+    """Test that a connected client's producer is kept while it has work."""
+    server, _, _ = _make_server()
+    await _send_input(server, "client", "producer", 1)
+    await _send_input(server, "client", "producer", 2)
+    producer_info = server._producer_infos["producer"]
+
+    await server._collect_idle_producers(time.monotonic() + IDLE_TIMEOUT)
+    assert server._producer_infos == {"producer": producer_info}
+
+    # Once its inputs are processed, the producer is idle
+    await producer_info.get_input_from_queue("engine")
+    producer_info.pending_token_returns.clear()
+    await server._collect_idle_producers(time.monotonic() + IDLE_TIMEOUT)
+    assert server._producer_infos == {}
+    assert server._client_producer_ids == {"client": set()}
+
+    # The client can keep sending inputs from the producer
+    status, _ = await _send_input(server, "client", "producer", 3)
+    assert status == gabriel_pb2.StatusCode.SUCCESS
+    assert server._producer_infos["producer"] is not producer_info
+
+
+@pytest.mark.asyncio
+async def test_result_for_removed_producer():
+    """Test that an engine moves on after a removed producer's result."""
+    server, _, context = _make_server()
+    await _send_input(server, "client-0", "producer-0", 1)
+    await server._client_disconnected("client-0")
+    await server._collect_idle_producers(time.monotonic() + IDLE_TIMEOUT)
+    assert server._producer_infos == {}
+
+    # Another producer's input waits behind the removed producer's input
+    await _send_input(server, "client-1", "producer-1", 1)
+    num_written = len(context.written)
+
+    from_engine = gabriel_pb2.FromEngine(frame_id=1, producer_id="producer-0")
+    from_engine.result.status.code = gabriel_pb2.StatusCode.SUCCESS
+    await server._handle_from_engine(context, from_engine)
+
+    assert len(context.written) == num_written + 1
+    to_engine = gabriel_pb2.ToEngine.FromString(context.written[-1])
+    assert (to_engine.producer_id, to_engine.frame_id) == ("producer-1", 1)
+
+
+@pytest.mark.asyncio
+async def test_disconnect_discards_queued_inputs():
+    """Test that a disconnected client's queued inputs are not processed."""
+    server, _, context = _make_server()
+    await _send_input(server, "client-0", "producer-0", 1)
+    await _send_input(server, "client-0", "producer-0", 2)
+    await _send_input(server, "client-1", "producer-1", 1)
+    producer_info = server._producer_infos["producer-0"]
+    num_queued = _disconnected_total("queued")
+
+    await server._client_disconnected("client-0")
+
+    assert _disconnected_total("queued") == num_queued + 1
+    assert producer_info.get_next_deadline() is None
+    assert producer_info.pending_token_returns == set()
+    # The engine moves on to the other client's input
+    await _return_result(
+        server, context, "producer-0", 1, gabriel_pb2.StatusCode.SUCCESS
+    )
+    to_engine = gabriel_pb2.ToEngine.FromString(context.written[-1])
+    assert (to_engine.producer_id, to_engine.frame_id) == ("producer-1", 1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("supports_cancel", [False, True])
+async def test_disconnect_cancels_in_flight_input(supports_cancel):
+    """Test that engines that support it are told to cancel inputs."""
+    server, engine_pool, context = _make_server(supports_cancel)
+    await _send_input(server, "client-0", "producer-0", 1)
+    await _send_input(server, "client-1", "producer-1", 1)
+    num_written = len(context.written)
+    num_cancelled = _disconnected_total("cancelled")
+
+    await server._client_disconnected("client-0")
+
+    if not supports_cancel:
+        assert len(context.written) == num_written
+        assert _disconnected_total("cancelled") == num_cancelled
+        return
+    assert _disconnected_total("cancelled") == num_cancelled + 1
+    assert len(context.written) == num_written + 1
+    to_engine = gabriel_pb2.ToEngine.FromString(context.written[-1])
+    assert to_engine.WhichOneof("message_type") == "cancel_input"
+    assert (to_engine.producer_id, to_engine.frame_id) == ("producer-0", 1)
+
+    # The engine skips the input, and is sent the next one
+    await _return_result(
+        server,
+        context,
+        "producer-0",
+        1,
+        gabriel_pb2.StatusCode.INPUT_CANCELLED,
+    )
+    to_engine = gabriel_pb2.ToEngine.FromString(context.written[-1])
+    assert (to_engine.producer_id, to_engine.frame_id) == ("producer-1", 1)
+    (engine_worker,) = engine_pool.replicas
+    assert engine_worker.get_num_in_flight() == 1
@@ -4,9 +4,12 @@ import asyncio
 import contextlib
 import copy
 import logging
+import time
 
 import pytest
+from gabriel_client.gabriel_client import _LatencyTracker, _TokenPool
 from gabriel_client.zeromq_client import ZeroMQClient
+from gabriel_protocol.v1 import gabriel_pb2
 from helpers import DEFAULT_SERVER_HOST, find_value, get_consumer
 from prometheus_client import REGISTRY
 
@@ -203,3 +206,113 @@ async def test_prometheus_client_metrics(
         else:
             metrics_found -= 1
     assert metrics_found == len(expected_metrics)
+
+
+def _latency_count(producer_id, engine_id, status):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_client_input_processing_latency_seconds_count",
+            {
+                "producer_id": producer_id,
+                "engine_id": engine_id,
+                "status": status,
+            },
+        )
+        or 0
+    )
+
+
+def _expired_total(producer_id, reason):
+    return (
+        REGISTRY.get_sample_value(
+            "gabriel_client_pending_inputs_expired_total",
+            {"producer_id": producer_id, "reason": reason},
+        )
+        or 0
+    )
+
+
+def _result(frame_id, engine_id, code=gabriel_pb2.StatusCode.SUCCESS):
+    result = gabriel_pb2.Result(frame_id=frame_id, target_engine_id=engine_id)
+    result.status.code = code
+    return result
+
+
+def test_latency_tracker_statuses():
+    """Test that results are recorded by engine and status, then forgotten."""
+    tracker = _LatencyTracker(max_pending=10, timeout=60)
+    tracker.sent("tracker-statuses", 1, ["engine-0", "engine-1"])
+    tracker.sent("tracker-statuses", 2, ["engine-0"])
+    tracker.sent("tracker-statuses", 3, ["engine-0"])
+
+    tracker.received("tracker-statuses", _result(1, "engine-0"))
+    assert len(tracker) == 3
+    tracker.received("tracker-statuses", _result(1, "engine-1"))
+    tracker.received(
+        "tracker-statuses",
+        _result(2, "engine-0", gabriel_pb2.StatusCode.SERVER_DROPPED_FRAME),
+    )
+    # Rejected by the server before reaching an engine
+    tracker.received(
+        "tracker-statuses",
+        _result(3, "", gabriel_pb2.StatusCode.NO_ENGINE_FOR_INPUT),
+    )
+
+    assert len(tracker) == 0
+    assert _latency_count("tracker-statuses", "engine-0", "SUCCESS") == 1
+    assert _latency_count("tracker-statuses", "engine-1", "SUCCESS") == 1
+    assert (
+        _latency_count("tracker-statuses", "engine-0", "SERVER_DROPPED_FRAME")
+        == 1
+    )
+    assert _latency_count("tracker-statuses", "", "NO_ENGINE_FOR_INPUT") == 1
+
+
+def test_latency_tracker_bounded():
+    """Test that inputs are forgotten when too many or too old."""
+    tracker = _LatencyTracker(max_pending=2, timeout=0.01)
+    for frame_id in range(1, 4):
+        tracker.sent("tracker-bounded", frame_id, ["engine-0", "engine-1"])
+    assert len(tracker) == 2
+    assert _expired_total("tracker-bounded", "capacity") == 1
+
+    # An input that an engine answered is not counted when forgotten
+    tracker.received("tracker-bounded", _result(2, "engine-0"))
+    time.sleep(0.02)
+    tracker.sent("tracker-bounded", 4, ["engine-0"])
+    assert len(tracker) == 1
+    assert _expired_total("tracker-bounded", "timeout") == 1
+
+    tracker.received("tracker-bounded", _result(3, "engine-0"))
+    assert _latency_count("tracker-bounded", "engine-0", "SUCCESS") == 1
+
+    tracker.clear("reconnect")
+    assert len(tracker) == 0
+    assert _expired_total("tracker-bounded", "reconnect") == 1
+
+
+@pytest.mark.asyncio
+async def test_token_wait_recorded():
+    """Test that the time waited for a token is recorded once it is taken."""
+    token_pool = _TokenPool(1, "token-wait")
+    await token_pool.get_token()
+
+    with contextlib.suppress(TimeoutError, asyncio.TimeoutError):
+        await asyncio.wait_for(token_pool.get_token(), timeout=0.05)
+    token_pool.return_token()
+    await token_pool.get_token()
+
+    labels = {"producer_id": "token-wait"}
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_producer_token_wait_seconds_count", labels
+        )
+        == 2
+    )
+    # The wait that timed out is included in the next one
+    assert (
+        REGISTRY.get_sample_value(
+            "gabriel_producer_token_wait_seconds_sum", labels
+        )
+        >= 0.05
+    )
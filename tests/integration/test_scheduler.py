@@ -0,0 +1,194 @@
+"""Tests for the policies that choose which producer an engine serves."""
+
+import collections
+import math
+
+import pytest
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.network_engine.scheduler import (
+    EarliestDeadlineScheduler,
+    PriorityScheduler,
+    RoundRobinScheduler,
+    SchedulingPolicy,
+    WeightedFairScheduler,
+    make_scheduler,
+)
+from gabriel_server.network_engine.server_runner import (
+    _EnginePool,
+    _EngineWorker,
+    _ProducerInfo,
+)
+
+
+class _Producer:
+    """Stands in for a _ProducerInfo, with fixed scheduling parameters."""
+
+    def __init__(self, name, priority=0, weight=1, deadline=None):
+        self.name = name
+        self.priority = priority
+        self.weight = weight
+        self.deadline = deadline
+
+    def get_priority(self):
+        return self.priority
+
+    def get_weight(self):
+        return self.weight
+
+    def get_next_deadline(self):
+        return self.deadline
+
+
+def _serve(scheduler, num_inputs):
+    """Send num_inputs inputs, from producers that always have one."""
+    served = []
+    for _ in range(num_inputs):
+        producer = scheduler.peek()
+        served.append(producer.name)
+        scheduler.sent(producer)
+    return served
+
+
+def test_round_robin():
+    """Test that producers take turns in the order they were added."""
+    scheduler = RoundRobinScheduler()
+    for name in "abc":
+        scheduler.add(_Producer(name))
+
+    assert _serve(scheduler, 6) == list("abcabc")
+
+
+def test_priority():
+    """Test that higher priorities are served first, in turn."""
+    scheduler = PriorityScheduler()
+    low = _Producer("low", priority=0)
+    scheduler.add(low)
+    for name in ["high-0", "high-1"]:
+        scheduler.add(_Producer(name, priority=5))
+
+    assert _serve(scheduler, 4) == ["high-0", "high-1", "high-0", "high-1"]
+
+    for _ in range(2):
+        scheduler.discard(scheduler.peek())
+    assert scheduler.peek() is low
+
+
+def test_weighted_fair():
+    """Test that producers are served in proportion to their weights."""
+    scheduler = WeightedFairScheduler()
+    for name, weight in [("a", 1), ("b", 2), ("c", 5)]:
+        scheduler.add(_Producer(name, weight=weight))
+
+    counts = collections.Counter(_serve(scheduler, 800))
+
+    assert counts == {"a": 100, "b": 200, "c": 500}
+
+
+def test_weighted_fair_idle_producer():
+    """Test that a producer cannot save up its share while it is idle."""
+    scheduler = WeightedFairScheduler()
+    busy = _Producer("busy")
+    idle = _Producer("idle")
+    scheduler.add(busy)
+    _serve(scheduler, 10)
+
+    scheduler.add(idle)
+    served = _serve(scheduler, 10)
+
+    assert served.count("idle") == 5
+
+
+def test_earliest_deadline():
+    """Test that the producer with the earliest deadline is served first."""
+    scheduler = EarliestDeadlineScheduler()
+    producers = [
+        _Producer("none"),
+        _Producer("late", deadline=20.0),
+        _Producer("early", deadline=10.0),
+    ]
+    for producer in producers:
+        scheduler.add(producer)
+
+    served = []
+    for _ in producers:
+        producer = scheduler.peek()
+        served.append(producer.name)
+        scheduler.discard(producer)
+    assert scheduler.peek() is None
+
+    assert served == ["early", "late", "none"]
+
+
+@pytest.mark.parametrize("scheduling_policy", list(SchedulingPolicy))
+def test_discard_and_add(scheduling_policy):
+    """Test that a discarded producer is served again once re-added."""
+    scheduler = make_scheduler(scheduling_policy)
+    producers = [_Producer(i, deadline=math.inf) for i in range(100)]
+    for producer in producers:
+        scheduler.add(producer)
+    for producer in producers[1:]:
+        scheduler.discard(producer)
+        # Discarding twice has no effect
+        scheduler.discard(producer)
+
+    assert _serve(scheduler, 3) == [0, 0, 0]
+
+    scheduler.discard(producers[0])
+    assert scheduler.peek() is None
+
+    scheduler.add(producers[50])
+    scheduler.add(producers[50])
+    assert scheduler.peek() is producers[50]
+    scheduler.discard(producers[50])
+    assert scheduler.peek() is None
+
+
+class _NullContext:
+    """Stands in for an engine's gRPC stream, discarding what is sent."""
+
+    async def write(self, message):
+        pass
+
+
+def _make_input(producer_id, frame_id, priority):
+    from_client = gabriel_pb2.FromClient()
+    from_client.input.producer_id = producer_id
+    from_client.input.frame_id = frame_id
+    from_client.input.target_engine_ids.append("engine")
+    from_client.input.input_frame.byte_payload = b"\x00"
+    from_client.input.priority = priority
+    return from_client
+
+
+@pytest.mark.asyncio
+async def test_priority_dispatch():
+    """Test that a free engine is sent the highest priority input first."""
+    engine_pool = _EnginePool("engine", PriorityScheduler())
+    engine_worker = _EngineWorker(_NullContext(), engine_pool, False, 1)
+    engine_pool.add_replica(engine_worker)
+    engine_pools = {"engine": engine_pool}
+    producers = {
+        producer_id: _ProducerInfo(producer_id, engine_pools, 10)
+        for producer_id in ["low", "high"]
+    }
+
+    # The first input keeps the engine busy while the others are queued
+    await producers["low"].process_input_from_client(
+        _make_input("low", 0, 0), "client", None
+    )
+    for frame_id in range(1, 3):
+        for producer_id, priority in [("low", 0), ("high", 1)]:
+            await producers[producer_id].process_input_from_client(
+                _make_input(producer_id, frame_id, priority), "client", None
+            )
+
+    served = []
+    producer_id, frame_id = "low", 0
+    for _ in range(4):
+        engine_worker.pop_in_flight_input(frame_id, producer_id)
+        await engine_worker.send_next_input()
+        metadata = engine_worker.get_in_flight_metadata()[0]
+        producer_id, frame_id = metadata.producer_id, metadata.frame_id
+        served.append((producer_id, frame_id))
+
+    assert served == [("high", 1), ("high", 2), ("low", 1), ("low", 2)]
@@ -0,0 +1,322 @@
+"""Tests for adapting the number of tokens that each producer holds."""
+
+import asyncio
+import time
+
+import pytest
+from gabriel_client.gabriel_client import _TokenPool
+from gabriel_client.zeromq_client import ZeroMQClient
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.cognitive_engine import Result
+from gabriel_server.gabriel_server import GabrielServer
+from gabriel_server.token_controller import TokenController
+from google.protobuf.any_pb2 import Any
+from helpers import DEFAULT_SERVER_HOST, cancel_and_wait, wait_until
+
+
+def _run(controller, frame_ids, turnaround_time, time_on_server, now=0.0):
+    """Send inputs one at a time, returning the changes of token count.
+
+    Each input arrives turnaround_time after the token of the previous one
+    was returned, and spends time_on_server on the server.
+    """
+    changes = []
+    for frame_id in frame_ids:
+        now += turnaround_time
+        controller.input_received("client", "producer", frame_id, now=now)
+        now += time_on_server
+        num_tokens = controller.token_returned(
+            "client",
+            "producer",
+            frame_id,
+            processed=True,
+            starved=True,
+            now=now,
+        )
+        if num_tokens is not None:
+            changes.append(num_tokens)
+    return changes, now
+
+
+def test_long_turnaround_adds_tokens():
+    """Test that tokens are added while the network is the bottleneck."""
+    controller = TokenController(num_tokens=1, max_num_tokens=3)
+
+    changes, _ = _run(controller, range(20), 0.3, 0.1)
+
+    # One token is added at a time, after the tokens given by the last
+    # change have all been returned, and no more than the maximum
+    assert changes == [2, 3]
+    assert controller.get_num_tokens("client", "producer") == 3
+
+
+def test_short_turnaround_removes_tokens():
+    """Test that tokens are taken away when the engine is the bottleneck."""
+    controller = TokenController(num_tokens=4, max_num_tokens=8)
+
+    changes, _ = _run(controller, range(20), 0.01, 0.1)
+
+    assert changes == [3, 2, 1]
+
+
+def test_queueing_delay_removes_tokens():
+    """Test that tokens are taken away while inputs wait in a queue."""
+    controller = TokenController(num_tokens=3, max_num_tokens=8)
+    changes, now = _run(controller, range(3), 1.0, 0.1)
+    assert changes == [4]
+
+    # Inputs now wait behind each other, though the turnaround time alone
+    # would call for more tokens
+    changes = []
+    for frame_id in range(3, 20):
+        controller.input_received("client", "producer", frame_id, now=now)
+        now += 0.5
+        num_tokens = controller.token_returned(
+            "client",
+            "producer",
+            frame_id,
+            processed=True,
+            starved=False,
+            now=now,
+        )
+        if num_tokens is not None:
+            changes.append(num_tokens)
+
+    assert changes == [3, 2, 1]
+
+
+def test_discarded_inputs_are_not_measured():
+    """Test that inputs the server discarded do not count as served."""
+    controller = TokenController(num_tokens=1, max_num_tokens=3)
+    controller.input_received("client", "producer", 0, now=0.0)
+
+    assert (
+        controller.token_returned(
+            "client",
+            "producer",
+            0,
+            processed=False,
+            starved=True,
+            now=0.0,
+        )
+        is None
+    )
+    # The turnaround time is still measured from the returned token
+    controller.input_received("client", "producer", 1, now=0.3)
+    assert controller._clients["client"]["producer"].turnaround_time == 0.3
+
+
+def test_remove_client():
+    """Test that a client's producers start over once it reconnects."""
+    controller = TokenController(num_tokens=1, max_num_tokens=3)
+    _run(controller, range(20), 0.3, 0.1)
+
+    controller.remove_client("client")
+
+    assert controller.get_num_tokens("client", "producer") == 1
+    assert (
+        controller.token_returned(
+            "client", "producer", 0, processed=True, starved=True
+        )
+        is None
+    )
+
+
+def test_invalid_num_tokens():
+    """Test that the starting number of tokens must be within bounds."""
+    with pytest.raises(ValueError):
+        TokenController(num_tokens=4, max_num_tokens=3)
+
+
+@pytest.mark.asyncio
+async def test_token_pool_grow():
+    """Test that tokens added to a pool can be taken right away."""
+    token_pool = _TokenPool(1, "producer")
+    await token_pool.get_token()
+    assert token_pool.is_locked()
+
+    token_pool.resize(3)
+
+    assert token_pool.get_remaining_tokens() == 2
+    await asyncio.wait_for(token_pool.get_token(), timeout=1)
+    await asyncio.wait_for(token_pool.get_token(), timeout=1)
+    assert token_pool.is_locked()
+
+
+@pytest.mark.asyncio
+async def test_token_pool_shrink_in_flight():
+    """Test that a pool shrinks as the tokens in use are returned."""
+    token_pool = _TokenPool(3, "producer")
+    for _ in range(3):
+        await token_pool.get_token()
+
+    token_pool.resize(1)
+
+    # The first two tokens returned are taken out of the pool
+    token_pool.return_token()
+    token_pool.return_token()
+    assert token_pool.is_locked()
+    token_pool.return_token()
+    assert token_pool.get_remaining_tokens() == 1
+
+
+@pytest.mark.asyncio
+async def test_token_pool_shrink_and_grow():
+    """Test that growing a pool first cancels out tokens still owed."""
+    token_pool = _TokenPool(3, "producer")
+
+    token_pool.resize(1)
+    assert token_pool.get_remaining_tokens() == 1
+    await token_pool.get_token()
+    assert token_pool.is_locked()
+
+    token_pool.resize(2)
+    assert token_pool.get_remaining_tokens() == 1
+    token_pool.return_token()
+    assert token_pool.get_remaining_tokens() == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_num_tokens", [5])
+async def test_adapt_tokens_to_slow_engine(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    prometheus_client_port,
+):
+    """Test that a producer is left one token while inputs queue up."""
+    frame_ids = []
+    token_counts = []
+
+    def handle(input_frame, client_info):
+        time.sleep(0.4)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    def consumer(result):
+        assert result.status.code == gabriel_pb2.StatusCode.SUCCESS
+        frame_ids.append(result.frame_id)
+
+    run_engines[0].handle_method = handle
+
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        consumer,
+        prometheus_client_port,
+    )
+    process_token_update = client._process_token_update
+
+    def record_token_update(token_update):
+        token_counts.append(token_update.num_tokens)
+        process_token_update(token_update)
+
+    client._process_token_update = record_token_update
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: 1 in token_counts, timeout=15)
+    num_results = len(frame_ids)
+    await wait_until(lambda: len(frame_ids) > num_results, timeout=5)
+    assert not task.done()
+    await cancel_and_wait(task)
+
+    # The producer produces an input far faster than the engine processes
+    # one, so a single token keeps the engine busy
+    assert token_counts[:4] == [4, 3, 2, 1]
+    assert len(frame_ids) > num_results
+
+
+class _ShrinkingTokenController:
+    """Stand-in for TokenController that shrinks a producer to 2 tokens."""
+
+    def __init__(self):
+        self.starved = []
+
+    def get_num_tokens(self, address, producer_id):
+        return 3
+
+    def input_received(self, address, producer_id, frame_id):
+        pass
+
+    def token_returned(
+        self, address, producer_id, frame_id, processed, starved
+    ):
+        self.starved.append(starved)
+        return 2
+
+
+class _RecordingServer(GabrielServer):
+    """GabrielServer that records the messages it sends to clients."""
+
+    def __init__(self, engine_cb):
+        super().__init__(3, engine_cb, {"engine"})
+        self.sent = []
+
+    async def launch_async(self, port_or_path, message_max_size, use_ipc):
+        pass
+
+    async def _send_via_transport(self, address, to_client):
+        self.sent.append(to_client)
+        return True
+
+    def is_running(self):
+        return True
+
+    async def _client_handler(self):
+        pass
+
+    async def _consumer(self, address):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_shrink_with_all_tokens_in_flight():
+    """Test that a client can't send with a token taken out by a shrink."""
+    token_pool = _TokenPool(3, "producer")
+
+    async def engine_cb(from_client, address, client_info, input_frame):
+        if from_client.input.frame_id == 2:
+            # The engine returns the token of the last input before the
+            # input is accepted
+            result = gabriel_pb2.Result()
+            result.status.code = gabriel_pb2.StatusCode.SUCCESS
+            result.frame_id = 2
+            await server.send_result(
+                "client", "producer", "engine", result, return_token=True
+            )
+        return (gabriel_pb2.StatusCode.SUCCESS, "")
+
+    server = _RecordingServer(engine_cb)
+    server._token_controller = _ShrinkingTokenController()
+    client = server._new_client()
+    client.client_info[0] = Any()
+    server._clients["client"] = client
+
+    for frame_id in range(3):
+        await token_pool.get_token()
+        from_client = gabriel_pb2.FromClient()
+        from_client.input.frame_id = frame_id
+        from_client.input.producer_id = "producer"
+        status, _ = await server._consumer_helper(
+            client, "client", from_client
+        )
+        assert status == gabriel_pb2.StatusCode.SUCCESS
+
+    assert server._token_controller.starved == [True]
+    assert [
+        to_client.WhichOneof("message_type") for to_client in server.sent
+    ] == [
+        "token_update",
+        "result_wrapper",
+    ]
+    for to_client in server.sent:
+        if to_client.HasField("token_update"):
+            token_pool.resize(to_client.token_update.num_tokens)
+        elif to_client.result_wrapper.return_token:
+            token_pool.return_token()
+
+    # The returned token was taken out of the pool, on the client and on
+    # the server alike
+    assert token_pool.is_locked()
+    assert client.tokens_for_producer["producer"] == 0
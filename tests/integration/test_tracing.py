@@ -0,0 +1,166 @@
+"""Tests for tracing inputs through the client, server and engine."""
+
+import asyncio
+import json
+import time
+
+import pytest
+from gabriel_client.zeromq_client import ZeroMQClient
+from gabriel_protocol.tracing import (
+    ChromeTraceWriter,
+    chrome_trace_events,
+    stage_durations,
+)
+from gabriel_protocol.v1 import gabriel_pb2
+from gabriel_server.cognitive_engine import Result
+from helpers import DEFAULT_SERVER_HOST, cancel_and_wait, wait_until
+from prometheus_client import REGISTRY
+
+MS = 1_000_000
+
+
+def _make_trace():
+    """Make a Trace with a 10 ms network delay each way.
+
+    The server's clock is 1 s ahead of the client's, and the engine's is 2 s
+    ahead of the server's.
+    """
+    return gabriel_pb2.Trace(
+        client_send_ns=100 * MS,
+        server_receive_ns=1_110 * MS,
+        enqueue_ns=1_111 * MS,
+        dispatch_ns=1_115 * MS,
+        engine_receive_ns=3_116 * MS,
+        handle_start_ns=3_117 * MS,
+        handle_end_ns=3_137 * MS,
+        engine_result_ns=1_138 * MS,
+        result_write_ns=1_140 * MS,
+        client_receive_ns=150 * MS,
+    )
+
+
+def test_stage_durations():
+    """Test that stages are only measured between the same host's times."""
+    durations = stage_durations(_make_trace())
+
+    assert durations == pytest.approx(
+        {
+            "receive": 0.001,
+            "queue": 0.004,
+            "engine_wait": 0.001,
+            "handle": 0.020,
+            "result": 0.002,
+            "engine_network": 0.002,
+            "server": 0.030,
+            "network": 0.020,
+        }
+    )
+
+
+def test_stage_durations_partial():
+    """Test that stages that were not reached are left out."""
+    trace = gabriel_pb2.Trace(
+        client_send_ns=100 * MS,
+        server_receive_ns=1_110 * MS,
+        enqueue_ns=1_111 * MS,
+    )
+
+    assert stage_durations(trace) == pytest.approx({"receive": 0.001})
+
+
+def test_chrome_trace_events():
+    """Test that the server's and engine's spans are put on one timeline."""
+    events = chrome_trace_events(_make_trace(), "producer", 7)
+    spans = {event["name"]: event for event in events}
+
+    assert spans["uplink"]["ts"] == pytest.approx(100_000)
+    assert spans["uplink"]["dur"] == pytest.approx(10_000)
+    assert spans["receive"]["ts"] == pytest.approx(110_000)
+    # The engine's round trip of 2 ms is split evenly around its 21 ms
+    assert spans["engine_wait"]["ts"] == pytest.approx(116_000)
+    assert spans["handle"]["ts"] == pytest.approx(117_000)
+    assert spans["downlink"]["ts"] == pytest.approx(140_000)
+    assert spans["downlink"]["dur"] == pytest.approx(10_000)
+    assert {event["tid"] for event in events} == {7}
+
+    assert chrome_trace_events(gabriel_pb2.Trace(), "producer", 7) == []
+
+
+def test_chrome_trace_writer(tmp_path):
+    """Test that the trace file is a JSON array of events."""
+    path = tmp_path / "trace.json"
+    writer = ChromeTraceWriter(str(path))
+    writer.write(_make_trace(), "producer", 1)
+    writer.write(_make_trace(), "producer", 2)
+    writer.close()
+
+    with open(path) as f:
+        events = json.load(f)
+    names = [event["args"]["name"] for event in events if event["ph"] == "M"]
+    assert names == ["client", "server", "engine"]
+    spans = [event for event in events if event["ph"] == "X"]
+    assert {event["tid"] for event in spans} == {1, 2}
+
+
+@pytest.mark.asyncio
+async def test_trace_end_to_end(
+    run_engines,
+    input_producer,
+    server_frontend_port,
+    prometheus_client_port,
+    tmp_path,
+):
+    """Test that a traced input is timed by the client, server and engine."""
+    traces = []
+
+    def handle(input_frame, client_info):
+        time.sleep(0.05)
+        status = gabriel_pb2.Status()
+        status.code = gabriel_pb2.StatusCode.SUCCESS
+        return Result(status, "hello")
+
+    run_engines[0].handle_method = handle
+    engine_id = run_engines[0].engine_name
+
+    def get_handle_count():
+        return (
+            REGISTRY.get_sample_value(
+                "gabriel_stage_latency_seconds_count",
+                {"engine_id": engine_id, "stage": "handle"},
+            )
+            or 0
+        )
+
+    handle_count = get_handle_count()
+    path = tmp_path / "trace.json"
+    client = ZeroMQClient(
+        f"tcp://{DEFAULT_SERVER_HOST}:{server_frontend_port}",
+        input_producer,
+        lambda result: None,
+        prometheus_client_port,
+        trace_sample_rate=1,
+        trace_file=str(path),
+    )
+    record_trace = client._record_trace
+
+    def capture_trace(result_wrapper):
+        record_trace(result_wrapper)
+        traces.append(result_wrapper.trace)
+
+    client._record_trace = capture_trace
+    task = asyncio.create_task(client.launch_async())
+
+    await wait_until(lambda: len(traces) >= 2, timeout=10)
+    await cancel_and_wait(task)
+
+    trace = traces[0]
+    for field in trace.DESCRIPTOR.fields:
+        assert getattr(trace, field.name), field.name
+    durations = stage_durations(trace)
+    assert durations["handle"] >= 0.05
+    assert durations["network"] >= 0
+    assert get_handle_count() >= handle_count + 2
+
+    with open(path) as f:
+        events = json.load(f)
+    assert "handle" in {event["name"] for event in events}
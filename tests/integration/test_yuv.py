@@ -0,0 +1,62 @@
+"""Tests for the BGR to YUV converters in gabriel_client.yuv."""
+
+import cv2
+import numpy as np
+import pytest
+from gabriel_client.yuv import bgr_to_i420, bgr_to_nv12, bgr_to_nv21
+
+
+@pytest.fixture
+def frame():
+    """A random BGR frame, sliced out of a larger one."""
+    rng = np.random.default_rng(0)
+    full_frame = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    return full_frame[10:58, 20:84]
+
+
+@pytest.mark.parametrize(
+    "convert, to_bgr",
+    [
+        (bgr_to_i420, cv2.COLOR_YUV2BGR_I420),
+        (bgr_to_nv21, cv2.COLOR_YUV2BGR_NV21),
+        (bgr_to_nv12, cv2.COLOR_YUV2BGR_NV12),
+    ],
+)
+@pytest.mark.parametrize("preallocate", [False, True])
+def test_conversion(frame, convert, to_bgr, preallocate):
+    """Test that each format decodes to the same image as OpenCV's I420."""
+    expected = cv2.cvtColor(
+        cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420), cv2.COLOR_YUV2BGR_I420
+    )
+    out = np.empty((72, 64), dtype=np.uint8) if preallocate else None
+
+    yuv = convert(frame, out)
+
+    assert yuv.shape == (72, 64)
+    if preallocate:
+        assert yuv is out
+    assert np.array_equal(cv2.cvtColor(yuv, to_bgr), expected)
+
+
+def test_nv21_chroma_order(frame):
+    """Test that NV21 interleaves V before U, and NV12 U before V."""
+    i420 = bgr_to_i420(frame).reshape(-1)
+    luma_size = 48 * 64
+    u_plane, v_plane = np.split(i420[luma_size:], 2)
+
+    nv21 = bgr_to_nv21(frame).reshape(-1)
+    assert np.array_equal(nv21[:luma_size], i420[:luma_size])
+    assert np.array_equal(nv21[luma_size::2], v_plane)
+    assert np.array_equal(nv21[luma_size + 1 :: 2], u_plane)
+
+    nv12 = bgr_to_nv12(frame).reshape(-1)
+    assert np.array_equal(nv12[luma_size::2], u_plane)
+    assert np.array_equal(nv12[luma_size + 1 :: 2], v_plane)
+
+
+def test_invalid_sizes(frame):
+    """Test that odd frame sizes and mismatched buffers are rejected."""
+    with pytest.raises(ValueError):
+        bgr_to_nv21(frame[:47])
+    with pytest.raises(ValueError):
+        bgr_to_nv21(frame, np.empty((48, 64), dtype=np.uint8))